@@ -0,0 +1,804 @@
+#!/usr/bin/env python
+
+"""
+benchmark_diffviewer.py [-n REPEAT] [-o results.json] [-b baseline.json]
+                        [-t THRESHOLD] [-k PATTERN] [--seed SEED]
+
+Benchmarks the main stages of rendering a diff in the diff viewer:
+
+* Parsing diffs (reviewboard.diffviewer.parser.DiffParser)
+* Diffing files (reviewboard.diffviewer.myersdiff.MyersDiffer)
+* Generating opcodes (reviewboard.diffviewer.opcode_generator.
+  DiffOpcodeGenerator)
+* Generating chunks, with and without syntax highlighting
+  (reviewboard.diffviewer.chunk_generator.RawDiffChunkGenerator)
+* Building the list of files to show
+  (reviewboard.diffviewer.diffutils.get_diff_files)
+* Generating chunks for uploaded files, which fetches and patches the files
+  from the repository (reviewboard.diffviewer.chunk_generator.
+  DiffChunkGenerator)
+
+The diffs are generated from a fixed random seed, so the results can be
+compared between runs. They cover a small diff, a diff of a large file, a
+diff with many files, a diff with a lot of moved code and an interdiff
+between two revisions of a diff. The sample diffs bundled with Review Board
+are benchmarked as well, for the stages that don't need a repository.
+
+Uploaded diffs are stored in a temporary database against a "Local File"
+repository containing the original files, and a local memory cache is used
+in place of the configured cache.
+
+Results can be written as JSON using -o, and compared against a previous run
+using -b. Any benchmark that's slower than the baseline by more than the
+threshold is reported as a regression, and the script will exit with a
+status of 1.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import difflib
+import fnmatch
+import glob
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+scripts_dir = os.path.abspath(os.path.dirname(__file__))
+
+# Source root directory
+sys.path.insert(0, os.path.abspath(os.path.join(scripts_dir, '..', '..')))
+
+# Script config directory
+sys.path.insert(0, os.path.join(scripts_dir, '..', 'internal', 'conf'))
+
+
+#: The format version of the JSON results.
+RESULTS_VERSION = 1
+
+
+class BenchmarkCase(object):
+    """A set of diffs to benchmark.
+
+    Attributes:
+        name (unicode):
+            The name of the case.
+
+        diffs (list of tuple):
+            The diffs for the case, as ``(parser_cls, data)`` tuples.
+
+        files (list of tuple):
+            The files changed by the diffs, as ``(orig_filename,
+            modified_filename, old_content, new_content)`` tuples. The
+            filenames are bytes, and the content is text.
+
+        repository_files (dict):
+            The original files that need to be in the repository, mapping
+            paths to text content. This is ``None`` for cases that can't be
+            uploaded.
+
+        interdiff_data (bytes):
+            The diff for a second revision of the files, used to benchmark
+            interdiffs.
+    """
+
+    def __init__(self, name, diffs, files, repository_files=None,
+                 interdiff_data=None):
+        """Initialize the case.
+
+        Args:
+            name (unicode):
+                The name of the case.
+
+            diffs (list of tuple):
+                The diffs for the case.
+
+            files (list of tuple):
+                The files changed by the diffs.
+
+            repository_files (dict, optional):
+                The original files that need to be in the repository.
+
+            interdiff_data (bytes, optional):
+                The diff for a second revision of the files.
+        """
+        self.name = name
+        self.diffs = diffs
+        self.files = files
+        self.repository_files = repository_files
+        self.interdiff_data = interdiff_data
+        self.diffset_id = None
+        self.interdiffset_id = None
+
+
+class CorpusGenerator(object):
+    """Generates the synthetic diffs to benchmark.
+
+    All content is generated from a seeded random number generator, so the
+    same corpus is produced on every run.
+    """
+
+    WORDS = [
+        'value', 'result', 'items', 'count', 'request', 'response', 'data',
+        'index', 'name', 'path', 'options', 'context', 'config', 'handler',
+        'user', 'review', 'diff', 'file', 'line', 'chunk',
+    ]
+
+    def __init__(self, seed):
+        """Initialize the generator.
+
+        Args:
+            seed (int):
+                The seed for the random number generator.
+        """
+        self.random = random.Random(seed)
+
+    def make_line(self):
+        """Return a random line of Python-like code.
+
+        Returns:
+            unicode:
+            The line, without a trailing newline.
+        """
+        rand = self.random
+        words = self.WORDS
+        indent = '    ' * rand.randint(0, 3)
+        kind = rand.randint(0, 9)
+
+        if kind == 0:
+            return ''
+        elif kind == 1:
+            return '%s# %s %s %s.' % (
+                indent, rand.choice(words).title(), rand.choice(words),
+                rand.choice(words))
+        elif kind == 2:
+            return '%sdef %s_%s(self, %s=%d):' % (
+                indent, rand.choice(words), rand.choice(words),
+                rand.choice(words), rand.randint(0, 100))
+        elif kind == 3:
+            return '%sif %s.%s is not None:' % (indent, rand.choice(words),
+                                                rand.choice(words))
+        elif kind == 4:
+            return "%sreturn '%s-%d'" % (indent, rand.choice(words),
+                                         rand.randint(0, 10000))
+        else:
+            return '%s%s_%d = %s(%s, %d)' % (
+                indent, rand.choice(words), rand.randint(0, 50),
+                rand.choice(words), rand.choice(words),
+                rand.randint(0, 10000))
+
+    def make_lines(self, num_lines):
+        """Return random lines of code.
+
+        Args:
+            num_lines (int):
+                The number of lines to generate.
+
+        Returns:
+            list of unicode:
+            The lines.
+        """
+        return [self.make_line() for i in range(num_lines)]
+
+    def modify_lines(self, lines, num_changes, max_change_size=5):
+        """Return a copy of lines with random changes made.
+
+        Each change will insert, delete or replace a run of lines.
+
+        Args:
+            lines (list of unicode):
+                The lines to modify.
+
+            num_changes (int):
+                The number of changes to make.
+
+            max_change_size (int, optional):
+                The maximum number of lines affected by each change.
+
+        Returns:
+            list of unicode:
+            The modified lines.
+        """
+        rand = self.random
+        lines = list(lines)
+
+        for i in range(num_changes):
+            pos = rand.randint(0, len(lines))
+            size = rand.randint(1, max_change_size)
+            kind = rand.randint(0, 2)
+
+            if kind == 0:
+                lines[pos:pos] = self.make_lines(size)
+            elif kind == 1:
+                del lines[pos:pos + size]
+            else:
+                lines[pos:pos + size] = [
+                    line.replace('_', '__', 1) + ' + 1'
+                    for line in lines[pos:pos + size]
+                ]
+
+        return lines
+
+    def move_blocks(self, lines, num_moves, block_size):
+        """Return a copy of lines with blocks of lines moved around.
+
+        Args:
+            lines (list of unicode):
+                The lines to modify.
+
+            num_moves (int):
+                The number of blocks to move.
+
+            block_size (int):
+                The number of lines in each block.
+
+        Returns:
+            list of unicode:
+            The modified lines.
+        """
+        rand = self.random
+        lines = list(lines)
+
+        for i in range(num_moves):
+            start = rand.randint(0, max(len(lines) - block_size, 0))
+            block = lines[start:start + block_size]
+            del lines[start:start + block_size]
+
+            pos = rand.randint(0, len(lines))
+            lines[pos:pos] = block
+
+        return lines
+
+    def make_case(self, name, num_files, num_lines, num_changes,
+                  num_moves=0, num_interdiff_changes=0):
+        """Return a generated case.
+
+        Args:
+            name (unicode):
+                The name of the case.
+
+            num_files (int):
+                The number of files to change.
+
+            num_lines (int):
+                The number of lines in each original file.
+
+            num_changes (int):
+                The number of changes to make to each file.
+
+            num_moves (int, optional):
+                The number of blocks of lines to move in each file.
+
+            num_interdiff_changes (int, optional):
+                The number of additional changes to make to each file for a
+                second revision of the diff. If 0, no interdiff will be
+                generated.
+
+        Returns:
+            BenchmarkCase:
+            The generated case.
+        """
+        repository_files = {}
+        files = []
+        diff = []
+        interdiff = []
+
+        for i in range(num_files):
+            path = '%s/src/module_%04d.py' % (name, i)
+            old_lines = self.make_lines(num_lines)
+            new_lines = old_lines
+
+            if num_moves:
+                new_lines = self.move_blocks(new_lines, num_moves,
+                                             block_size=8)
+
+            new_lines = self.modify_lines(new_lines, num_changes)
+
+            repository_files[path] = self._join_lines(old_lines)
+            files.append((path.encode('utf-8'), path.encode('utf-8'),
+                          repository_files[path],
+                          self._join_lines(new_lines)))
+            diff.append(self._make_diff(path, old_lines, new_lines))
+
+            if num_interdiff_changes:
+                interdiff.append(self._make_diff(
+                    path,
+                    old_lines,
+                    self.modify_lines(new_lines, num_interdiff_changes)))
+
+        if interdiff:
+            interdiff_data = ''.join(interdiff).encode('utf-8')
+        else:
+            interdiff_data = None
+
+        from reviewboard.diffviewer.parser import DiffParser
+
+        return BenchmarkCase(
+            name=name,
+            diffs=[(DiffParser, ''.join(diff).encode('utf-8'))],
+            files=files,
+            repository_files=repository_files,
+            interdiff_data=interdiff_data)
+
+    def _join_lines(self, lines):
+        """Return the content of a file made up of lines.
+
+        Args:
+            lines (list of unicode):
+                The lines in the file.
+
+        Returns:
+            unicode:
+            The file content.
+        """
+        return ''.join('%s\n' % line for line in lines)
+
+    def _make_diff(self, path, old_lines, new_lines):
+        """Return a unified diff between two versions of a file.
+
+        Args:
+            path (unicode):
+                The path to the file.
+
+            old_lines (list of unicode):
+                The lines in the original file.
+
+            new_lines (list of unicode):
+                The lines in the modified file.
+
+        Returns:
+            unicode:
+            The diff.
+        """
+        return ''.join(
+            '%s\n' % line
+            for line in difflib.unified_diff(old_lines, new_lines,
+                                             fromfile=path,
+                                             tofile=path,
+                                             fromfiledate='(original)',
+                                             tofiledate='(modified)',
+                                             lineterm='')
+        )
+
+
+def load_sample_case(filenames):
+    """Return a case for the sample diffs bundled with Review Board.
+
+    The sample diffs don't include the full original files, so the files
+    are reconstructed from the lines in each diff.
+
+    Args:
+        filenames (list of unicode):
+            The paths to the sample diffs.
+
+    Returns:
+        BenchmarkCase:
+        The case for the samples.
+    """
+    from reviewboard.scmtools.git import GitDiffParser
+
+    diffs = []
+    files = []
+
+    for filename in filenames:
+        with io.open(filename, 'rb') as fp:
+            data = fp.read()
+
+        diffs.append((GitDiffParser, data))
+
+        for parsed_file in GitDiffParser(data).parse():
+            old_lines = []
+            new_lines = []
+            in_hunk = False
+
+            diff_lines = parsed_file.data.decode('utf-8', 'replace')
+
+            for line in diff_lines.splitlines():
+                if line.startswith('@@'):
+                    in_hunk = True
+                elif not in_hunk:
+                    continue
+                elif line.startswith(' '):
+                    old_lines.append(line[1:])
+                    new_lines.append(line[1:])
+                elif line.startswith('-'):
+                    old_lines.append(line[1:])
+                elif line.startswith('+'):
+                    new_lines.append(line[1:])
+
+            files.append((parsed_file.orig_filename,
+                          parsed_file.modified_filename,
+                          ''.join('%s\n' % line for line in old_lines),
+                          ''.join('%s\n' % line for line in new_lines)))
+
+    return BenchmarkCase(name='samples',
+                         diffs=diffs,
+                         files=files)
+
+
+def build_corpus(seed):
+    """Return all the cases to benchmark.
+
+    Args:
+        seed (int):
+            The seed for generating the synthetic diffs.
+
+    Returns:
+        list of BenchmarkCase:
+        The cases.
+    """
+    generator = CorpusGenerator(seed)
+    sample_filenames = sorted(glob.glob(os.path.join(
+        scripts_dir, '..', '..', 'reviewboard', 'reviews', 'management',
+        'commands', 'diffs', '*.diff')))
+
+    return [
+        generator.make_case('small', num_files=1, num_lines=300,
+                            num_changes=3),
+        generator.make_case('large', num_files=1, num_lines=20000,
+                            num_changes=200),
+        generator.make_case('many-files', num_files=100, num_lines=100,
+                            num_changes=2),
+        generator.make_case('heavy-move', num_files=1, num_lines=3000,
+                            num_changes=10, num_moves=60),
+        generator.make_case('interdiff', num_files=5, num_lines=1000,
+                            num_changes=10, num_interdiff_changes=10),
+        load_sample_case(sample_filenames),
+    ]
+
+
+def upload_corpus(cases, repository_dir):
+    """Store the diffs for the cases in the database.
+
+    The original files are written to the repository directory, and each
+    case's diffs are uploaded to a "Local File" repository pointing to it.
+
+    Args:
+        cases (list of BenchmarkCase):
+            The cases to upload. Cases without repository files are skipped.
+
+        repository_dir (unicode):
+            The directory to write the original files to.
+    """
+    from reviewboard.diffviewer.models import DiffSet, DiffSetHistory
+    from reviewboard.scmtools.models import Repository, Tool
+
+    tool = Tool.objects.get_or_create(
+        name='Local File',
+        class_name='reviewboard.scmtools.localfile.LocalFileTool')[0]
+    repository = Repository.objects.create(name='Benchmarks',
+                                           path=repository_dir,
+                                           tool=tool)
+
+    for case in cases:
+        if not case.repository_files:
+            continue
+
+        for path, content in case.repository_files.items():
+            filename = os.path.join(repository_dir, path)
+            dirname = os.path.dirname(filename)
+
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+
+            with io.open(filename, 'w', encoding='utf-8') as fp:
+                fp.write(content)
+
+        history = DiffSetHistory.objects.create()
+        case.diffset_id = DiffSet.objects.create_from_data(
+            repository=repository,
+            diff_file_name='diff',
+            diff_file_contents=case.diffs[0][1],
+            diffset_history=history,
+            basedir='').pk
+
+        if case.interdiff_data:
+            case.interdiffset_id = DiffSet.objects.create_from_data(
+                repository=repository,
+                diff_file_name='diff',
+                diff_file_contents=case.interdiff_data,
+                diffset_history=history,
+                basedir='').pk
+
+
+def get_benchmarks(cases):
+    """Return the benchmarks to run for the cases.
+
+    Args:
+        cases (list of BenchmarkCase):
+            The cases to benchmark.
+
+    Returns:
+        list of tuple:
+        The benchmarks, as ``(name, func)`` tuples.
+    """
+    from django.utils import six
+
+    from reviewboard.diffviewer.chunk_generator import (DiffChunkGenerator,
+                                                        RawDiffChunkGenerator)
+    from reviewboard.diffviewer.diffutils import get_diff_files
+    from reviewboard.diffviewer.models import DiffSet
+    from reviewboard.diffviewer.myersdiff import MyersDiffer
+    from reviewboard.diffviewer.opcode_generator import \
+        get_diff_opcode_generator
+
+    benchmarks = []
+
+    def _parse(case):
+        for parser_cls, data in case.diffs:
+            parser_cls(data).parse()
+
+    def _diff(file_lines):
+        for old_lines, new_lines in file_lines:
+            list(MyersDiffer(old_lines, new_lines).get_opcodes())
+
+    def _generate_opcodes(file_opcodes):
+        for old_lines, new_lines, opcodes in file_opcodes:
+            differ = MyersDiffer(old_lines, new_lines)
+            differ.get_opcodes = lambda: iter(opcodes)
+            list(get_diff_opcode_generator(differ))
+
+    def _generate_chunks(case, enable_syntax_highlighting):
+        for orig_filename, modified_filename, old, new in case.files:
+            generator = RawDiffChunkGenerator(
+                old=old.encode('utf-8'),
+                new=new.encode('utf-8'),
+                orig_filename=orig_filename.decode('utf-8'),
+                modified_filename=modified_filename.decode('utf-8'),
+                enable_syntax_highlighting=enable_syntax_highlighting)
+            list(generator.get_chunks_uncached())
+
+    def _get_diff_files(case):
+        diffset = DiffSet.objects.get(pk=case.diffset_id)
+
+        if case.interdiffset_id:
+            interdiffset = DiffSet.objects.get(pk=case.interdiffset_id)
+        else:
+            interdiffset = None
+
+        return get_diff_files(diffset=diffset,
+                              interdiffset=interdiffset)
+
+    def _generate_filediff_chunks(case):
+        for diff_file in _get_diff_files(case):
+            generator = DiffChunkGenerator(
+                request=None,
+                filediff=diff_file['filediff'],
+                interfilediff=diff_file['interfilediff'],
+                force_interdiff=diff_file['force_interdiff'])
+            list(generator.get_chunks_uncached())
+
+    for case in cases:
+        file_lines = [
+            (old.splitlines(), new.splitlines())
+            for orig_filename, modified_filename, old, new in case.files
+        ]
+        file_opcodes = [
+            (old_lines, new_lines,
+             list(MyersDiffer(old_lines, new_lines).get_opcodes()))
+            for old_lines, new_lines in file_lines
+        ]
+
+        benchmarks += [
+            ('parse:%s' % case.name,
+             lambda case=case: _parse(case)),
+            ('myers:%s' % case.name,
+             lambda file_lines=file_lines: _diff(file_lines)),
+            ('opcodes:%s' % case.name,
+             lambda file_opcodes=file_opcodes:
+                _generate_opcodes(file_opcodes)),
+            ('chunks:%s' % case.name,
+             lambda case=case: _generate_chunks(case, False)),
+            ('chunks-highlighted:%s' % case.name,
+             lambda case=case: _generate_chunks(case, True)),
+        ]
+
+        if case.diffset_id is not None:
+            benchmarks += [
+                ('get_diff_files:%s' % case.name,
+                 lambda case=case: _get_diff_files(case)),
+                ('filediff-chunks:%s' % case.name,
+                 lambda case=case: _generate_filediff_chunks(case)),
+            ]
+
+    return [
+        (six.text_type(name), func)
+        for name, func in benchmarks
+    ]
+
+
+def compare_results(results, baseline, threshold):
+    """Compare results against a baseline and print the differences.
+
+    Args:
+        results (dict):
+            The results of this run.
+
+        baseline (dict):
+            The results of a previous run.
+
+        threshold (float):
+            The fraction by which a benchmark can be slower than the baseline
+            before it's considered a regression.
+
+    Returns:
+        list of unicode:
+        The names of the benchmarks that regressed.
+    """
+    regressions = []
+    baseline_results = baseline['results']
+
+    print()
+    print('Compared to baseline:')
+    print()
+
+    for name, result in sorted(results['results'].items()):
+        baseline_result = baseline_results.get(name)
+
+        if baseline_result is None:
+            print('%-40s  (not in baseline)' % name)
+            continue
+
+        old_time = baseline_result['min']
+        new_time = result['min']
+        change = (new_time - old_time) / max(old_time, 1e-9)
+
+        if change > threshold:
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif change < -threshold:
+            status = 'improved'
+        else:
+            status = ''
+
+        print('%-40s %10.2f ms -> %10.2f ms  (%+6.1f%%)  %s'
+              % (name, old_time * 1000, new_time * 1000, change * 100,
+                 status))
+
+    return regressions
+
+
+def main():
+    """Run the benchmarks."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reviewboard.settings')
+
+    from django.conf import settings
+
+    # Don't touch the configured cache (which may be shared with a running
+    # server), and make sure results aren't affected by its latency.
+    settings.CACHES['forwarded_backend'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark-diffviewer',
+    }
+
+    import django
+    django.setup()
+
+    from django.core.cache import cache
+    from django.test.runner import DiscoverRunner
+    from django.utils import six
+
+    from reviewboard import get_version_string, initialize
+    from reviewboard.diffviewer.diffutils import \
+        clear_line_changed_regions_cache
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark the diff viewer.')
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+                        help='The number of times to run each benchmark.')
+    parser.add_argument('-o', '--output',
+                        help='A file to write the results to, as JSON.')
+    parser.add_argument('-b', '--baseline',
+                        help='The JSON results of a previous run to compare '
+                             'against.')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                        help='The fraction by which a benchmark can be '
+                             'slower than the baseline before it is '
+                             'considered a regression. The default is 0.1.')
+    parser.add_argument('-k', '--only', dest='pattern',
+                        help='Only run benchmarks with names matching this '
+                             'wildcard pattern (for example, '
+                             '"chunks*:large").')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='The seed used to generate the diffs.')
+    options = parser.parse_args()
+
+    baseline = None
+
+    if options.baseline:
+        with io.open(options.baseline, 'r', encoding='utf-8') as fp:
+            baseline = json.load(fp)
+
+        if baseline.get('version') != RESULTS_VERSION:
+            sys.stderr.write('The baseline results are in an unsupported '
+                             'format.\n')
+            sys.exit(1)
+
+        if baseline.get('seed') != options.seed:
+            sys.stderr.write('The baseline was generated with a different '
+                             'seed. Results may not be comparable.\n')
+
+    runner = DiscoverRunner(verbosity=0)
+    old_db_config = runner.setup_databases()
+    repository_dir = tempfile.mkdtemp(prefix='rb-benchmark-')
+
+    try:
+        initialize(load_extensions=False)
+
+        cases = build_corpus(options.seed)
+        upload_corpus(cases, repository_dir)
+
+        benchmarks = get_benchmarks(cases)
+
+        if options.pattern:
+            benchmarks = [
+                (name, func)
+                for name, func in benchmarks
+                if fnmatch.fnmatch(name, options.pattern)
+            ]
+
+        if not benchmarks:
+            sys.stderr.write('No benchmarks matched "%s".\n'
+                             % options.pattern)
+            sys.exit(1)
+
+        results = {
+            'version': RESULTS_VERSION,
+            'reviewboard': get_version_string(),
+            'python': platform.python_version(),
+            'seed': options.seed,
+            'repeat': options.repeat,
+            'results': {},
+        }
+
+        def _clear_caches():
+            cache.clear()
+            clear_line_changed_regions_cache()
+
+        for name, func in benchmarks:
+            # Each run starts with empty caches, so that cached file
+            # contents, highlighting, changed regions within lines and
+            # interdiff state don't skew results.
+            times = timeit.repeat(func,
+                                  setup=_clear_caches,
+                                  number=1,
+                                  repeat=options.repeat)
+            times.sort()
+
+            results['results'][name] = {
+                'min': times[0],
+                'median': times[len(times) // 2],
+                'max': times[-1],
+            }
+
+            print('%-40s  min: %10.2f ms  median: %10.2f ms'
+                  % (name, times[0] * 1000, times[len(times) // 2] * 1000))
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(repository_dir)
+        runner.teardown_databases(old_db_config)
+
+    if options.output:
+        with io.open(options.output, 'w', encoding='utf-8') as fp:
+            fp.write(six.text_type(json.dumps(results, indent=2,
+                                              sort_keys=True)))
+
+    if baseline is not None:
+        regressions = compare_results(results, baseline, options.threshold)
+
+        if regressions:
+            print()
+            print('%d of %d benchmarks regressed by more than %.0f%%'
+                  % (len(regressions), len(results['results']),
+                     options.threshold * 100))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+"""
+benchmark_intraline_diffs.py [-n REPEAT] [/path/to/file.diff ...]
+
+Benchmarks the algorithms used to find changes within modified lines
+(see reviewboard.diffviewer.diffutils.get_line_changed_regions).
+
+Pairs of removed and added lines are taken from each diff, the way the diff
+viewer pairs up replaced lines. If no diffs are given, the sample diffs
+bundled with Review Board are used.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import glob
+import io
+import os
+import sys
+import timeit
+
+scripts_dir = os.path.abspath(os.path.dirname(__file__))
+
+# Source root directory
+sys.path.insert(0, os.path.abspath(os.path.join(scripts_dir, '..', '..')))
+
+# Script config directory
+sys.path.insert(0, os.path.join(scripts_dir, '..', 'internal', 'conf'))
+
+
+def load_line_pairs(filenames):
+    """Return the pairs of replaced lines in a list of diffs.
+
+    Args:
+        filenames (list of unicode):
+            The paths to the diffs.
+
+    Returns:
+        list of tuple:
+        The list of ``(old_line, new_line)`` pairs.
+    """
+    pairs = []
+
+    for filename in filenames:
+        with io.open(filename, 'r', encoding='utf-8',
+                     errors='replace') as fp:
+            lines = fp.read().splitlines()
+
+        removed = []
+        added = []
+
+        for line in lines + ['']:
+            if line.startswith('-') and not line.startswith('---'):
+                if added:
+                    pairs += zip(removed, added)
+                    removed = []
+                    added = []
+
+                removed.append(line[1:])
+            elif line.startswith('+') and not line.startswith('+++'):
+                added.append(line[1:])
+            else:
+                pairs += zip(removed, added)
+                removed = []
+                added = []
+
+    return [
+        (old_line, new_line)
+        for old_line, new_line in pairs
+        if old_line != new_line
+    ]
+
+
+def main():
+    """Run the benchmarks."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reviewboard.settings')
+
+    import django
+    django.setup()
+
+    from reviewboard.diffviewer.diffutils import (
+        INTRALINE_DIFF_CHARACTERS,
+        INTRALINE_DIFF_TOKENS,
+        clear_line_changed_regions_cache,
+        get_line_changed_regions)
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark the intraline diff algorithms.')
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+                        help='The number of times to run each benchmark.')
+    parser.add_argument('diffs', nargs='*',
+                        help='The diffs to take replaced lines from.')
+    options = parser.parse_args()
+
+    filenames = options.diffs or sorted(glob.glob(os.path.join(
+        scripts_dir, '..', '..', 'reviewboard', 'reviews', 'management',
+        'commands', 'diffs', '*.diff')))
+    pairs = load_line_pairs(filenames)
+
+    if not pairs:
+        sys.stderr.write('No replaced lines were found in the diffs.\n')
+        sys.exit(1)
+
+    print('%d replaced line pairs from %d diffs' % (len(pairs),
+                                                    len(filenames)))
+    print()
+
+    results = {}
+
+    for algorithm in (INTRALINE_DIFF_CHARACTERS, INTRALINE_DIFF_TOKENS):
+        def _run(use_cache):
+            for old_line, new_line in pairs:
+                get_line_changed_regions(old_line, new_line,
+                                         algorithm=algorithm,
+                                         use_cache=use_cache)
+
+        uncached = min(timeit.repeat(lambda: _run(False),
+                                     number=1,
+                                     repeat=options.repeat))
+
+        clear_line_changed_regions_cache()
+        _run(True)
+        cached = min(timeit.repeat(lambda: _run(True),
+                                   number=1,
+                                   repeat=options.repeat))
+
+        results[algorithm] = [
+            get_line_changed_regions(old_line, new_line,
+                                     algorithm=algorithm,
+                                     use_cache=False)
+            for old_line, new_line in pairs
+        ]
+
+        print('%-12s  uncached: %8.2f ms (%6.2f us/line)  '
+              'cached: %8.2f ms'
+              % (algorithm,
+                 uncached * 1000,
+                 uncached * 1000000 / len(pairs),
+                 cached * 1000))
+
+    num_same = sum(
+        1
+        for regions1, regions2 in zip(results[INTRALINE_DIFF_CHARACTERS],
+                                      results[INTRALINE_DIFF_TOKENS])
+        if regions1 == regions2
+    )
+
+    print()
+    print('%d of %d line pairs (%.1f%%) have identical regions'
+          % (num_same, len(pairs), 100.0 * num_same / len(pairs)))
+
+
+if __name__ == '__main__':
+    main()
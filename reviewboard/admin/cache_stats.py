@@ -4,12 +4,26 @@ import logging
 import socket
 
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import ugettext_lazy as _
+from djblets.cache.backend import make_cache_key
 from djblets.cache.forwarding_backend import DEFAULT_FORWARD_CACHE_ALIAS
 
 
 logger = logging.getLogger(__name__)
 
 
+#: The hit/miss counters kept for Review Board's own caches.
+#:
+#: Each is a tuple of ``(counter_id, label)``. Hits and misses are recorded
+#: with :py:func:`record_cache_hit` and :py:func:`record_cache_miss`.
+CACHE_COUNTERS = [
+    ('diffviewer-chunks', _('Diff chunks (by file content)')),
+    ('diffviewer-highlighting', _('Syntax-highlighted files')),
+    ('diffviewer-interdiffs', _('Interdiff file matches and ranges')),
+]
+
+
 def get_memcached_hosts():
     """Return the hosts currently configured for memcached.
 
@@ -113,3 +127,96 @@ def get_cache_stats():
         all_stats.append((hostname, stats))
 
     return all_stats
+
+
+def _increment_cache_counter(counter_id, field):
+    """Increment a hit or miss counter.
+
+    The counters are stored in the cache, so that they're shared between
+    all processes and servers. They may be lost if evicted.
+
+    Args:
+        counter_id (unicode):
+            The ID of the counter.
+
+        field (unicode):
+            The field to increment (``hits`` or ``misses``).
+    """
+    key = make_cache_key('cache-counter-%s-%s' % (counter_id, field))
+
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter doesn't exist yet (or was evicted). If another process
+        # beat us to adding it, try incrementing again.
+        if not cache.add(key, 1, None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                pass
+    except Exception as e:
+        logger.error('Unable to increment cache counter "%s": %s',
+                     key, e)
+
+
+def record_cache_hit(counter_id):
+    """Record a cache hit for one of Review Board's caches.
+
+    Args:
+        counter_id (unicode):
+            The ID of the counter, from :py:data:`CACHE_COUNTERS`.
+    """
+    _increment_cache_counter(counter_id, 'hits')
+
+
+def record_cache_miss(counter_id):
+    """Record a cache miss for one of Review Board's caches.
+
+    Args:
+        counter_id (unicode):
+            The ID of the counter, from :py:data:`CACHE_COUNTERS`.
+    """
+    _increment_cache_counter(counter_id, 'misses')
+
+
+def get_cache_counter_stats():
+    """Return hit/miss statistics for Review Board's own caches.
+
+    Returns:
+        list of tuple:
+        Each list item corresponds to an entry in :py:data:`CACHE_COUNTERS`.
+        The item is a tuple in the form of ``(label, stats)``, where
+        ``stats`` is a dictionary containing ``hits``, ``misses``,
+        ``total``, ``hit_rate`` and ``miss_rate`` keys.
+    """
+    keys = {}
+
+    for counter_id, label in CACHE_COUNTERS:
+        for field in ('hits', 'misses'):
+            keys[(counter_id, field)] = make_cache_key(
+                'cache-counter-%s-%s' % (counter_id, field))
+
+    values = cache.get_many(list(keys.values()))
+    all_stats = []
+
+    for counter_id, label in CACHE_COUNTERS:
+        hits = values.get(keys[(counter_id, 'hits')], 0)
+        misses = values.get(keys[(counter_id, 'misses')], 0)
+        total = hits + misses
+
+        stats = {
+            'hits': hits,
+            'misses': misses,
+            'total': total,
+        }
+
+        if total == 0:
+            stats['hit_rate'] = 0
+            stats['miss_rate'] = 0
+        else:
+            stats['hit_rate'] = 100 * hits / total
+            stats['miss_rate'] = 100 * misses / total
+
+        all_stats.append((label, stats))
+
+    return all_stats
@@ -8,6 +8,14 @@ from django import forms
 from django.utils.translation import ugettext_lazy as _
 from djblets.siteconfig.forms import SiteSettingsForm
 
+from reviewboard.diffviewer.compression import \
+    diff_compression_codec_registry
+from reviewboard.diffviewer.diffutils import (INTRALINE_DIFF_CHARACTERS,
+                                              INTRALINE_DIFF_TOKENS,
+                                              PATCH_ENGINE_BUILTIN,
+                                              PATCH_ENGINE_SUBPROCESS)
+from reviewboard.diffviewer.prerender import prerender_backend_registry
+
 
 class DiffSettingsForm(SiteSettingsForm):
     """Diff settings for Review Board."""
@@ -23,6 +31,13 @@ class DiffSettingsForm(SiteSettingsForm):
         required=False,
         widget=forms.TextInput(attrs={'size': '5'}))
 
+    diffviewer_syntax_highlighting_max_bytes = forms.IntegerField(
+        label=_('Syntax highlighting size limit (bytes)'),
+        help_text=_('Files larger than this many bytes will not have syntax '
+                    'highlighting. Enter 0 for no limit.'),
+        min_value=0,
+        widget=forms.TextInput(attrs={'size': '10'}))
+
     diffviewer_show_trailing_whitespace = forms.BooleanField(
         label=_('Show trailing whitespace'),
         help_text=_('Show excess trailing whitespace as red blocks. This '
@@ -59,12 +74,136 @@ class DiffSettingsForm(SiteSettingsForm):
         initial=10,
         widget=forms.TextInput(attrs={'size': '5'}))
 
+    diffviewer_diff_algorithm = forms.ChoiceField(
+        label=_('Diff algorithm'),
+        choices=(
+            ('myers', _('Myers')),
+            ('myers-bounded', _('Myers, with a bounded cost')),
+            ('patience', _('Patience')),
+            ('histogram', _('Histogram')),
+        ),
+        help_text=_('The algorithm used to compute differences between '
+                    'lines in newly-uploaded diffs. Existing diffs are not '
+                    'affected. This can be overridden for a repository by '
+                    'setting "diff_algorithm" in its extra data.'))
+
+    diffviewer_intraline_diff_algorithm = forms.ChoiceField(
+        label=_('Changes within lines'),
+        choices=(
+            (INTRALINE_DIFF_CHARACTERS, _('Compare characters')),
+            (INTRALINE_DIFF_TOKENS, _('Compare words and symbols')),
+        ),
+        help_text=_('How the changes within a modified line are found. '
+                    'Comparing words and symbols is faster, and highlights '
+                    'whole words rather than scattered characters.'))
+
     diffviewer_max_diff_size = forms.IntegerField(
         label=_('Max diff size (bytes)'),
         help_text=_('The maximum size (in bytes) for any given diff. Enter 0 '
                     'to disable size restrictions.'),
         widget=forms.TextInput(attrs={'size': '15'}))
 
+    diffviewer_streaming_threshold = forms.IntegerField(
+        label=_('Streaming threshold'),
+        help_text=_('Files with at least this many changed lines will be '
+                    'sent to the browser as they\'re rendered, rather than '
+                    'all at once. Enter 0 to disable streaming.'),
+        min_value=0,
+        widget=forms.TextInput(attrs={'size': '10'}))
+
+    diffviewer_patch_engine = forms.ChoiceField(
+        label=_('Patch engine'),
+        choices=(
+            (PATCH_ENGINE_BUILTIN,
+             _('Built-in, falling back on patch(1) when needed')),
+            (PATCH_ENGINE_SUBPROCESS, _('Always use patch(1)')),
+        ),
+        help_text=_('How diffs are applied to files when rendering them. '
+                    'The built-in engine avoids launching a process for '
+                    'every file.'))
+
+    diffviewer_prefetch_max_workers = forms.IntegerField(
+        label=_('Parallel file fetches'),
+        help_text=_('The maximum number of files fetched at once from '
+                    'repositories when rendering a diff. Enter 0 to fetch '
+                    'files one at a time.'),
+        min_value=0,
+        widget=forms.TextInput(attrs={'size': '5'}))
+
+    diffviewer_prefetch_max_workers_per_repository = forms.IntegerField(
+        label=_('Parallel file fetches per repository'),
+        help_text=_('The maximum number of files fetched at once from any '
+                    'one repository. This can be overridden for a repository '
+                    'by setting "prefetch_max_workers" in its extra data.'),
+        min_value=1,
+        widget=forms.TextInput(attrs={'size': '5'}))
+
+    diffviewer_file_store_max_size = forms.IntegerField(
+        label=_('Local file store size (MB)'),
+        help_text=_('The maximum size of the on-disk store for files fetched '
+                    'from repositories, used when files are no longer in the '
+                    'cache. This avoids fetching the same files again from '
+                    'slow repositories. Enter 0 to disable the store.'),
+        min_value=0,
+        widget=forms.TextInput(attrs={'size': '10'}))
+
+    diffviewer_file_store_path = forms.CharField(
+        label=_('Local file store path'),
+        required=False,
+        help_text=_('The directory for the local file store. This must be '
+                    'writable by the web server, and can be shared between '
+                    'servers. Leave blank to use the "file-store" directory '
+                    'in the site\'s data directory.'),
+        widget=forms.TextInput(attrs={'size': '40'}))
+
+    diffviewer_prerender_backend_id = forms.ChoiceField(
+        label=_('Pre-render diffs'),
+        required=False,
+        help_text=_('How diffs are rendered in the background after they '
+                    'are uploaded or published, so they load quickly when '
+                    'first viewed. This requires a shared cache, such as '
+                    'memcached.'))
+
+    diffviewer_prerender_workers = forms.IntegerField(
+        label=_('Pre-render worker processes'),
+        help_text=_('The number of worker processes each server process '
+                    'will use for pre-rendering diffs, when using a local '
+                    'process pool.'),
+        min_value=1,
+        widget=forms.TextInput(attrs={'size': '5'}))
+
+    diffviewer_compression_codec_id = forms.ChoiceField(
+        label=_('Diff compression'),
+        help_text=_('How newly-uploaded diffs are compressed when stored in '
+                    'the database. bzip2 uses the least space, but is the '
+                    'slowest to read. Existing diffs can be recompressed '
+                    'using "rb-site manage /path/to/site recompressdiffs".'))
+
+    def __init__(self, *args, **kwargs):
+        """Initialize the form.
+
+        Args:
+            *args (tuple):
+                Positional arguments for the parent class.
+
+            **kwargs (dict):
+                Keyword arguments for the parent class.
+        """
+        super(DiffSettingsForm, self).__init__(*args, **kwargs)
+
+        self.fields['diffviewer_prerender_backend_id'].choices = [
+            ('', _('Disabled')),
+        ] + [
+            (backend.backend_id, backend.name)
+            for backend in prerender_backend_registry
+        ]
+
+        self.fields['diffviewer_compression_codec_id'].choices = [
+            (codec.codec_id, codec.name)
+            for codec in diff_compression_codec_registry
+            if codec.available
+        ]
+
     def load(self):
         """Load settings from the form.
 
@@ -94,6 +233,7 @@ class DiffSettingsForm(SiteSettingsForm):
                 'classes': ('wide',),
                 'fields': ('diffviewer_syntax_highlighting',
                            'diffviewer_syntax_highlighting_threshold',
+                           'diffviewer_syntax_highlighting_max_bytes',
                            'diffviewer_show_trailing_whitespace',
                            'include_space_patterns'),
             },
@@ -108,6 +248,17 @@ class DiffSettingsForm(SiteSettingsForm):
                 'fields': ('diffviewer_max_diff_size',
                            'diffviewer_context_num_lines',
                            'diffviewer_paginate_by',
-                           'diffviewer_paginate_orphans')
+                           'diffviewer_paginate_orphans',
+                           'diffviewer_diff_algorithm',
+                           'diffviewer_intraline_diff_algorithm',
+                           'diffviewer_streaming_threshold',
+                           'diffviewer_patch_engine',
+                           'diffviewer_prefetch_max_workers',
+                           'diffviewer_prefetch_max_workers_per_repository',
+                           'diffviewer_file_store_max_size',
+                           'diffviewer_file_store_path',
+                           'diffviewer_prerender_backend_id',
+                           'diffviewer_prerender_workers',
+                           'diffviewer_compression_codec_id')
             }
         )
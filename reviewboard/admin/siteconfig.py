@@ -147,12 +147,24 @@ defaults.update({
     'auth_x509_autocreate_users': False,
     'company': '',
     'default_use_rich_text': True,
+    'diffviewer_compression_codec_id': 'B',
     'diffviewer_context_num_lines': 5,
+    'diffviewer_diff_algorithm': 'myers',
+    'diffviewer_file_store_max_size': 0,
+    'diffviewer_file_store_path': '',
     'diffviewer_include_space_patterns': [],
+    'diffviewer_intraline_diff_algorithm': 'characters',
     'diffviewer_max_diff_size': 0,
     'diffviewer_paginate_by': 20,
     'diffviewer_paginate_orphans': 10,
+    'diffviewer_patch_engine': 'builtin',
+    'diffviewer_prefetch_max_workers': 8,
+    'diffviewer_prefetch_max_workers_per_repository': 4,
+    'diffviewer_prerender_backend_id': '',
+    'diffviewer_prerender_workers': 2,
+    'diffviewer_streaming_threshold': 10000,
     'diffviewer_syntax_highlighting': True,
+    'diffviewer_syntax_highlighting_max_bytes': 200000,
     'diffviewer_syntax_highlighting_threshold': 0,
     'diffviewer_show_trailing_whitespace': True,
     'mail_send_review_mail': False,
@@ -0,0 +1,43 @@
+"""Unit tests for reviewboard.admin.cache_stats."""
+
+from __future__ import unicode_literals
+
+from reviewboard.admin.cache_stats import (get_cache_counter_stats,
+                                           record_cache_hit,
+                                           record_cache_miss)
+from reviewboard.testing import TestCase
+
+
+class CacheCounterTests(TestCase):
+    """Unit tests for the cache hit/miss counters."""
+
+    def test_get_cache_counter_stats(self):
+        """Testing get_cache_counter_stats"""
+        record_cache_hit('diffviewer-chunks')
+        record_cache_hit('diffviewer-chunks')
+        record_cache_hit('diffviewer-chunks')
+        record_cache_miss('diffviewer-chunks')
+
+        stats = dict(get_cache_counter_stats())
+        self.assertEqual(
+            stats['Diff chunks (by file content)'],
+            {
+                'hits': 3,
+                'misses': 1,
+                'total': 4,
+                'hit_rate': 75,
+                'miss_rate': 25,
+            })
+
+    def test_get_cache_counter_stats_empty(self):
+        """Testing get_cache_counter_stats without any hits or misses"""
+        stats = dict(get_cache_counter_stats())
+        self.assertEqual(
+            stats['Diff chunks (by file content)'],
+            {
+                'hits': 0,
+                'misses': 0,
+                'total': 0,
+                'hit_rate': 0,
+                'miss_rate': 0,
+            })
@@ -15,7 +15,8 @@ from djblets.siteconfig.views import site_settings as djblets_site_settings
 from djblets.util.compat.django.shortcuts import render
 from djblets.util.compat.django.template.loader import render_to_string
 
-from reviewboard.admin.cache_stats import get_cache_stats
+from reviewboard.admin.cache_stats import (get_cache_counter_stats,
+                                           get_cache_stats)
 from reviewboard.admin.decorators import superuser_required
 from reviewboard.admin.forms.ssh_settings import SSHSettingsForm
 from reviewboard.admin.security_checks import SecurityCheckRunner
@@ -116,6 +117,7 @@ def cache_stats(request, template_name="admin/cache_stats.html"):
         context={
             'cache_hosts': cache_stats,
             'cache_backend': cache_info['BACKEND'],
+            'cache_counters': get_cache_counter_stats(),
             'title': _('Server Cache'),
             'root_path': reverse('admin:index'),
         })
@@ -0,0 +1,135 @@
+"""Utilities for working with cached data."""
+
+from __future__ import unicode_literals
+
+import logging
+import zlib
+
+import djblets
+from django.core.cache import cache
+from django.utils import six
+from django.utils.six.moves import cPickle as pickle, range
+from djblets.cache.backend import cache_memoize, make_cache_key
+
+
+logger = logging.getLogger(__name__)
+
+
+#: The versions of djblets whose large data storage format is understood.
+#:
+#: :py:func:`get_many_cached_large_data` reads data stored by
+#: :py:func:`~djblets.cache.backend.cache_memoize` directly, and must be
+#: checked against any new versions of djblets before they're added here.
+#: With any other version, the data is read one key at a time through
+#: :py:func:`~djblets.cache.backend.cache_memoize`.
+LARGE_DATA_DJBLETS_VERSIONS = {(2, 0)}
+
+
+class _CacheMiss(Exception):
+    """An item wasn't found in the cache."""
+
+
+def get_many_cached_large_data(keys):
+    """Return several items stored in the cache as large data.
+
+    This looks up items stored by :py:func:`~djblets.cache.backend.
+    cache_memoize` with ``large_data=True``, using two cache requests in
+    total, rather than two for each item. Items that aren't in the cache,
+    or can't be read, are left out of the results.
+
+    Args:
+        keys (list of unicode):
+            The keys passed to :py:func:`~djblets.cache.backend.cache_memoize`
+            for each item.
+
+    Returns:
+        dict:
+        A dictionary mapping the keys of any items found in the cache to the
+        items.
+    """
+    if djblets.VERSION[:2] not in LARGE_DATA_DJBLETS_VERSIONS:
+        return _get_many_cached_large_data_unbatched(keys)
+
+    # cache_memoize() stores large data under a main key containing the
+    # number of chunks, with the pickled items (normally zlib-compressed)
+    # split across keys for each chunk. djblets doesn't provide a way of
+    # reading several of these at once, so we read them ourselves. The unit
+    # tests check this against cache_memoize().
+    main_keys = {
+        make_cache_key(key): key
+        for key in keys
+    }
+    chunk_counts = cache.get_many(list(six.iterkeys(main_keys)))
+    chunk_keys = {}
+
+    for main_key, chunk_count in six.iteritems(chunk_counts):
+        key = main_keys[main_key]
+
+        try:
+            chunk_keys[key] = [
+                make_cache_key('%s-%d' % (key, i))
+                for i in range(int(chunk_count))
+            ]
+        except (TypeError, ValueError):
+            continue
+
+    if not chunk_keys:
+        return {}
+
+    chunks = cache.get_many([
+        chunk_key
+        for key_chunk_keys in six.itervalues(chunk_keys)
+        for chunk_key in key_chunk_keys
+    ])
+    results = {}
+
+    for key, key_chunk_keys in six.iteritems(chunk_keys):
+        try:
+            data = b''.join(
+                chunks[chunk_key][0]
+                for chunk_key in key_chunk_keys
+            )
+
+            try:
+                data = zlib.decompress(data)
+            except zlib.error:
+                # The data was stored without compression.
+                pass
+
+            results[key] = pickle.loads(data)
+        except Exception as e:
+            logger.debug('Unable to load large data from cache key %s: %s',
+                         key, e)
+
+    return results
+
+
+def _get_many_cached_large_data_unbatched(keys):
+    """Return several items stored in the cache as large data, one at a time.
+
+    This is used by :py:func:`get_many_cached_large_data` for versions of
+    djblets whose storage format hasn't been checked.
+
+    Args:
+        keys (list of unicode):
+            The keys passed to :py:func:`~djblets.cache.backend.cache_memoize`
+            for each item.
+
+    Returns:
+        dict:
+        A dictionary mapping the keys of any items found in the cache to the
+        items.
+    """
+    def _raise_cache_miss():
+        raise _CacheMiss
+
+    results = {}
+
+    for key in keys:
+        try:
+            results[key] = cache_memoize(key, _raise_cache_miss,
+                                         large_data=True)
+        except _CacheMiss:
+            pass
+
+    return results
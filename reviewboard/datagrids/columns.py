@@ -992,7 +992,7 @@ class DiffSizeColumn(Column):
 
         diffset = diffsets[-1]
 
-        counts = diffset.get_total_line_counts()
+        counts = diffset.get_total_raw_line_counts()
         insert_count = counts.get('raw_insert_count')
         delete_count = counts.get('raw_delete_count')
         result = []
@@ -1013,8 +1013,8 @@ class DiffSizeColumn(Column):
     def augment_queryset(self, state, queryset):
         """Add additional queries to the queryset.
 
-        This will prefetch the diffsets and filediffs needed to perform the
-        line calculations.
+        This will prefetch the diffsets, which store the line counts shown
+        in the column.
 
         Args:
             state (djblets.datagrid.grids.StatefulColumn):
@@ -1029,5 +1029,4 @@ class DiffSizeColumn(Column):
         """
         # TODO: Update this to fetch only the specific fields when we move
         #       to a newer version of Django.
-        return queryset.prefetch_related('diffset_history__diffsets',
-                                         'diffset_history__diffsets__files')
+        return queryset.prefetch_related('diffset_history__diffsets')
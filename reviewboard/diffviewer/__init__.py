@@ -0,0 +1,17 @@
+"""Diff viewer initialization."""
+
+from __future__ import unicode_literals
+
+from reviewboard.signals import initializing
+
+
+def _on_initializing(**kwargs):
+    """Set up signal handlers for the diff viewer."""
+    from reviewboard.diffviewer.signal_handlers import \
+        on_review_request_published
+    from reviewboard.reviews.signals import review_request_published
+
+    review_request_published.connect(on_review_request_published)
+
+
+initializing.connect(_on_initializing)
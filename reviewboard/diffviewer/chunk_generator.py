@@ -3,9 +3,13 @@ from __future__ import unicode_literals
 import fnmatch
 import functools
 import hashlib
+import logging
 import re
+from bisect import bisect_left
 
+import pygments
 import pygments.util
+from django.core.cache import cache
 from django.utils import six
 from django.utils.encoding import force_text
 from django.utils.html import escape
@@ -13,12 +17,15 @@ from django.utils.safestring import mark_safe
 from django.utils.six.moves import range, zip_longest
 from django.utils.translation import get_language, ugettext as _
 from djblets.log import log_timed
-from djblets.cache.backend import cache_memoize
+from djblets.cache.backend import (cache_memoize, cache_memoize_iter,
+                                   make_cache_key)
 from djblets.siteconfig.models import SiteConfiguration
 from pygments import highlight
 from pygments.formatters import HtmlFormatter
 from pygments.lexers import guess_lexer_for_filename
 
+from reviewboard.admin.cache_stats import (record_cache_hit,
+                                           record_cache_miss)
 from reviewboard.diffviewer.differ import DiffCompatVersion, get_differ
 from reviewboard.diffviewer.diffutils import (get_filediff_encodings,
                                               get_line_changed_regions,
@@ -28,6 +35,36 @@ from reviewboard.diffviewer.diffutils import (get_filediff_encodings,
                                               split_line_endings)
 from reviewboard.diffviewer.opcode_generator import (DiffOpcodeGenerator,
                                                      get_diff_opcode_generator)
+from reviewboard.diffviewer.processors import get_interdiff_ranges
+
+
+logger = logging.getLogger(__name__)
+
+
+class _MissingCacheSegmentError(Exception):
+    """A segment of cached chunks was missing from the cache."""
+
+
+def _make_chunks_info():
+    """Return information for an empty list of cached chunks.
+
+    Returns:
+        dict:
+        The information on the chunks. See
+        :py:meth:`RawDiffChunkGenerator.get_cached_chunks_info`.
+    """
+    return {
+        'num_chunks': 0,
+        'num_segments': 0,
+        'line_counts': {
+            'equal': 0,
+            'replace': 0,
+            'insert': 0,
+            'delete': 0,
+        },
+        'changed_chunk_indexes': [],
+        'whitespace_chunk_indexes': [],
+    }
 
 
 class NoWrapperHtmlFormatter(HtmlFormatter):
@@ -66,6 +103,9 @@ class RawDiffChunkGenerator(object):
 
     # The maximum size a line can be before we start shutting off styling.
     STYLED_MAX_LINE_LEN = 1000
+
+    # The maximum size of a file to style, if the
+    # diffviewer_syntax_highlighting_max_bytes setting hasn't been set.
     STYLED_MAX_LIMIT_BYTES = 200000  # 200KB
 
     # A list of filename extensions that won't be styled.
@@ -76,9 +116,18 @@ class RawDiffChunkGenerator(object):
     # Default tab size used in browsers.
     TAB_SIZE = DiffOpcodeGenerator.TAB_SIZE
 
+    #: The number of lines of chunks to store in each segment of the cache.
+    #:
+    #: Chunks are cached in segments, so that the chunks for large files can
+    #: be stored and read back a segment at a time rather than all at once.
+    #: Chunks are never split, so a segment containing a single large chunk
+    #: may exceed this.
+    CACHE_SEGMENT_MAX_LINES = 2000
+
     def __init__(self, old, new, orig_filename, modified_filename,
                  enable_syntax_highlighting=True, encoding_list=None,
-                 diff_compat=DiffCompatVersion.DEFAULT):
+                 diff_compat=DiffCompatVersion.DEFAULT,
+                 intraline_diff_algorithm=None):
         """Initialize the chunk generator.
 
         Args:
@@ -105,6 +154,12 @@ class RawDiffChunkGenerator(object):
             diff_compat (int, optional):
                 A specific diff compatibility version to use for any diffing
                 logic.
+
+            intraline_diff_algorithm (unicode, optional):
+                The algorithm used to find changes within modified lines.
+                See :py:func:`~reviewboard.diffviewer.diffutils.
+                get_line_changed_regions`. If not specified, this defaults
+                to the ``diffviewer_intraline_diff_algorithm`` setting.
         """
         # Check that the data coming in is in the formats we accept.
         for param, param_name in ((old, 'old'), (new, 'new')):
@@ -141,10 +196,25 @@ class RawDiffChunkGenerator(object):
         self.diff_compat = diff_compat
         self.differ = None
 
+        if intraline_diff_algorithm is None:
+            siteconfig = SiteConfiguration.objects.get_current()
+            intraline_diff_algorithm = \
+                siteconfig.get('diffviewer_intraline_diff_algorithm')
+
+        self.intraline_diff_algorithm = intraline_diff_algorithm
+
         # Chunk processing state.
         self._last_header = [None, None]
         self._last_header_index = [0, 0]
         self._chunk_index = 0
+        self._line_ranges = None
+
+        #: Information on the chunks being returned.
+        #:
+        #: This is set before the first chunk is yielded, whether the chunks
+        #: are being read from the cache or generated, and is in the form
+        #: returned by :py:meth:`get_cached_chunks_info`.
+        self.chunks_info = None
 
     def get_opcode_generator(self):
         """Return the DiffOpcodeGenerator used to generate diff opcodes."""
@@ -156,17 +226,269 @@ class RawDiffChunkGenerator(object):
         If a cache key is provided and there are chunks already computed in the
         cache, they will be yielded. Otherwise, new chunks will be generated,
         stored in cache (given a cache key), and yielded.
+
+        Chunks are cached in segments of up to
+        :py:attr:`CACHE_SEGMENT_MAX_LINES` lines, and are yielded a segment
+        at a time as they're read from or stored in the cache.
         """
         if cache_key:
-            chunks = cache_memoize(cache_key,
-                                   lambda: list(self.get_chunks_uncached()),
-                                   large_data=True)
+            chunks = self._get_segment_cached_chunks(cache_key)
         else:
             chunks = self.get_chunks_uncached()
 
         for chunk in chunks:
             yield chunk
 
+    def get_cached_chunks_info(self, cache_key):
+        """Return information on the chunks stored in the cache.
+
+        This can be used to find out about the chunks for a diff before
+        reading them from the cache.
+
+        Args:
+            cache_key (unicode):
+                The cache key passed to :py:meth:`get_chunks`.
+
+        Returns:
+            dict:
+            A dictionary with the following keys, or ``None`` if the chunks
+            aren't in the cache:
+
+            ``num_chunks`` (int):
+                The number of chunks.
+
+            ``num_segments`` (int):
+                The number of segments the chunks are cached in.
+
+            ``line_counts`` (dict):
+                The number of lines for each type of change (``equal``,
+                ``replace``, ``insert`` and ``delete``).
+
+            ``changed_chunk_indexes`` (list of int):
+                The indexes of chunks that aren't ``equal``.
+
+            ``whitespace_chunk_indexes`` (list of int):
+                The indexes of chunks that only contain whitespace changes.
+        """
+        return self._get_cached_chunks_info(cache_key)
+
+    def get_chunks_in_ranges(self, line_ranges, cache_key=None):
+        """Return the chunks, rendering only the lines in the given ranges.
+
+        This is used to show small parts of a diff, such as the lines a
+        comment was made on, without the cost of rendering the entire file.
+        The files are still diffed in full, so the chunks and their line
+        numbers are the same as those returned by :py:meth:`get_chunks`.
+        However, only the lines within the ranges are syntax-highlighted and
+        have changed regions computed. All other lines only contain their
+        line numbers.
+
+        Each range of lines is syntax-highlighted on its own, so constructs
+        spanning the start or end of a range (such as multi-line strings)
+        may be highlighted differently than in the full diff.
+
+        If a cache key is provided, the chunks are cached for this set of
+        ranges, separately from the chunks for the full diff.
+
+        Args:
+            line_ranges (list of tuple):
+                The ranges of lines to render, as ``(first_line, num_lines)``
+                tuples of virtual line numbers (see
+                :py:func:`~reviewboard.diffviewer.diffutils.
+                get_chunks_in_range`).
+
+            cache_key (unicode, optional):
+                The base cache key for the chunks, as passed to
+                :py:meth:`get_chunks`.
+
+        Returns:
+            list of dict:
+            The chunks.
+        """
+        def _render_chunks():
+            self._line_ranges = line_ranges
+
+            try:
+                chunks = list(self.get_chunks_uncached())
+            finally:
+                self._line_ranges = None
+
+            return self.chunks_info, chunks
+
+        if cache_key:
+            key = '%s-ranges-%s' % (
+                cache_key,
+                ','.join(
+                    '%d:%d' % (first_line, num_lines)
+                    for first_line, num_lines in line_ranges
+                ))
+
+            self.chunks_info, chunks = cache_memoize(key, _render_chunks,
+                                                     large_data=True)
+        else:
+            self.chunks_info, chunks = _render_chunks()
+
+        return chunks
+
+    def _get_segment_cached_chunks(self, cache_key, on_cache_hit=None,
+                                   on_cache_miss=None):
+        """Yield chunks from the cache, generating and caching them if needed.
+
+        The chunks are stored in segments of up to
+        :py:attr:`CACHE_SEGMENT_MAX_LINES` lines, followed by a key
+        containing information on the chunks (see
+        :py:meth:`get_cached_chunks_info`). That key is only stored once all
+        the segments have been stored.
+
+        If a segment has gone missing from the cache by the time it's read,
+        the chunks will be generated again, picking up where the cached
+        chunks left off.
+
+        Args:
+            cache_key (unicode):
+                The base cache key for the chunks.
+
+            on_cache_hit (callable, optional):
+                A function to call with the information on the chunks, if
+                they're in the cache.
+
+            on_cache_miss (callable, optional):
+                A function to call if the chunks need to be generated.
+
+        Yields:
+            dict:
+            Each chunk.
+        """
+        chunks_info = self._get_cached_chunks_info(cache_key)
+        num_yielded = 0
+
+        if chunks_info is not None:
+            self.chunks_info = chunks_info
+
+            if on_cache_hit is not None:
+                on_cache_hit(chunks_info)
+
+            try:
+                for i in range(chunks_info['num_segments']):
+                    segment = self._load_chunks_segment(cache_key, i)
+
+                    for chunk in segment:
+                        yield chunk
+                        num_yielded += 1
+
+                return
+            except _MissingCacheSegmentError:
+                logger.debug('Segment %d of chunks for cache key %s is '
+                             'missing. Regenerating chunks.',
+                             i, cache_key)
+        elif on_cache_miss is not None:
+            on_cache_miss()
+
+        chunks_info = _make_chunks_info()
+        line_counts = chunks_info['line_counts']
+        segment = []
+        segment_num_lines = 0
+        max_lines = self.CACHE_SEGMENT_MAX_LINES
+
+        # Each segment is stored before its chunks are yielded, so that the
+        # caller can't modify the chunks before they're cached.
+        for i, chunk in enumerate(self.get_chunks_uncached()):
+            change = chunk['change']
+            line_counts[change] += chunk['numlines']
+
+            if change != 'equal':
+                chunks_info['changed_chunk_indexes'].append(i)
+
+                if chunk['meta'].get('whitespace_chunk'):
+                    chunks_info['whitespace_chunk_indexes'].append(i)
+
+            segment.append(chunk)
+            segment_num_lines += chunk['numlines']
+
+            if segment_num_lines >= max_lines:
+                self._store_chunks_segment(cache_key,
+                                           chunks_info['num_segments'],
+                                           segment)
+                chunks_info['num_segments'] += 1
+
+                for segment_chunk in segment[num_yielded:]:
+                    yield segment_chunk
+
+                num_yielded = max(num_yielded - len(segment), 0)
+                segment = []
+                segment_num_lines = 0
+
+            chunks_info['num_chunks'] += 1
+
+        if segment:
+            self._store_chunks_segment(cache_key, chunks_info['num_segments'],
+                                       segment)
+            chunks_info['num_segments'] += 1
+
+            for segment_chunk in segment[num_yielded:]:
+                yield segment_chunk
+
+        cache_memoize('%s-segments' % cache_key,
+                      lambda: chunks_info,
+                      force_overwrite=True)
+
+    def _get_cached_chunks_info(self, cache_key):
+        """Return information on the chunks stored in the cache.
+
+        Args:
+            cache_key (unicode):
+                The base cache key for the chunks.
+
+        Returns:
+            dict:
+            Information on the chunks, or ``None`` if the chunks aren't in
+            the cache.
+        """
+        return cache.get(make_cache_key('%s-segments' % cache_key))
+
+    def _load_chunks_segment(self, cache_key, segment_index):
+        """Load a segment of chunks from the cache.
+
+        Args:
+            cache_key (unicode):
+                The base cache key for the chunks.
+
+            segment_index (int):
+                The index of the segment to load.
+
+        Returns:
+            list of dict:
+            The chunks in the segment.
+
+        Raises:
+            _MissingCacheSegmentError:
+                The segment was not in the cache.
+        """
+        def _on_missing():
+            raise _MissingCacheSegmentError
+
+        key = '%s-segment-%d' % (cache_key, segment_index)
+
+        return list(cache_memoize_iter(key, _on_missing))
+
+    def _store_chunks_segment(self, cache_key, segment_index, chunks):
+        """Store a segment of chunks in the cache.
+
+        Args:
+            cache_key (unicode):
+                The base cache key for the chunks.
+
+            segment_index (int):
+                The index of the segment to store.
+
+            chunks (list of dict):
+                The chunks in the segment.
+        """
+        key = '%s-segment-%d' % (cache_key, segment_index)
+
+        for chunk in cache_memoize_iter(key, chunks, force_overwrite=True):
+            pass
+
     def get_chunks_uncached(self):
         """Yield the list of chunks, bypassing the cache."""
         for chunk in self.generate_chunks(self.old, self.new):
@@ -249,13 +571,13 @@ class RawDiffChunkGenerator(object):
         a_num_lines = len(a)
         b_num_lines = len(b)
 
+        markup_a = None
+        markup_b = None
+
         if is_lists:
             markup_a = a
             markup_b = b
-        else:
-            markup_a = None
-            markup_b = None
-
+        elif self._line_ranges is None:
             if self._get_enable_syntax_highlighting(old, new, a, b):
                 # TODO: Try to figure out the right lexer for these files
                 #       once instead of twice.
@@ -285,10 +607,28 @@ class RawDiffChunkGenerator(object):
         self.differ.add_interesting_lines_for_headers(self.orig_filename)
 
         context_num_lines = siteconfig.get("diffviewer_context_num_lines")
-        collapse_threshold = 2 * context_num_lines + 3
 
         line_num = 1
-        opcodes_generator = self.get_opcode_generator()
+        rendered_line_nums = None
+
+        # The opcodes are needed up-front to describe the chunks (see
+        # chunks_info) before any of them are generated.
+        opcodes = list(self.get_opcode_generator())
+        self.chunks_info = self._make_opcodes_chunks_info(
+            opcodes, a_num_lines, b_num_lines, context_num_lines)
+
+        if self._line_ranges is not None:
+            # Only the lines in the requested ranges will be rendered.
+            rendered_line_nums = set()
+
+            for first_line, num_lines in self._line_ranges:
+                rendered_line_nums.update(range(first_line,
+                                                first_line + num_lines))
+
+            if markup_a is None:
+                markup_a, markup_b = self._markup_rendered_lines(
+                    opcodes, sorted(rendered_line_nums), a, b,
+                    self._get_enable_syntax_highlighting(old, new, a, b))
 
         counts = {
             'equal': 0,
@@ -297,14 +637,15 @@ class RawDiffChunkGenerator(object):
             'delete': 0,
         }
 
-        for tag, i1, i2, j1, j2, meta in opcodes_generator:
+        for tag, i1, i2, j1, j2, meta in opcodes:
             old_lines = markup_a[i1:i2]
             new_lines = markup_b[j1:j2]
             num_lines = max(len(old_lines), len(new_lines))
 
-            lines = [
-                self._diff_line(tag, meta, *diff_args)
-                for diff_args in zip_longest(
+            if rendered_line_nums is None:
+                lines = [
+                    self._diff_line(tag, meta, *diff_args)
+                    for diff_args in zip_longest(
                         range(line_num, line_num + num_lines),
                         range(i1 + 1, i2 + 1),
                         range(j1 + 1, j2 + 1),
@@ -312,27 +653,35 @@ class RawDiffChunkGenerator(object):
                         b[j1:j2],
                         old_lines,
                         new_lines)
-            ]
+                ]
+            else:
+                lines = [
+                    self._diff_line(tag, meta, *diff_args)
+                    if diff_args[0] in rendered_line_nums
+                    else [diff_args[0], diff_args[1] or '', '', [],
+                          diff_args[2] or '', '', [], False]
+                    for diff_args in zip_longest(
+                        range(line_num, line_num + num_lines),
+                        range(i1 + 1, i2 + 1),
+                        range(j1 + 1, j2 + 1),
+                        a[i1:i2],
+                        b[j1:j2],
+                        old_lines,
+                        new_lines)
+                ]
 
             counts[tag] += num_lines
 
-            if tag == 'equal' and num_lines > collapse_threshold:
-                last_range_start = num_lines - context_num_lines
-
-                if line_num == 1:
-                    yield self._new_chunk(lines, 0, last_range_start, True)
-                    yield self._new_chunk(lines, last_range_start, num_lines)
-                else:
-                    yield self._new_chunk(lines, 0, context_num_lines)
-
-                    if i2 == a_num_lines and j2 == b_num_lines:
-                        yield self._new_chunk(lines, context_num_lines,
-                                              num_lines, True)
-                    else:
-                        yield self._new_chunk(lines, context_num_lines,
-                                              last_range_start, True)
-                        yield self._new_chunk(lines, last_range_start,
-                                              num_lines)
+            collapsed_ranges = self._get_collapsed_ranges(
+                tag=tag,
+                num_lines=num_lines,
+                is_first=(line_num == 1),
+                is_last=(i2 == a_num_lines and j2 == b_num_lines),
+                context_num_lines=context_num_lines)
+
+            if collapsed_ranges:
+                for start, end, collapsable in collapsed_ranges:
+                    yield self._new_chunk(lines, start, end, collapsable)
             else:
                 yield self._new_chunk(lines, 0, num_lines, False, tag, meta)
 
@@ -340,6 +689,113 @@ class RawDiffChunkGenerator(object):
 
         self.counts = counts
 
+    def _get_collapsed_ranges(self, tag, num_lines, is_first, is_last,
+                              context_num_lines):
+        """Return the ranges of lines to split a collapsable opcode into.
+
+        Long runs of equal lines are split into chunks, so that all but the
+        lines of context around changes can be collapsed.
+
+        Args:
+            tag (unicode):
+                The opcode's tag.
+
+            num_lines (int):
+                The number of lines in the opcode.
+
+            is_first (bool):
+                Whether the opcode starts at the beginning of the files.
+
+            is_last (bool):
+                Whether the opcode ends at the end of the files.
+
+            context_num_lines (int):
+                The number of lines of context to show around changes.
+
+        Returns:
+            list of tuple:
+            A list of ``(start, end, collapsable)`` tuples for each chunk,
+            relative to the opcode's lines, or ``None`` if the opcode isn't
+            split.
+        """
+        if tag != 'equal' or num_lines <= 2 * context_num_lines + 3:
+            return None
+
+        last_range_start = num_lines - context_num_lines
+
+        if is_first:
+            return [
+                (0, last_range_start, True),
+                (last_range_start, num_lines, False),
+            ]
+        elif is_last:
+            return [
+                (0, context_num_lines, False),
+                (context_num_lines, num_lines, True),
+            ]
+        else:
+            return [
+                (0, context_num_lines, False),
+                (context_num_lines, last_range_start, True),
+                (last_range_start, num_lines, False),
+            ]
+
+    def _make_opcodes_chunks_info(self, opcodes, a_num_lines, b_num_lines,
+                                  context_num_lines):
+        """Return information on the chunks that opcodes will generate.
+
+        Args:
+            opcodes (list of tuple):
+                The opcodes for the diff.
+
+            a_num_lines (int):
+                The number of lines in the old file.
+
+            b_num_lines (int):
+                The number of lines in the new file.
+
+            context_num_lines (int):
+                The number of lines of context to show around changes.
+
+        Returns:
+            dict:
+            The information on the chunks. See
+            :py:meth:`get_cached_chunks_info`.
+        """
+        chunks_info = _make_chunks_info()
+        line_counts = chunks_info['line_counts']
+        is_first = True
+        num_chunks = 0
+
+        for tag, i1, i2, j1, j2, meta in opcodes:
+            num_lines = max(i2 - i1, j2 - j1)
+            line_counts[tag] += num_lines
+
+            collapsed_ranges = self._get_collapsed_ranges(
+                tag=tag,
+                num_lines=num_lines,
+                is_first=is_first,
+                is_last=(i2 == a_num_lines and j2 == b_num_lines),
+                context_num_lines=context_num_lines)
+
+            if collapsed_ranges:
+                num_chunks += len(collapsed_ranges)
+            else:
+                if tag != 'equal':
+                    chunks_info['changed_chunk_indexes'].append(num_chunks)
+
+                    if meta.get('whitespace_chunk'):
+                        chunks_info['whitespace_chunk_indexes'].append(
+                            num_chunks)
+
+                num_chunks += 1
+
+            is_first = is_first and num_lines == 0
+
+        chunks_info['num_chunks'] = num_chunks
+
+        return chunks_info
+
     def normalize_source_string(self, s, encoding_list, **kwargs):
         """Normalize a source string of text to use for the diff.
 
@@ -449,9 +905,13 @@ class RawDiffChunkGenerator(object):
         should be highlighted.
 
         This defaults to simply wrapping get_line_changed_regions() from
-        diffutils. Subclasses can override to provide custom behavior.
+        diffutils, using the generator's :py:attr:`intraline_diff_algorithm`.
+        Subclasses can override to provide custom behavior, such as a
+        different algorithm.
         """
-        return get_line_changed_regions(old_line, new_line)
+        return get_line_changed_regions(
+            old_line, new_line,
+            algorithm=self.intraline_diff_algorithm)
 
     def _get_enable_syntax_highlighting(self, old, new, a, b):
         """Returns whether or not we'll be enabling syntax highlighting.
@@ -474,8 +934,10 @@ class RawDiffChunkGenerator(object):
 
         # Very long files, especially XML files, can take a long time to
         # highlight. For files over a certain size, don't highlight them.
-        if (len(old) > self.STYLED_MAX_LIMIT_BYTES or
-                len(new) > self.STYLED_MAX_LIMIT_BYTES):
+        max_bytes = siteconfig.get('diffviewer_syntax_highlighting_max_bytes',
+                                   self.STYLED_MAX_LIMIT_BYTES)
+
+        if max_bytes and (len(old) > max_bytes or len(new) > max_bytes):
             return False
 
         # Don't style the file if we have any *really* long lines.
@@ -488,6 +950,118 @@ class RawDiffChunkGenerator(object):
 
         return True
 
+    def _markup_rendered_lines(self, opcodes, rendered_line_nums, a, b,
+                               enable_syntax_highlighting):
+        """Return the markup for the lines being rendered.
+
+        This is used by :py:meth:`get_chunks_in_ranges` to mark up only the
+        lines of each file that fall within the requested ranges. Each run of
+        consecutive lines is syntax-highlighted separately.
+
+        Args:
+            opcodes (list of tuple):
+                The opcodes for the diff.
+
+            rendered_line_nums (list of int):
+                The sorted virtual line numbers being rendered.
+
+            a (list of unicode):
+                The lines of the original file.
+
+            b (list of unicode):
+                The lines of the modified file.
+
+            enable_syntax_highlighting (bool):
+                Whether to syntax-highlight the lines.
+
+        Returns:
+            tuple:
+            A tuple of ``(markup_a, markup_b)``. Each is a list with an entry
+            for each line in the file, which will be ``None`` for any line
+            that isn't being rendered.
+        """
+        a_indexes = []
+        b_indexes = []
+        line_num = 1
+
+        for tag, i1, i2, j1, j2, meta in opcodes:
+            num_lines = max(i2 - i1, j2 - j1)
+
+            for n in range(bisect_left(rendered_line_nums, line_num),
+                           bisect_left(rendered_line_nums,
+                                       line_num + num_lines)):
+                offset = rendered_line_nums[n] - line_num
+
+                if offset < i2 - i1:
+                    a_indexes.append(i1 + offset)
+
+                if offset < j2 - j1:
+                    b_indexes.append(j1 + offset)
+
+            line_num += num_lines
+
+        return (
+            self._markup_lines(a, a_indexes, self.orig_filename,
+                               enable_syntax_highlighting),
+            self._markup_lines(b, b_indexes, self.modified_filename,
+                               enable_syntax_highlighting),
+        )
+
+    def _markup_lines(self, lines, indexes, filename,
+                      enable_syntax_highlighting):
+        """Return the markup for some of the lines in a file.
+
+        Args:
+            lines (list of unicode):
+                The lines in the file.
+
+            indexes (list of int):
+                The sorted indexes of the lines to mark up.
+
+            filename (unicode):
+                The name of the file, used for syntax highlighting.
+
+            enable_syntax_highlighting (bool):
+                Whether to syntax-highlight the lines.
+
+        Returns:
+            list of unicode:
+            A list with an entry for each line in the file, which will be
+            ``None`` for any line that wasn't marked up.
+        """
+        markup = [None] * len(lines)
+        filename = self.normalize_path_for_display(filename)
+        i = 0
+
+        while i < len(indexes):
+            # Find the next run of consecutive lines.
+            start = indexes[i]
+            end = start + 1
+            i += 1
+
+            while i < len(indexes) and indexes[i] == end:
+                end += 1
+                i += 1
+
+            run_markup = None
+
+            if enable_syntax_highlighting:
+                # These lines are only part of the file, and are cached
+                # along with the chunks for the ranges being rendered, so
+                # they aren't stored in the highlighted file cache.
+                run_markup = self._apply_pygments(
+                    ''.join('%s\n' % line for line in lines[start:end]),
+                    filename,
+                    use_cache=False)
+
+            if run_markup and len(run_markup) >= end - start:
+                markup[start:end] = run_markup[:end - start]
+            else:
+                markup[start:end] = [escape(line)
+                                     for line in lines[start:end]]
+
+        return markup
+
     def _diff_line(self, tag, meta, v_line_num, old_line_num, new_line_num,
                    old_line, new_line, old_markup, new_markup):
         """Creates a single line in the diff viewer.
@@ -797,12 +1371,17 @@ class RawDiffChunkGenerator(object):
         else:
             self._last_header_index[0] = last_index
 
-    def _apply_pygments(self, data, filename):
+    def _apply_pygments(self, data, filename, use_cache=True):
         """Apply Pygments syntax-highlighting to a file's contents.
 
         This will only apply syntax highlighting if a lexer is available and
         the file extension is not blacklisted.
 
+        The highlighted lines are cached based on the file's contents and the
+        lexer, separately from any chunks, so that a file shared between
+        diffs (such as the original version of a file modified in several
+        revisions of a diff) is only highlighted once.
+
         Args:
             data (unicode):
                 The data to syntax highlight.
@@ -811,6 +1390,11 @@ class RawDiffChunkGenerator(object):
                 The name of the file. This is used to help determine a
                 suitable lexer.
 
+            use_cache (bool, optional):
+                Whether to cache the highlighted lines. If ``False``, the
+                lines will always be highlighted, and won't be counted in
+                the highlighting cache statistics.
+
         Returns:
             list of unicode:
             A list of lines, all syntax-highlighted, if a lexer is found.
@@ -829,8 +1413,34 @@ class RawDiffChunkGenerator(object):
 
         lexer.add_filter('codetagify')
 
-        return split_line_endings(
-            highlight(data, lexer, NoWrapperHtmlFormatter()))
+        if not use_cache:
+            return split_line_endings(
+                highlight(data, lexer, NoWrapperHtmlFormatter()))
+
+        lexer_cls = type(lexer)
+        key = 'diff-highlighted-lines-%s-%s.%s-%s' % (
+            pygments.__version__,
+            lexer_cls.__module__,
+            lexer_cls.__name__,
+            hashlib.sha256(data.encode('utf-8')).hexdigest())
+        state = {
+            'cache_hit': True,
+        }
+
+        def _highlight_lines():
+            state['cache_hit'] = False
+
+            return split_line_endings(
+                highlight(data, lexer, NoWrapperHtmlFormatter()))
+
+        lines = cache_memoize(key, _highlight_lines, large_data=True)
+
+        if state['cache_hit']:
+            record_cache_hit('diffviewer-highlighting')
+        else:
+            record_cache_miss('diffviewer-highlighting')
+
+        return lines
 
 
 class DiffChunkGenerator(RawDiffChunkGenerator):
@@ -913,6 +1523,7 @@ class DiffChunkGenerator(RawDiffChunkGenerator):
         self.repository = filediff.get_repository()
         self.tool = self.repository.get_scmtool()
         self.base_filediff = base_filediff
+        self._filediff_files = None
 
         if base_filediff:
             orig_filename = base_filediff.source_file
@@ -946,20 +1557,108 @@ class DiffChunkGenerator(RawDiffChunkGenerator):
         else:
             key += 'interdiff-%s-none' % self.filediff.pk
 
-        key += '-%s' % get_language()
+        key += '-%s-%s' % (self.intraline_diff_algorithm, get_language())
+
+        return key
+
+    def make_content_cache_key(self):
+        """Create a content-addressed cache key for any generated chunks.
+
+        Unlike :py:meth:`make_cache_key`, this is based on the checksums of
+        the original and patched files, rather than the IDs of the
+        FileDiffs. Identical changes to a file, whether re-uploaded in a new
+        revision of a diff or posted to another review request, will share
+        the same key, along with the same cached chunks.
+
+        This is only available for a FileDiff shown on its own (or reverted)
+        once its checksums have been computed. See
+        :py:meth:`_can_cache_by_content`.
+
+        Returns:
+            unicode:
+            The cache key, or ``None`` if content-addressed caching can't be
+            used for these chunks.
+        """
+        filediff = self.filediff
+
+        if (not self._can_cache_by_content() or
+            filediff.orig_sha256 is None or
+            filediff.patched_sha256 is None):
+            return None
+
+        # Anything else that affects how the files are decoded, highlighted
+        # and diffed.
+        file_info = '\0'.join([
+            self.orig_filename,
+            self.modified_filename,
+            self.tool.name,
+            self.intraline_diff_algorithm,
+        ] + get_filediff_encodings(filediff, self.encoding_list))
+
+        key = 'diff-sidebyside-content-'
+
+        if self.enable_syntax_highlighting:
+            key += 'hl-'
+
+        if self.force_interdiff:
+            key += 'reverted-'
+
+        key += '%s-%s-%s-%s-%s' % (
+            self.diff_compat,
+            filediff.orig_sha256,
+            filediff.patched_sha256,
+            force_text(hashlib.sha1(file_info.encode('utf-8')).hexdigest()),
+            get_language())
 
         return key
 
     def get_opcode_generator(self):
         """Return the DiffOpcodeGenerator used to generate diff opcodes."""
-        diff = self.filediff.diff
-
         if self.interfilediff:
-            interdiff = self.interfilediff.diff
+            return get_diff_opcode_generator(
+                self.differ,
+                interdiff_ranges=self._get_interdiff_ranges())
+        else:
+            return get_diff_opcode_generator(self.differ, self.filediff.diff,
+                                             None)
+
+    def _get_interdiff_ranges(self):
+        """Return the ranges used to filter the opcodes for an interdiff.
+
+        The ranges only depend on the two uploaded diffs, so they're cached
+        for the pair of FileDiffs, letting them be reused when the interdiff
+        is viewed again with different rendering options. The diffs are only
+        loaded if the ranges aren't already in the cache.
+
+        Returns:
+            tuple:
+            The ranges, as returned by
+            :py:func:`~reviewboard.diffviewer.processors.
+            get_interdiff_ranges`.
+        """
+        key = 'diffviewer-interdiff-ranges-%s-%s-%s-%s' % (
+            self.filediff.diffset_id,
+            self.interfilediff.diffset_id,
+            self.filediff.pk,
+            self.interfilediff.pk)
+        state = {
+            'cache_hit': True,
+        }
+
+        def _compute_ranges():
+            state['cache_hit'] = False
+
+            return get_interdiff_ranges(self.filediff.diff,
+                                        self.interfilediff.diff)
+
+        ranges = cache_memoize(key, _compute_ranges)
+
+        if state['cache_hit']:
+            record_cache_hit('diffviewer-interdiffs')
         else:
-            interdiff = None
+            record_cache_miss('diffviewer-interdiffs')
 
-        return get_diff_opcode_generator(self.differ, diff, interdiff)
+        return ranges
 
     def get_chunks(self):
         """Return the chunks for the given diff information.
@@ -972,21 +1671,161 @@ class DiffChunkGenerator(RawDiffChunkGenerator):
         yielded. Otherwise, new chunks will be generated, stored in cache,
         and yielded.
         """
-        counts = self.filediff.get_line_counts()
-
-        if (self.filediff.binary or
-            self.filediff.source_revision == '' or
-            ((self.filediff.is_new or self.filediff.deleted or
-              self.filediff.moved or self.filediff.copied) and
-             counts['raw_insert_count'] == 0 and
-             counts['raw_delete_count'] == 0)):
+        if not self._has_chunks():
+            self.chunks_info = _make_chunks_info()
             return
 
-        cache_key = self.make_cache_key()
+        cache_key, by_content = self._get_cache_key()
 
-        for chunk in super(DiffChunkGenerator, self).get_chunks(cache_key):
+        if by_content:
+            chunks = self._get_content_cached_chunks(cache_key)
+        else:
+            chunks = super(DiffChunkGenerator, self).get_chunks(cache_key)
+
+        for chunk in chunks:
             yield chunk
 
+    def get_cached_chunks_info(self):
+        """Return information on the chunks stored in the cache.
+
+        See :py:meth:`RawDiffChunkGenerator.get_cached_chunks_info` for the
+        information returned.
+
+        Returns:
+            dict:
+            Information on the chunks, or ``None`` if the chunks aren't in
+            the cache.
+        """
+        if not self._has_chunks():
+            return _make_chunks_info()
+
+        cache_key = None
+
+        if self._can_cache_by_content():
+            cache_key = self.make_content_cache_key()
+
+        if cache_key is None:
+            # Either the chunks are cached by ID, or the file checksums
+            # aren't known yet, in which case the chunks may still be cached
+            # by ID from before the checksums were available.
+            cache_key = self.make_cache_key()
+
+        return self._get_cached_chunks_info(cache_key)
+
+    def get_chunks_in_ranges(self, line_ranges):
+        """Return the chunks, rendering only the lines in the given ranges.
+
+        See :py:meth:`RawDiffChunkGenerator.get_chunks_in_ranges` for
+        details. The chunks are cached for this set of ranges, under the
+        same base cache key used for the chunks of the full diff.
+
+        Args:
+            line_ranges (list of tuple):
+                The ranges of lines to render, as ``(first_line, num_lines)``
+                tuples of virtual line numbers.
+
+        Returns:
+            list of dict:
+            The chunks.
+        """
+        if not self._has_chunks():
+            self.chunks_info = _make_chunks_info()
+            return []
+
+        return super(DiffChunkGenerator, self).get_chunks_in_ranges(
+            line_ranges, cache_key=self._get_cache_key()[0])
+
+    def _get_cache_key(self):
+        """Return the cache key for the chunks.
+
+        Chunks are cached by content when possible, which requires the
+        checksums of the files up-front. If they're not yet known (such as
+        for FileDiffs created by older versions of Review Board), any chunks
+        already cached by ID (see :py:meth:`make_cache_key`) are used
+        instead. Otherwise, the files will be loaded to compute the
+        checksums, and reused if the chunks need to be generated.
+
+        Returns:
+            tuple:
+            A 2-tuple of the cache key and whether it's a content cache key
+            from :py:meth:`make_content_cache_key`.
+        """
+        if not self._can_cache_by_content():
+            return self.make_cache_key(), False
+
+        filediff = self.filediff
+
+        if filediff.orig_sha256 is None or filediff.patched_sha256 is None:
+            cache_key = self.make_cache_key()
+
+            if self._get_cached_chunks_info(cache_key) is not None:
+                return cache_key, False
+
+            old, new = self._get_filediff_files()
+            self._set_filediff_checksums(filediff, old, new)
+
+        return self.make_content_cache_key(), True
+
+    def _has_chunks(self):
+        """Return whether there may be chunks to generate for the file.
+
+        There are no chunks for binary files, added or deleted 0-length
+        files, or files that have moved with no additional changes.
+
+        Returns:
+            bool:
+            ``True`` if chunks may be generated for the file.
+        """
+        filediff = self.filediff
+        counts = filediff.get_line_counts()
+
+        return not (
+            filediff.binary or
+            filediff.source_revision == '' or
+            ((filediff.is_new or filediff.deleted or
+              filediff.moved or filediff.copied) and
+             counts['raw_insert_count'] == 0 and
+             counts['raw_delete_count'] == 0))
+
+    def _get_content_cached_chunks(self, cache_key):
+        """Yield chunks from the content-addressed cache.
+
+        The chunks will be generated and cached if they're not already in the
+        cache. Hits and misses are recorded for the cache statistics.
+
+        If the chunks came from the cache (having possibly been generated for
+        another FileDiff), the line counts for this FileDiff will be set from
+        them, if needed.
+
+        Args:
+            cache_key (unicode):
+                The key from :py:meth:`make_content_cache_key`.
+
+        Yields:
+            dict:
+            Each chunk.
+        """
+        def _on_cache_hit(chunks_info):
+            record_cache_hit('diffviewer-chunks')
+
+            filediff = self.filediff
+
+            if (not self.force_interdiff and
+                filediff.extra_data.get('total_line_count') is None):
+                counts = chunks_info['line_counts']
+
+                filediff.set_line_counts(
+                    insert_count=counts['insert'],
+                    delete_count=counts['delete'],
+                    replace_count=counts['replace'],
+                    equal_count=counts['equal'],
+                    total_line_count=sum(six.itervalues(counts)))
+
+        return self._get_segment_cached_chunks(
+            cache_key,
+            on_cache_hit=_on_cache_hit,
+            on_cache_miss=lambda: record_cache_miss('diffviewer-chunks'))
+
     def get_chunks_uncached(self):
         """Yield the list of chunks, bypassing the cache."""
         base_filediff = self.base_filediff
@@ -994,11 +1833,7 @@ class DiffChunkGenerator(RawDiffChunkGenerator):
         interfilediff = self.interfilediff
         request = self.request
 
-        old = get_original_file(filediff=filediff,
-                                request=request)
-        new = get_patched_file(source_data=old,
-                               filediff=filediff,
-                               request=request)
+        old, new = self._get_filediff_files()
 
         old_encoding_list = get_filediff_encodings(filediff)
         new_encoding_list = old_encoding_list
@@ -1045,22 +1880,7 @@ class DiffChunkGenerator(RawDiffChunkGenerator):
                                         request=request)
                 old_encoding_list = get_filediff_encodings(ancestor_filediff)
 
-        # Check whether we have a SHA256 checksum first. They were introduced
-        # in Review Board 4.0, long after SHA1 checksums. If we already have
-        # a SHA256 checksum, then we'll also have a SHA1 checksum, but the
-        # inverse is not true.
-        if filediff.orig_sha256 is None:
-            if filediff.orig_sha1 is None:
-                filediff.extra_data.update({
-                    'orig_sha1': self._get_sha1(old),
-                    'patched_sha1': self._get_sha1(new),
-                })
-
-            filediff.extra_data.update({
-                'orig_sha256': self._get_sha256(old),
-                'patched_sha256': self._get_sha256(new),
-            })
-            filediff.save(update_fields=['extra_data'])
+        self._set_filediff_checksums(filediff, old, new)
 
         if interfilediff:
             old = new
@@ -1073,22 +1893,7 @@ class DiffChunkGenerator(RawDiffChunkGenerator):
                                    request=request)
             new_encoding_list = get_filediff_encodings(interfilediff)
 
-            # Check whether we have a SHA256 checksum first. They were
-            # introduced in Review Board 4.0, long after SHA1 checksums. If we
-            # already have a SHA256 checksum, then we'll also have a SHA1
-            # checksum, but the inverse is not true.
-            if interfilediff.orig_sha256 is None:
-                if interfilediff.orig_sha1 is None:
-                    interfilediff.extra_data.update({
-                        'orig_sha1': self._get_sha1(interdiff_orig),
-                        'patched_sha1': self._get_sha1(new),
-                    })
-
-                interfilediff.extra_data.update({
-                    'orig_sha256': self._get_sha256(interdiff_orig),
-                    'patched_sha256': self._get_sha256(new),
-                })
-                interfilediff.save(update_fields=['extra_data'])
+            self._set_filediff_checksums(interfilediff, interdiff_orig, new)
         elif self.force_interdiff:
             # Basically, revert the change.
             old, new = new, old
@@ -1134,6 +1939,76 @@ class DiffChunkGenerator(RawDiffChunkGenerator):
     def normalize_path_for_display(self, filename):
         return self.tool.normalize_path_for_display(filename)
 
+    def _can_cache_by_content(self):
+        """Return whether chunks can be cached by the content of the files.
+
+        Interdiffs also depend on the contents of the diffs, and the
+        original file of a FileDiff in a commit series may come from another
+        FileDiff (which isn't reflected in its checksums), so those are
+        always cached by the IDs of the FileDiffs.
+
+        Returns:
+            bool:
+            Whether :py:meth:`make_content_cache_key` can be used.
+        """
+        return (self.interfilediff is None and
+                self.base_filediff is None and
+                self.filediff.commit_id is None)
+
+    def _get_filediff_files(self):
+        """Return the original and patched files for the FileDiff.
+
+        The files are fetched once per chunk generator.
+
+        Returns:
+            tuple:
+            A 2-tuple of:
+
+            1. The original file (:py:class:`bytes`).
+            2. The patched file (:py:class:`bytes`).
+        """
+        if self._filediff_files is None:
+            old = get_original_file(filediff=self.filediff,
+                                    request=self.request)
+            new = get_patched_file(source_data=old,
+                                   filediff=self.filediff,
+                                   request=self.request)
+            self._filediff_files = (old, new)
+
+        return self._filediff_files
+
+    def _set_filediff_checksums(self, filediff, orig, patched):
+        """Store checksums of the original and patched files on a FileDiff.
+
+        Nothing will be stored if the checksums are already known.
+
+        Args:
+            filediff (reviewboard.diffviewer.models.filediff.FileDiff):
+                The FileDiff to store checksums on.
+
+            orig (bytes):
+                The original file.
+
+            patched (bytes):
+                The patched file.
+        """
+        # Check whether we have a SHA256 checksum first. They were introduced
+        # in Review Board 4.0, long after SHA1 checksums. If we already have
+        # a SHA256 checksum, then we'll also have a SHA1 checksum, but the
+        # inverse is not true.
+        if filediff.orig_sha256 is None:
+            if filediff.orig_sha1 is None:
+                filediff.extra_data.update({
+                    'orig_sha1': self._get_sha1(orig),
+                    'patched_sha1': self._get_sha1(patched),
+                })
+
+            filediff.extra_data.update({
+                'orig_sha256': self._get_sha256(orig),
+                'patched_sha256': self._get_sha256(patched),
+            })
+            filediff.save(update_fields=['extra_data'])
+
     def _get_sha1(self, content):
         """Return a SHA1 hash for the provided content.
 
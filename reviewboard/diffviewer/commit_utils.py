@@ -3,25 +3,240 @@
 from __future__ import unicode_literals
 
 import base64
+import bisect
 import json
+import struct
 from itertools import chain
 
-from django.utils.encoding import force_bytes
-from django.utils.six.moves import zip
+from django.utils import six
+from django.utils.encoding import force_bytes, force_text
+from django.utils.six.moves import range, zip
 
 from reviewboard.scmtools.core import PRE_CREATION, UNKNOWN
 
 
+class ValidationHistory(dict):
+    """Validation metadata for a commit series, indexed for fast lookups.
+
+    This is a dictionary of validation info, as described in
+    :py:func:`update_validation_info`, that can also efficiently answer
+    whether a file exists at a point in the commit history.
+
+    Each commit's added, modified and removed files are indexed by path the
+    first time the commit is looked at, and results of looking up a file are
+    remembered for every commit walked through to find it. This keeps
+    validating long commit series from repeatedly walking the history and
+    scanning every commit's files for every file in every commit.
+
+    When created by :py:func:`deserialize_validation_info`, the original
+    JSON is kept, so that :py:func:`serialize_validation_info` only needs to
+    encode commits added afterward.
+
+    Entries are expected to be added for new commits, but not modified.
+    Entries should only be changed using item assignment, deletion or
+    :py:meth:`update`, which keep the indexes and original JSON up to date.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Initialize the history.
+
+        Args:
+            *args (tuple):
+                Positional arguments to pass to :py:class:`dict`.
+
+            **kwargs (dict):
+                Keyword arguments to pass to :py:class:`dict`.
+        """
+        super(ValidationHistory, self).__init__(*args, **kwargs)
+
+        self._raw_json = None
+        self._raw_keys = None
+        self._reset_indexes()
+
+    def get_file_exists(self, parent_id, path, revision):
+        """Return whether a file exists, according to the history.
+
+        Args:
+            parent_id (unicode):
+                The ID of the commit to start looking from.
+
+            path (unicode):
+                The file path.
+
+            revision (unicode):
+                The revision of the file, or
+                :py:data:`~reviewboard.scmtools.core.UNKNOWN`.
+
+        Returns:
+            bool:
+            Whether the file exists. This will be ``None`` if the history does
+            not contain the file, in which case the repository must be
+            checked.
+        """
+        # Revisions may be Revision instances (such as UNKNOWN), which can't
+        # be used as keys.
+        revision = force_text(revision)
+        visited = []
+        commit_id = parent_id
+        result = None
+
+        while commit_id in self:
+            key = (commit_id, path, revision)
+
+            if key in self._results:
+                result = self._results[key]
+                break
+
+            if key in visited:
+                # The parent IDs form a cycle.
+                break
+
+            visited.append(key)
+            removed, revisions = self._get_commit_index(commit_id)
+
+            if revision == UNKNOWN and path in removed:
+                result = False
+                break
+
+            if (path in revisions and
+                (revision == UNKNOWN or revision in revisions[path])):
+                result = True
+                break
+
+            commit_id = self[commit_id]['parent_id']
+
+        for key in visited:
+            self._results[key] = result
+
+        return result
+
+    def serialize(self):
+        """Serialize the history to JSON.
+
+        If the history was deserialized and commits have only been added
+        since, the original JSON is reused, and only the new commits are
+        encoded.
+
+        Returns:
+            bytes:
+            The JSON-encoded history.
+        """
+        raw_json = self._raw_json
+
+        if raw_json is None or not self._raw_keys.issubset(self):
+            return json.dumps(self).encode('utf-8')
+
+        new_entries = [
+            '%s: %s' % (json.dumps(commit_id), json.dumps(entry))
+            for commit_id, entry in six.iteritems(self)
+            if commit_id not in self._raw_keys
+        ]
+
+        if not new_entries:
+            return raw_json
+
+        new_json = ', '.join(new_entries).encode('utf-8')
+
+        if self._raw_keys:
+            return b'%s, %s}' % (raw_json[:-1], new_json)
+        else:
+            return b'{%s}' % new_json
+
+    def __setitem__(self, commit_id, entry):
+        """Set the entry for a commit.
+
+        Args:
+            commit_id (unicode):
+                The ID of the commit.
+
+            entry (dict):
+                The validation info for the commit.
+        """
+        if commit_id in self:
+            self._raw_json = None
+
+        super(ValidationHistory, self).__setitem__(commit_id, entry)
+        self._reset_indexes()
+
+    def __delitem__(self, commit_id):
+        """Remove the entry for a commit.
+
+        Args:
+            commit_id (unicode):
+                The ID of the commit.
+        """
+        super(ValidationHistory, self).__delitem__(commit_id)
+        self._raw_json = None
+        self._reset_indexes()
+
+    def update(self, *args, **kwargs):
+        """Update the history with entries from another dictionary.
+
+        Args:
+            *args (tuple):
+                Positional arguments to pass to :py:meth:`dict.update`.
+
+            **kwargs (dict):
+                Keyword arguments to pass to :py:meth:`dict.update`.
+        """
+        for commit_id, entry in six.iteritems(dict(*args, **kwargs)):
+            self[commit_id] = entry
+
+    def _reset_indexes(self):
+        """Reset the indexes of commits and file lookups."""
+        self._commit_indexes = {}
+        self._results = {}
+
+    def _get_commit_index(self, commit_id):
+        """Return the index of files changed in a commit.
+
+        Args:
+            commit_id (unicode):
+                The ID of the commit.
+
+        Returns:
+            tuple:
+            A 2-tuple of:
+
+            1. The set of removed paths.
+            2. A dictionary mapping each added or modified path to the set
+               of its revisions.
+        """
+        try:
+            return self._commit_indexes[commit_id]
+        except KeyError:
+            pass
+
+        tree = self[commit_id]['tree']
+        removed = {
+            removed_info['filename']
+            for removed_info in tree['removed']
+        }
+        revisions = {}
+
+        for added_info in chain(tree['added'], tree['modified']):
+            revisions.setdefault(added_info['filename'], set()).add(
+                force_text(added_info['revision']))
+
+        index = (removed, revisions)
+        self._commit_indexes[commit_id] = index
+
+        return index
+
+
 def get_file_exists_in_history(validation_info, repository, parent_id, path,
                                revision, base_commit_id=None, request=None):
     """Return whether or not the file exists, given the validation information.
 
     Args:
-        validation_info (dict):
+        validation_info (dict or ValidationHistory):
             Validation metadata generated by the
             :py:class:`~reviewboard.webapi.resources.validate_diffcommit.
             ValidateDiffCommitResource`.
 
+            When checking many files, this should be a
+            :py:class:`ValidationHistory`, so that lookups can be shared.
+
         repository (reviewboard.scmtools.models.Repository):
             The repository.
 
@@ -44,22 +259,13 @@ def get_file_exists_in_history(validation_info, repository, parent_id, path,
         bool:
         Whether or not the file exists.
     """
-    while parent_id in validation_info:
-        entry = validation_info[parent_id]
-        tree = entry['tree']
+    if not isinstance(validation_info, ValidationHistory):
+        validation_info = ValidationHistory(validation_info)
 
-        if revision == UNKNOWN:
-            for removed_info in tree['removed']:
-                if removed_info['filename'] == path:
-                    return False
+    exists = validation_info.get_file_exists(parent_id, path, revision)
 
-        for added_info in chain(tree['added'], tree['modified']):
-            if (added_info['filename'] == path and
-                (revision == UNKNOWN or
-                 added_info['revision'] == revision)):
-                return True
-
-        parent_id = entry['parent_id']
+    if exists is not None:
+        return exists
 
     # We did not find an entry in our validation info, so we need to fall back
     # to checking the repository.
@@ -68,6 +274,263 @@ def get_file_exists_in_history(validation_info, repository, parent_id, path,
                                       request=request)
 
 
+class FileDiffAncestorIndex(object):
+    """An index of the ancestors of FileDiffs in a commit series.
+
+    Each :py:class:`~reviewboard.diffviewer.models.filediff.FileDiff` in a
+    commit series has at most one direct ancestor: the most recent FileDiff
+    in an earlier commit that produced the file it modifies (or, for a newly
+    added file, that deleted a file at that path). This index stores that
+    link, along with the commit ID and deleted state of each FileDiff, so the
+    full ancestry of any FileDiff can be found without loading or walking
+    the other FileDiffs in the series.
+
+    The index is stored in the
+    :py:class:`~reviewboard.diffviewer.models.diffset.DiffSet` as a packed
+    array of fixed-size entries (see :py:meth:`serialize`).
+    """
+
+    _ENTRY = struct.Struct(str('<IIIB'))
+
+    @classmethod
+    def build(cls, filediffs):
+        """Build an index for the FileDiffs of a commit series.
+
+        Args:
+            filediffs (list of reviewboard.diffviewer.models.filediff.
+                       FileDiff):
+                The per-commit FileDiffs in the series. Any FileDiffs from
+                the cumulative diff will be ignored.
+
+        Returns:
+            FileDiffAncestorIndex:
+            The new index.
+        """
+        filediffs = sorted(
+            (
+                filediff
+                for filediff in filediffs
+                if filediff.commit_id is not None
+            ),
+            key=lambda filediff: (filediff.commit_id, filediff.pk))
+
+        # Map each resulting file to the FileDiffs that produced it, by
+        # filename and revision, and map each filename to the FileDiffs that
+        # deleted it. Each is stored as a list of commit IDs (in ascending
+        # order) and a list of the positions of the matching FileDiffs. As
+        # with FileDiff._compute_ancestors(), only the last of several
+        # matching FileDiffs in a commit is considered.
+        by_dest = {}
+        deleted_by_dest_file = {}
+
+        def _add(commits_info, commit_id, i):
+            commit_ids, positions = commits_info
+
+            if commit_ids and commit_ids[-1] == commit_id:
+                positions[-1] = i
+            else:
+                commit_ids.append(commit_id)
+                positions.append(i)
+
+        for i, filediff in enumerate(filediffs):
+            _add(by_dest.setdefault((filediff.dest_file,
+                                     filediff.dest_detail),
+                                    ([], [])),
+                 filediff.commit_id, i)
+
+            if filediff.deleted:
+                _add(deleted_by_dest_file.setdefault(filediff.dest_file,
+                                                     ([], [])),
+                     filediff.commit_id, i)
+
+        def _find_prev(commits_info, commit_id):
+            # Find the position of the FileDiff in the most recent commit
+            # before commit_id.
+            if commits_info is None:
+                return None
+
+            commit_ids, positions = commits_info
+            j = bisect.bisect_left(commit_ids, commit_id)
+
+            if j == 0:
+                return None
+
+            return positions[j - 1]
+
+        entries = []
+
+        for filediff in filediffs:
+            if filediff.is_new:
+                prev = _find_prev(
+                    deleted_by_dest_file.get(filediff.source_file),
+                    filediff.commit_id)
+            else:
+                prev = _find_prev(
+                    by_dest.get((filediff.source_file,
+                                 filediff.source_revision)),
+                    filediff.commit_id)
+
+            entries.append((filediff.pk, prev, filediff.commit_id,
+                            filediff.deleted))
+
+        return cls(entries)
+
+    @classmethod
+    def deserialize(cls, data):
+        """Deserialize an index.
+
+        Args:
+            data (unicode):
+                The serialized index, as returned by :py:meth:`serialize`.
+
+        Returns:
+            FileDiffAncestorIndex:
+            The deserialized index.
+        """
+        packed = base64.b64decode(force_bytes(data))
+        entry_size = cls._ENTRY.size
+        entries = []
+
+        for offset in range(0, len(packed), entry_size):
+            filediff_id, parent, commit_id, deleted = \
+                cls._ENTRY.unpack_from(packed, offset)
+
+            if parent:
+                parent -= 1
+            else:
+                parent = None
+
+            entries.append((filediff_id, parent, commit_id, bool(deleted)))
+
+        return cls(entries)
+
+    def __init__(self, entries):
+        """Initialize the index.
+
+        Args:
+            entries (list of tuple):
+                The entries in the index. Each is a 4-tuple of the FileDiff
+                ID, the position of its direct ancestor's entry (or
+                ``None``), its commit ID, and whether the file was deleted.
+        """
+        self._entries = entries
+        self._positions = {
+            entry[0]: i
+            for i, entry in enumerate(entries)
+        }
+
+    def serialize(self):
+        """Serialize the index for storage.
+
+        Each entry is packed as a 32-bit FileDiff ID, a 32-bit position of
+        the direct ancestor's entry plus one (or 0 if there isn't one), a
+        32-bit commit ID, and a byte for the deleted state.
+
+        Returns:
+            unicode:
+            The base64-encoded packed index.
+        """
+        pack = self._ENTRY.pack
+
+        return force_text(base64.b64encode(b''.join(
+            pack(filediff_id,
+                 0 if parent is None else parent + 1,
+                 commit_id,
+                 deleted)
+            for filediff_id, parent, commit_id, deleted in self._entries
+        )))
+
+    def __contains__(self, filediff_id):
+        """Return whether a FileDiff is in the index.
+
+        Args:
+            filediff_id (int):
+                The ID of the FileDiff.
+
+        Returns:
+            bool:
+            Whether the FileDiff is in the index.
+        """
+        return filediff_id in self._positions
+
+    def get_ancestor_ids(self, filediff_id):
+        """Return the IDs of the ancestors of a FileDiff.
+
+        The ancestors are split in the same way as
+        :py:meth:`FileDiff.get_ancestors()
+        <reviewboard.diffviewer.models.filediff.FileDiff.get_ancestors>`, at
+        the most recent ancestor that deleted the file.
+
+        Args:
+            filediff_id (int):
+                The ID of the FileDiff.
+
+        Returns:
+            tuple:
+            A 2-tuple of:
+
+            * The compliment of the minimal ancestors (py:class:`list` of
+              :py:class:`int`).
+            * The list of minimal ancestors (py:class:`list` of
+              :py:class:`int`).
+
+            Both are in application order.
+
+        Raises:
+            KeyError:
+                The FileDiff is not in the index.
+        """
+        entries = self._entries
+        ancestor_ids = []
+        split = 0
+        parent = entries[self._positions[filediff_id]][1]
+
+        while parent is not None:
+            ancestor_id, parent, commit_id, deleted = entries[parent]
+            ancestor_ids.append(ancestor_id)
+
+            if deleted and not split:
+                split = len(ancestor_ids)
+
+        ancestor_ids.reverse()
+        split = len(ancestor_ids) - split + 1 if split else 0
+
+        return ancestor_ids[:split], ancestor_ids[split:]
+
+    def get_base_filediff_id(self, filediff_id, base_commit_id):
+        """Return the ID of the base FileDiff of a FileDiff in a commit range.
+
+        This is the most recent ancestor of the FileDiff in a commit that
+        equals or precedes ``base_commit_id``.
+
+        Args:
+            filediff_id (int):
+                The ID of the FileDiff.
+
+            base_commit_id (int):
+                The ID of the newest commit that the base FileDiff can be
+                associated with.
+
+        Returns:
+            int:
+            The ID of the base FileDiff, or ``None`` if there isn't one.
+
+        Raises:
+            KeyError:
+                The FileDiff is not in the index.
+        """
+        entries = self._entries
+        parent = entries[self._positions[filediff_id]][1]
+
+        while parent is not None:
+            ancestor_id, parent, commit_id, deleted = entries[parent]
+
+            if commit_id <= base_commit_id:
+                return ancestor_id
+
+        return None
+
+
 def exclude_ancestor_filediffs(to_filter, all_filediffs=None):
     """Exclude all ancestor FileDiffs from the given list and return the rest.
 
@@ -120,7 +583,7 @@ def deserialize_validation_info(raw):
             The raw validation info from the client.
 
     Returns:
-        dict:
+        ValidationHistory:
         The deserialized validation info.
 
     Raises:
@@ -131,26 +594,34 @@ def deserialize_validation_info(raw):
         TypeError:
             The base64-decoded data could not be interpreted as JSON.
     """
-    value = json.loads(base64.b64decode(force_bytes(raw)).decode('utf-8'))
+    raw_json = base64.b64decode(force_bytes(raw)).strip()
+    value = json.loads(raw_json.decode('utf-8'))
 
     if not isinstance(value, dict):
         raise ValueError('Invalid format.')
 
-    return value
+    history = ValidationHistory(value)
+    history._raw_json = raw_json
+    history._raw_keys = frozenset(value)
+
+    return history
 
 
 def serialize_validation_info(info):
     """Serialize the given validation info into a raw format.
 
     Args:
-        info (dict):
+        info (dict or ValidationHistory):
             The dictionary of validation info.
 
     Returns:
         unicode:
         The base64-encoded JSON of the validation info.
     """
-    data = json.dumps(info).encode('utf-8')
+    if isinstance(info, ValidationHistory):
+        data = info.serialize()
+    else:
+        data = json.dumps(info).encode('utf-8')
 
     return base64.b64encode(data).decode('utf-8')
 
@@ -159,7 +630,7 @@ def update_validation_info(validation_info, commit_id, parent_id, filediffs):
     """Update the validation info with a new commit.
 
     Args:
-        validation_info (dict):
+        validation_info (dict or ValidationHistory):
             The dictionary of validation info. This will be modified in-place.
 
             This is a mapping of commit IDs to their metadata. Each metadata
@@ -189,12 +660,12 @@ def update_validation_info(validation_info, commit_id, parent_id, filediffs):
             filediff_creator.create_filediffs`.
 
     Returns:
-        dict:
+        dict or ValidationHistory:
         The dictionary of validation info.
     """
     from reviewboard.diffviewer.models import FileDiff
 
-    assert validation_info == {} or parent_id in validation_info
+    assert not validation_info or parent_id in validation_info
     assert commit_id not in validation_info
 
     added = []
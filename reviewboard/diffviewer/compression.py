@@ -0,0 +1,486 @@
+"""Compression codecs for stored diff data.
+
+:py:class:`~reviewboard.diffviewer.models.raw_file_diff_data.RawFileDiffData`
+stores each file's diff using a compression codec, identified by a single
+character saved alongside the data. The codec used for new diffs is chosen
+through the ``diffviewer_compression_codec_id`` setting.
+
+bzip2 compresses diffs well, but is slow to decompress, which adds up when
+rendering large diffs with a cold cache. zlib decompresses much faster, and
+Zstandard (available when the ``zstandard`` package is installed) is
+faster still. Zstandard can also make use of a dictionary trained on
+existing diffs (see :py:func:`train_zstd_dictionary`), which greatly
+improves compression of small diffs.
+
+Extensions can register their own codecs in
+:py:data:`diff_compression_codec_registry`.
+"""
+
+from __future__ import unicode_literals
+
+import bz2
+import logging
+import threading
+import time
+import zlib
+
+from django.utils.translation import ugettext_lazy as _
+from djblets.siteconfig.models import SiteConfiguration
+
+from reviewboard.registries.registry import Registry
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class BaseDiffCompressionCodec(object):
+    """Base class for a diff compression codec.
+
+    Subclasses must set :py:attr:`codec_id` and :py:attr:`name`, and
+    implement :py:meth:`compress` and :py:meth:`decompress`.
+    """
+
+    #: The unique ID of the codec.
+    #:
+    #: This is stored with each compressed diff, and must be a single
+    #: character.
+    codec_id = None
+
+    #: The displayed name of the codec.
+    name = None
+
+    @property
+    def available(self):
+        """Whether the codec can be used.
+
+        Codecs depending on optional modules should return ``False`` if
+        those modules are not installed.
+        """
+        return True
+
+    def compress(self, data):
+        """Compress diff data.
+
+        Args:
+            data (bytes):
+                The data to compress.
+
+        Returns:
+            bytes:
+            The compressed data.
+        """
+        raise NotImplementedError
+
+    def decompress(self, data):
+        """Decompress diff data.
+
+        Args:
+            data (bytes):
+                The data to decompress.
+
+        Returns:
+            bytes:
+            The decompressed data.
+        """
+        raise NotImplementedError
+
+
+class Bzip2DiffCompressionCodec(BaseDiffCompressionCodec):
+    """A codec compressing diffs with bzip2.
+
+    This is the codec used for all diffs stored by older versions of
+    Review Board.
+    """
+
+    codec_id = 'B'
+    name = _('bzip2')
+
+    def compress(self, data):
+        """Compress diff data.
+
+        Args:
+            data (bytes):
+                The data to compress.
+
+        Returns:
+            bytes:
+            The compressed data.
+        """
+        return bz2.compress(data, 9)
+
+    def decompress(self, data):
+        """Decompress diff data.
+
+        Args:
+            data (bytes):
+                The data to decompress.
+
+        Returns:
+            bytes:
+            The decompressed data.
+        """
+        return bz2.decompress(data)
+
+
+class ZlibDiffCompressionCodec(BaseDiffCompressionCodec):
+    """A codec compressing diffs with zlib."""
+
+    codec_id = 'Z'
+    name = _('zlib')
+
+    def compress(self, data):
+        """Compress diff data.
+
+        Args:
+            data (bytes):
+                The data to compress.
+
+        Returns:
+            bytes:
+            The compressed data.
+        """
+        return zlib.compress(data, 9)
+
+    def decompress(self, data):
+        """Decompress diff data.
+
+        Args:
+            data (bytes):
+                The data to decompress.
+
+        Returns:
+            bytes:
+            The decompressed data.
+        """
+        return zlib.decompress(data)
+
+
+class ZstdDiffCompressionCodec(BaseDiffCompressionCodec):
+    """A codec compressing diffs with Zstandard.
+
+    This requires the ``zstandard`` package.
+    """
+
+    codec_id = 'S'
+    name = _('Zstandard')
+
+    #: The compression level to use.
+    COMPRESSION_LEVEL = 12
+
+    @property
+    def available(self):
+        """Whether the zstandard module is installed."""
+        return zstandard is not None
+
+    def compress(self, data):
+        """Compress diff data.
+
+        Args:
+            data (bytes):
+                The data to compress.
+
+        Returns:
+            bytes:
+            The compressed data.
+        """
+        compressor = zstandard.ZstdCompressor(level=self.COMPRESSION_LEVEL)
+
+        return compressor.compress(data)
+
+    def decompress(self, data):
+        """Decompress diff data.
+
+        Args:
+            data (bytes):
+                The data to decompress.
+
+        Returns:
+            bytes:
+            The decompressed data.
+        """
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+class ZstdDictionaryDiffCompressionCodec(ZstdDiffCompressionCodec):
+    """A codec compressing small diffs with a trained Zstandard dictionary.
+
+    Diffs no larger than :py:attr:`MAX_DICTIONARY_DATA_SIZE` are compressed
+    using the most recently trained dictionary (see
+    :py:func:`train_zstd_dictionary`). Larger diffs, or any diffs compressed
+    before a dictionary has been trained, are compressed without one.
+
+    The ID of the dictionary is stored in the compressed data, so diffs
+    remain readable after newer dictionaries are trained.
+    """
+
+    codec_id = 'D'
+    name = _('Zstandard with a trained dictionary')
+
+    #: The maximum size of a diff to compress using the dictionary.
+    #:
+    #: Dictionaries make little difference for larger diffs.
+    MAX_DICTIONARY_DATA_SIZE = 32 * 1024
+
+    #: How often to check for a newly-trained dictionary, in seconds.
+    #:
+    #: Dictionaries trained in this process are picked up immediately
+    #: (see :py:meth:`invalidate_current_dictionary`). Other processes
+    #: will start using them once this much time has passed.
+    CURRENT_DICTIONARY_CHECK_INTERVAL = 60
+
+    def __init__(self):
+        """Initialize the codec."""
+        self._dictionaries = {}
+        self._current_dict_id = None
+        self._current_dict_checked = None
+        self._lock = threading.Lock()
+
+    def compress(self, data):
+        """Compress diff data.
+
+        Args:
+            data (bytes):
+                The data to compress.
+
+        Returns:
+            bytes:
+            The compressed data.
+        """
+        dictionary = None
+
+        if len(data) <= self.MAX_DICTIONARY_DATA_SIZE:
+            dict_id = self._get_current_dict_id()
+
+            if dict_id:
+                dictionary = self._get_dictionary(dict_id)
+
+        if dictionary is None:
+            return super(ZstdDictionaryDiffCompressionCodec,
+                         self).compress(data)
+
+        compressor = zstandard.ZstdCompressor(level=self.COMPRESSION_LEVEL,
+                                              dict_data=dictionary)
+
+        return compressor.compress(data)
+
+    def decompress(self, data):
+        """Decompress diff data.
+
+        Args:
+            data (bytes):
+                The data to decompress.
+
+        Returns:
+            bytes:
+            The decompressed data.
+        """
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+
+        if dict_id:
+            decompressor = zstandard.ZstdDecompressor(
+                dict_data=self._get_dictionary(dict_id))
+        else:
+            decompressor = zstandard.ZstdDecompressor()
+
+        return decompressor.decompress(data)
+
+    def invalidate_current_dictionary(self):
+        """Invalidate the cached ID of the most recently trained dictionary.
+
+        The next diff compressed will look up the current dictionary again.
+        This is called when a new dictionary is trained.
+        """
+        with self._lock:
+            self._current_dict_id = None
+            self._current_dict_checked = None
+
+    def _get_current_dict_id(self):
+        """Return the ID of the most recently trained dictionary.
+
+        The ID is kept in memory, and only looked up in the database again
+        every :py:attr:`CURRENT_DICTIONARY_CHECK_INTERVAL` seconds, so that
+        compressing a large number of diffs doesn't perform a query for each
+        one.
+
+        Returns:
+            int:
+            The Zstandard ID of the dictionary, or ``None`` if no dictionary
+            has been trained.
+        """
+        from reviewboard.diffviewer.models import DiffCompressionDictionary
+
+        now = time.time()
+
+        with self._lock:
+            checked = self._current_dict_checked
+
+            if (checked is not None and
+                now - checked < self.CURRENT_DICTIONARY_CHECK_INTERVAL):
+                return self._current_dict_id
+
+        dict_ids = list(
+            DiffCompressionDictionary.objects
+            .order_by('-pk')
+            .values_list('dict_id', flat=True)[:1])
+
+        if dict_ids:
+            dict_id = dict_ids[0]
+        else:
+            dict_id = None
+
+        with self._lock:
+            self._current_dict_id = dict_id
+            self._current_dict_checked = now
+
+        return dict_id
+
+    def _get_dictionary(self, dict_id):
+        """Return a trained dictionary.
+
+        Dictionaries never change once trained, so they're kept in memory
+        after the first time they're loaded.
+
+        Args:
+            dict_id (int):
+                The Zstandard ID of the dictionary.
+
+        Returns:
+            zstandard.ZstdCompressionDict:
+            The dictionary.
+
+        Raises:
+            reviewboard.diffviewer.models.diff_compression_dictionary.
+            DiffCompressionDictionary.DoesNotExist:
+                The dictionary could not be found.
+        """
+        from reviewboard.diffviewer.models import DiffCompressionDictionary
+
+        with self._lock:
+            dictionary = self._dictionaries.get(dict_id)
+
+        if dictionary is None:
+            stored_dictionary = \
+                DiffCompressionDictionary.objects.get(dict_id=dict_id)
+            dictionary = zstandard.ZstdCompressionDict(
+                bytes(stored_dictionary.data))
+
+            with self._lock:
+                self._dictionaries[dict_id] = dictionary
+
+        return dictionary
+
+
+class DiffCompressionCodecRegistry(Registry):
+    """A registry for diff compression codecs.
+
+    See :py:ref:`the registry documentation <registry-guides>` for information
+    on how registries work.
+    """
+
+    lookup_attrs = ['codec_id']
+
+    def get_defaults(self):
+        """Return the default compression codecs.
+
+        Returns:
+            list of BaseDiffCompressionCodec:
+            The default codecs.
+        """
+        return [
+            Bzip2DiffCompressionCodec(),
+            ZlibDiffCompressionCodec(),
+            ZstdDiffCompressionCodec(),
+            ZstdDictionaryDiffCompressionCodec(),
+        ]
+
+    @property
+    def current_codec(self):
+        """The codec configured for compressing new diffs.
+
+        If the configured codec is not registered or not available, this
+        falls back on bzip2.
+        """
+        siteconfig = SiteConfiguration.objects.get_current()
+        codec_id = siteconfig.get('diffviewer_compression_codec_id')
+        codec = self.get('codec_id', codec_id)
+
+        if codec is None or not codec.available:
+            logger.error('The diff compression codec "%s" is not available. '
+                         'Falling back on bzip2.',
+                         codec_id)
+            codec = self.get('codec_id', Bzip2DiffCompressionCodec.codec_id)
+
+        return codec
+
+
+#: The registry of diff compression codecs.
+diff_compression_codec_registry = DiffCompressionCodecRegistry()
+
+
+def train_zstd_dictionary(max_samples=10000, dict_size=112640):
+    """Train a new Zstandard dictionary from stored diffs.
+
+    The dictionary is trained on the most recent small diffs, and will be
+    used by :py:class:`ZstdDictionaryDiffCompressionCodec` for diffs
+    compressed from now on.
+
+    Args:
+        max_samples (int, optional):
+            The maximum number of stored diffs to train on.
+
+        dict_size (int, optional):
+            The size of the dictionary to train, in bytes.
+
+    Returns:
+        reviewboard.diffviewer.models.diff_compression_dictionary.
+        DiffCompressionDictionary:
+        The new dictionary.
+
+    Raises:
+        ValueError:
+            There were not enough stored diffs to train a dictionary, or the
+            ``zstandard`` package is not installed.
+    """
+    from reviewboard.diffviewer.models import (DiffCompressionDictionary,
+                                               RawFileDiffData)
+
+    if zstandard is None:
+        raise ValueError('The zstandard module must be installed to train '
+                         'a diff compression dictionary.')
+
+    max_size = ZstdDictionaryDiffCompressionCodec.MAX_DICTIONARY_DATA_SIZE
+    samples = []
+
+    for raw_diff_data in RawFileDiffData.objects.order_by('-pk').iterator():
+        content = raw_diff_data.content
+
+        if len(content) <= max_size:
+            samples.append(content)
+
+            if len(samples) >= max_samples:
+                break
+
+    try:
+        dictionary = zstandard.train_dictionary(dict_size, samples)
+    except zstandard.ZstdError as e:
+        raise ValueError('Unable to train a diff compression dictionary '
+                         'from %d diffs: %s'
+                         % (len(samples), e))
+
+    stored_dictionary = DiffCompressionDictionary.objects.create(
+        dict_id=dictionary.dict_id(),
+        data=dictionary.as_bytes())
+
+    # Make sure the new dictionary is used right away in this process.
+    codec = diff_compression_codec_registry.get(
+        'codec_id', ZstdDictionaryDiffCompressionCodec.codec_id)
+
+    if codec is not None:
+        codec.invalidate_current_dictionary()
+
+    return stored_dictionary
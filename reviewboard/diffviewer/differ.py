@@ -1,7 +1,10 @@
 from __future__ import unicode_literals
 
+import logging
 import os
 
+from djblets.siteconfig.models import SiteConfiguration
+
 from reviewboard.diffviewer.errors import DiffCompatError
 from reviewboard.diffviewer.filetypes import (HEADER_REGEXES,
                                               HEADER_REGEX_ALIASES)
@@ -20,9 +23,31 @@ class DiffCompatVersion(object):
     # (prevents very long diff times for certain files)
     MYERS_SMS_COST_BAIL = 2
 
+    # Myers differ with a bound on the total edit cost of a diff, after which
+    # it gives up on finding a minimal diff (like GNU diff's
+    # --speed-large-files). This bounds the worst-case time for huge files.
+    MYERS_BOUNDED_COST = 3
+
+    # Patience differ, falling back on the bounded Myers differ for regions
+    # without any unique lines.
+    PATIENCE = 4
+
+    # Histogram differ, falling back on the bounded Myers differ for regions
+    # without any sufficiently rare lines.
+    HISTOGRAM = 5
+
     DEFAULT = MYERS_SMS_COST_BAIL
 
-    MYERS_VERSIONS = (MYERS, MYERS_SMS_COST_BAIL)
+    MYERS_VERSIONS = (MYERS, MYERS_SMS_COST_BAIL, MYERS_BOUNDED_COST)
+
+    # Diff algorithm names that can be chosen for new diffs, mapped to their
+    # compatibility versions.
+    ALGORITHMS = {
+        'myers': DEFAULT,
+        'myers-bounded': MYERS_BOUNDED_COST,
+        'patience': PATIENCE,
+        'histogram': HISTOGRAM,
+    }
 
 
 class Differ(object):
@@ -84,19 +109,66 @@ class Differ(object):
         raise NotImplementedError
 
 
+def get_diff_compat_version(repository=None):
+    """Return the diff compatibility version to use for new diffs.
+
+    The diff algorithm can be chosen for the whole site through the
+    ``diffviewer_diff_algorithm`` setting, and overridden for a repository
+    through the ``diff_algorithm`` key in its
+    :py:attr:`~reviewboard.scmtools.models.Repository.extra_data`. See
+    :py:attr:`DiffCompatVersion.ALGORITHMS` for the available algorithms.
+
+    Args:
+        repository (reviewboard.scmtools.models.Repository, optional):
+            The repository the new diff is being uploaded to.
+
+    Returns:
+        int:
+        The diff compatibility version to store on the new
+        :py:class:`~reviewboard.diffviewer.models.diffset.DiffSet`.
+    """
+    algorithm = None
+
+    if repository is not None and repository.extra_data:
+        algorithm = repository.extra_data.get('diff_algorithm')
+
+    if not algorithm:
+        siteconfig = SiteConfiguration.objects.get_current()
+        algorithm = siteconfig.get('diffviewer_diff_algorithm')
+
+    if not algorithm:
+        return DiffCompatVersion.DEFAULT
+
+    try:
+        return DiffCompatVersion.ALGORITHMS[algorithm]
+    except KeyError:
+        logging.warning('Unknown diff algorithm "%s" configured. Falling '
+                        'back on the default.',
+                        algorithm)
+
+        return DiffCompatVersion.DEFAULT
+
+
 def get_differ(a, b, ignore_space=False,
                compat_version=DiffCompatVersion.DEFAULT):
     """Returns a differ for with the given settings.
 
     By default, this will return the MyersDiffer. Older differs can be used
     by specifying a compat_version, but this is only for *really* ancient
-    diffs, currently.
+    diffs, currently. Newer compatibility versions may instead select the
+    PatienceDiffer or HistogramDiffer.
     """
     cls = None
 
     if compat_version in DiffCompatVersion.MYERS_VERSIONS:
         from reviewboard.diffviewer.myersdiff import MyersDiffer
         cls = MyersDiffer
+    elif compat_version == DiffCompatVersion.PATIENCE:
+        from reviewboard.diffviewer.patiencediff import PatienceDiffer
+        cls = PatienceDiffer
+    elif compat_version == DiffCompatVersion.HISTOGRAM:
+        from reviewboard.diffviewer.histogramdiff import HistogramDiffer
+        cls = HistogramDiffer
     elif compat_version == DiffCompatVersion.SMDIFFER:
         from reviewboard.diffviewer.smdiff import SMDiffer
         cls = SMDiffer
@@ -1,28 +1,38 @@
 from __future__ import unicode_literals
 
 import fnmatch
+import hashlib
 import logging
 import os
 import re
 import shutil
 import subprocess
 import tempfile
+import threading
+from collections import OrderedDict
 from difflib import SequenceMatcher
 from functools import cmp_to_key
 
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections
 from django.utils import six
 from django.utils.encoding import force_text
+from django.utils.six.moves import queue
 from django.utils.translation import ugettext as _
+from djblets.cache.backend import cache_memoize, make_cache_key
 from djblets.log import log_timed
 from djblets.siteconfig.models import SiteConfiguration
 from djblets.util.compat.python.past import cmp
 from djblets.util.contextmanagers import controlled_subprocess
 
+from reviewboard.admin.cache_stats import record_cache_hit, record_cache_miss
 from reviewboard.deprecation import RemovedInReviewBoard50Warning
 from reviewboard.diffviewer.commit_utils import exclude_ancestor_filediffs
 from reviewboard.diffviewer.errors import DiffTooBigError, PatchError
+from reviewboard.diffviewer.patcher import apply_patch
 from reviewboard.scmtools.core import PRE_CREATION, HEAD
+from reviewboard.scmtools.errors import FileNotFoundError
 
 
 CHUNK_RANGE_RE = re.compile(
@@ -38,6 +48,64 @@ NEWLINE_UNICODE_RE = re.compile(r'(?:\n|\r(?:\r?\n)?)')
 _PATCH_GARBAGE_INPUT = 'patch: **** Only garbage was found in the patch input.'
 
 
+#: Apply patches in-process, falling back on patch(1) if needed.
+#:
+#: This is the default for the ``diffviewer_patch_engine`` setting.
+PATCH_ENGINE_BUILTIN = 'builtin'
+
+#: Always apply patches using patch(1).
+PATCH_ENGINE_SUBPROCESS = 'patch'
+
+
+#: Find changes within lines by comparing them character by character.
+#:
+#: This is the default for the ``diffviewer_intraline_diff_algorithm``
+#: setting.
+INTRALINE_DIFF_CHARACTERS = 'characters'
+
+#: Find changes within lines by comparing them token by token.
+INTRALINE_DIFF_TOKENS = 'tokens'
+
+#: The minimum similarity between two lines for changes within them to be
+#: shown.
+INTRALINE_DIFF_MIN_RATIO = 0.6
+
+#: The maximum number of tokens compared between two lines.
+#:
+#: If the differing portions of two lines contain more tokens than this
+#: combined, they're treated as a single changed region.
+INTRALINE_DIFF_MAX_TOKENS = 400
+
+#: The number of seconds to remember files not found when prefetching.
+#:
+#: Requests for those files made shortly after the prefetch (such as the
+#: requests rendering each file on a page of the diff viewer) will fail
+#: with the same error, rather than fetching them again. Other errors may
+#: be temporary, and aren't remembered.
+PREFETCH_FAILURE_EXPIRATION = 60
+
+#: The maximum number of line pairs to keep in the changed regions cache.
+LINE_CHANGED_REGIONS_CACHE_SIZE = 10000
+
+#: The maximum total length of the line pairs in the changed regions cache.
+#:
+#: Each line pair is stored in the cache as its key, so this bounds the
+#: memory used by the cache when lines are long.
+LINE_CHANGED_REGIONS_CACHE_MAX_CHARS = 2000000
+
+#: The maximum combined length of a line pair stored in the cache.
+#:
+#: Longer lines (such as minified JavaScript) are rarely seen again, and
+#: would take up much of the cache.
+LINE_CHANGED_REGIONS_CACHE_MAX_LINE_CHARS = 2000
+
+INTRALINE_TOKEN_RE = re.compile(r'\w+|\s+|[^\w\s]', re.UNICODE)
+
+_line_changed_regions_cache = OrderedDict()
+_line_changed_regions_cache_chars = 0
+_line_changed_regions_cache_lock = threading.Lock()
+
+
 def convert_to_unicode(s, encoding_list):
     """Return the passed string as a unicode object.
 
@@ -206,8 +274,14 @@ def split_line_endings(data):
 def patch(diff, orig_file, filename, request=None):
     """Apply a diff to a file.
 
-    This delegates out to ``patch`` because noone except Larry Wall knows how
-    to patch.
+    By default, this applies the diff in-process, using
+    :py:func:`reviewboard.diffviewer.patcher.apply_patch`. If that can't
+    apply every hunk, this delegates out to ``patch``, because noone except
+    Larry Wall knows how to patch.
+
+    The engine used is controlled by the ``diffviewer_patch_engine`` site
+    configuration setting. See :py:data:`PATCH_ENGINE_BUILTIN` and
+    :py:data:`PATCH_ENGINE_SUBPROCESS`.
 
     Args:
         diff (bytes):
@@ -236,13 +310,73 @@ def patch(diff, orig_file, filename, request=None):
         # Someone uploaded an unchanged file. Return the one we're patching.
         return orig_file
 
-    # Prepare the temporary directory if none is available
-    tempdir = tempfile.mkdtemp(prefix='reviewboard.')
-
     try:
         orig_file = convert_line_endings(orig_file)
         diff = convert_line_endings(diff)
 
+        siteconfig = SiteConfiguration.objects.get_current()
+        engine = siteconfig.get('diffviewer_patch_engine',
+                                PATCH_ENGINE_BUILTIN)
+
+        if engine == PATCH_ENGINE_BUILTIN:
+            try:
+                return apply_patch(diff=diff,
+                                   orig_file=orig_file,
+                                   filename=filename)
+            except PatchError as e:
+                logging.debug('In-process patching of %s failed. Falling '
+                              'back on patch(1): %s',
+                              filename, e.error_output,
+                              request=request)
+                builtin_error = e
+        else:
+            builtin_error = None
+
+        try:
+            return _patch_with_subprocess(diff=diff,
+                                          orig_file=orig_file,
+                                          filename=filename)
+        except OSError:
+            if builtin_error is None:
+                raise
+
+            # patch(1) isn't available, so the best we can do is report the
+            # failure from the in-process engine.
+            raise builtin_error
+    finally:
+        log_timer.done()
+
+
+def _patch_with_subprocess(diff, orig_file, filename):
+    """Apply a diff to a file using the patch(1) command.
+
+    Args:
+        diff (bytes):
+            The contents of the diff to apply. This must have normalized
+            line endings.
+
+        orig_file (bytes):
+            The contents of the original file. This must have normalized
+            line endings.
+
+        filename (unicode):
+            The name of the file being patched.
+
+    Returns:
+        bytes:
+        The contents of the patched file.
+
+    Raises:
+        OSError:
+            The patch command could not be run.
+
+        reviewboard.diffutils.errors.PatchError:
+            An error occurred when trying to apply the patch.
+    """
+    # Prepare the temporary directory if none is available
+    tempdir = tempfile.mkdtemp(prefix='reviewboard.')
+
+    try:
         (fd, oldfile) = tempfile.mkstemp(dir=tempdir)
         f = os.fdopen(fd, 'w+b')
         f.write(orig_file)
@@ -295,7 +429,41 @@ def patch(diff, orig_file, filename, request=None):
         return new_file
     finally:
         shutil.rmtree(tempdir)
-        log_timer.done()
+
+
+def _get_original_file_source(filediff):
+    """Return the path and revision of a FileDiff's file in the repository.
+
+    Args:
+        filediff (reviewboard.diffviewer.models.filediff.FileDiff):
+            The FileDiff to return the source file information for.
+
+    Returns:
+        tuple:
+        A 2-tuple of the path and revision of the file to fetch from the
+        repository.
+    """
+    extra_data = filediff.extra_data or {}
+
+    # If the file has a parent source filename/revision recorded, we're
+    # going to need to fetch that, since that'll be (potentially) the
+    # latest commit in the repository.
+    #
+    # This information was added in Review Board 3.0.19. Prior versions
+    # stored the parent source revision as filediff.source_revision
+    # (rather than leaving that as identifying information for the actual
+    # file being shown in the review). It did not store the parent
+    # filename at all (which impacted diffs that contained a moved/renamed
+    # file on any type of repository that required a filename for lookup,
+    # such as Mercurial -- Git was not affected, since it only needs
+    # blob SHAs).
+    #
+    # If we're not working with a parent diff, or this is a FileDiff
+    # with legacy parent diff information, we just use the FileDiff
+    # FileDiff filename/revision fields as normal.
+    return (extra_data.get('parent_source_filename', filediff.source_file),
+            extra_data.get('parent_source_revision',
+                           filediff.source_revision))
 
 
 def get_original_file_from_repo(filediff, request=None, encoding_list=None):
@@ -340,36 +508,19 @@ def get_original_file_from_repo(filediff, request=None, encoding_list=None):
             An error occurred while computing the pre-patch file.
     """
     data = b''
-    extra_data = filediff.extra_data or {}
-
-    # If the file has a parent source filename/revision recorded, we're
-    # going to need to fetch that, since that'll be (potentially) the
-    # latest commit in the repository.
-    #
-    # This information was added in Review Board 3.0.19. Prior versions
-    # stored the parent source revision as filediff.source_revision
-    # (rather than leaving that as identifying information for the actual
-    # file being shown in the review). It did not store the parent
-    # filename at all (which impacted diffs that contained a moved/renamed
-    # file on any type of repository that required a filename for lookup,
-    # such as Mercurial -- Git was not affected, since it only needs
-    # blob SHAs).
-    #
-    # If we're not working with a parent diff, or this is a FileDiff
-    # with legacy parent diff information, we just use the FileDiff
-    # FileDiff filename/revision fields as normal.
-    source_filename = extra_data.get('parent_source_filename',
-                                     filediff.source_file)
-    source_revision = extra_data.get('parent_source_revision',
-                                     filediff.source_revision)
+    source_filename, source_revision = _get_original_file_source(filediff)
 
     if source_revision != PRE_CREATION:
         repository = filediff.get_repository()
+        base_commit_id = filediff.diffset.base_commit_id
+
+        _check_prefetch_failure(repository, source_filename, source_revision,
+                                base_commit_id)
 
         data = repository.get_file(
             source_filename,
             source_revision,
-            base_commit_id=filediff.diffset.base_commit_id,
+            base_commit_id=base_commit_id,
             request=request)
         # Convert to unicode before we do anything to manipulate the string.
         encoding_list = get_filediff_encodings(filediff, encoding_list)
@@ -504,6 +655,361 @@ def get_original_file(filediff, request=None, encoding_list=None):
     return data
 
 
+def prefetch_original_files(filediffs, request=None, wait=True):
+    """Fetch the files needed for the original versions of FileDiffs.
+
+    The files that :py:func:`get_original_file` would fetch from the
+    repository for each FileDiff are fetched concurrently using a bounded
+    pool of threads, and stored in the cache. Later calls to
+    :py:func:`get_original_file` will then find them in the cache, rather
+    than fetching them one after another.
+
+    The total number of threads is limited by the
+    ``diffviewer_prefetch_max_workers`` setting (0 disables prefetching).
+    The number of threads fetching from any one repository is limited by the
+    ``diffviewer_prefetch_max_workers_per_repository`` setting, which can be
+    overridden for a repository by setting ``prefetch_max_workers`` in its
+    extra data.
+
+    Repositories that can fetch many files at once more efficiently (see
+    :py:attr:`Repository.supports_batched_file_fetches
+    <reviewboard.scmtools.models.Repository.supports_batched_file_fetches>`)
+    have their files split evenly between their threads, with each thread
+    fetching its share in one batch.
+
+    Errors fetching files are logged, rather than raised. Files that weren't
+    found are remembered for :py:data:`PREFETCH_FAILURE_EXPIRATION` seconds,
+    during which :py:func:`get_original_file` will raise the same error for
+    them rather than fetching them again.
+
+    Args:
+        filediffs (list of reviewboard.diffviewer.models.filediff.FileDiff):
+            The FileDiffs to prefetch files for.
+
+        request (django.http.HttpRequest, optional):
+            The HTTP request from the client.
+
+        wait (bool, optional):
+            Whether to wait for the files to be fetched. If ``False``, the
+            files will be fetched in the background, and this will return
+            once the fetches have been started.
+    """
+    siteconfig = SiteConfiguration.objects.get_current()
+    max_workers = siteconfig.get('diffviewer_prefetch_max_workers')
+
+    if not max_workers:
+        return
+
+    fetches = OrderedDict()
+    seen = set()
+
+    for filediff in filediffs:
+        # This mirrors the logic in get_original_file() for finding the
+        # FileDiff whose file must come from the repository.
+        if not filediff.parent_diff:
+            ancestors = filediff.get_ancestors(minimal=True)
+
+            if ancestors:
+                filediff = ancestors[0]
+
+        if filediff.is_new:
+            continue
+
+        path, revision = _get_original_file_source(filediff)
+
+        if revision == PRE_CREATION:
+            continue
+
+        repository = filediff.get_repository()
+        base_commit_id = filediff.diffset.base_commit_id
+        key = (repository.pk, path, revision, base_commit_id)
+
+        if (key not in seen and
+            cache.get(_make_prefetch_failure_cache_key(*key)) is None):
+            seen.add(key)
+            fetches.setdefault(repository.pk, (repository, []))[1].append(
+                (path, revision, base_commit_id))
+
+    if sum(len(file_info) for repository, file_info in
+           six.itervalues(fetches)) < 2:
+        # There's nothing to gain from fetching in parallel.
+        return
+
+    max_workers_per_repository = \
+        siteconfig.get('diffviewer_prefetch_max_workers_per_repository')
+    threads = []
+
+    for repository, file_info in six.itervalues(fetches):
+        num_workers = min(
+            (repository.extra_data or {}).get('prefetch_max_workers',
+                                              max_workers_per_repository),
+            len(file_info),
+            max_workers - len(threads))
+
+        if num_workers < 1:
+            continue
+
+        # Load anything that may need the database before sharing the
+        # repository with other threads.
+        repository.scmtool_class
+        repository.hosting_service
+
+        fetch_queue = queue.Queue()
+
+        if repository.supports_batched_file_fetches:
+            for i in range(num_workers):
+                fetch_queue.put(file_info[i::num_workers])
+        else:
+            for info in file_info:
+                fetch_queue.put([info])
+
+        for i in range(num_workers):
+            thread = threading.Thread(target=_prefetch_original_files_worker,
+                                      args=(repository, fetch_queue, request))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+    if not wait:
+        logging.debug('Prefetching %d original files in the background '
+                      'using %d threads',
+                      len(seen), len(threads),
+                      request=request)
+        return
+
+    log_timer = log_timed('Prefetching %d original files using %d threads'
+                          % (len(seen), len(threads)),
+                          request=request)
+
+    for thread in threads:
+        thread.join()
+
+    log_timer.done()
+
+
+def _prefetch_original_files_worker(repository, fetch_queue, request):
+    """Fetch queued files from a repository.
+
+    This is run in a thread by :py:func:`prefetch_original_files`.
+
+    Args:
+        repository (reviewboard.scmtools.models.Repository):
+            The repository to fetch files from.
+
+        fetch_queue (queue.Queue):
+            The queue of files to fetch. Each item is a list of files to
+            fetch together, as tuples of path, revision and base commit ID.
+
+        request (django.http.HttpRequest):
+            The HTTP request from the client.
+    """
+    try:
+        while True:
+            try:
+                file_info = fetch_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if len(file_info) == 1:
+                path, revision, base_commit_id = file_info[0]
+
+                try:
+                    repository.get_file(path,
+                                        revision,
+                                        base_commit_id=base_commit_id,
+                                        request=request)
+                except Exception as e:
+                    logging.debug('Unable to prefetch file "%s" (revision '
+                                  '%s) from repository %s: %s',
+                                  path, revision, repository.pk, e)
+                    _record_prefetch_failure(repository, path, revision,
+                                             base_commit_id, e)
+            else:
+                try:
+                    results = repository.get_files(file_info,
+                                                   request=request)
+                except Exception as e:
+                    logging.debug('Unable to prefetch %d files from '
+                                  'repository %s: %s',
+                                  len(file_info), repository.pk, e)
+                    continue
+
+                for (path, revision, base_commit_id), result in \
+                        zip(file_info, results):
+                    if isinstance(result, Exception):
+                        logging.debug('Unable to prefetch file "%s" '
+                                      '(revision %s) from repository %s: '
+                                      '%s',
+                                      path, revision, repository.pk, result)
+                        _record_prefetch_failure(repository, path, revision,
+                                                 base_commit_id, result)
+    finally:
+        # Close any database connections opened by this thread.
+        connections.close_all()
+
+
+def _make_prefetch_failure_cache_key(repository_id, path, revision,
+                                     base_commit_id):
+    """Return the cache key for a file that failed to be prefetched.
+
+    Args:
+        repository_id (int):
+            The ID of the repository containing the file.
+
+        path (unicode):
+            The path to the file.
+
+        revision (reviewboard.scmtools.core.Revision):
+            The revision of the file.
+
+        base_commit_id (unicode):
+            The ID of the commit the file is relative to, if any.
+
+    Returns:
+        unicode:
+        The cache key.
+    """
+    return make_cache_key('diffviewer-prefetch-failure:%s:%s:%s:%s'
+                          % (repository_id, base_commit_id, revision, path))
+
+
+def _record_prefetch_failure(repository, path, revision, base_commit_id,
+                             error):
+    """Remember that a file failed to be prefetched.
+
+    Only files that weren't found are remembered. Other errors (such as
+    connection or authentication problems) may be temporary, so those files
+    will be fetched again when needed.
+
+    Args:
+        repository (reviewboard.scmtools.models.Repository):
+            The repository containing the file.
+
+        path (unicode):
+            The path to the file.
+
+        revision (reviewboard.scmtools.core.Revision):
+            The revision of the file.
+
+        base_commit_id (unicode):
+            The ID of the commit the file is relative to, if any.
+
+        error (Exception):
+            The error fetching the file.
+    """
+    if isinstance(error, FileNotFoundError):
+        cache.set(
+            _make_prefetch_failure_cache_key(repository.pk, path, revision,
+                                             base_commit_id),
+            {
+                'detail': error.detail,
+            },
+            PREFETCH_FAILURE_EXPIRATION)
+
+
+def _check_prefetch_failure(repository, path, revision, base_commit_id):
+    """Raise the error for a file recently not found when prefetched.
+
+    Args:
+        repository (reviewboard.scmtools.models.Repository):
+            The repository containing the file.
+
+        path (unicode):
+            The path to the file.
+
+        revision (reviewboard.scmtools.core.Revision):
+            The revision of the file.
+
+        base_commit_id (unicode):
+            The ID of the commit the file is relative to, if any.
+
+    Raises:
+        reviewboard.scmtools.errors.FileNotFoundError:
+            The file was not found when prefetched.
+    """
+    failure = cache.get(_make_prefetch_failure_cache_key(
+        repository.pk, path, revision, base_commit_id))
+
+    if failure is not None:
+        raise FileNotFoundError(path,
+                                revision,
+                                detail=failure['detail'],
+                                base_commit_id=base_commit_id)
+
+
+def prefetch_diff_files(files, enable_syntax_highlighting=True,
+                        request=None, wait=True):
+    """Prefetch the original files for diff files that need rendering.
+
+    Files whose chunks are already in the cache are skipped. See
+    :py:func:`prefetch_original_files` for details.
+
+    Args:
+        files (list of dict):
+            The list of files from :py:func:`get_diff_files`.
+
+        enable_syntax_highlighting (bool, optional):
+            Whether the files will be rendered with syntax highlighting.
+
+        request (django.http.HttpRequest, optional):
+            The HTTP request from the client.
+
+        wait (bool, optional):
+            Whether to wait for the files to be fetched. See
+            :py:func:`prefetch_original_files`.
+    """
+    from reviewboard.diffviewer.chunk_generator import get_diff_chunk_generator
+
+    _prefetch_diff_files(
+        files,
+        [
+            get_diff_chunk_generator(
+                request,
+                diff_file['filediff'],
+                diff_file['interfilediff'],
+                diff_file['force_interdiff'],
+                enable_syntax_highlighting,
+                base_filediff=diff_file.get('base_filediff'))
+            for diff_file in files
+        ],
+        request=request,
+        wait=wait)
+
+
+def _prefetch_diff_files(files, generators, request=None, wait=True):
+    """Prefetch the original files for diff files without cached chunks.
+
+    Args:
+        files (list of dict):
+            The list of files from :py:func:`get_diff_files`.
+
+        generators (list of reviewboard.diffviewer.chunk_generator.
+                    DiffChunkGenerator):
+            The chunk generators for each file.
+
+        request (django.http.HttpRequest, optional):
+            The HTTP request from the client.
+
+        wait (bool, optional):
+            Whether to wait for the files to be fetched. See
+            :py:func:`prefetch_original_files`.
+    """
+    filediffs = []
+
+    for diff_file, generator in zip(files, generators):
+        if generator.get_cached_chunks_info() is None:
+            filediffs += [
+                filediff
+                for filediff in (diff_file['filediff'],
+                                 diff_file.get('base_filediff'),
+                                 diff_file['interfilediff'])
+                if filediff is not None
+            ]
+
+    if filediffs:
+        prefetch_original_files(filediffs, request=request, wait=wait)
+
+
 def get_patched_file(source_data, filediff, request=None):
     """Return the patched version of a file.
 
@@ -655,7 +1161,7 @@ def get_matched_interdiff_files(tool, filediffs, interfilediffs):
     # things like renamed/moved files, particularly when there are multiple
     # of them with the same source filename.
     #
-    # This is done in four stages:
+    # This is done in several stages:
     #
     # 1. Build up maps and a set for keeping track of possible
     #    interfilediff candidates for future stages.
@@ -668,31 +1174,54 @@ def get_matched_interdiff_files(tool, filediffs, interfilediffs):
     #    match here.
     #
     # 3. Look for any files that are common between the two diff revisions
+    #    that have the same source filename and destination filename, when
+    #    the file was moved/copied.
+    #
+    # 4. Look for any files that are common between the two diff revisions
     #    that have the same source filename and new/deleted state. These will
     #    ignore the destination filename, helping to match cases where diff 1
     #    modifies a file and diff 2 modifies + renames/moves it.
     #
-    # 4. Add any remaining files from diff 2 that weren't found in diff 1.
+    # 5. Look for any files with the same source filename and compatible
+    #    new/deleted states.
+    #
+    # 6. Add any remaining files from diff 2 that weren't found in diff 1.
+    #
+    # Each stage looks up candidates in maps keyed by the details it compares,
+    # rather than scanning through every interfilediff sharing a source
+    # filename. This keeps matching fast for diffs with many files.
     #
     # We don't have to worry about things like the order of matched diffs.
     # That will be taken care of at the end of the function.
     detail_interdiff_map = {}
+    dest_interdiff_map = {}
+    state_interdiff_map = {}
     simple_interdiff_map = {}
     remaining_interfilediffs = set()
 
     # Stage 1: Build up the maps/set of interfilediffs.
     for interfilediff in interfilediffs:
         source_file = _normfile(interfilediff.source_file)
-        detail_key = _make_detail_key(interfilediff)
 
-        # We'll store this interfilediff in three spots: The set of
-        # all interfilediffs, the detail map (for source + dest +
-        # is_new file comparisons), and the simple map (for direct
-        # source_file comparisons). These will be used for the
-        # different matching stages.
+        # We'll store this interfilediff in several spots: The set of all
+        # interfilediffs not yet matched, the detail map (for source + dest +
+        # is_new file comparisons), the destination map (for source + dest
+        # comparisons), the state map (for source + is_new/deleted
+        # comparisons), and the simple map (for direct source_file
+        # comparisons). These will be used for the different matching stages.
+        #
+        # The set of remaining interfilediffs is the authority on whether an
+        # interfilediff has been matched. The lists in the maps are left
+        # alone as matches are found.
         remaining_interfilediffs.add(interfilediff)
-        detail_interdiff_map[detail_key] = interfilediff
-        simple_interdiff_map.setdefault(source_file, set()).add(interfilediff)
+        detail_interdiff_map[_make_detail_key(interfilediff)] = interfilediff
+        dest_interdiff_map.setdefault(
+            (source_file, interfilediff.dest_file),
+            []).append(interfilediff)
+        state_interdiff_map.setdefault(
+            (source_file, interfilediff.is_new, interfilediff.deleted),
+            []).append(interfilediff)
+        simple_interdiff_map.setdefault(source_file, []).append(interfilediff)
 
     # Stage 2: Look for common files with the same source/destination
     #          filenames and new/deleted states.
@@ -702,24 +1231,14 @@ def get_matched_interdiff_files(tool, filediffs, interfilediffs):
     remaining_filediffs = []
 
     for filediff in filediffs:
-        source_file = _normfile(filediff.source_file)
+        interfilediff = detail_interdiff_map.pop(_make_detail_key(filediff),
+                                                 None)
 
-        try:
-            interfilediff = detail_interdiff_map.pop(
-                _make_detail_key(filediff))
-        except KeyError:
+        if interfilediff is None:
             remaining_filediffs.append(filediff)
-            continue
-
-        yield filediff, interfilediff
-
-        if interfilediff:
+        else:
             remaining_interfilediffs.discard(interfilediff)
-
-            try:
-                simple_interdiff_map.get(source_file, []).remove(interfilediff)
-            except ValueError:
-                pass
+            yield filediff, interfilediff
 
     # Stage 3: Look for common files with the same source/destination
     #          filenames (when they differ).
@@ -731,19 +1250,21 @@ def get_matched_interdiff_files(tool, filediffs, interfilediffs):
     new_remaining_filediffs = []
 
     for filediff in remaining_filediffs:
-        source_file = _normfile(filediff.source_file)
-        found_interfilediffs = [
-            temp_interfilediff
-            for temp_interfilediff in simple_interdiff_map.get(source_file, [])
-            if (temp_interfilediff.dest_file == filediff.dest_file and
-                filediff.source_file != filediff.dest_file)
-        ]
+        found_interfilediffs = None
+
+        if filediff.source_file != filediff.dest_file:
+            found_interfilediffs = [
+                temp_interfilediff
+                for temp_interfilediff in dest_interdiff_map.get(
+                    (_normfile(filediff.source_file), filediff.dest_file),
+                    [])
+                if temp_interfilediff in remaining_interfilediffs
+            ]
 
         if found_interfilediffs:
             remaining_interfilediffs.difference_update(found_interfilediffs)
 
             for interfilediff in found_interfilediffs:
-                simple_interdiff_map[source_file].remove(interfilediff)
                 yield filediff, interfilediff
         else:
             new_remaining_filediffs.append(filediff)
@@ -760,19 +1281,19 @@ def get_matched_interdiff_files(tool, filediffs, interfilediffs):
     new_remaining_filediffs = []
 
     for filediff in remaining_filediffs:
-        source_file = _normfile(filediff.source_file)
         found_interfilediffs = [
             temp_interfilediff
-            for temp_interfilediff in simple_interdiff_map.get(source_file, [])
-            if (temp_interfilediff.is_new == filediff.is_new and
-                temp_interfilediff.deleted == filediff.deleted)
+            for temp_interfilediff in state_interdiff_map.get(
+                (_normfile(filediff.source_file), filediff.is_new,
+                 filediff.deleted),
+                [])
+            if temp_interfilediff in remaining_interfilediffs
         ]
 
         if found_interfilediffs:
             remaining_interfilediffs.difference_update(found_interfilediffs)
 
             for interfilediff in found_interfilediffs:
-                simple_interdiff_map[source_file].remove(interfilediff)
                 yield filediff, interfilediff
         else:
             new_remaining_filediffs.append(filediff)
@@ -794,12 +1315,19 @@ def get_matched_interdiff_files(tool, filediffs, interfilediffs):
     #
     # Any files not found with a matching interdiff will simply be yielded.
     # This is the last stage dealing with the filediffs in the first revision.
+    #
+    # Unlike the previous stages, an interfilediff may be matched against
+    # more than one filediff here, so the candidates are the interfilediffs
+    # remaining at the start of this stage.
+    stage5_interfilediffs = set(remaining_interfilediffs)
+
     for filediff in remaining_filediffs:
-        source_file = _normfile(filediff.source_file)
         found_interfilediffs = [
             temp_interfilediff
-            for temp_interfilediff in simple_interdiff_map.get(source_file, [])
-            if (((filediff.is_new or not temp_interfilediff.is_new) or
+            for temp_interfilediff in simple_interdiff_map.get(
+                _normfile(filediff.source_file), [])
+            if (temp_interfilediff in stage5_interfilediffs and
+                ((filediff.is_new or not temp_interfilediff.is_new) or
                  (not filediff.is_new and temp_interfilediff.is_new and
                   filediff.dest_detail == temp_interfilediff.dest_detail)) and
                 (not filediff.deleted or temp_interfilediff.deleted))
@@ -809,9 +1337,6 @@ def get_matched_interdiff_files(tool, filediffs, interfilediffs):
             remaining_interfilediffs.difference_update(found_interfilediffs)
 
             for interfilediff in found_interfilediffs:
-                # NOTE: If more stages are ever added that deal with
-                #       simple_interdiff_map, then we'll need to remove
-                #       interfilediff from that map here.
                 yield filediff, interfilediff
         else:
             yield filediff, None
@@ -826,8 +1351,92 @@ def get_matched_interdiff_files(tool, filediffs, interfilediffs):
     # the source filediff and not specify an interdiff. Keeps things
     # simple, code-wise, since we really have no need to special-case
     # this.
-    for interfilediff in remaining_interfilediffs:
-        yield None, interfilediff
+    for interfilediff in interfilediffs:
+        if interfilediff in remaining_interfilediffs:
+            yield None, interfilediff
+
+
+def get_cached_matched_interdiff_files(tool, diffset, interdiffset, filediffs,
+                                       interfilediffs):
+    """Return pairs of matched files for an interdiff, using the cache.
+
+    This wraps :py:func:`get_matched_interdiff_files`, caching the resulting
+    pairs of FileDiff IDs for the two diffsets. The cache key includes the
+    IDs of all the provided filediffs and interfilediffs, so different
+    subsets of the diffsets (such as when showing a single file) are cached
+    separately.
+
+    Args:
+        tool (reviewboard.scmtools.core.SCMTool)
+            The tool used for all these diffs.
+
+        diffset (reviewboard.diffviewer.models.diffset.DiffSet):
+            The diffset on the left-hand side of the diff range.
+
+        interdiffset (reviewboard.diffviewer.models.diffset.DiffSet):
+            The diffset on the right-hand side of the diff range.
+
+        filediffs (list of reviewboard.diffviewer.models.filediff.FileDiff):
+            The list of filediffs on the left-hand side of the diff range.
+
+        interfilediffs (list of reviewboard.diffviewer.models.filediff.
+                        FileDiff):
+            The list of filediffs on the right-hand side of the diff range.
+
+    Returns:
+        list of tuple:
+        The paired off filediff matches, in the form returned by
+        :py:func:`get_matched_interdiff_files`.
+    """
+    filediffs_by_id = {
+        filediff.pk: filediff
+        for filediff in filediffs
+    }
+    interfilediffs_by_id = {
+        interfilediff.pk: interfilediff
+        for interfilediff in interfilediffs
+    }
+
+    if None in filediffs_by_id or None in interfilediffs_by_id:
+        # These haven't been saved, so we have no way to cache them.
+        return list(get_matched_interdiff_files(tool=tool,
+                                                filediffs=filediffs,
+                                                interfilediffs=interfilediffs))
+
+    files_hash = hashlib.sha1(('%s:%s' % (
+        ','.join(six.text_type(pk) for pk in sorted(filediffs_by_id)),
+        ','.join(six.text_type(pk) for pk in sorted(interfilediffs_by_id)),
+    )).encode('utf-8')).hexdigest()
+    key = 'diffviewer-interdiff-files-%s-%s-%s' % (diffset.pk,
+                                                   interdiffset.pk,
+                                                   files_hash)
+    state = {
+        'cache_hit': True,
+    }
+
+    def _match_files():
+        state['cache_hit'] = False
+
+        return [
+            (filediff and filediff.pk, interfilediff and interfilediff.pk)
+            for filediff, interfilediff in get_matched_interdiff_files(
+                tool=tool,
+                filediffs=filediffs,
+                interfilediffs=interfilediffs)
+        ]
+
+    matched_ids = cache_memoize(key, _match_files)
+
+    if state['cache_hit']:
+        record_cache_hit('diffviewer-interdiffs')
+    else:
+        record_cache_miss('diffviewer-interdiffs')
+
+    return [
+        (filediffs_by_id.get(filediff_id),
+         interfilediffs_by_id.get(interfilediff_id))
+        for filediff_id, interfilediff_id in matched_ids
+    ]
 
 
 def get_filediffs_match(filediff1, filediff2):
@@ -864,24 +1473,35 @@ def get_filediffs_match(filediff1, filediff2):
     if filediff1 is None and filediff2 is None:
         raise ValueError('filediff1 and filediff2 cannot both be None')
 
+    if filediff1 is None or filediff2 is None:
+        return False
+
+    if (filediff1.diff_hash_id is not None and
+        filediff2.diff_hash_id is not None):
+        # Diff data is stored once for each unique diff, so we can compare
+        # the IDs without loading the data.
+        diffs_equal = (filediff1.diff_hash_id == filediff2.diff_hash_id)
+    else:
+        diffs_equal = (filediff1.diff == filediff2.diff)
+
     # For the hash comparisons, there's a chance we won't have any SHA1 (RB
     # 2.0+) or SHA256 (RB 4.0+) hashes, so we have to check for them. We want
     # to prioritize SHA256 hashes, but if the filediff or interfilediff lacks
     # a SHA256 hash, we want to fall back to SHA1.
-    return (filediff1 is not None and filediff2 is not None and
-            (filediff1.diff == filediff2.diff or
-             (filediff1.deleted and filediff2.deleted) or
-             (filediff1.patched_sha256 is not None and
-              filediff1.patched_sha256 == filediff2.patched_sha256) or
-             ((filediff1.patched_sha256 is None or
-               filediff2.patched_sha256 is None) and
-              filediff1.patched_sha1 is not None and
-              filediff1.patched_sha1 == filediff2.patched_sha1)))
+    return (diffs_equal or
+            (filediff1.deleted and filediff2.deleted) or
+            (filediff1.patched_sha256 is not None and
+             filediff1.patched_sha256 == filediff2.patched_sha256) or
+            ((filediff1.patched_sha256 is None or
+              filediff2.patched_sha256 is None) and
+             filediff1.patched_sha1 is not None and
+             filediff1.patched_sha1 == filediff2.patched_sha1))
 
 
 def get_diff_files(diffset, filediff=None, interdiffset=None,
                    interfilediff=None, base_filediff=None, request=None,
-                   filename_patterns=None, base_commit=None, tip_commit=None):
+                   filename_patterns=None, base_commit=None, tip_commit=None,
+                   lazy=False):
     """Return a list of files that will be displayed in a diff.
 
     This will go through the given diffset/interdiffset, or a given filediff
@@ -946,10 +1566,16 @@ def get_diff_files(diffset, filediff=None, interdiffset=None,
             :py:class:`DiffCommits <reviewboard.diffviewer.models.diffcommit
             .DiffCommit>`.
 
+        lazy (bool, optional):
+            Whether to only build the information on each file when it's
+            accessed. This is useful when only some of the files will be
+            shown, such as a page of files in the diff viewer.
+
     Returns:
         list of dict:
         A list of dictionaries containing information on the files to show
-        in the diff, in the order in which they would be shown.
+        in the diff, in the order in which they would be shown. If ``lazy``
+        is ``True``, this will be a :py:class:`DiffFileList`.
     """
     # It is presently not supported to do an interdiff with commit spans. It
     # would require base/tip commits for the interdiffset as well.
@@ -1046,8 +1672,10 @@ def get_diff_files(diffset, filediff=None, interdiffset=None,
             interfilediffs = []
 
         filediff_parts = []
-        matched_filediffs = get_matched_interdiff_files(
+        matched_filediffs = get_cached_matched_interdiff_files(
             tool=tool,
+            diffset=diffset,
+            interdiffset=interdiffset,
             filediffs=filediffs,
             interfilediffs=interfilediffs)
 
@@ -1078,14 +1706,13 @@ def get_diff_files(diffset, filediff=None, interdiffset=None,
         ]
 
     # Now that we have all the bits and pieces we care about for the filediffs,
-    # we can start building information about each entry on the diff viewer.
-    files = []
-
-    for parts in filediff_parts:
-        filediff, interfilediff, force_interdiff = parts
-
-        newfile = filediff.is_new
+    # we can work out which entries will be shown in the diff viewer. This
+    # only needs the information already loaded for each FileDiff, so it's
+    # cheap enough to do for every file, even when only some of them will be
+    # displayed.
+    entries = []
 
+    for filediff, interfilediff, force_interdiff in filediff_parts:
         if interdiffset:
             # First, find out if we want to even process this one.
             # If the diffs are identical, or the patched files are identical,
@@ -1095,21 +1722,6 @@ def get_diff_files(diffset, filediff=None, interdiffset=None,
             if get_filediffs_match(filediff, interfilediff):
                 continue
 
-            source_revision = _('Diff Revision %s') % diffset.revision
-        else:
-            source_revision = get_revision_str(filediff.source_revision)
-
-        if interfilediff:
-            dest_revision = _('Diff Revision %s') % interdiffset.revision
-        else:
-            if force_interdiff:
-                dest_revision = (_('Diff Revision %s - File Reverted') %
-                                 interdiffset.revision)
-            elif newfile:
-                dest_revision = _('New File')
-            else:
-                dest_revision = _('New Change')
-
         if interfilediff:
             raw_depot_filename = filediff.dest_file
             raw_dest_filename = interfilediff.dest_file
@@ -1130,6 +1742,38 @@ def get_diff_files(diffset, filediff=None, interdiffset=None,
                                                 filenames=filenames):
                 continue
 
+        entries.append((filediff, interfilediff, force_interdiff,
+                        depot_filename, dest_filename, len(entries)))
+
+    if len(entries) > 1:
+        entries = get_sorted_filediffs(
+            entries,
+            key=lambda entry: entry[1] or entry[0])
+
+    def _build_file(entry):
+        # Build the full information on an entry in the diff viewer. This is
+        # where the more expensive work for each file happens.
+        (filediff, interfilediff, force_interdiff, depot_filename,
+         dest_filename, index) = entry
+
+        newfile = filediff.is_new
+
+        if interdiffset:
+            source_revision = _('Diff Revision %s') % diffset.revision
+        else:
+            source_revision = get_revision_str(filediff.source_revision)
+
+        if interfilediff:
+            dest_revision = _('Diff Revision %s') % interdiffset.revision
+        else:
+            if force_interdiff:
+                dest_revision = (_('Diff Revision %s - File Reverted') %
+                                 interdiffset.revision)
+            elif newfile:
+                dest_revision = _('New File')
+            else:
+                dest_revision = _('New Change')
+
         base_filediff = None
 
         if filediff.commit_id:
@@ -1172,7 +1816,7 @@ def get_diff_files(diffset, filediff=None, interdiffset=None,
             'moved_or_copied': filediff.moved or filediff.copied,
             'newfile': newfile,
             'is_symlink': filediff.extra_data.get('is_symlink', False),
-            'index': len(files),
+            'index': index,
             'chunks_loaded': False,
             'is_new_file': (
                 (newfile or
@@ -1195,37 +1839,154 @@ def get_diff_files(diffset, filediff=None, interdiffset=None,
         if force_interdiff:
             f['force_interdiff_revision'] = interdiffset.revision
 
-        files.append(f)
+        return f
+
+    if lazy:
+        files = DiffFileList(entries, _build_file)
+    else:
+        files = [
+            _build_file(entry)
+            for entry in entries
+        ]
 
     log_timer.done()
 
-    if len(files) == 1:
-        return files
-    else:
-        return get_sorted_filediffs(
-            files,
-            key=lambda f: f['interfilediff'] or f['filediff'])
+    return files
+
+
+class DiffFileList(object):
+    """A lazily-built list of files to display in a diff.
+
+    This is returned by :py:func:`get_diff_files` when passing
+    ``lazy=True``. The files to show are already matched up, filtered, and
+    sorted, but the information on each file is only built when that file is
+    accessed. This allows a page of files to be shown from a large diff
+    without doing the work for every file in the diff.
+
+    This can be passed to :py:class:`django.core.paginator.Paginator`.
+    """
+
+    def __init__(self, entries, build_file_func):
+        """Initialize the list.
+
+        Args:
+            entries (list of tuple):
+                The sorted entries for the files to show.
+
+            build_file_func (callable):
+                The function used to build the information on a file from
+                an entry.
+        """
+        self._entries = entries
+        self._build_file = build_file_func
+        self._files = {}
+
+    def get_filediff_index(self, filediff_id):
+        """Return the position of the file for a FileDiff in the list.
+
+        Args:
+            filediff_id (int):
+                The ID of the FileDiff shown for the file.
+
+        Returns:
+            int:
+            The position of the file, or ``None`` if the FileDiff isn't
+            shown.
+        """
+        for i, entry in enumerate(self._entries):
+            if entry[0].pk == filediff_id:
+                return i
+
+        return None
+
+    def __len__(self):
+        """Return the number of files in the list.
+
+        Returns:
+            int:
+            The number of files.
+        """
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        """Return the information on a file or a range of files.
+
+        Args:
+            index (int or slice):
+                The position of the file, or a range of positions.
+
+        Returns:
+            dict or list of dict:
+            The information on the file, or a list for a range of files.
+        """
+        if isinstance(index, slice):
+            return [
+                self[i]
+                for i in range(*index.indices(len(self._entries)))
+            ]
+
+        if index < 0:
+            index += len(self._entries)
+
+        try:
+            f = self._files[index]
+        except KeyError:
+            f = self._build_file(self._entries[index])
+            self._files[index] = f
+
+        return f
+
+    def __iter__(self):
+        """Iterate through the information on all the files.
+
+        Yields:
+            dict:
+            The information on each file.
+        """
+        for i in range(len(self._entries)):
+            yield self[i]
 
 
 def populate_diff_chunks(files, enable_syntax_highlighting=True,
-                         request=None):
+                         request=None, line_ranges=None):
     """Populates a list of diff files with chunk data.
 
     This accepts a list of files (generated by get_diff_files) and generates
     diff chunk data for each file in the list. The chunk data is stored in
     the file state.
+
+    If there are several files to generate chunks for, the files they need
+    from the repository are fetched in parallel first (see
+    :py:func:`prefetch_original_files`).
+
+    If ``line_ranges`` is provided, and a file's chunks aren't already in the
+    cache, only the lines within those ranges will be rendered (see
+    :py:meth:`~reviewboard.diffviewer.chunk_generator.
+    RawDiffChunkGenerator.get_chunks_in_ranges`). The resulting chunks are
+    cached for those ranges, and must only be used to show them.
     """
     from reviewboard.diffviewer.chunk_generator import get_diff_chunk_generator
 
-    for diff_file in files:
-        generator = get_diff_chunk_generator(
+    generators = [
+        get_diff_chunk_generator(
             request,
             diff_file['filediff'],
             diff_file['interfilediff'],
             diff_file['force_interdiff'],
             enable_syntax_highlighting,
             base_filediff=diff_file.get('base_filediff'))
-        chunks = list(generator.get_chunks())
+        for diff_file in files
+    ]
+
+    if len(files) > 1:
+        _prefetch_diff_files(files, generators, request=request)
+
+    for diff_file, generator in zip(files, generators):
+        if (line_ranges is not None and
+            generator.get_cached_chunks_info() is None):
+            chunks = generator.get_chunks_in_ranges(line_ranges)
+        else:
+            chunks = list(generator.get_chunks())
 
         diff_file.update({
             'chunks': chunks,
@@ -1250,7 +2011,8 @@ def populate_diff_chunks(files, enable_syntax_highlighting=True,
         })
 
 
-def get_file_from_filediff(context, filediff, interfilediff):
+def get_file_from_filediff(context, filediff, interfilediff,
+                           line_ranges=None):
     """Return the files that corresponds to the filediff/interfilediff.
 
     This is primarily intended for use with templates. It takes a
@@ -1258,6 +2020,11 @@ def get_file_from_filediff(context, filediff, interfilediff):
     in order to improve performance and reduce lookup times for files that have
     already been fetched.
 
+    If ``line_ranges`` is provided the first time the file is looked up, then
+    only the lines within those ranges may be rendered (see
+    :py:func:`populate_diff_chunks`). The file stored in the context will
+    then only be suitable for showing those ranges.
+
     This function returns either exactly one file or ``None``.
     """
     interdiffset = None
@@ -1278,7 +2045,8 @@ def get_file_from_filediff(context, filediff, interfilediff):
                                interfilediff=interfilediff,
                                request=request)
         populate_diff_chunks(files, get_enable_highlighting(context['user']),
-                             request=request)
+                             request=request,
+                             line_ranges=line_ranges)
         context[key] = files
 
     if not files:
@@ -1507,29 +2275,291 @@ def get_enable_highlighting(user):
             user_syntax_highlighting)
 
 
-def get_line_changed_regions(oldline, newline):
-    """Returns regions of changes between two similar lines."""
+def get_line_changed_regions(oldline, newline,
+                             algorithm=INTRALINE_DIFF_CHARACTERS,
+                             use_cache=True):
+    """Return regions of changes between two similar lines.
+
+    If the lines aren't similar enough (see
+    :py:data:`INTRALINE_DIFF_MIN_RATIO`), no regions will be returned, as
+    highlighting most of a line isn't useful.
+
+    Results are kept in a bounded in-memory cache, so that the same pair of
+    lines (which is common when re-rendering a diff, or viewing interdiffs)
+    is only compared once per process. Very long lines aren't cached (see
+    :py:data:`LINE_CHANGED_REGIONS_CACHE_MAX_LINE_CHARS`).
+
+    Args:
+        oldline (unicode):
+            The original line.
+
+        newline (unicode):
+            The modified line.
+
+        algorithm (unicode, optional):
+            The algorithm used to compare the lines. This is one of
+            :py:data:`INTRALINE_DIFF_CHARACTERS` or
+            :py:data:`INTRALINE_DIFF_TOKENS`.
+
+        use_cache (bool, optional):
+            Whether to use the cache of results.
+
+    Returns:
+        tuple:
+        A 2-tuple of the lists of ``(start, end)`` regions changed in the
+        original and modified lines, or ``(None, None)`` if the lines aren't
+        similar enough to show changes within them.
+
+    Raises:
+        ValueError:
+            The algorithm was not valid.
+    """
+    global _line_changed_regions_cache_chars
+
     if oldline is None or newline is None:
         return None, None
 
+    if algorithm == INTRALINE_DIFF_TOKENS:
+        func = _get_line_changed_regions_by_tokens
+    elif algorithm == INTRALINE_DIFF_CHARACTERS:
+        func = _get_line_changed_regions_by_characters
+    else:
+        raise ValueError('Invalid intraline diff algorithm "%s"'
+                         % algorithm)
+
+    num_chars = len(oldline) + len(newline)
+
+    if (not use_cache or
+        num_chars > LINE_CHANGED_REGIONS_CACHE_MAX_LINE_CHARS):
+        return func(oldline, newline)
+
+    key = (algorithm, oldline, newline)
+
+    with _line_changed_regions_cache_lock:
+        regions = _line_changed_regions_cache.pop(key, None)
+
+        if regions is not None:
+            # Re-insert it, marking it as the most recently used.
+            _line_changed_regions_cache[key] = regions
+
+    if regions is None:
+        regions = func(oldline, newline)
+
+        with _line_changed_regions_cache_lock:
+            if key not in _line_changed_regions_cache:
+                _line_changed_regions_cache_chars += num_chars
+
+            _line_changed_regions_cache[key] = regions
+
+            while (len(_line_changed_regions_cache) >
+                   LINE_CHANGED_REGIONS_CACHE_SIZE or
+                   _line_changed_regions_cache_chars >
+                   LINE_CHANGED_REGIONS_CACHE_MAX_CHARS):
+                (old_algorithm, old_oldline, old_newline), old_regions = \
+                    _line_changed_regions_cache.popitem(last=False)
+                _line_changed_regions_cache_chars -= \
+                    len(old_oldline) + len(old_newline)
+
+    # Callers get their own copies of the lists, so the cached results can't
+    # be modified.
+    old_regions, new_regions = regions
+
+    if old_regions is None:
+        return None, None
+
+    return list(old_regions), list(new_regions)
+
+
+def clear_line_changed_regions_cache():
+    """Clear the cache of results from get_line_changed_regions()."""
+    global _line_changed_regions_cache_chars
+
+    with _line_changed_regions_cache_lock:
+        _line_changed_regions_cache.clear()
+        _line_changed_regions_cache_chars = 0
+
+
+def _get_line_changed_regions_by_characters(oldline, newline):
+    """Return regions of changes between two lines, comparing characters.
+
+    Args:
+        oldline (unicode):
+            The original line.
+
+        newline (unicode):
+            The modified line.
+
+    Returns:
+        tuple:
+        A 2-tuple of the lists of regions changed in the original and
+        modified lines, or ``(None, None)``.
+    """
     # Use the SequenceMatcher directly. It seems to give us better results
     # for this. We should investigate steps to move to the new differ.
     differ = SequenceMatcher(None, oldline, newline)
 
     # This thresholds our results -- we don't want to show inter-line diffs
     # if most of the line has changed, unless those lines are very short.
+    # The quick ratio (based only on the lengths of the lines) is an upper
+    # bound on the real ratio, and rules out some lines for free.
 
     # FIXME: just a plain, linear threshold is pretty crummy here.  Short
     # changes in a short line get lost.  I haven't yet thought of a fancy
     # nonlinear test.
-    if differ.ratio() < 0.6:
+    if (differ.real_quick_ratio() < INTRALINE_DIFF_MIN_RATIO or
+        differ.ratio() < INTRALINE_DIFF_MIN_RATIO):
         return None, None
 
+    return _get_line_changed_regions_from_opcodes(oldline, newline,
+                                                  differ.get_opcodes())
+
+
+def _get_line_changed_regions_by_tokens(oldline, newline):
+    """Return regions of changes between two lines, comparing tokens.
+
+    Any common prefix and suffix of the lines are matched up first, which
+    is enough to handle most changed lines (a single edit somewhere in the
+    line) without any further comparison. The remaining portions of the
+    lines are split into words, runs of whitespace and punctuation, which
+    are compared using :py:class:`difflib.SequenceMatcher`. This is far
+    cheaper than comparing every character, and highlights whole words
+    instead of scattered letters within them.
+
+    Args:
+        oldline (unicode):
+            The original line.
+
+        newline (unicode):
+            The modified line.
+
+    Returns:
+        tuple:
+        A 2-tuple of the lists of regions changed in the original and
+        modified lines, or ``(None, None)``.
+    """
+    old_len = len(oldline)
+    new_len = len(newline)
+    total_len = old_len + new_len
+
+    if total_len == 0:
+        return [], []
+
+    # Find the common prefix and suffix.
+    max_len = min(old_len, new_len)
+    prefix_len = 0
+
+    while (prefix_len < max_len and
+           oldline[prefix_len] == newline[prefix_len]):
+        prefix_len += 1
+
+    max_len -= prefix_len
+    suffix_len = 0
+
+    while (suffix_len < max_len and
+           oldline[old_len - suffix_len - 1] ==
+           newline[new_len - suffix_len - 1]):
+        suffix_len += 1
+
+    old_end = old_len - suffix_len
+    new_end = new_len - suffix_len
+    matched_len = prefix_len + suffix_len
+
+    # At best, the smaller of the remaining portions matches completely. If
+    # that still isn't similar enough, there's nothing more to do.
+    if (2.0 * (matched_len + min(old_end, new_end) - prefix_len) / total_len <
+        INTRALINE_DIFF_MIN_RATIO):
+        return None, None
+
+    opcodes = []
+
+    if prefix_len > 0:
+        opcodes.append(('equal', 0, prefix_len, 0, prefix_len))
+
+    if prefix_len < old_end and prefix_len < new_end:
+        old_tokens = INTRALINE_TOKEN_RE.findall(oldline, prefix_len, old_end)
+        new_tokens = INTRALINE_TOKEN_RE.findall(newline, prefix_len, new_end)
+
+        if len(old_tokens) + len(new_tokens) > INTRALINE_DIFF_MAX_TOKENS:
+            opcodes.append(('replace', prefix_len, old_end,
+                            prefix_len, new_end))
+        else:
+            old_offsets = _get_token_offsets(old_tokens, prefix_len)
+            new_offsets = _get_token_offsets(new_tokens, prefix_len)
+            differ = SequenceMatcher(None, old_tokens, new_tokens,
+                                     autojunk=False)
+
+            for tag, i1, i2, j1, j2 in differ.get_opcodes():
+                i1 = old_offsets[i1]
+                i2 = old_offsets[i2]
+
+                if tag == 'equal':
+                    matched_len += i2 - i1
+
+                opcodes.append((tag, i1, i2, new_offsets[j1],
+                                new_offsets[j2]))
+    elif prefix_len < old_end:
+        opcodes.append(('delete', prefix_len, old_end, prefix_len,
+                        prefix_len))
+    elif prefix_len < new_end:
+        opcodes.append(('insert', prefix_len, prefix_len, prefix_len,
+                        new_end))
+
+    if 2.0 * matched_len / total_len < INTRALINE_DIFF_MIN_RATIO:
+        return None, None
+
+    if suffix_len > 0:
+        opcodes.append(('equal', old_end, old_len, new_end, new_len))
+
+    return _get_line_changed_regions_from_opcodes(oldline, newline, opcodes)
+
+
+def _get_token_offsets(tokens, start):
+    """Return the offsets of tokens within a line.
+
+    Args:
+        tokens (list of unicode):
+            The tokens from the line.
+
+        start (int):
+            The offset of the first token.
+
+    Returns:
+        list of int:
+        The offset of each token, followed by the offset of the end of the
+        last token.
+    """
+    offsets = [start]
+
+    for token in tokens:
+        start += len(token)
+        offsets.append(start)
+
+    return offsets
+
+
+def _get_line_changed_regions_from_opcodes(oldline, newline, opcodes):
+    """Return regions of changes between two lines from diff opcodes.
+
+    Args:
+        oldline (unicode):
+            The original line.
+
+        newline (unicode):
+            The modified line.
+
+        opcodes (list of tuple):
+            The opcodes for the changes between characters in the lines.
+
+    Returns:
+        tuple:
+        A 2-tuple of the lists of regions changed in the original and
+        modified lines.
+    """
     oldchanges = []
     newchanges = []
     back = (0, 0)
 
-    for tag, i1, i2, j1, j2 in differ.get_opcodes():
+    for tag, i1, i2, j1, j2 in opcodes:
         if tag == 'equal':
             if (i2 - i1 < 3) or (j2 - j1 < 3):
                 back = (j2 - j1, i2 - i1)
@@ -2025,3 +3055,37 @@ def get_total_line_counts(files_qs):
                     counts[key] += value
 
     return counts
+
+
+def get_total_raw_line_counts(filediffs):
+    """Return the total raw line counts of all given FileDiffs.
+
+    Unlike :py:func:`get_total_line_counts`, this only includes the line
+    counts known when the diff was uploaded, which never change afterward.
+    This makes them suitable for storing on the parent
+    :py:class:`~reviewboard.diffviewer.models.diffset.DiffSet` or
+    :py:class:`~reviewboard.diffviewer.models.diffcommit.DiffCommit`.
+
+    Args:
+        filediffs (list of reviewboard.diffviewer.models.filediff.FileDiff):
+            The FileDiffs to count lines for. This may be a queryset.
+
+    Returns:
+        dict:
+        A dictionary with the following keys:
+
+        * ``raw_insert_count``
+        * ``raw_delete_count``
+    """
+    raw_insert_count = 0
+    raw_delete_count = 0
+
+    for filediff in filediffs:
+        counts = filediff.get_line_counts()
+        raw_insert_count += counts['raw_insert_count'] or 0
+        raw_delete_count += counts['raw_delete_count'] or 0
+
+    return {
+        'raw_insert_count': raw_insert_count,
+        'raw_delete_count': raw_delete_count,
+    }
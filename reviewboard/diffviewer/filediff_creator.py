@@ -26,6 +26,12 @@ _IMPL_EXTENSIONS = [
     b'c', b'C', b'cc', b'cpp', b'cxx', b'c++', b'm', b'mm', b'M'
 ]
 
+# The maximum number of files, and total size of their diffs, to store in
+# the database at once. Storing in batches saves queries on diffs with many
+# files, without holding a very large diff in memory all at once.
+_STORE_BATCH_MAX_FILES = 200
+_STORE_BATCH_MAX_BYTES = 10 * 1024 * 1024
+
 
 def create_filediffs(diff_file_contents, parent_diff_file_contents,
                      repository, basedir, base_commit_id, diffset,
@@ -33,11 +39,18 @@ def create_filediffs(diff_file_contents, parent_diff_file_contents,
                      diffcommit=None, validate_only=False):
     """Create FileDiffs from the given data.
 
+    Each file's diff is stored as soon as it's parsed, so when the diffs are
+    provided as :py:class:`~reviewboard.diffviewer.parser.DiffLineStream`
+    instances, only one file's diff needs to be held in memory at a time.
+
     Args:
-        diff_file_contents (bytes):
+        diff_file_contents (bytes or
+                            reviewboard.diffviewer.parser.DiffLineStream):
             The contents of the diff file.
 
-        parent_diff_file_contents (bytes):
+        parent_diff_file_contents (bytes or
+                                   reviewboard.diffviewer.parser.
+                                   DiffLineStream):
             The contents of the parent diff file.
 
         repository (reviewboard.scmtools.models.Repository):
@@ -87,6 +100,11 @@ def create_filediffs(diff_file_contents, parent_diff_file_contents,
     from reviewboard.diffviewer.diffutils import convert_to_unicode
     from reviewboard.diffviewer.models import FileDiff
 
+    if validate_only:
+        raw_diffs = None
+    else:
+        raw_diffs = {}
+
     files, parser, parent_commit_id, parent_files = _prepare_file_list(
         diff_file_contents=diff_file_contents,
         parent_diff_file_contents=parent_diff_file_contents,
@@ -95,14 +113,14 @@ def create_filediffs(diff_file_contents, parent_diff_file_contents,
         basedir=basedir,
         check_existence=check_existence,
         get_file_exists=get_file_exists,
-        base_commit_id=base_commit_id)
+        base_commit_id=base_commit_id,
+        raw_diffs=raw_diffs)
 
     encoding_list = repository.get_encoding_list()
     filediffs = []
 
     for f in files:
         parent_file = None
-        parent_content = b''
 
         extra_data = {
             'is_symlink': f.is_symlink,
@@ -110,7 +128,6 @@ def create_filediffs(diff_file_contents, parent_diff_file_contents,
 
         if f.orig_filename in parent_files:
             parent_file = parent_files[f.orig_filename]
-            parent_content = parent_file.data
 
             # Store the information on the parent's filename and revision.
             # It's important we force these to text, since they may be
@@ -166,11 +183,22 @@ def create_filediffs(diff_file_contents, parent_diff_file_contents,
         if not validate_only:
             # This state all requires making modifications to the database.
             # We only want to do this if we're saving.
-            filediff.diff = f.data
-            filediff.parent_diff = parent_content
-
-            filediff.set_line_counts(raw_insert_count=f.insert_count,
-                                     raw_delete_count=f.delete_count)
+            if f in raw_diffs:
+                # The line counts were stored along with the diff.
+                filediff.diff_hash = raw_diffs[f]
+                filediff.diff64 = b''
+                filediff.extra_data.update({
+                    'raw_insert_count': f.insert_count,
+                    'raw_delete_count': f.delete_count,
+                })
+            else:
+                filediff.diff = b''
+                filediff.set_line_counts(raw_insert_count=f.insert_count,
+                                         raw_delete_count=f.delete_count)
+
+            if parent_file in raw_diffs:
+                filediff.parent_diff_hash = raw_diffs[parent_file]
+                filediff.parent_diff64 = b''
 
         filediffs.append(filediff)
 
@@ -183,14 +211,18 @@ def create_filediffs(diff_file_contents, parent_diff_file_contents,
 
 def _prepare_file_list(diff_file_contents, parent_diff_file_contents,
                        repository, request, basedir, check_existence,
-                       get_file_exists=None, base_commit_id=None):
+                       get_file_exists=None, base_commit_id=None,
+                       raw_diffs=None):
     """Extract the list of files from the diff.
 
     Args:
-        diff_file_contents (bytes):
+        diff_file_contents (bytes or
+                            reviewboard.diffviewer.parser.DiffLineStream):
             The contents of the diff.
 
-        parent_diff_file_contents (bytes):
+        parent_diff_file_contents (bytes or
+                                   reviewboard.diffviewer.parser.
+                                   DiffLineStream):
             The contents of the parent diff, if any.
 
         repository (reviewboard.scmtools.models.Repository):
@@ -217,6 +249,10 @@ def _prepare_file_list(diff_file_contents, parent_diff_file_contents,
             files, if the diffs represent blob IDs instead of commit IDs
             and the service doesn't support those lookups.
 
+        raw_diffs (dict, optional):
+            A dictionary to store each file's diff data in. See
+            :py:func:`_process_files`.
+
     Returns:
         tuple:
         A tuple of the following:
@@ -251,7 +287,8 @@ def _prepare_file_list(diff_file_contents, parent_diff_file_contents,
         request=request,
         check_existence=(check_existence and
                          not parent_diff_file_contents),
-        get_file_exists=get_file_exists))
+        get_file_exists=get_file_exists,
+        raw_diffs=raw_diffs))
 
     if len(files) == 0:
         raise EmptyDiffError(_('The diff is empty.'))
@@ -283,7 +320,8 @@ def _prepare_file_list(diff_file_contents, parent_diff_file_contents,
                 base_commit_id=base_commit_id,
                 request=request,
                 check_existence=check_existence,
-                limit_to=diff_filenames)
+                limit_to=diff_filenames,
+                raw_diffs=raw_diffs)
         }
 
         # This will return a non-None value only for tools that use commit
@@ -295,7 +333,7 @@ def _prepare_file_list(diff_file_contents, parent_diff_file_contents,
 
 def _process_files(parser, basedir, repository, base_commit_id,
                    request, get_file_exists=None, check_existence=False,
-                   limit_to=None):
+                   limit_to=None, raw_diffs=None):
     """Collect metadata about files in the parser.
 
     Args:
@@ -331,6 +369,19 @@ def _process_files(parser, basedir, repository, base_commit_id,
         limit_to (list of unicode, optional):
             A list of filenames to limit the results to.
 
+        raw_diffs (dict, optional):
+            A dictionary to store each file's diff data in.
+
+            If provided, each file's diff will be stored as a
+            :py:class:`~reviewboard.diffviewer.models.raw_file_diff_data.
+            RawFileDiffData` shortly after it's parsed (files are stored in
+            batches), and the dictionary will map the file to it. Files with
+            empty diffs are not stored. Otherwise, the diff will be
+            discarded.
+
+            Either way, the diff data will no longer be available on the
+            yielded files.
+
     Yields:
        reviewboard.diffviewer.parser.ParsedDiffFile:
        The files present in the diff.
@@ -346,8 +397,10 @@ def _process_files(parser, basedir, repository, base_commit_id,
 
     tool = repository.get_scmtool()
     basedir = force_bytes(basedir)
+    pending_files = []
+    pending_size = 0
 
-    for f in parser.parse():
+    for f in parser.iter_files():
         # This will either be a Revision or bytes. Either way, convert it
         # bytes now.
         orig_revision = force_bytes(f.orig_file_details)
@@ -371,6 +424,7 @@ def _process_files(parser, basedir, repository, base_commit_id,
         if limit_to is not None and dest_filename not in limit_to:
             # This file isn't actually needed for the diff, so save
             # ourselves a remote file existence check and some storage.
+            f.discard_data()
             continue
 
         source_filename = _normalize_filename(source_filename, basedir)
@@ -395,7 +449,68 @@ def _process_files(parser, basedir, repository, base_commit_id,
         f.orig_file_details = source_revision
         f.modified_filename = dest_filename
 
-        yield f
+        if raw_diffs is None:
+            f.discard_data()
+
+            yield f
+        else:
+            pending_files.append(f)
+            pending_size += len(f.data)
+
+            if (len(pending_files) >= _STORE_BATCH_MAX_FILES or
+                pending_size >= _STORE_BATCH_MAX_BYTES):
+                for pending_file in _store_raw_diffs(pending_files,
+                                                     raw_diffs):
+                    yield pending_file
+
+                pending_files = []
+                pending_size = 0
+
+    for pending_file in _store_raw_diffs(pending_files, raw_diffs):
+        yield pending_file
+
+
+def _store_raw_diffs(files, raw_diffs):
+    """Store the diffs for a batch of files.
+
+    The diffs are stored as :py:class:`~reviewboard.diffviewer.models.
+    raw_file_diff_data.RawFileDiffData` along with their line counts, using
+    as few queries as possible. Files with empty diffs are not stored.
+
+    Args:
+        files (list of reviewboard.diffviewer.parser.ParsedDiffFile):
+            The files to store the diffs for.
+
+        raw_diffs (dict):
+            The dictionary mapping files to stored diffs. This will be
+            updated with the new entries.
+
+    Returns:
+        list of reviewboard.diffviewer.parser.ParsedDiffFile:
+        The files, after their diff data has been discarded.
+    """
+    from reviewboard.diffviewer.models import RawFileDiffData
+
+    files_to_store = [
+        f
+        for f in files
+        if f.data
+    ]
+
+    if files_to_store:
+        raw_diffs.update(zip(
+            files_to_store,
+            RawFileDiffData.objects.bulk_get_or_create_from_data(
+                [f.data for f in files_to_store],
+                line_counts=[
+                    (f.insert_count, f.delete_count)
+                    for f in files_to_store
+                ])))
+
+    for f in files:
+        f.discard_data()
+
+    return files
 
 
 def _compare_files(file1, file2):
@@ -12,9 +12,10 @@ from django.core.exceptions import ValidationError
 from django.utils.encoding import force_text
 from django.utils.translation import ugettext, ugettext_lazy as _
 
-from reviewboard.diffviewer.commit_utils import (deserialize_validation_info,
+from reviewboard.diffviewer.commit_utils import (ValidationHistory,
+                                                 deserialize_validation_info,
                                                  get_file_exists_in_history)
-from reviewboard.diffviewer.differ import DiffCompatVersion
+from reviewboard.diffviewer.differ import get_diff_compat_version
 from reviewboard.diffviewer.diffutils import check_diff_size
 from reviewboard.diffviewer.filediff_creator import create_filediffs
 from reviewboard.diffviewer.models import DiffCommit, DiffSet
@@ -39,7 +40,7 @@ class BaseCommitValidationForm(forms.Form):
         base64-encoded JSON.
 
         Returns:
-            dict:
+            reviewboard.diffviewer.commit_utils.ValidationHistory:
             The parsed validation information.
 
         Raises:
@@ -49,7 +50,7 @@ class BaseCommitValidationForm(forms.Form):
         validation_info = self.cleaned_data.get('validation_info', '').strip()
 
         if not validation_info:
-            return {}
+            return ValidationHistory()
 
         try:
             return deserialize_validation_info(validation_info)
@@ -470,11 +471,11 @@ class ValidateCommitForm(BaseCommitValidationForm):
                           revision=0,
                           basedir='',
                           repository=self.repository,
-                          diffcompat=DiffCompatVersion.DEFAULT,
+                          diffcompat=get_diff_compat_version(self.repository),
                           base_commit_id=base_commit_id)
 
         get_file_exists = partial(get_file_exists_in_history,
-                                  validation_info or {},
+                                  validation_info or ValidationHistory(),
                                   self.repository,
                                   self.cleaned_data['parent_id'])
 
@@ -0,0 +1,112 @@
+from __future__ import unicode_literals
+
+from django.utils.six.moves import range
+
+from reviewboard.diffviewer.patiencediff import PatienceDiffer
+
+
+class HistogramDiffer(PatienceDiffer):
+    """An implementation of the Histogram Diff algorithm.
+
+    This is an extension of :py:class:`~reviewboard.diffviewer.patiencediff.
+    PatienceDiffer` (as popularized by JGit and :command:`git diff
+    --histogram`). Rather than requiring anchor lines to be unique, it builds
+    a histogram of the lines in the original region and splits the region on
+    the longest common run of lines that contains the rarest line found in
+    both files.
+
+    Lines that occur more than :py:attr:`MAX_CHAIN_LENGTH` times in a region
+    are never used to split it. Regions that can't be split are handed off
+    to the bounded-cost Myers algorithm.
+    """
+
+    #: The maximum number of occurrences of a line to consider it as a split
+    #: point.
+    MAX_CHAIN_LENGTH = 64
+
+    def _find_matches(self, a_lower, a_upper, b_lower, b_upper):
+        """Return the matching block to split a region on.
+
+        Args:
+            a_lower (int):
+                The start of the region in the original file.
+
+            a_upper (int):
+                The end of the region in the original file.
+
+            b_lower (int):
+                The start of the region in the modified file.
+
+            b_upper (int):
+                The end of the region in the modified file.
+
+        Returns:
+            list of tuple:
+            A list containing a single ``(i, j, length)`` tuple for the
+            matching block, or an empty list if there are no suitable lines
+            to split on.
+        """
+        a = self.a_data.data
+        b = self.b_data.data
+        max_chain_length = self.MAX_CHAIN_LENGTH
+
+        # Build the histogram of lines in the original region, mapping each
+        # line code to the indexes it's found at.
+        occurrences = {}
+
+        for i in range(a_lower, a_upper):
+            occurrences.setdefault(a[i], []).append(i)
+
+        best = None
+        best_count = max_chain_length
+        j = b_lower
+
+        while j < b_upper:
+            indexes = occurrences.get(b[j])
+
+            if indexes is None or len(indexes) > best_count:
+                j += 1
+                continue
+
+            next_j = j + 1
+
+            for i in indexes:
+                if len(indexes) > best_count:
+                    break
+
+                # Extend the match in both directions, tracking the rarest
+                # line within it.
+                start_i = i
+                start_j = j
+                end_i = i + 1
+                end_j = j + 1
+                count = len(indexes)
+
+                while (start_i > a_lower and start_j > b_lower and
+                       a[start_i - 1] == b[start_j - 1]):
+                    start_i -= 1
+                    start_j -= 1
+                    count = min(count, len(occurrences[a[start_i]]))
+
+                while (end_i < a_upper and end_j < b_upper and
+                       a[end_i] == b[end_j]):
+                    count = min(count, len(occurrences[a[end_i]]))
+                    end_i += 1
+                    end_j += 1
+
+                length = end_i - start_i
+
+                if (best is None or
+                    count < best_count or
+                    (count == best_count and length > best[2])):
+                    best = (start_i, start_j, length)
+                    best_count = count
+
+                next_j = max(next_j, end_j)
+
+            j = next_j
+
+        if best is None:
+            return []
+
+        return [best]
@@ -0,0 +1,169 @@
+"""Management command to store line counts on existing diffs."""
+
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils.translation import ugettext as _
+from djblets.util.compat.django.core.management.base import BaseCommand
+
+from reviewboard.diffviewer.models import DiffCommit, DiffSet
+
+
+class Command(BaseCommand):
+    """Management command to store line counts on existing diffs.
+
+    Diffs uploaded to Review Board 4.0 and higher store the total number
+    of inserted and deleted lines on each DiffSet and DiffCommit. Older
+    diffs have them computed from their FileDiffs every time they're
+    shown (for instance, in the Diff Size column on the dashboard). This
+    command computes and stores them, and can be safely run in the
+    background while the server is in use.
+    """
+
+    help = _('Stores the total line counts for diffs uploaded to older '
+             'versions of Review Board.')
+
+    def add_arguments(self, parser):
+        """Add arguments to the command.
+
+        Args:
+            parser (argparse.ArgumentParser):
+                The argument parser for the command.
+        """
+        parser.add_argument(
+            '--batch-size',
+            action='store',
+            dest='batch_size',
+            type=int,
+            default=100,
+            help=_('The number of diffs to process in each database '
+                   'transaction. The default is 100.'))
+        parser.add_argument(
+            '--max-diffs',
+            action='store',
+            dest='max_diffs',
+            type=int,
+            default=None,
+            help=_('The maximum number of diffs and commits to store line '
+                   'counts for. This is useful if you have a lot of diffs '
+                   'and want to process them over several sessions.'))
+
+    def handle(self, **options):
+        """Handle the command.
+
+        Args:
+            **options (dict):
+                Options parsed on the command line.
+
+        Raises:
+            django.core.management.CommandError:
+                The options were invalid.
+        """
+        batch_size = options['batch_size']
+        max_diffs = options['max_diffs']
+
+        if batch_size < 1:
+            raise CommandError(_('--batch-size must be a positive number.'))
+
+        # Don't allow queries to be stored.
+        settings.DEBUG = False
+
+        num_diffsets = self._store_line_counts(DiffSet, batch_size,
+                                               max_diffs)
+
+        if max_diffs is not None:
+            max_diffs = max(max_diffs - num_diffsets, 0)
+
+        num_commits = self._store_line_counts(DiffCommit, batch_size,
+                                              max_diffs)
+
+        if num_diffsets == 0 and num_commits == 0:
+            self.stdout.write(_('All diffs already have line counts '
+                                'stored.'))
+        else:
+            self.stdout.write(
+                _('Stored line counts for %(num_diffsets)s diffs and '
+                  '%(num_commits)s commits.')
+                % {
+                    'num_diffsets': num_diffsets,
+                    'num_commits': num_commits,
+                })
+
+    def _store_line_counts(self, model, batch_size, max_items):
+        """Store line counts on all instances of a model missing them.
+
+        Args:
+            model (type):
+                The model to process. This is either
+                :py:class:`~reviewboard.diffviewer.models.diffset.DiffSet`
+                or :py:class:`~reviewboard.diffviewer.models.diffcommit.
+                DiffCommit`.
+
+            batch_size (int):
+                The number of instances to process in each transaction.
+
+            max_items (int):
+                The maximum number of instances to process, or ``None`` to
+                process all of them.
+
+        Returns:
+            int:
+            The number of instances that had line counts stored.
+        """
+        key = model._RAW_LINE_COUNTS_KEY
+        num_processed = 0
+        last_pk = 0
+
+        while max_items is None or num_processed < max_items:
+            batch = list(
+                model.objects
+                .filter(pk__gt=last_pk)
+                .order_by('pk')
+                [:batch_size])
+
+            if not batch:
+                break
+
+            last_pk = batch[-1].pk
+            objs = [
+                obj
+                for obj in batch
+                if key not in (obj.extra_data or {})
+            ]
+
+            if max_items is not None:
+                objs = objs[:max_items - num_processed]
+
+            if not objs:
+                continue
+
+            prefetch_related_objects(objs, 'files')
+
+            with transaction.atomic():
+                # Lock the rows being updated, and only store the counts on
+                # the latest copies, so that concurrent changes to their
+                # extra_data aren't overwritten.
+                stored_objs = (
+                    model.objects
+                    .select_for_update()
+                    .filter(pk__in=[obj.pk for obj in objs])
+                    .only('extra_data')
+                    .in_bulk())
+
+                for obj in objs:
+                    stored_obj = stored_objs[obj.pk]
+
+                    if stored_obj.extra_data is None:
+                        stored_obj.extra_data = {}
+
+                    if key not in stored_obj.extra_data:
+                        stored_obj.extra_data[key] = \
+                            obj.get_total_raw_line_counts()
+                        stored_obj.save(update_fields=('extra_data',))
+
+            num_processed += len(objs)
+
+        return num_processed
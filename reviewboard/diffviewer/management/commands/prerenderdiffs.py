@@ -0,0 +1,134 @@
+"""Management command to pre-render diffs for recent review requests."""
+
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from django.core.management.base import CommandError
+from django.utils import timezone
+from django.utils.translation import ugettext as _
+from djblets.util.compat.django.core.management.base import BaseCommand
+
+from reviewboard.diffviewer.prerender import (prerender_backend_registry,
+                                              prerender_diffset)
+from reviewboard.reviews.models import ReviewRequest
+
+
+class Command(BaseCommand):
+    """Management command to pre-render diffs for recent review requests.
+
+    This fills the cache with the rendered diff chunks for the latest diffs
+    on review requests that were recently updated, so that they're fast to
+    view after the cache has been cleared or the server has been upgraded.
+    """
+
+    help = _('Pre-renders the latest diffs on recently-updated review '
+             'requests, storing the results in the cache.')
+
+    def add_arguments(self, parser):
+        """Add arguments to the command.
+
+        Args:
+            parser (argparse.ArgumentParser):
+                The argument parser for the command.
+        """
+        parser.add_argument(
+            '--days',
+            action='store',
+            dest='days',
+            type=int,
+            default=7,
+            help=_('Pre-render diffs on review requests updated within this '
+                   'many days. The default is 7.'))
+        parser.add_argument(
+            '--max-review-requests',
+            action='store',
+            dest='max_review_requests',
+            type=int,
+            default=None,
+            help=_('The maximum number of review requests to pre-render '
+                   'diffs for, starting with the most recently updated.'))
+        parser.add_argument(
+            '--queue',
+            action='store_true',
+            dest='queue',
+            default=False,
+            help=_('Queue the diffs using the configured pre-rendering '
+                   'backend, instead of rendering them in this process. This '
+                   'is intended for backends that hand the work off to a '
+                   'task queue.'))
+
+    def handle(self, **options):
+        """Handle the command.
+
+        Args:
+            **options (dict):
+                Options parsed on the command line.
+
+        Raises:
+            django.core.management.CommandError:
+                The options were invalid, or queueing was requested with
+                pre-rendering disabled.
+        """
+        days = options['days']
+        max_review_requests = options['max_review_requests']
+
+        if days < 1:
+            raise CommandError(_('--days must be a positive number.'))
+
+        if options['queue']:
+            backend = prerender_backend_registry.current_backend
+
+            if backend is None:
+                raise CommandError(
+                    _('--queue requires a diff pre-rendering backend to be '
+                      'configured in the Diff Viewer settings.'))
+        else:
+            backend = None
+
+        review_requests = (
+            ReviewRequest.objects
+            .filter(public=True,
+                    diffset_history__diffsets__isnull=False,
+                    last_updated__gte=timezone.now() - timedelta(days=days))
+            .distinct()
+            .order_by('-last_updated')
+        )
+
+        if max_review_requests is not None:
+            review_requests = review_requests[:max_review_requests]
+
+        num_diffsets = 0
+        num_files = 0
+
+        for review_request in review_requests:
+            diffset = review_request.get_latest_diffset()
+
+            if diffset is None:
+                continue
+
+            if backend is None:
+                self.stdout.write(
+                    _('Pre-rendering diff revision %(revision)s for review '
+                      'request %(review_request_id)s...')
+                    % {
+                        'revision': diffset.revision,
+                        'review_request_id': review_request.display_id,
+                    })
+                num_files += prerender_diffset(diffset.pk)
+            else:
+                backend.queue_diffset(diffset.pk)
+
+            num_diffsets += 1
+
+        if backend is None:
+            self.stdout.write(
+                _('Pre-rendered %(num_files)s files in %(num_diffsets)s '
+                  'diffs.')
+                % {
+                    'num_files': num_files,
+                    'num_diffsets': num_diffsets,
+                })
+        else:
+            self.stdout.write(
+                _('Queued %s diffs for pre-rendering.') % num_diffsets)
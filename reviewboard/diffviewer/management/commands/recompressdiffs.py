@@ -0,0 +1,183 @@
+"""Management command to recompress stored diffs."""
+
+from __future__ import unicode_literals, division
+
+import sys
+
+from django.conf import settings
+from django.contrib.humanize.templatetags.humanize import intcomma
+from django.core.management.base import CommandError
+from django.utils import six
+from django.utils.translation import ugettext as _
+from djblets.util.compat.django.core.management.base import BaseCommand
+
+from reviewboard.diffviewer.compression import (
+    ZstdDictionaryDiffCompressionCodec,
+    diff_compression_codec_registry,
+    train_zstd_dictionary)
+from reviewboard.diffviewer.models import RawFileDiffData
+
+
+class Command(BaseCommand):
+    """Management command to recompress stored diffs.
+
+    This recompresses diffs stored by Review Board 2.5+ using a new codec,
+    such as one that's faster to decompress than the bzip2 compression used
+    by older versions. It can also train a new dictionary for compressing
+    small diffs with Zstandard.
+    """
+
+    help = _('Recompresses the diffs stored in the database using the '
+             'configured compression codec.')
+
+    def add_arguments(self, parser):
+        """Add arguments to the command.
+
+        Args:
+            parser (argparse.ArgumentParser):
+                The argument parser for the command.
+        """
+        parser.add_argument(
+            '--codec',
+            action='store',
+            dest='codec_id',
+            default=None,
+            help=_('The ID of the codec to compress diffs with. This '
+                   'defaults to the codec configured in the Diff Viewer '
+                   'settings. Available codecs are: %s')
+                 % ', '.join(
+                     '%s (%s)' % (codec.codec_id, codec.name)
+                     for codec in diff_compression_codec_registry
+                     if codec.available))
+        parser.add_argument(
+            '--batch-size',
+            action='store',
+            dest='batch_size',
+            type=int,
+            default=100,
+            help=_('The number of diffs to recompress in each database '
+                   'transaction. The default is 100.'))
+        parser.add_argument(
+            '--max-diffs',
+            action='store',
+            dest='max_diffs',
+            type=int,
+            default=None,
+            help=_('The maximum number of diffs to recompress. This is '
+                   'useful if you have a lot of diffs and want to '
+                   'recompress them over several sessions.'))
+        parser.add_argument(
+            '--train-dictionary',
+            action='store_true',
+            dest='train_dictionary',
+            default=False,
+            help=_('Train a new dictionary for compressing small diffs from '
+                   'the most recent stored diffs before recompressing. This '
+                   'requires the zstandard module.'))
+        parser.add_argument(
+            '--dictionary-samples',
+            action='store',
+            dest='dictionary_samples',
+            type=int,
+            default=10000,
+            help=_('The maximum number of diffs to train the dictionary on. '
+                   'The default is 10000.'))
+
+    def handle(self, **options):
+        """Handle the command.
+
+        Args:
+            **options (dict):
+                Options parsed on the command line.
+
+        Raises:
+            django.core.management.CommandError:
+                The options were invalid, or the dictionary could not be
+                trained.
+        """
+        codec_id = options['codec_id']
+        batch_size = options['batch_size']
+
+        if codec_id is None:
+            codec = diff_compression_codec_registry.current_codec
+        else:
+            codec = diff_compression_codec_registry.get('codec_id', codec_id)
+
+            if codec is None or not codec.available:
+                raise CommandError(
+                    _('The compression codec "%s" is not available.')
+                    % codec_id)
+
+        if batch_size < 1:
+            raise CommandError(_('--batch-size must be a positive number.'))
+
+        if options['train_dictionary']:
+            try:
+                dictionary = train_zstd_dictionary(
+                    max_samples=options['dictionary_samples'])
+            except ValueError as e:
+                raise CommandError(six.text_type(e))
+
+            self.stdout.write(_('Trained compression dictionary %s.')
+                              % dictionary.dict_id)
+
+            if not isinstance(codec, ZstdDictionaryDiffCompressionCodec):
+                self.stderr.write(
+                    _('Warning: The dictionary will only be used when '
+                      'compressing with the "%s" codec.')
+                    % ZstdDictionaryDiffCompressionCodec.codec_id)
+
+        self.stdout.write(_('Recompressing stored diffs using %s...\n')
+                          % codec.name)
+
+        # Don't allow queries to be stored.
+        settings.DEBUG = False
+
+        info = RawFileDiffData.objects.recompress_all(
+            codec=codec,
+            batch_done_cb=self._on_batch_done,
+            batch_size=batch_size,
+            max_diffs=options['max_diffs'])
+
+        if info['diffs_processed'] == 0:
+            self.stdout.write(_('All diffs have already been recompressed.'))
+        else:
+            old_diff_size = info['old_diff_size']
+            new_diff_size = info['new_diff_size']
+
+            self.stdout.write(
+                _('\n'
+                  '\n'
+                  'Recompressed %(count)s stored diffs from %(old_size)s '
+                  'bytes to %(new_size)s bytes (%(change_pct)+0.2f%%)')
+                % {
+                    'count': intcomma(info['diffs_processed']),
+                    'old_size': intcomma(old_diff_size),
+                    'new_size': intcomma(new_diff_size),
+                    'change_pct': (float(new_diff_size - old_diff_size) /
+                                   float(max(old_diff_size, 1)) * 100),
+                })
+
+    def _on_batch_done(self, total_diffs_processed, total_count, **kwargs):
+        """Handler for when a batch of diffs are processed.
+
+        Args:
+            total_diffs_processed (int):
+                The total number of diffs processed so far.
+
+            total_count (int):
+                The total number of diffs to process.
+
+            **kwargs (dict, unused):
+                Unused keyword arguments.
+        """
+        # NOTE: We use sys.stdout when writing instead of self.stdout in order
+        #       to control newlines. Command.stdout will force a \n for each
+        #       write.
+        total_count = max(total_diffs_processed, total_count)
+
+        sys.stdout.write('  [%d%%] %s/%s\r'
+                         % (total_diffs_processed * 100 / total_count,
+                            total_diffs_processed,
+                            total_count))
+        sys.stdout.flush()
@@ -2,23 +2,29 @@
 
 from __future__ import unicode_literals
 
-import bz2
 import gc
 import hashlib
 import logging
 from functools import partial
 
 from django.conf import settings
-from django.db import models, reset_queries, connection, connections
+from django.db import (models, reset_queries, connection, connections,
+                       transaction)
 from django.db.models import Count, Q
 from django.db.utils import IntegrityError
+from django.utils import six
 from django.utils.encoding import force_text
 from django.utils.translation import ugettext as _
 
-from reviewboard.diffviewer.commit_utils import get_file_exists_in_history
-from reviewboard.diffviewer.differ import DiffCompatVersion
-from reviewboard.diffviewer.diffutils import check_diff_size
+from reviewboard.diffviewer.commit_utils import (ValidationHistory,
+                                                 get_file_exists_in_history)
+from reviewboard.diffviewer.compression import diff_compression_codec_registry
+from reviewboard.diffviewer.differ import get_diff_compat_version
+from reviewboard.diffviewer.diffutils import (check_diff_size,
+                                              get_total_raw_line_counts)
 from reviewboard.diffviewer.filediff_creator import create_filediffs
+from reviewboard.diffviewer.parser import DiffLineStream
+from reviewboard.diffviewer.prerender import queue_prerender_diffset
 
 
 logger = logging.getLogger(__name__)
@@ -594,20 +600,146 @@ class RawFileDiffDataManager(models.Manager):
     This provides conveniences for creating an entry based on a
     LegacyFileDiffData object.
     """
-    def process_diff_data(self, data):
+
+    #: The maximum number of hashes to look up in a single query.
+    HASH_LOOKUP_BATCH_SIZE = 500
+
+    def process_diff_data(self, data, codec=None):
         """Processes a diff, returning the resulting content and compression.
 
         If the content would benefit from being compressed, this will
         return the compressed content and the value for the compression
         flag. Otherwise, it will return the raw content.
+
+        Args:
+            data (bytes):
+                The diff data to process.
+
+            codec (reviewboard.diffviewer.compression.
+                   BaseDiffCompressionCodec, optional):
+                The codec to compress with. This defaults to the codec
+                configured in the ``diffviewer_compression_codec_id``
+                setting.
+
+        Returns:
+            tuple:
+            A 2-tuple of the data to store and the value for the
+            compression flag.
         """
-        compressed_data = bz2.compress(data, 9)
+        if codec is None:
+            codec = diff_compression_codec_registry.current_codec
+
+        compressed_data = codec.compress(data)
 
         if len(compressed_data) < len(data):
-            return compressed_data, self.model.COMPRESSION_BZIP2
+            return compressed_data, codec.codec_id
         else:
             return data, None
 
+    def recompress_all(self, codec=None, batch_done_cb=None, batch_size=100,
+                       max_diffs=None):
+        """Recompress stored diffs using a new codec.
+
+        Every stored diff not already compressed with the codec is
+        decompressed and compressed again, in batches. Diffs that don't
+        benefit from compression are stored uncompressed, as with new diffs.
+
+        This is safe to run while Review Board is in use.
+
+        Args:
+            codec (reviewboard.diffviewer.compression.
+                   BaseDiffCompressionCodec, optional):
+                The codec to compress with. This defaults to the codec
+                configured in the ``diffviewer_compression_codec_id``
+                setting.
+
+            batch_done_cb (callable, optional):
+                A function to call after each batch of objects has been
+                processed. This can be used for progress notification.
+
+                This should be in the form of:
+
+                .. code-block:: python
+
+                   def on_batch_done(total_diffs_processed=None,
+                                     total_count=None, **kwargs):
+                       ...
+
+            batch_size (int, optional):
+                The number of objects to process in each batch.
+
+            max_diffs (int, optional):
+                The maximum number of diffs to process.
+
+        Returns:
+            dict:
+            A dictionary containing the number of diffs processed
+            (``diffs_processed``) and their total stored size before
+            (``old_diff_size``) and after (``new_diff_size``).
+        """
+        assert batch_done_cb is None or callable(batch_done_cb)
+
+        if codec is None:
+            codec = diff_compression_codec_registry.current_codec
+
+        queryset = (
+            self.exclude(compression=codec.codec_id)
+            .order_by('pk')
+        )
+
+        total_count = queryset.count()
+
+        if max_diffs is not None:
+            total_count = min(total_count, max_diffs)
+
+        total_diffs_processed = 0
+        old_diff_size = 0
+        new_diff_size = 0
+        last_pk = 0
+
+        while max_diffs is None or total_diffs_processed < max_diffs:
+            limit = batch_size
+
+            if max_diffs is not None:
+                limit = min(limit, max_diffs - total_diffs_processed)
+
+            batch = list(queryset.filter(pk__gt=last_pk)[:limit])
+
+            if not batch:
+                break
+
+            with transaction.atomic():
+                for raw_diff_data in batch:
+                    old_size = len(raw_diff_data.binary)
+                    processed_data, compression = \
+                        self.process_diff_data(raw_diff_data.content,
+                                               codec=codec)
+
+                    if compression != raw_diff_data.compression:
+                        self.filter(pk=raw_diff_data.pk).update(
+                            binary=processed_data,
+                            compression=compression)
+
+                    old_diff_size += old_size
+                    new_diff_size += len(processed_data)
+
+            total_diffs_processed += len(batch)
+            last_pk = batch[-1].pk
+
+            if batch_done_cb is not None:
+                batch_done_cb(total_diffs_processed=total_diffs_processed,
+                              total_count=total_count)
+
+            # Keep memory usage down when processing many diffs.
+            reset_queries()
+            gc.collect()
+
+        return {
+            'diffs_processed': total_diffs_processed,
+            'old_diff_size': old_diff_size,
+            'new_diff_size': new_diff_size,
+        }
+
     def get_or_create_from_data(self, data):
         """Return or create a new stored entry for diff data.
 
@@ -639,6 +771,110 @@ class RawFileDiffDataManager(models.Manager):
                 'compression': compression,
             })
 
+    def bulk_get_or_create_from_data(self, data_list, line_counts=None):
+        """Return or create stored entries for a list of diff data.
+
+        This works like :py:meth:`get_or_create_from_data`, but looks up
+        all existing entries in one query and creates any missing entries
+        at once, which is much faster for diffs with many files.
+
+        Args:
+            data_list (list of bytes):
+                The diff data to store or return entries for.
+
+            line_counts (list of tuple, optional):
+                A list of ``(insert_count, delete_count)`` tuples for each
+                item in ``data_list``. If provided, these will be stored on
+                new entries, and on existing entries that don't yet have line
+                counts, saving them from being calculated later.
+
+        Returns:
+            list of reviewboard.diffviewer.models.raw_file_diff_data.
+            RawFileDiffData:
+            The entries for the diff data, in the same order as
+            ``data_list``.
+
+        Raises:
+            TypeError:
+                The data passed in contained a value that was not a bytes
+                string.
+        """
+        for data in data_list:
+            if not isinstance(data, bytes):
+                raise TypeError(
+                    'RawFileDiffData.objects.bulk_get_or_create_from_data '
+                    'expects bytes values, not %s'
+                    % type(data))
+
+        if line_counts is None:
+            line_counts = [(None, None)] * len(data_list)
+
+        assert len(line_counts) == len(data_list)
+
+        hashes = [
+            self._hash_hexdigest(data)
+            for data in data_list
+        ]
+        entries = self._get_by_hashes(hashes)
+        new_entries = {}
+
+        for binary_hash, data, (insert_count, delete_count) in \
+                zip(hashes, data_list, line_counts):
+            if binary_hash in entries or binary_hash in new_entries:
+                continue
+
+            processed_data, compression = self.process_diff_data(data)
+            new_entry = self.model(binary_hash=binary_hash,
+                                   binary=processed_data,
+                                   compression=compression,
+                                   extra_data={})
+
+            if insert_count is not None:
+                new_entry.insert_count = insert_count
+
+            if delete_count is not None:
+                new_entry.delete_count = delete_count
+
+            new_entries[binary_hash] = new_entry
+
+        if new_entries:
+            try:
+                with transaction.atomic():
+                    self.bulk_create(list(six.itervalues(new_entries)))
+            except IntegrityError:
+                # Some of these were created by another request since we
+                # looked them up. Fall back on creating them one-by-one.
+                for new_entry in six.itervalues(new_entries):
+                    self.get_or_create(
+                        binary_hash=new_entry.binary_hash,
+                        defaults={
+                            'binary': new_entry.binary,
+                            'compression': new_entry.compression,
+                            'extra_data': new_entry.extra_data,
+                        })
+
+            # Not all databases return the IDs of bulk-created rows, so
+            # fetch the new entries again.
+            entries.update(self._get_by_hashes(list(new_entries)))
+
+        for binary_hash, (insert_count, delete_count) in zip(hashes,
+                                                             line_counts):
+            entry = entries[binary_hash]
+
+            if ((insert_count is not None and entry.insert_count is None) or
+                (delete_count is not None and entry.delete_count is None)):
+                if entry.extra_data is None:
+                    entry.extra_data = {}
+
+                entry.insert_count = insert_count
+                entry.delete_count = delete_count
+                entry.save(update_fields=['extra_data'])
+
+        return [
+            entries[binary_hash]
+            for binary_hash in hashes
+        ]
+
     def create_from_legacy(self, legacy, save=True):
         processed_data, compression = self.process_diff_data(legacy.binary)
 
@@ -657,6 +893,32 @@ class RawFileDiffDataManager(models.Manager):
         hasher.update(diff)
         return hasher.hexdigest()
 
+    def _get_by_hashes(self, hashes):
+        """Return the stored entries for a list of hashes.
+
+        The hashes are looked up in batches, to stay within the limits some
+        databases place on the number of parameters in a query.
+
+        Args:
+            hashes (list of unicode):
+                The hashes of the diff data.
+
+        Returns:
+            dict:
+            A dictionary mapping the hashes of any stored entries to the
+            entries.
+        """
+        entries = {}
+
+        for i in range(0, len(hashes), self.HASH_LOOKUP_BATCH_SIZE):
+            entries.update(
+                (entry.binary_hash, entry)
+                for entry in self.filter(binary_hash__in=hashes[
+                    i:i + self.HASH_LOOKUP_BATCH_SIZE])
+            )
+
+        return entries
+
 
 class BaseDiffManager(models.Manager):
     """A base manager class for creating models out of uploaded diffs"""
@@ -757,9 +1019,19 @@ class BaseDiffManager(models.Manager):
         """
         check_diff_size(diff_file, parent_diff_file)
 
+        # If the SCMTool can parse diffs as they're read from the uploaded
+        # files, avoid reading them entirely into memory.
+        streaming = repository.get_scmtool().supports_streaming_diffs
+
+        def get_contents(uploaded_file):
+            if streaming:
+                return DiffLineStream(uploaded_file.chunks())
+            else:
+                return uploaded_file.read()
+
         if parent_diff_file:
             parent_diff_file_name = parent_diff_file.name
-            parent_diff_file_contents = parent_diff_file.read()
+            parent_diff_file_contents = get_contents(parent_diff_file)
         else:
             parent_diff_file_name = None
             parent_diff_file_contents = None
@@ -767,7 +1039,7 @@ class BaseDiffManager(models.Manager):
         return self.create_from_data(
             repository=repository,
             diff_file_name=diff_file.name,
-            diff_file_contents=diff_file.read(),
+            diff_file_contents=get_contents(diff_file),
             parent_diff_file_name=parent_diff_file_name,
             parent_diff_file_contents=parent_diff_file_contents,
             request=request,
@@ -836,13 +1108,17 @@ class DiffCommitManager(BaseDiffManager):
             diff_file_name (unicode):
                 The name of the diff file.
 
-            diff_file_contents (bytes):
+            diff_file_contents (bytes or
+                                reviewboard.diffviewer.parser.
+                                DiffLineStream):
                 The contents of the diff file.
 
             parent_diff_file_name (unicode):
                 The name of the parent diff file.
 
-            parent_diff_file_contents (bytes):
+            parent_diff_file_contents (bytes or
+                                       reviewboard.diffviewer.parser.
+                                       DiffLineStream):
                 The contents of the parent diff file.
 
             diffset (reviewboard.diffviewer.models.diffset.DiffSet):
@@ -869,8 +1145,9 @@ class DiffCommitManager(BaseDiffManager):
             request (django.http.HttpRequest, optional):
                 The HTTP request from the client.
 
-            validation_info (dict, optional):
-                A dictionary of parsed validation information from the
+            validation_info (reviewboard.diffviewer.commit_utils.
+                             ValidationHistory, optional):
+                The parsed validation information from the
                 :py:class:`~reviewboard.webapi.resources.validate_diffcommit.
                 ValidateDiffCommitResource`.
 
@@ -919,11 +1196,11 @@ class DiffCommitManager(BaseDiffManager):
             diffcommit.save()
 
         get_file_exists = partial(get_file_exists_in_history,
-                                  validation_info or {},
+                                  validation_info or ValidationHistory(),
                                   repository,
                                   parent_id)
 
-        create_filediffs(
+        filediffs = create_filediffs(
             get_file_exists=get_file_exists,
             diff_file_contents=diff_file_contents,
             parent_diff_file_contents=parent_diff_file_contents,
@@ -939,6 +1216,14 @@ class DiffCommitManager(BaseDiffManager):
         if validate_only:
             return None
 
+        # Store the total line counts, so that they can be shown without
+        # loading the FileDiffs again.
+        diffcommit.extra_data[self.model._RAW_LINE_COUNTS_KEY] = \
+            get_total_raw_line_counts(filediffs)
+        diffcommit.save(update_fields=('extra_data',))
+
+        diffset._add_raw_line_counts(filediffs, save=True)
+
         return diffcommit
 
 
@@ -981,13 +1266,17 @@ class DiffSetManager(BaseDiffManager):
             diff_file_name (unicode):
                 The filename of the main diff file.
 
-            diff_file_contents (bytes):
+            diff_file_contents (bytes or
+                                reviewboard.diffviewer.parser.
+                                DiffLineStream):
                 The contents of the main diff file.
 
             parent_diff_file_name (unicode, optional):
                 The filename of the parent diff, if one is provided.
 
-            parent_diff_file_contents (bytes, optional):
+            parent_diff_file_contents (bytes or
+                                       reviewboard.diffviewer.parser.
+                                       DiffLineStream, optional):
                 The contents of the parent diff, if one is provided.
 
             diffset_history (reviewboard.diffviewer.models.diffset_history.
@@ -1051,13 +1340,13 @@ class DiffSetManager(BaseDiffManager):
             basedir=basedir,
             history=diffset_history,
             repository=repository,
-            diffcompat=DiffCompatVersion.DEFAULT,
+            diffcompat=get_diff_compat_version(repository),
             base_commit_id=base_commit_id)
 
         if not validate_only:
             diffset.save()
 
-        create_filediffs(
+        filediffs = create_filediffs(
             get_file_exists=repository.get_file_exists,
             diff_file_contents=diff_file_contents,
             parent_diff_file_contents=parent_diff_file_contents,
@@ -1073,6 +1362,14 @@ class DiffSetManager(BaseDiffManager):
         if validate_only:
             return None
 
+        # Store the total line counts, so that they can be shown without
+        # loading the FileDiffs again.
+        diffset.extra_data[self.model._RAW_LINE_COUNTS_KEY] = \
+            get_total_raw_line_counts(filediffs)
+        diffset.save(update_fields=('extra_data',))
+
+        queue_prerender_diffset(diffset)
+
         return diffset
 
     def create_empty(self, repository, diffset_history=None, **kwargs):
@@ -1100,9 +1397,16 @@ class DiffSetManager(BaseDiffManager):
             The created DiffSet.
         """
         kwargs.setdefault('revision', 0)
+
+        # Commits will add their line counts to these as they're created.
+        extra_data = dict(kwargs.pop('extra_data', None) or {})
+        extra_data[self.model._RAW_LINE_COUNTS_KEY] = \
+            get_total_raw_line_counts([])
+
         return super(DiffSetManager, self).create(
             name='diff',
             history=diffset_history,
             repository=repository,
-            diffcompat=DiffCompatVersion.DEFAULT,
+            diffcompat=get_diff_compat_version(repository),
+            extra_data=extra_data,
             **kwargs)
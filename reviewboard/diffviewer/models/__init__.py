@@ -2,6 +2,8 @@
 
 from __future__ import unicode_literals
 
+from reviewboard.diffviewer.models.diff_compression_dictionary import \
+    DiffCompressionDictionary
 from reviewboard.diffviewer.models.diffcommit import DiffCommit
 from reviewboard.diffviewer.models.diffset import DiffSet
 from reviewboard.diffviewer.models.diffset_history import DiffSetHistory
@@ -13,6 +15,7 @@ from reviewboard.diffviewer.models.raw_file_diff_data import RawFileDiffData
 
 __all__ = [
     'DiffCommit',
+    'DiffCompressionDictionary',
     'DiffSet',
     'DiffSetHistory',
     'FileDiff',
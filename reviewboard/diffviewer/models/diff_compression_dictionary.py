@@ -0,0 +1,29 @@
+"""DiffCompressionDictionary model definition."""
+
+from __future__ import unicode_literals
+
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+
+class DiffCompressionDictionary(models.Model):
+    """A trained dictionary used to compress small diffs.
+
+    These are created by
+    :py:func:`~reviewboard.diffviewer.compression.train_zstd_dictionary`,
+    and used by
+    :py:class:`~reviewboard.diffviewer.compression.
+    ZstdDictionaryDiffCompressionCodec`. Dictionaries must not be deleted
+    while any diffs compressed with them are still stored.
+    """
+
+    dict_id = models.PositiveIntegerField(_('dictionary ID'), unique=True)
+    data = models.BinaryField()
+    timestamp = models.DateTimeField(_('timestamp'), default=timezone.now)
+
+    class Meta:
+        app_label = 'diffviewer'
+        db_table = 'diffviewer_diffcompressiondictionary'
+        verbose_name = _('Diff Compression Dictionary')
+        verbose_name_plural = _('Diff Compression Dictionaries')
@@ -10,7 +10,8 @@ from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 from djblets.db.fields import JSONField
 
-from reviewboard.diffviewer.diffutils import get_total_line_counts
+from reviewboard.diffviewer.diffutils import (get_total_line_counts,
+                                              get_total_raw_line_counts)
 from reviewboard.diffviewer.managers import DiffCommitManager
 from reviewboard.diffviewer.models.diffset import DiffSet
 from reviewboard.diffviewer.validators import (COMMIT_ID_LENGTH,
@@ -39,6 +40,8 @@ class DiffCommit(models.Model):
     #: The date format that this model uses.
     ISO_DATE_FORMAT = '%Y-%m-%d %H:%M:%S%z'
 
+    _RAW_LINE_COUNTS_KEY = '__raw_line_counts'
+
     filename = models.CharField(
         _('File Name'),
         max_length=256,
@@ -225,6 +228,29 @@ class DiffCommit(models.Model):
         """
         return get_total_line_counts(self.files.all())
 
+    def get_total_raw_line_counts(self):
+        """Return the total raw line counts of all child FileDiffs.
+
+        These are stored on the commit when it's created, so they can be
+        shown without loading any FileDiffs. For commits created by older
+        versions of Review Board, they will be computed from the FileDiffs,
+        but not stored. The :command:`aggregatelinecounts` management
+        command stores them.
+
+        Returns:
+            dict:
+            A dictionary with the following keys:
+
+            * ``raw_insert_count``
+            * ``raw_delete_count``
+        """
+        counts = (self.extra_data or {}).get(self._RAW_LINE_COUNTS_KEY)
+
+        if counts is None:
+            counts = get_total_raw_line_counts(self.files.all())
+
+        return dict(counts)
+
     def __str__(self):
         """Return a human-readable representation of the commit.
 
@@ -2,16 +2,21 @@
 
 from __future__ import unicode_literals
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
 from django.utils import six, timezone
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext, ugettext_lazy as _
+from djblets.cache.backend import make_cache_key
 from djblets.db.fields import JSONField, RelationCounterField
 
+from reviewboard.diffviewer.commit_utils import FileDiffAncestorIndex
 from reviewboard.diffviewer.filediff_creator import create_filediffs
-from reviewboard.diffviewer.diffutils import get_total_line_counts
+from reviewboard.diffviewer.diffutils import (get_total_line_counts,
+                                              get_total_raw_line_counts)
 from reviewboard.diffviewer.managers import DiffSetManager
+from reviewboard.diffviewer.prerender import queue_prerender_diffset
 from reviewboard.scmtools.models import Repository
 
 
@@ -20,6 +25,8 @@ class DiffSet(models.Model):
     """A revisioned collection of FileDiffs."""
 
     _FINALIZED_COMMIT_SERIES_KEY = '__finalized_commit_series'
+    _FILEDIFF_ANCESTOR_INDEX_KEY = '__filediff_ancestor_index'
+    _RAW_LINE_COUNTS_KEY = '__raw_line_counts'
 
     name = models.CharField(_('name'), max_length=256)
     revision = models.IntegerField(_("revision"))
@@ -155,10 +162,18 @@ class DiffSet(models.Model):
             self.extra_data = {}
 
         self.extra_data[self._FINALIZED_COMMIT_SERIES_KEY] = True
+        self._add_raw_line_counts(filediffs)
+
+        # No more commits can be added, so the ancestors of every FileDiff in
+        # the series are now known.
+        self._set_filediff_ancestor_index(FileDiffAncestorIndex.build(
+            self.files.filter(commit_id__isnull=False)))
 
         if save:
             self.save(update_fields=('extra_data',))
 
+        queue_prerender_diffset(self)
+
         return filediffs
 
     def get_total_line_counts(self):
@@ -182,6 +197,197 @@ class DiffSet(models.Model):
         """
         return get_total_line_counts(self.files.all())
 
+    def get_total_raw_line_counts(self):
+        """Return the total raw line counts of all child FileDiffs.
+
+        These are stored on the DiffSet as FileDiffs are added to it, so
+        they can be shown (for instance, in the dashboard) without loading
+        any FileDiffs. For DiffSets created by older versions of Review
+        Board, they will be computed from the FileDiffs, but not stored. The
+        :command:`aggregatelinecounts` management command stores them.
+
+        Returns:
+            dict:
+            A dictionary with the following keys:
+
+            * ``raw_insert_count``
+            * ``raw_delete_count``
+        """
+        counts = (self.extra_data or {}).get(self._RAW_LINE_COUNTS_KEY)
+
+        if counts is None:
+            counts = get_total_raw_line_counts(self.files.all())
+
+        return dict(counts)
+
+    def _add_raw_line_counts(self, filediffs, save=False):
+        """Add the raw line counts of new FileDiffs to the stored totals.
+
+        If no totals have been stored yet, this does nothing, leaving them
+        to be computed from all the FileDiffs by
+        :py:meth:`get_total_raw_line_counts`.
+
+        Args:
+            filediffs (list of reviewboard.diffviewer.models.filediff.
+                       FileDiff):
+                The FileDiffs that were added to the DiffSet.
+
+            save (bool, optional):
+                Whether to save the new totals. If set, the stored totals
+                are locked and updated in the database, so that FileDiffs
+                added concurrently (such as when uploading commits in
+                parallel) are all counted. Otherwise, the caller is
+                responsible for saving the DiffSet.
+
+        Returns:
+            bool:
+            Whether the stored totals were updated.
+        """
+        if save and self.pk:
+            with transaction.atomic():
+                stored_diffset = (
+                    DiffSet.objects
+                    .select_for_update()
+                    .only('extra_data')
+                    .get(pk=self.pk))
+
+                if not stored_diffset._add_raw_line_counts(filediffs):
+                    return False
+
+                stored_diffset.save(update_fields=('extra_data',))
+
+            if self.extra_data is None:
+                self.extra_data = {}
+
+            self.extra_data[self._RAW_LINE_COUNTS_KEY] = \
+                stored_diffset.extra_data[self._RAW_LINE_COUNTS_KEY]
+
+            return True
+
+        counts = (self.extra_data or {}).get(self._RAW_LINE_COUNTS_KEY)
+
+        if counts is None:
+            return False
+
+        new_counts = get_total_raw_line_counts(filediffs)
+
+        self.extra_data[self._RAW_LINE_COUNTS_KEY] = {
+            key: counts.get(key, 0) + value
+            for key, value in six.iteritems(new_counts)
+        }
+
+        return True
+
+    def get_filediff_ancestor_index(self):
+        """Return the index of ancestors of the FileDiffs in the series.
+
+        The index is built when the commit series is finalized. For commit
+        series finalized by older versions of Review Board, it will be built
+        and saved the first time it's needed.
+
+        Returns:
+            reviewboard.diffviewer.commit_utils.FileDiffAncestorIndex:
+            The index, or ``None`` if the commit series hasn't been finalized.
+        """
+        index = getattr(self, '_filediff_ancestor_index', None)
+
+        if index is None and self.is_commit_series_finalized:
+            if self.pk:
+                index = self.get_cached_filediff_ancestor_index(self.pk)
+
+            if index is None:
+                data = self.extra_data.get(self._FILEDIFF_ANCESTOR_INDEX_KEY)
+
+                if data is None:
+                    index = self._store_filediff_ancestor_index()
+                else:
+                    index = FileDiffAncestorIndex.deserialize(data)
+
+                if self.pk:
+                    cache.set(
+                        self._make_filediff_ancestor_index_cache_key(self.pk),
+                        index)
+
+            self._filediff_ancestor_index = index
+
+        return index
+
+    @classmethod
+    def get_cached_filediff_ancestor_index(cls, diffset_id):
+        """Return the cached index of ancestors of the FileDiffs in a series.
+
+        Once a commit series is finalized, its index never changes. The
+        deserialized index is cached when first loaded, so that FileDiffs
+        loaded separately from their DiffSet can look up their ancestors
+        without loading the DiffSet or deserializing the index again.
+
+        Args:
+            diffset_id (int):
+                The ID of the DiffSet.
+
+        Returns:
+            reviewboard.diffviewer.commit_utils.FileDiffAncestorIndex:
+            The index, or ``None`` if it isn't in the cache.
+        """
+        return cache.get(
+            cls._make_filediff_ancestor_index_cache_key(diffset_id))
+
+    @classmethod
+    def _make_filediff_ancestor_index_cache_key(cls, diffset_id):
+        """Return the cache key for the index of ancestors of FileDiffs.
+
+        Args:
+            diffset_id (int):
+                The ID of the DiffSet.
+
+        Returns:
+            unicode:
+            The cache key.
+        """
+        return make_cache_key('diffset-filediff-ancestor-index:%s'
+                              % diffset_id)
+
+    def _store_filediff_ancestor_index(self):
+        """Build and store the index of ancestors for an older series.
+
+        This is used for commit series finalized by older versions of Review
+        Board. The index is stored on a freshly-loaded, locked copy of the
+        DiffSet, so that any other changes made to its extra data in the
+        meantime aren't lost.
+
+        Returns:
+            reviewboard.diffviewer.commit_utils.FileDiffAncestorIndex:
+            The new index.
+        """
+        index = FileDiffAncestorIndex.build(self.per_commit_files)
+
+        if self.pk:
+            with transaction.atomic():
+                stored_diffset = (
+                    DiffSet.objects
+                    .select_for_update()
+                    .only('extra_data')
+                    .get(pk=self.pk))
+
+                if (self._FILEDIFF_ANCESTOR_INDEX_KEY not in
+                    stored_diffset.extra_data):
+                    stored_diffset._set_filediff_ancestor_index(index)
+                    stored_diffset.save(update_fields=('extra_data',))
+
+        self._set_filediff_ancestor_index(index)
+
+        return index
+
+    def _set_filediff_ancestor_index(self, index):
+        """Set the index of ancestors of the FileDiffs in the series.
+
+        Args:
+            index (reviewboard.diffviewer.commit_utils.FileDiffAncestorIndex):
+                The index to store.
+        """
+        self.extra_data[self._FILEDIFF_ANCESTOR_INDEX_KEY] = index.serialize()
+        self._filediff_ancestor_index = index
+
     @property
     def per_commit_files(self):
         """The files limited to per-commit diffs.
@@ -15,6 +15,7 @@ from djblets.db.fields import Base64Field, JSONField
 
 from reviewboard.diffviewer.managers import FileDiffManager
 from reviewboard.diffviewer.models.diffcommit import DiffCommit
+from reviewboard.diffviewer.models.diffset import DiffSet
 from reviewboard.diffviewer.models.legacy_file_diff_data import \
     LegacyFileDiffData
 from reviewboard.diffviewer.models.raw_file_diff_data import RawFileDiffData
@@ -443,8 +444,11 @@ class FileDiff(models.Model):
     def get_ancestors(self, minimal, filediffs=None, update=True):
         """Return the ancestors of this FileDiff.
 
-        This will update the ancestors of this :py:class:`FileDiff` and all its
-        ancestors if they are not already cached.
+        If the commit series has been finalized, the ancestors are looked up
+        in the :py:class:`~reviewboard.diffviewer.models.diffset.DiffSet`'s
+        ancestor index. Otherwise, this will update the ancestors of this
+        :py:class:`FileDiff` and all its ancestors if they are not already
+        cached.
 
         Args:
             minimal (bool):
@@ -473,8 +477,22 @@ class FileDiff(models.Model):
         if self.commit_id is None:
             return []
 
-        if (self.extra_data is None or
-            self._ANCESTORS_KEY not in self.extra_data):
+        ancestor_index = self._get_filediff_ancestor_index()
+
+        if ancestor_index is not None and self.pk in ancestor_index:
+            # The commit series is finalized, so we can look up the ancestors
+            # in the DiffSet's index.
+            compliment_ids, minimal_ids = \
+                ancestor_index.get_ancestor_ids(self.pk)
+
+            if filediffs is None:
+                if compliment_ids or minimal_ids:
+                    filediffs = FileDiff.objects.filter(
+                        pk__in=compliment_ids + minimal_ids)
+                else:
+                    filediffs = []
+        elif (self.extra_data is None or
+              self._ANCESTORS_KEY not in self.extra_data):
             if filediffs is None:
                 filediffs = list(FileDiff.objects.filter(
                     diffset_id=self.diffset_id))
@@ -534,6 +552,17 @@ class FileDiff(models.Model):
         """
         if base_commit and self.commit_id:
             if ancestors is None:
+                ancestor_index = self._get_filediff_ancestor_index()
+
+                if ancestor_index is not None and self.pk in ancestor_index:
+                    base_filediff_id = ancestor_index.get_base_filediff_id(
+                        self.pk, base_commit.pk)
+
+                    if base_filediff_id is None:
+                        return None
+
+                    return FileDiff.objects.get(pk=base_filediff_id)
+
                 ancestors = self.get_ancestors(minimal=False) or []
 
             for ancestor in reversed(ancestors):
@@ -542,6 +571,25 @@ class FileDiff(models.Model):
 
         return None
 
+    def _get_filediff_ancestor_index(self):
+        """Return the index of ancestors for this FileDiff's commit series.
+
+        If the DiffSet hasn't been loaded for this FileDiff, the cached index
+        is used if available, rather than loading the DiffSet.
+
+        Returns:
+            reviewboard.diffviewer.commit_utils.FileDiffAncestorIndex:
+            The index, or ``None`` if the commit series hasn't been finalized.
+        """
+        if not FileDiff.diffset.is_cached(self):
+            ancestor_index = \
+                DiffSet.get_cached_filediff_ancestor_index(self.diffset_id)
+
+            if ancestor_index is not None:
+                return ancestor_index
+
+        return self.diffset.get_filediff_ancestor_index()
+
     def _compute_ancestors(self, filediffs, update):
         """Compute the ancestors of this FileDiff.
 
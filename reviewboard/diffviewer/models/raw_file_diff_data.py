@@ -2,13 +2,18 @@
 
 from __future__ import unicode_literals
 
-import bz2
 import logging
 
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from djblets.db.fields import JSONField
 
+from reviewboard.diffviewer.compression import (
+    Bzip2DiffCompressionCodec,
+    ZlibDiffCompressionCodec,
+    ZstdDiffCompressionCodec,
+    ZstdDictionaryDiffCompressionCodec,
+    diff_compression_codec_registry)
 from reviewboard.diffviewer.errors import DiffParserError
 from reviewboard.diffviewer.managers import RawFileDiffDataManager
 
@@ -18,14 +23,24 @@ class RawFileDiffData(models.Model):
 
     This is the class used in Review Board 2.5+ to store diff content.
     Unlike in previous versions, the content is not base64-encoded. Instead,
-    it is stored either as bzip2-compressed data (if the resulting
-    compressed data is smaller than the raw data), or as the raw data itself.
+    it is stored either as compressed data (if the resulting compressed data
+    is smaller than the raw data), or as the raw data itself.
+
+    The ``compression`` field holds the ID of the codec the data was
+    compressed with (see :py:mod:`reviewboard.diffviewer.compression`).
     """
 
-    COMPRESSION_BZIP2 = 'B'
+    COMPRESSION_BZIP2 = Bzip2DiffCompressionCodec.codec_id
+    COMPRESSION_ZLIB = ZlibDiffCompressionCodec.codec_id
+    COMPRESSION_ZSTD = ZstdDiffCompressionCodec.codec_id
+    COMPRESSION_ZSTD_DICTIONARY = ZstdDictionaryDiffCompressionCodec.codec_id
 
     COMPRESSION_CHOICES = (
         (COMPRESSION_BZIP2, _('BZip2-compressed')),
+        (COMPRESSION_ZLIB, _('zlib-compressed')),
+        (COMPRESSION_ZSTD, _('Zstandard-compressed')),
+        (COMPRESSION_ZSTD_DICTIONARY,
+         _('Zstandard-compressed with a dictionary')),
     )
 
     binary_hash = models.CharField(_("hash"), max_length=40, unique=True)
@@ -43,15 +58,19 @@ class RawFileDiffData(models.Model):
         The content will be uncompressed (if necessary) and returned as the
         raw set of bytes originally uploaded.
         """
-        if self.compression == self.COMPRESSION_BZIP2:
-            return bz2.decompress(self.binary)
-        elif self.compression is None:
+        if self.compression is None:
             return bytes(self.binary)
-        else:
+
+        codec = diff_compression_codec_registry.get('codec_id',
+                                                    self.compression)
+
+        if codec is None or not codec.available:
             raise NotImplementedError(
                 'Unsupported compression method %s for RawFileDiffData %s'
                 % (self.compression, self.pk))
 
+        return codec.decompress(bytes(self.binary))
+
     @property
     def insert_count(self):
         return self.extra_data.get('insert_count')
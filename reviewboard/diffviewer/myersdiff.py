@@ -1,5 +1,9 @@
 from __future__ import unicode_literals
 
+from array import array
+from collections import Counter
+
+from django.utils import six
 from django.utils.six.moves import range
 
 from reviewboard.diffviewer.differ import Differ, DiffCompatVersion
@@ -11,6 +15,19 @@ class MyersDiffer(Differ):
     """
     SNAKE_LIMIT = 20
 
+    # The maximum total edit cost (the number of diagonals explored while
+    # searching for middle snakes) for a diff, when using
+    # DiffCompatVersion.MYERS_BOUNDED_COST or newer. Past this, the differ
+    # stops looking for a minimal diff and treats any remaining differing
+    # regions as replaced wholesale.
+    MAX_TOTAL_COST = 1000000
+
+    # Whether to store line codes, line indexes and discard state in compact
+    # integer arrays rather than lists. This uses well under half the memory
+    # for large files and produces identical results, but is a bit slower
+    # on CPython, which has to box integers read back out of arrays.
+    USE_ARRAYS = False
+
     DISCARD_NONE = 0
     DISCARD_FOUND = 1
     DISCARD_CANCEL = 2
@@ -38,9 +55,34 @@ class MyersDiffer(Differ):
 
         # SMS State
         self.max_lines = 0
+        self.max_cost = None
+        self._approx_sqrt_cache = {}
         self.fdiag = None
         self.bdiag = None
 
+        # Cost bounding state
+        self.bounded_cost = (
+            self.compat_version is not None and
+            self.compat_version >= DiffCompatVersion.MYERS_BOUNDED_COST)
+        self.total_cost = 0
+
+    def _new_vector(self, size):
+        """Return a new zero-filled vector of integers.
+
+        Args:
+            size (int):
+                The size of the vector.
+
+        Returns:
+            list or array.array:
+            The new vector. This will be an :py:class:`array.array` if
+            :py:attr:`USE_ARRAYS` is set.
+        """
+        if self.USE_ARRAYS:
+            return array(str('i'), (0,)) * size
+        else:
+            return [0] * size
+
     def ratio(self):
         self._gen_diff_data()
         a_equals = self.a_data.length - len(self.a_data.modified)
@@ -169,56 +211,64 @@ class MyersDiffer(Differ):
         """
         Converts all unique lines of text into unique numbers. Comparing
         lists of numbers is faster than comparing lists of strings.
+
+        Lines are interned in a single pass. New lines are given the next
+        available code, so codes are handed out in order of first
+        appearance. Interesting lines are then looked up by code, checking
+        the regexes only against the first appearance of each new line.
         """
-        codes = []
+        # TODO: Handle ignoring/triming spaces, ignoring casing, and
+        #       special hooks
+        code_table = self.code_table
+        first_new_code = len(code_table) + 1
+
+        if self.ignore_space:
+            # We still want to show lines that contain only whitespace.
+            keys = (line.lstrip() or line for line in lines)
+        else:
+            keys = lines
 
-        linenum = 0
+        # This relies on the code table only ever growing, one line at a
+        # time, so that its size is always the last code handed out.
+        codes = (
+            code_table.setdefault(key, len(code_table) + 1)
+            for key in keys
+        )
 
-        if is_modified_file:
-            interesting_lines = self.interesting_lines[1]
+        if self.USE_ARRAYS:
+            codes = array(str('i'), codes)
         else:
-            interesting_lines = self.interesting_lines[0]
-
-        for line in lines:
-            # TODO: Handle ignoring/triming spaces, ignoring casing, and
-            #       special hooks
-
-            raw_line = line
-            stripped_line = line.lstrip()
-
-            if self.ignore_space:
-                # We still want to show lines that contain only whitespace.
-                if len(stripped_line) > 0:
-                    line = stripped_line
-
-            interesting_line_name = None
-
-            try:
-                code = self.code_table[line]
-                interesting_line_name = \
-                    self.interesting_line_table.get(code, None)
-            except KeyError:
-                # This is a new, unrecorded line, so mark it and store it.
-                self.last_code += 1
-                code = self.last_code
-                self.code_table[line] = code
-
-                # Check to see if this is an interesting line that the caller
-                # wants recorded.
-                if stripped_line:
-                    for name, regex in self.interesting_line_regexes:
-                        if regex.match(raw_line):
-                            interesting_line_name = name
-                            self.interesting_line_table[code] = name
-                            break
+            codes = list(codes)
+
+        self.last_code = len(code_table)
+
+        if self.interesting_line_regexes:
+            if is_modified_file:
+                interesting_lines = self.interesting_lines[1]
+            else:
+                interesting_lines = self.interesting_lines[0]
+
+            interesting_line_table = self.interesting_line_table
+            next_new_code = first_new_code
 
-            if interesting_line_name:
-                interesting_lines[interesting_line_name].append((linenum,
-                                                                 raw_line))
+            for linenum, (code, raw_line) in enumerate(zip(codes, lines)):
+                if code == next_new_code:
+                    # This is the first time we've seen this line. Check to
+                    # see if this is an interesting line that the caller
+                    # wants recorded.
+                    next_new_code += 1
 
-            codes.append(code)
+                    if raw_line.lstrip():
+                        for name, regex in self.interesting_line_regexes:
+                            if regex.match(raw_line):
+                                interesting_line_table[code] = name
+                                break
 
-            linenum += 1
+                interesting_line_name = interesting_line_table.get(code)
+
+                if interesting_line_name:
+                    interesting_lines[interesting_line_name].append(
+                        (linenum, raw_line))
 
         return codes
 
@@ -243,12 +293,26 @@ class MyersDiffer(Differ):
         up_min = up_max = up_k
 
         cost = 0
-        max_cost = max(256, self._very_approx_sqrt(self.max_lines * 4))
+
+        if self.max_cost is None:
+            # This only depends on the total number of lines, so compute it
+            # once per diff.
+            self.max_cost = max(256,
+                                self._very_approx_sqrt(self.max_lines * 4))
+
+        max_cost = self.max_cost
+        cost_bail = (
+            self.compat_version is not None and
+            self.compat_version >= DiffCompatVersion.MYERS_SMS_COST_BAIL)
 
         while True:
             cost += 1
             big_snake = False
 
+            if self.bounded_cost:
+                self.total_cost += (down_max - down_min +
+                                    up_max - up_min) // 2 + 2
+
             if down_min > dmin:
                 down_min -= 1
                 down_vector[self.downoff + down_min - 1] = -1
@@ -369,8 +433,9 @@ class MyersDiffer(Differ):
                 if best > 0:
                     return ret_x, ret_y, False, True
 
-            if (cost >= max_cost and
-                self.compat_version >= DiffCompatVersion.MYERS_SMS_COST_BAIL):
+            if ((cost >= max_cost and cost_bail) or
+                (self.bounded_cost and
+                 self.total_cost >= self.MAX_TOTAL_COST)):
                 # We've reached or gone past the max cost. Just give up now
                 # and report the halfway point between our best results.
                 fx_best = bx_best = 0
@@ -455,13 +520,15 @@ class MyersDiffer(Differ):
             a_upper -= 1
             b_upper -= 1
 
-        if a_lower == a_upper:
-            # Inserted lines.
+        if (a_lower == a_upper or b_lower == b_upper or
+            (self.bounded_cost and self.total_cost >= self.MAX_TOTAL_COST)):
+            # Inserted or deleted lines, or we've given up on finding a
+            # minimal diff and are treating the rest of this range as
+            # changed.
             while b_lower < b_upper:
                 self.b_data.modified[self.b_data.real_indexes[b_lower]] = True
                 b_lower += 1
-        elif b_lower == b_upper:
-            # Deleted lines
+
             while a_lower < a_upper:
                 self.a_data.modified[self.a_data.real_indexes[a_lower]] = True
                 a_lower += 1
@@ -678,20 +745,19 @@ class MyersDiffer(Differ):
 
             data.undiscarded_lines = j
 
-        self.a_data.undiscarded = [0] * self.a_data.length
-        self.b_data.undiscarded = [0] * self.b_data.length
-        self.a_data.real_indexes = [0] * self.a_data.length
-        self.b_data.real_indexes = [0] * self.b_data.length
-        a_discarded = [0] * self.a_data.length
-        b_discarded = [0] * self.b_data.length
-        a_code_counts = [0] * (1 + self.last_code)
-        b_code_counts = [0] * (1 + self.last_code)
+        self.a_data.undiscarded = self._new_vector(self.a_data.length)
+        self.b_data.undiscarded = self._new_vector(self.b_data.length)
+        self.a_data.real_indexes = self._new_vector(self.a_data.length)
+        self.b_data.real_indexes = self._new_vector(self.b_data.length)
+        a_discarded = self._new_vector(self.a_data.length)
+        b_discarded = self._new_vector(self.b_data.length)
+        a_code_counts = self._new_vector(1 + self.last_code)
+        b_code_counts = self._new_vector(1 + self.last_code)
 
-        for item in self.a_data.data:
-            a_code_counts[item] += 1
-
-        for item in self.b_data.data:
-            b_code_counts[item] += 1
+        for code_counts, data in ((a_code_counts, self.a_data),
+                                  (b_code_counts, self.b_data)):
+            for item, count in six.iteritems(Counter(data.data)):
+                code_counts[item] = count
 
         build_discard_list(self.a_data, a_discarded, b_code_counts)
         build_discard_list(self.b_data, b_discarded, a_code_counts)
@@ -703,10 +769,31 @@ class MyersDiffer(Differ):
         discard_lines(self.b_data, b_discarded)
 
     def _very_approx_sqrt(self, i):
+        try:
+            return self._approx_sqrt_cache[i]
+        except KeyError:
+            pass
+
+        orig_i = i
         result = 1
-        i /= 4
-        while i > 0:
+
+        if self.bounded_cost:
+            # Older compatibility versions use true division on Python 3,
+            # which results in a wildly inflated result (effectively
+            # disabling the cost heuristics). Newer versions compute this
+            # the way GNU diff (and Python 2) would.
+            i = int(i) // 4
+
+            while i > 0:
+                i //= 4
+                result *= 2
+        else:
             i /= 4
-            result *= 2
+
+            while i > 0:
+                i /= 4
+                result *= 2
+
+        self._approx_sqrt_cache[orig_i] = result
 
         return result
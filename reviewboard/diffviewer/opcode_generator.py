@@ -2,6 +2,7 @@ from __future__ import unicode_literals
 
 import os
 import re
+from bisect import bisect_left
 
 from django.utils import six
 from django.utils.six.moves import range
@@ -33,6 +34,38 @@ class MoveRange(object):
         return '<MoveRange(%d, %d, %r)>' % (self.start, self.end, self.groups)
 
 
+class MoveCandidates(object):
+    """Stores the removed lines in a group that could be part of a move.
+
+    Each instance covers the lines in a single delete/replace group that
+    share the same content. Lines are removed as they're claimed by a move.
+    """
+
+    __slots__ = ('key', 'group', 'group_index', 'positions')
+
+    def __init__(self, group, group_index):
+        self.key = group[1:5]
+        self.group = group
+        self.group_index = group_index
+        self.positions = []
+
+    def __contains__(self, i):
+        positions = self.positions
+        n = bisect_left(positions, i)
+
+        return n < len(positions) and positions[n] == i
+
+    def remove(self, i):
+        positions = self.positions
+        n = bisect_left(positions, i)
+
+        if n < len(positions) and positions[n] == i:
+            del positions[n]
+
+    def __repr__(self):
+        return '<MoveCandidates(%r, %r)>' % (self.key, self.positions)
+
+
 class DiffOpcodeGenerator(object):
     ALPHANUM_RE = re.compile(r'\w')
     WHITESPACE_RE = re.compile(r'\s')
@@ -40,12 +73,42 @@ class DiffOpcodeGenerator(object):
     MOVE_PREFERRED_MIN_LINES = 2
     MOVE_MIN_LINE_LENGTH = 20
 
+    # The maximum amount of work (inserted lines and groups of candidate
+    # removed lines examined) spent detecting moves in a file. Past this,
+    # move detection stops, keeping any moves already found, so that files
+    # with huge numbers of similar lines don't take forever to render.
+    MOVE_DETECTION_MAX_WORK = 2000000
+
     TAB_SIZE = 8
 
-    def __init__(self, differ, diff=None, interdiff=None):
+    def __init__(self, differ, diff=None, interdiff=None,
+                 interdiff_ranges=None):
+        """Initialize the generator.
+
+        Args:
+            differ (reviewboard.diffviewer.differ.Differ):
+                The differ used to generate the opcodes.
+
+            diff (bytes, optional):
+                The diff data for the file, when generating an interdiff.
+
+            interdiff (bytes, optional):
+                The diff data for the interdiff's file.
+
+            interdiff_ranges (tuple, optional):
+                Pre-computed ranges for filtering the interdiff opcodes, as
+                returned by
+                :py:func:`~reviewboard.diffviewer.processors.
+                get_interdiff_ranges`. If not provided, they'll be computed
+                from ``diff`` and ``interdiff``. If provided, ``diff`` and
+                ``interdiff`` are not needed.
+        """
         self.differ = differ
         self.diff = diff
         self.interdiff = interdiff
+        self.interdiff_ranges = interdiff_ranges
+        self.is_interdiff = (interdiff_ranges is not None or
+                             bool(diff and interdiff))
 
     def __iter__(self):
         """Returns opcodes from the differ with extra metadata.
@@ -59,7 +122,9 @@ class DiffOpcodeGenerator(object):
         """
         self.groups = []
         self.removes = {}
+        self.removes_by_index = {}
         self.inserts = []
+        self.move_detection_work = 0
 
         # Run the opcodes through the chain.
         opcodes = self.differ.get_opcodes()
@@ -74,11 +139,12 @@ class DiffOpcodeGenerator(object):
             yield opcodes
 
     def _apply_processors(self, opcodes):
-        if self.diff and self.interdiff:
+        if self.is_interdiff:
             # Filter out any lines unrelated to these changes from the
             # interdiff. This will get rid of any merge information.
-            opcodes = filter_interdiff_opcodes(opcodes, self.diff,
-                                               self.interdiff)
+            opcodes = filter_interdiff_opcodes(
+                opcodes, self.diff, self.interdiff,
+                interdiff_ranges=self.interdiff_ranges)
 
         for opcode in opcodes:
             yield opcode
@@ -127,7 +193,7 @@ class DiffOpcodeGenerator(object):
             yield tag, i1, i2, j1, j2, meta
 
     def _apply_meta_processors(self, opcodes):
-        if self.interdiff:
+        if self.is_interdiff:
             # When filtering out opcodes, we may have converted chunks into
             # "filtered-equal" chunks. This allowed us to skip any additional
             # processing, particularly the indentation highlighting. It's
@@ -141,25 +207,34 @@ class DiffOpcodeGenerator(object):
         for group_index, group in enumerate(opcodes):
             self.groups.append(group)
 
-            # Store delete/insert ranges for later lookup. We will be building
-            # keys that in most cases will be unique for the particular block
-            # of text being inserted/deleted. There is a chance of collision,
-            # so we store a list of matching groups under that key.
+            # Index the removed lines for later lookup. This maps the
+            # content of each line to the groups of removed lines with that
+            # content (in order), and each removed line back to its group.
             #
-            # Later, we will loop through the keys and attempt to find insert
-            # keys/groups that match remove keys/groups.
+            # Later, we will loop through the inserted lines and look up
+            # the removed lines they may have been moved from.
             tag = group[0]
 
             if tag in ('delete', 'replace'):
                 i1 = group[1]
                 i2 = group[2]
+                a = self.differ.a
 
                 for i in range(i1, i2):
-                    line = self.differ.a[i].strip()
+                    line = a[i].strip()
 
                     if line:
-                        self.removes.setdefault(line, []).append(
-                            (i, group, group_index))
+                        candidates_list = self.removes.setdefault(line, [])
+
+                        if (candidates_list and
+                            candidates_list[-1].group_index == group_index):
+                            candidates = candidates_list[-1]
+                        else:
+                            candidates = MoveCandidates(group, group_index)
+                            candidates_list.append(candidates)
+
+                        candidates.positions.append(i)
+                        self.removes_by_index[i] = (line, candidates)
 
             if tag in ('insert', 'replace'):
                 self.inserts.append(group)
@@ -297,6 +372,9 @@ class DiffOpcodeGenerator(object):
         r_move_indexes_used = set()
 
         for insert in self.inserts:
+            if self.move_detection_work >= self.MOVE_DETECTION_MAX_WORK:
+                break
+
             self._compute_move_for_insert(r_move_indexes_used, *insert)
 
     def _compute_move_for_insert(self, r_move_indexes_used, itag, ii1, ii2,
@@ -337,8 +415,8 @@ class DiffOpcodeGenerator(object):
         # Each line in this range has a corresponding consecutive delete line.
         i_move_range = MoveRange(i_move_cur, i_move_cur)
 
-        # The deleted move ranges. The key is a string in the form of
-        # "{i1}-{i2}-{j1}-{j2}", with those positions taken from the remove
+        # The deleted move ranges. The key is a tuple in the form of
+        # (i1, i2, j1, j2), with those positions taken from the remove
         # group for the line. The value is an instance of MoveRange. The values
         # in MoveRange are used to quickly locate deleted lines we've found
         # that match the inserted lines, so we can assemble ranges later.
@@ -346,10 +424,18 @@ class DiffOpcodeGenerator(object):
 
         move_key = None
         is_replace = (itag == 'replace')
+        max_work = self.MOVE_DETECTION_MAX_WORK
 
         # Loop through every location from ij1 through ij2 - 1 until we've
         # reached the end.
         while i_move_cur < ij2:
+            self.move_detection_work += 1
+
+            if self.move_detection_work >= max_work:
+                # We've spent as long as we're willing to on this file. Any
+                # move ranges still being built are dropped.
+                return
+
             try:
                 iline = self.differ.b[i_move_cur].strip()
             except IndexError:
@@ -373,36 +459,60 @@ class DiffOpcodeGenerator(object):
                 #
                 # If there isn't any move information for this line, we'll
                 # simply add it to the move ranges.
-                for ri, rgroup, rgroup_index in self.removes[iline]:
-                    # Ignore any lines that have already been processed as
-                    # part of a move, so we don't end up with incorrect blocks
-                    # of lines being matched.
-                    if ri in r_move_indexes_used:
-                        continue
-
+                #
+                # Removed lines are looked at a group at a time. Within a
+                # group, only the first removed line can start a new range,
+                # and only the line following a range can extend it, so
+                # there's no need to look at any others. Lines that have
+                # already been processed as part of a move have been removed
+                # from the index, so we don't end up with incorrect blocks of
+                # lines being matched.
+                for candidates in self.removes[iline]:
+                    self.move_detection_work += 1
+
+                    rgroup = candidates.group
+                    rgroup_index = candidates.group_index
+                    ri = candidates.positions[0]
                     r_move_range = r_move_ranges.get(move_key)
 
-                    if not r_move_range or ri != r_move_range.end + 1:
-                        # We either didn't have a previous range, or this
-                        # group didn't immediately follow it, so we need
-                        # to start a new one.
-                        move_key = '%s-%s-%s-%s' % rgroup[1:5]
-                        r_move_range = r_move_ranges.get(move_key)
+                    if r_move_range and ri == r_move_range.end + 1:
+                        # This is part of the current range, so update the
+                        # end of the range to include it.
+                        r_move_range.end = ri
+                        r_move_range.add_group(rgroup, rgroup_index)
+                        updated_range = True
+                        break
+
+                    # This group didn't immediately follow any previous
+                    # range, so we need to look at the range for this
+                    # group, or start a new one.
+                    move_key = candidates.key
+                    r_move_range = r_move_ranges.get(move_key)
 
                     if r_move_range:
-                        # If the remove information for the line is next in
-                        # the sequence for this calculated move range...
-                        if ri == r_move_range.end + 1:
-                            # This is part of the current range, so update
-                            # the end of the range to include it.
+                        # If the line following this calculated move range
+                        # is one of the removed lines...
+                        ri = r_move_range.end + 1
+
+                        if ri in candidates:
+                            # This is part of the range, so update the end
+                            # of the range to include it.
                             r_move_range.end = ri
                             r_move_range.add_group(rgroup, rgroup_index)
                             updated_range = True
+                            break
                     else:
                         # Check that this isn't a replace line that's just
                         # "replacing" itself (which would happen if it's just
-                        # changing whitespace).
-                        if not is_replace or i_move_cur - ij1 != ri - ii1:
+                        # changing whitespace). If it is, try the next line
+                        # in the group.
+                        if is_replace and i_move_cur - ij1 == ri - ii1:
+                            if len(candidates.positions) > 1:
+                                ri = candidates.positions[1]
+                            else:
+                                ri = None
+
+                        if ri is not None:
                             # We don't have any move ranges yet, or we're done
                             # with the existing range, so it's time to build
                             # one based on any removed lines we find that
@@ -410,11 +520,7 @@ class DiffOpcodeGenerator(object):
                             r_move_ranges[move_key] = \
                                 MoveRange(ri, ri, [(rgroup, rgroup_index)])
                             updated_range = True
-
-                    if updated_range:
-                        # We found a range we were able to update. Don't
-                        # attempt any more matches for removed lines.
-                        break
+                            break
 
                 if not updated_range and r_move_ranges:
                     # We didn't find a move range that this line is a part
@@ -525,12 +631,35 @@ class DiffOpcodeGenerator(object):
                         # We'll use the r_range above, but normalize back to
                         # 0-based indexes.
                         r_move_indexes_used.update(r - 1 for r in r_range)
+                        self._remove_move_candidates(r_range)
 
                 # Reset the state for the next range.
                 move_key = None
                 i_move_range = MoveRange(i_move_cur, i_move_cur)
                 r_move_ranges = {}
 
+    def _remove_move_candidates(self, r_range):
+        """Remove lines that are part of a move from the index.
+
+        Args:
+            r_range (list of int):
+                The 1-based line numbers of the removed lines in the move.
+        """
+        removes = self.removes
+        removes_by_index = self.removes_by_index
+
+        for r in r_range:
+            try:
+                line, candidates = removes_by_index.pop(r - 1)
+            except KeyError:
+                # This is a blank or equal line.
+                continue
+
+            candidates.remove(r - 1)
+
+            if not candidates.positions:
+                removes[line].remove(candidates)
+
     def _find_longest_move_range(self, r_move_ranges):
         # Go through every range of lines we've found and find the longest.
         #
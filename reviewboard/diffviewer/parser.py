@@ -334,11 +334,16 @@ class ParsedDiffFile(object):
     def data(self):
         """The data for this diff.
 
-        This must be accessed after :py:meth:`finalize` has been called.
+        This must be accessed after :py:meth:`finalize` has been called, and
+        before :py:meth:`discard_data` has been called.
         """
         if self._data is None:
-            raise ValueError('ParsedDiffFile.data cannot be accessed until '
-                             'finalize() is called.')
+            if self._data_io.closed:
+                raise ValueError('ParsedDiffFile.data cannot be accessed '
+                                 'after discard_data() is called.')
+            else:
+                raise ValueError('ParsedDiffFile.data cannot be accessed '
+                                 'until finalize() is called.')
 
         return self._data
 
@@ -351,6 +356,16 @@ class ParsedDiffFile(object):
         self._data = self._data_io.getvalue()
         self._data_io.close()
 
+    def discard_data(self):
+        """Discard the data for this diff.
+
+        This frees the memory used by the data once it's no longer needed,
+        such as after it's been stored. :py:attr:`data` can no longer be
+        accessed afterward.
+        """
+        self._data = None
+        self._data_io.close()
+
     def prepend_data(self, data):
         """Prepend data to the buffer.
 
@@ -395,6 +410,217 @@ class ParsedDiffFile(object):
         RemovedInReviewBoard50Warning.warn(message, stacklevel=3)
 
 
+class DiffLineStream(object):
+    """The lines of a diff, read incrementally as they're needed.
+
+    This can be passed to a :py:class:`DiffParser` in place of the diff's
+    content, in order to parse very large diffs without loading them into
+    memory all at once. It reads from an iterable of byte strings, such as
+    :py:meth:`UploadedFile.chunks()
+    <django.core.files.uploadedfile.UploadedFile.chunks>`, and splits them
+    into lines the same way as
+    :py:func:`~reviewboard.diffviewer.diffutils.split_line_endings`.
+
+    Lines can be accessed by index or slice, like a list of lines. Lines are
+    read as they're accessed, and lines the parser is done with are discarded
+    (see :py:meth:`discard_before`).
+
+    Until the end of the diff has been read, ``len()`` returns the number of
+    lines read so far, after reading at least :py:attr:`LOOKAHEAD_LINES`
+    lines past the furthest line accessed. Parsers only compare line numbers
+    near the lines they're working on against the length, so this behaves
+    the same as the length of the full list of lines.
+    """
+
+    #: The number of lines to read past the furthest line accessed.
+    LOOKAHEAD_LINES = 1000
+
+    #: The minimum number of finished lines to discard at once.
+    #:
+    #: Discarding in batches avoids repeatedly shifting the list of lines.
+    DISCARD_BATCH_LINES = 1000
+
+    def __init__(self, chunks):
+        """Initialize the stream.
+
+        Args:
+            chunks (iterable of bytes):
+                The chunks of diff content to read.
+        """
+        self._chunks = iter(chunks)
+        self._lines = []
+        self._first_linenum = 0
+        self._discard_linenum = 0
+        self._max_linenum = 0
+        self._pending = b''
+        self._eof = False
+
+        #: The number of bytes of diff content read so far.
+        self.size = 0
+
+    def __len__(self):
+        """Return the number of lines available.
+
+        Returns:
+            int:
+            The number of lines, as described above.
+        """
+        self._read_through(self._max_linenum + self.LOOKAHEAD_LINES)
+
+        return self._first_linenum + len(self._lines)
+
+    def __getitem__(self, index):
+        """Return a line or a list of lines.
+
+        Args:
+            index (int or slice):
+                The line number or range of line numbers to return.
+
+        Returns:
+            bytes or list of bytes:
+            The line, or list of lines.
+
+        Raises:
+            IndexError:
+                The line is past the end of the diff.
+
+            ValueError:
+                The line was discarded, or the index was negative.
+        """
+        if isinstance(index, slice):
+            start, stop, step = index.start or 0, index.stop, index.step
+
+            if step not in (None, 1) or start < 0 or (stop is not None and
+                                                      stop < 0):
+                raise ValueError('DiffLineStream only supports slices with '
+                                 'positive indexes and no step.')
+
+            self._check_available(start)
+
+            if stop is None:
+                self._read_through(None)
+            else:
+                self._read_through(stop - 1)
+                self._max_linenum = max(self._max_linenum, stop - 1)
+
+            return self._lines[start - self._first_linenum:
+                               None if stop is None
+                               else max(stop - self._first_linenum, 0)]
+
+        if index < 0:
+            raise ValueError('DiffLineStream does not support negative '
+                             'indexes.')
+
+        self._check_available(index)
+        self._read_through(index)
+
+        if index > self._max_linenum:
+            self._max_linenum = index
+
+        try:
+            return self._lines[index - self._first_linenum]
+        except IndexError:
+            raise IndexError('Line %d is past the end of the diff' % index)
+
+    def __iter__(self):
+        """Iterate through the remaining lines.
+
+        Yields:
+            bytes:
+            Each line that hasn't been discarded.
+        """
+        linenum = self._discard_linenum
+
+        while True:
+            try:
+                yield self[linenum]
+            except IndexError:
+                break
+
+            linenum += 1
+
+    def discard_before(self, linenum):
+        """Discard the lines before a given line number.
+
+        Parsers call this once they no longer need to access earlier lines.
+        Attempting to access a discarded line will raise an error.
+
+        Args:
+            linenum (int):
+                The line number of the first line that's still needed.
+        """
+        if linenum > self._discard_linenum:
+            self._discard_linenum = linenum
+
+            if linenum - self._first_linenum >= self.DISCARD_BATCH_LINES:
+                del self._lines[:linenum - self._first_linenum]
+                self._first_linenum = linenum
+
+    def _check_available(self, linenum):
+        """Check that a line hasn't been discarded.
+
+        Args:
+            linenum (int):
+                The line number to check.
+
+        Raises:
+            ValueError:
+                The line was discarded.
+        """
+        if linenum < self._discard_linenum:
+            raise ValueError('Line %d of the diff has already been discarded.'
+                             % linenum)
+
+    def _read_through(self, linenum):
+        """Read content until a line is available or the diff ends.
+
+        Args:
+            linenum (int):
+                The line number to read through, or ``None`` to read the
+                rest of the diff.
+        """
+        from reviewboard.diffviewer.diffutils import NEWLINE_BYTES_RE
+
+        lines = self._lines
+
+        while (not self._eof and
+               (linenum is None or
+                self._first_linenum + len(lines) <= linenum)):
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self._eof = True
+
+                if self._pending:
+                    lines += NEWLINE_BYTES_RE.split(self._pending)
+
+                    # As with split_line_endings(), a trailing newline
+                    # doesn't start a new line.
+                    if not lines[-1]:
+                        lines.pop()
+
+                    self._pending = b''
+
+                break
+
+            if not chunk:
+                continue
+
+            self.size += len(chunk)
+            data = self._pending + chunk
+
+            # A trailing carriage return may be the start of a \r\n or
+            # \r\r\n line ending, so hold it back until the next chunk.
+            end = len(data)
+
+            while end > 0 and data[end - 1:end] == b'\r':
+                end -= 1
+
+            new_lines = NEWLINE_BYTES_RE.split(data[:end])
+            self._pending = new_lines.pop() + data[end:]
+            lines += new_lines
+
+
 class DiffParser(object):
     """Parses diff files, allowing subclasses to specialize parsing behavior.
 
@@ -403,6 +629,11 @@ class DiffParser(object):
     such as ``Index:`` lines, in order to extract files and their modified
     content from a diff.
 
+    The diff can be provided either as a byte string or as a
+    :py:class:`DiffLineStream`. When using a stream, files should be read
+    using :py:meth:`iter_files`, which returns each file as soon as it's
+    parsed, rather than :py:meth:`parse`.
+
     Subclasses can extend the parsing behavior to extract additional metadata
     or handle special representations of changes. They may want to override the
     following methods:
@@ -427,24 +658,30 @@ class DiffParser(object):
         """Initialize the parser.
 
         Args:
-            data (bytes):
+            data (bytes or DiffLineStream):
                 The diff content to parse.
 
         Raises:
             TypeError:
-                The provided ``data`` argument was not a ``bytes`` type.
+                The provided ``data`` argument was not a ``bytes`` type or
+                a :py:class:`DiffLineStream`.
         """
         from reviewboard.diffviewer.diffutils import split_line_endings
 
-        if not isinstance(data, bytes):
+        if isinstance(data, DiffLineStream):
+            self.data = None
+            self.lines = data
+        elif isinstance(data, bytes):
+            self.data = data
+            self.lines = split_line_endings(data)
+        else:
             raise TypeError(
                 _('%s expects bytes values for "data", not %s')
                 % (type(self).__name__, type(data)))
 
         self.base_commit_id = None
         self.new_commit_id = None
-        self.data = data
-        self.lines = split_line_endings(data)
+        self._parsing = False
 
     def parse(self):
         """Parse the diff.
@@ -462,24 +699,71 @@ class DiffParser(object):
                 corrupted diff, or an error in the parsing implementation.
                 Details are in the error message.
         """
-        logger.debug('%s.parse: Beginning parse of diff, size = %s',
-                     type(self).__name__, len(self.data))
+        self._parsing = True
+
+        try:
+            self.files = list(self.iter_files())
+        finally:
+            self._parsing = False
+
+        return self.files
+
+    def iter_files(self):
+        """Parse the diff, yielding each file as it's parsed.
+
+        Unlike :py:meth:`parse`, this doesn't keep a list of all the files
+        in the diff. Along with a :py:class:`DiffLineStream`, this allows
+        very large diffs to be parsed using a bounded amount of memory.
+
+        Subclasses that need to control the parsing loop should override
+        this, rather than :py:meth:`parse`. Subclasses that override
+        :py:meth:`parse` instead are still supported, but will parse the
+        whole diff before returning any files.
+
+        Yields:
+            ParsedDiffFile:
+            Each file in the diff, after it has been finalized.
+
+        Raises:
+            reviewboard.diffviewer.errors.DiffParserError:
+                There was an error parsing part of the diff. This may be a
+                corrupted diff, or an error in the parsing implementation.
+                Details are in the error message.
+        """
+        if (not getattr(self, '_parsing', False) and
+            (six.get_unbound_function(type(self).parse) is not
+             six.get_unbound_function(DiffParser.parse))):
+            # This is an older parser that implements its own parsing loop
+            # in parse(). Let it do the work.
+            for parsed_file in self.parse():
+                yield parsed_file
+
+            return
+
+        if self.data is None:
+            logger.debug('%s.iter_files: Beginning parse of streamed diff',
+                         type(self).__name__)
+        else:
+            logger.debug('%s.iter_files: Beginning parse of diff, size = %s',
+                         type(self).__name__, len(self.data))
 
         preamble = io.BytesIO()
-        self.files = []
         parsed_file = None
         i = 0
 
         # Go through each line in the diff, looking for diff headers.
         while i < len(self.lines):
+            self._discard_lines_before(i)
             next_linenum, new_file = self.parse_change_header(i)
 
             if new_file:
                 # This line is the start of a new file diff.
                 #
                 # First, finalize the last one.
-                if self.files:
-                    self.files[-1].finalize()
+                if parsed_file is not None:
+                    parsed_file.finalize()
+
+                    yield parsed_file
 
                 parsed_file = new_file
 
@@ -489,7 +773,6 @@ class DiffParser(object):
                 preamble.close()
                 preamble = io.BytesIO()
 
-                self.files.append(parsed_file)
                 i = next_linenum
             else:
                 if parsed_file:
@@ -499,14 +782,28 @@ class DiffParser(object):
                     preamble.write(b'\n')
                     i += 1
 
-        if self.files:
-            self.files[-1].finalize()
-
         preamble.close()
 
-        logger.debug('%s.parse: Finished parsing diff.', type(self).__name__)
+        if parsed_file is not None:
+            parsed_file.finalize()
 
-        return self.files
+            yield parsed_file
+
+        logger.debug('%s.iter_files: Finished parsing diff.',
+                     type(self).__name__)
+
+    def _discard_lines_before(self, linenum):
+        """Discard lines of a streamed diff that are no longer needed.
+
+        Parsing loops call this when moving past lines that won't be looked
+        at again. This does nothing if the diff wasn't streamed.
+
+        Args:
+            linenum (int):
+                The line number of the first line that's still needed.
+        """
+        if self.data is None:
+            self.lines.discard_before(linenum)
 
     def parse_diff_line(self, linenum, parsed_file):
         """Parse a line of data in a diff.
@@ -0,0 +1,509 @@
+"""An in-process applier for unified diffs.
+
+This implements the subset of :command:`patch` needed by the diff viewer,
+operating entirely on byte strings in memory. It understands unified diffs
+(including ``\\ No newline at end of file`` markers), applies hunks at an
+offset if the surrounding file has shifted, and supports a limited amount of
+context fuzz, much like GNU :command:`patch`.
+
+Anything that can't be applied cleanly results in a
+:py:class:`~reviewboard.diffviewer.errors.PatchError` containing
+:command:`patch`-style error output and ``.rej``-style rejects, allowing the
+caller to fall back on the real :command:`patch` tool.
+"""
+
+from __future__ import unicode_literals
+
+import os
+import re
+
+from reviewboard.diffviewer.errors import PatchError
+
+
+#: The maximum amount of fuzz allowed when applying a hunk.
+#:
+#: This matches the default used by GNU :command:`patch`.
+DEFAULT_MAX_FUZZ = 2
+
+
+_HUNK_HEADER_RE = re.compile(
+    br'^@@ -(?P<orig_start>\d+)(?:,(?P<orig_len>\d+))? '
+    br'\+(?P<new_start>\d+)(?:,(?P<new_len>\d+))? @@(?P<extra>.*)$')
+
+
+class MalformedPatchError(ValueError):
+    """A unified diff could not be parsed by the in-process applier."""
+
+
+class _Hunk(object):
+    """A hunk within a unified diff.
+
+    Attributes:
+        orig_start (int):
+            The 1-based starting line of the hunk in the original file.
+
+        orig_len (int):
+            The number of lines from the original file in the hunk.
+
+        new_start (int):
+            The 1-based starting line of the hunk in the patched file.
+
+        new_len (int):
+            The number of lines from the patched file in the hunk.
+
+        lines (list of tuple):
+            The lines in the hunk. Each is a tuple of the operation
+            (``b' '``, ``b'-'`` or ``b'+'``) and the line content, including
+            the trailing newline (if any).
+
+        raw_lines (list of bytes):
+            The raw lines of the hunk from the diff, including the header.
+            These are used for generating rejects.
+    """
+
+    def __init__(self, orig_start, orig_len, new_start, new_len, header):
+        self.orig_start = orig_start
+        self.orig_len = orig_len
+        self.new_start = new_start
+        self.new_len = new_len
+        self.lines = []
+        self.raw_lines = [header]
+
+    def get_context_counts(self):
+        """Return the number of lines of context around the hunk's changes.
+
+        Returns:
+            tuple:
+            A 2-tuple containing the number of leading and trailing lines of
+            context.
+        """
+        lines = self.lines
+        num_lines = len(lines)
+        prefix = 0
+        suffix = 0
+
+        while prefix < num_lines and lines[prefix][0] == b' ':
+            prefix += 1
+
+        while suffix < num_lines and lines[-1 - suffix][0] == b' ':
+            suffix += 1
+
+        return prefix, suffix
+
+
+def _split_lines(data):
+    """Split data into lines, preserving newlines.
+
+    Unlike :py:meth:`bytes.splitlines`, this only ever splits on ``\\n``.
+
+    Args:
+        data (bytes):
+            The data to split.
+
+    Returns:
+        list of bytes:
+        The lines, each ending with ``\\n`` except possibly the last.
+    """
+    lines = data.split(b'\n')
+
+    if lines[-1]:
+        last = lines.pop()
+    else:
+        last = None
+        lines.pop()
+
+    lines = [line + b'\n' for line in lines]
+
+    if last is not None:
+        lines.append(last)
+
+    return lines
+
+
+def parse_hunks(diff):
+    """Parse the hunks from a unified diff for a single file.
+
+    Any file headers (``diff --git``, ``index``, ``---``/``+++``, etc.)
+    preceding the first hunk are skipped.
+
+    Args:
+        diff (bytes):
+            The unified diff to parse. This must use ``\\n`` line endings.
+
+    Returns:
+        list of _Hunk:
+        The list of parsed hunks.
+
+    Raises:
+        MalformedPatchError:
+            The diff was malformed, or contained a hunk that was cut short.
+    """
+    hunks = []
+    lines = _split_lines(diff)
+    num_lines = len(lines)
+    i = 0
+
+    while i < num_lines:
+        m = _HUNK_HEADER_RE.match(lines[i].rstrip(b'\n'))
+        i += 1
+
+        if not m:
+            # Like patch(1), anything outside of a hunk is ignored.
+            continue
+
+        orig_len = m.group('orig_len')
+        new_len = m.group('new_len')
+
+        hunk = _Hunk(orig_start=int(m.group('orig_start')),
+                     orig_len=int(orig_len) if orig_len is not None else 1,
+                     new_start=int(m.group('new_start')),
+                     new_len=int(new_len) if new_len is not None else 1,
+                     header=lines[i - 1])
+        orig_remaining = hunk.orig_len
+        new_remaining = hunk.new_len
+
+        while (orig_remaining > 0 or new_remaining > 0) and i < num_lines:
+            line = lines[i]
+            op = line[:1]
+
+            if line == b'\n':
+                # Some tools strip the trailing whitespace from empty
+                # lines of context. patch(1) treats these as context.
+                op = b' '
+                line = b' \n'
+
+            if op == b' ':
+                orig_remaining -= 1
+                new_remaining -= 1
+            elif op == b'-':
+                orig_remaining -= 1
+            elif op == b'+':
+                new_remaining -= 1
+            elif op == b'\\':
+                _strip_hunk_newline(hunk)
+                hunk.raw_lines.append(lines[i])
+                i += 1
+                continue
+            else:
+                break
+
+            if orig_remaining < 0 or new_remaining < 0:
+                raise MalformedPatchError(
+                    'Hunk at line %d has more lines than its header '
+                    'specifies' % i)
+
+            hunk.lines.append((op, line[1:]))
+            hunk.raw_lines.append(lines[i])
+            i += 1
+
+        if orig_remaining > 0 or new_remaining > 0:
+            raise MalformedPatchError('Hunk ending at line %d is truncated'
+                                      % i)
+
+        # A "No newline at end of file" marker may trail the last line of
+        # the hunk.
+        if i < num_lines and lines[i].startswith(b'\\'):
+            _strip_hunk_newline(hunk)
+            hunk.raw_lines.append(lines[i])
+            i += 1
+
+        hunks.append(hunk)
+
+    return hunks
+
+
+def _strip_hunk_newline(hunk):
+    """Strip the newline from the last line of a hunk.
+
+    This handles the ``\\ No newline at end of file`` marker.
+
+    Args:
+        hunk (_Hunk):
+            The hunk to modify.
+
+    Raises:
+        MalformedPatchError:
+            The marker didn't follow a line in the hunk.
+    """
+    if not hunk.lines:
+        raise MalformedPatchError(
+            '"No newline at end of file" marker found outside of a line')
+
+    op, text = hunk.lines[-1]
+
+    if text.endswith(b'\n'):
+        hunk.lines[-1] = (op, text[:-1])
+
+
+def _find_hunk(file_keys, pattern, guess, min_pos, anchor_start=False,
+               anchor_end=False):
+    """Locate the position in a file where a hunk's lines match.
+
+    This searches outward from the guessed position, alternating between
+    later and earlier positions, and never before ``min_pos``.
+
+    Hunks with less leading context than trailing context can only apply to
+    the start of the file, and hunks with less trailing context than leading
+    context can only apply to the end of the file. This mirrors the behavior
+    of GNU :command:`patch`.
+
+    Args:
+        file_keys (list of bytes):
+            The lines of the file being patched, without trailing newlines.
+
+        pattern (list of bytes):
+            The lines (context and removed lines) to match, without trailing
+            newlines.
+
+        guess (int):
+            The 0-based position where the hunk is expected to apply.
+
+        min_pos (int):
+            The earliest position the hunk is allowed to apply at.
+
+        anchor_start (bool, optional):
+            Whether the hunk must apply at the start of the file.
+
+        anchor_end (bool, optional):
+            Whether the hunk must apply at the end of the file.
+
+    Returns:
+        int:
+        The 0-based position where the hunk matches, or ``None``.
+    """
+    num_pattern = len(pattern)
+    max_pos = len(file_keys) - num_pattern
+
+    if max_pos < min_pos:
+        return None
+
+    if num_pattern == 0:
+        return max(min_pos, min(guess, max_pos))
+
+    if anchor_start:
+        if anchor_end and max_pos != 0:
+            return None
+
+        candidates = [0]
+    elif anchor_end:
+        candidates = [max_pos]
+    else:
+        candidates = _iter_hunk_positions(
+            guess=max(min_pos, min(guess, max_pos)),
+            min_pos=min_pos,
+            max_pos=max_pos)
+
+    first = pattern[0]
+
+    for pos in candidates:
+        if (min_pos <= pos <= max_pos and
+            file_keys[pos] == first and
+            file_keys[pos:pos + num_pattern] == pattern):
+            return pos
+
+    return None
+
+
+def _iter_hunk_positions(guess, min_pos, max_pos):
+    """Iterate through the positions to try for a hunk.
+
+    Positions are generated as needed, starting at the guessed position and
+    moving outward from it, so that finding a hunk at or near its expected
+    position doesn't require considering every position in the file.
+
+    Args:
+        guess (int):
+            The 0-based position where the hunk is expected to apply. This
+            must be between ``min_pos`` and ``max_pos``.
+
+        min_pos (int):
+            The earliest position to try.
+
+        max_pos (int):
+            The latest position to try.
+
+    Yields:
+        int:
+        Each position to try.
+    """
+    yield guess
+
+    for offset in range(1, max(max_pos - guess, guess - min_pos) + 1):
+        if guess + offset <= max_pos:
+            yield guess + offset
+
+        if guess - offset >= min_pos:
+            yield guess - offset
+
+
+def apply_patch(diff, orig_file, filename, max_fuzz=DEFAULT_MAX_FUZZ):
+    """Apply a unified diff to file contents in memory.
+
+    Hunks are applied in order. Each hunk is first looked for at its
+    expected location (adjusted by the offset of any prior hunks), and then
+    at increasing distances from it. If a hunk doesn't match exactly, up to
+    ``max_fuzz`` lines of leading and trailing context will be ignored.
+
+    Both ``diff`` and ``orig_file`` should already have their line endings
+    normalized to ``\\n``.
+
+    Args:
+        diff (bytes):
+            The unified diff to apply.
+
+        orig_file (bytes):
+            The contents of the original file.
+
+        filename (unicode):
+            The name of the file being patched. This is used for error
+            output.
+
+        max_fuzz (int, optional):
+            The maximum number of lines of context that may be ignored when
+            locating a hunk.
+
+    Returns:
+        bytes:
+        The contents of the patched file.
+
+    Raises:
+        reviewboard.diffviewer.errors.PatchError:
+            The diff could not be parsed or one or more hunks could not be
+            applied.
+    """
+    base_filename = os.path.basename(filename)
+
+    try:
+        hunks = parse_hunks(diff)
+    except MalformedPatchError as e:
+        raise PatchError(filename=filename,
+                         error_output='patch: **** malformed patch: %s' % e,
+                         orig_file=orig_file,
+                         new_file=None,
+                         diff=diff,
+                         rejects=None)
+
+    file_lines = _split_lines(orig_file)
+    file_keys = [line.rstrip(b'\n') for line in file_lines]
+    result = []
+    messages = []
+    rejected = []
+
+    # The position in file_lines up to which lines have been copied to the
+    # result, and the accumulated offset of applied hunks.
+    copied_pos = 0
+    offset = 0
+
+    for hunk_num, hunk in enumerate(hunks, start=1):
+        if hunk.orig_len == 0:
+            first_line = hunk.orig_start + 1
+        else:
+            first_line = hunk.orig_start
+
+        guess = first_line - 1 + offset
+        num_lines = len(hunk.lines)
+        prefix_context, suffix_context = hunk.get_context_counts()
+        context = max(prefix_context, suffix_context)
+        pos = None
+
+        # As with patch(1), fuzz is applied relative to the larger amount of
+        # context on either side of the hunk. The side with less context
+        # must then be anchored to the start or end of the file.
+        for fuzz in range(min(max_fuzz, context) + 1):
+            prefix_fuzz = fuzz + prefix_context - context
+            suffix_fuzz = fuzz + suffix_context - context
+            trimmed = max(prefix_fuzz, 0)
+            lines = hunk.lines[trimmed:num_lines - max(suffix_fuzz, 0)]
+
+            # Comparisons ignore trailing newlines. These may legitimately
+            # differ when a file lacks a trailing newline, and will be
+            # preserved from the original file.
+            pattern = [
+                text.rstrip(b'\n')
+                for op, text in lines
+                if op != b'+'
+            ]
+            pos = _find_hunk(file_keys=file_keys,
+                             pattern=pattern,
+                             guess=guess + trimmed,
+                             min_pos=copied_pos,
+                             anchor_start=(prefix_fuzz < 0 and
+                                           first_line <= 1),
+                             anchor_end=suffix_fuzz < 0)
+
+            if pos is not None:
+                break
+
+        if pos is None:
+            rejected.append(hunk)
+            messages.append('Hunk #%d FAILED at %d.'
+                            % (hunk_num, hunk.orig_start))
+            continue
+
+        line_offset = pos - trimmed - (guess - offset)
+
+        if line_offset or fuzz:
+            msg = 'Hunk #%d succeeded at %d' % (hunk_num, pos - trimmed + 1)
+
+            if fuzz:
+                msg += ' with fuzz %d' % fuzz
+
+            if line_offset:
+                msg += (' (offset %d line%s)'
+                        % (line_offset, '' if abs(line_offset) == 1 else 's'))
+
+            messages.append(msg + '.')
+
+        # Copy everything up to the start of the hunk, then walk the hunk.
+        # Context lines are taken from the original file, removed lines are
+        # skipped, and added lines come from the diff.
+        result += file_lines[copied_pos:pos]
+        file_pos = pos
+
+        for op, text in lines:
+            if op == b' ':
+                result.append(file_lines[file_pos])
+                file_pos += 1
+            elif op == b'-':
+                file_pos += 1
+            else:
+                result.append(text)
+
+        copied_pos = file_pos
+        offset = line_offset
+
+    result += file_lines[copied_pos:]
+
+    # If content was appended after a line lacking a newline (for instance,
+    # when a hunk's context was fuzzed away at the end of the file), make
+    # sure lines don't get joined together.
+    for i in range(len(result) - 1):
+        if not result[i].endswith(b'\n'):
+            result[i] += b'\n'
+
+    new_file = b''.join(result)
+
+    if rejected:
+        rejects = [
+            ('--- %s\n+++ %s\n' % (base_filename, base_filename))
+            .encode('utf-8'),
+        ]
+
+        for hunk in rejected:
+            rejects += hunk.raw_lines
+
+        messages.append(
+            '%d out of %d hunk%s FAILED -- saving rejects to file %s.rej'
+            % (len(rejected), len(hunks), '' if len(hunks) == 1 else 's',
+               base_filename))
+
+        raise PatchError(
+            filename=filename,
+            error_output='\n'.join(['patching file %s' % base_filename] +
+                                   messages),
+            orig_file=orig_file,
+            new_file=new_file,
+            diff=diff,
+            rejects=b''.join(rejects))
+
+    return new_file
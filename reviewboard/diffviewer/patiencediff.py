@@ -0,0 +1,185 @@
+from __future__ import unicode_literals
+
+from array import array
+from bisect import bisect_left
+
+from django.utils.six.moves import range
+
+from reviewboard.diffviewer.myersdiff import MyersDiffer
+
+
+class PatienceDiffer(MyersDiffer):
+    """An implementation of Bram Cohen's Patience Diff algorithm.
+
+    Lines that appear exactly once in both regions being compared are used
+    as anchors. The longest run of anchors appearing in the same order on
+    both sides is matched up, and the regions between the anchors are diffed
+    recursively.
+
+    Regions without any anchors are handed off to the Myers algorithm, which
+    will be bounded in cost (see
+    :py:attr:`DiffCompatVersion.MYERS_BOUNDED_COST
+    <reviewboard.diffviewer.differ.DiffCompatVersion.MYERS_BOUNDED_COST>`).
+
+    This tends to produce more readable diffs for code that has been
+    reorganized, and avoids the worst-case behavior of the Myers algorithm
+    on large files with few unique lines in common.
+    """
+
+    def _gen_diff_data(self):
+        """Generate all the diff data needed to return opcodes.
+
+        This is only called once during the liftime of a differ instance.
+        """
+        if self.a_data and self.b_data:
+            return
+
+        self.a_data = self.DiffData(self._gen_diff_codes(self.a, False))
+        self.b_data = self.DiffData(self._gen_diff_codes(self.b, True))
+
+        # Unlike the Myers differ, no lines are discarded up-front, so that
+        # anchors can be found against the full data. The Myers fallback
+        # then works with the same indexes.
+        for data in (self.a_data, self.b_data):
+            data.undiscarded = data.data
+            data.undiscarded_lines = data.length
+
+            if self.USE_ARRAYS:
+                data.real_indexes = array(str('i'), range(data.length))
+            else:
+                data.real_indexes = list(range(data.length))
+
+        self.max_lines = self.a_data.length + self.b_data.length + 3
+        self.fdiag = [0] * self.max_lines
+        self.bdiag = [0] * self.max_lines
+        self.downoff = self.upoff = self.b_data.length + 1
+
+        a = self.a_data.data
+        b = self.b_data.data
+
+        # Regions are processed with an explicit stack, rather than
+        # recursion, to keep large files from hitting the recursion limit.
+        regions = [(0, self.a_data.length, 0, self.b_data.length)]
+
+        while regions:
+            a_lower, a_upper, b_lower, b_upper = regions.pop()
+
+            while (a_lower < a_upper and b_lower < b_upper and
+                   a[a_lower] == b[b_lower]):
+                a_lower += 1
+                b_lower += 1
+
+            while (a_upper > a_lower and b_upper > b_lower and
+                   a[a_upper - 1] == b[b_upper - 1]):
+                a_upper -= 1
+                b_upper -= 1
+
+            if a_lower == a_upper or b_lower == b_upper:
+                matches = None
+            else:
+                matches = self._find_matches(a_lower, a_upper,
+                                             b_lower, b_upper)
+
+            if matches:
+                prev_a = a_lower
+                prev_b = b_lower
+
+                for i, j, length in matches:
+                    regions.append((prev_a, i, prev_b, j))
+                    prev_a = i + length
+                    prev_b = j + length
+
+                regions.append((prev_a, a_upper, prev_b, b_upper))
+            else:
+                self._lcs(a_lower, a_upper, b_lower, b_upper,
+                          self.minimal_diff)
+
+        self._shift_chunks(self.a_data, self.b_data)
+        self._shift_chunks(self.b_data, self.a_data)
+
+    def _find_matches(self, a_lower, a_upper, b_lower, b_upper):
+        """Return the matching blocks to split a region on.
+
+        Subclasses can override this to use a different strategy for
+        choosing anchors.
+
+        Args:
+            a_lower (int):
+                The start of the region in the original file.
+
+            a_upper (int):
+                The end of the region in the original file.
+
+            b_lower (int):
+                The start of the region in the modified file.
+
+            b_upper (int):
+                The end of the region in the modified file.
+
+        Returns:
+            list of tuple:
+            A list of ``(i, j, length)`` tuples of matching blocks, in order
+            and non-overlapping. An empty list means no anchors were found.
+        """
+        a = self.a_data.data
+        b = self.b_data.data
+
+        # Find the lines that appear exactly once in each region. A value of
+        # None marks lines seen more than once.
+        a_unique = {}
+        b_unique = {}
+
+        for i in range(a_lower, a_upper):
+            code = a[i]
+            a_unique[code] = None if code in a_unique else i
+
+        for j in range(b_lower, b_upper):
+            code = b[j]
+
+            if a_unique.get(code) is not None:
+                b_unique[code] = None if code in b_unique else j
+
+        # Build the list of original file indexes for the anchors, ordered
+        # by their position in the modified file.
+        pairs = [
+            (a_unique[code], j)
+            for code, j in sorted(
+                ((code, j)
+                 for code, j in b_unique.items()
+                 if j is not None),
+                key=lambda item: item[1])
+        ]
+
+        if not pairs:
+            return []
+
+        # Find the longest increasing subsequence of original file indexes,
+        # using patience sorting.
+        pile_tops = []
+        pile_indexes = []
+        backrefs = [None] * len(pairs)
+
+        for n, (i, j) in enumerate(pairs):
+            pile = bisect_left(pile_tops, i)
+
+            if pile > 0:
+                backrefs[n] = pile_indexes[pile - 1]
+
+            if pile == len(pile_tops):
+                pile_tops.append(i)
+                pile_indexes.append(n)
+            else:
+                pile_tops[pile] = i
+                pile_indexes[pile] = n
+
+        matches = []
+        n = pile_indexes[-1]
+
+        while n is not None:
+            i, j = pairs[n]
+            matches.append((i, j, 1))
+            n = backrefs[n]
+
+        matches.reverse()
+
+        return matches
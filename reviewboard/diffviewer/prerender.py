@@ -0,0 +1,331 @@
+"""Background pre-rendering of diff chunks.
+
+When a diff is uploaded or published, the chunks for each file can be
+generated ahead of time by a pre-rendering backend, warming the cache so that
+the first person to view the diff doesn't pay the cost of fetching, patching,
+diffing and highlighting every file.
+
+Pre-rendering is off by default. It's enabled by choosing a backend in the
+``diffviewer_prerender_backend_id`` setting. Extensions can register their
+own backends (for instance, to hand the work off to a task queue) in
+:py:data:`prerender_backend_registry`.
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import multiprocessing
+import threading
+
+from django.db import connections, transaction
+from django.utils.translation import ugettext_lazy as _
+
+from reviewboard.registries.registry import Registry
+
+
+# Models (including SiteConfiguration) are imported where they're used, so
+# that spawned pre-rendering workers can import this module before Django
+# has been set up.
+
+
+logger = logging.getLogger(__name__)
+
+
+def prerender_diffset(diffset_id):
+    """Generate and cache the chunks for every file in a DiffSet.
+
+    This renders the files the way the diff viewer would show the DiffSet
+    on its own, using the site's syntax highlighting setting. Files that
+    fail to render are logged and skipped.
+
+    Args:
+        diffset_id (int):
+            The ID of the DiffSet to pre-render.
+
+    Returns:
+        int:
+        The number of files that were rendered (or were already cached).
+    """
+    from djblets.siteconfig.models import SiteConfiguration
+
+    from reviewboard.diffviewer.chunk_generator import \
+        get_diff_chunk_generator
+    from reviewboard.diffviewer.diffutils import (get_diff_files,
+                                                  prefetch_diff_files)
+    from reviewboard.diffviewer.models import DiffSet
+
+    try:
+        diffset = (
+            DiffSet.objects
+            .select_related('repository')
+            .get(pk=diffset_id)
+        )
+    except DiffSet.DoesNotExist:
+        logger.warning('Unable to pre-render diff chunks for DiffSet %s: '
+                       'The DiffSet does not exist.',
+                       diffset_id)
+        return 0
+
+    siteconfig = SiteConfiguration.objects.get_current()
+    enable_syntax_highlighting = \
+        siteconfig.get('diffviewer_syntax_highlighting')
+    num_rendered = 0
+    files = get_diff_files(diffset)
+
+    try:
+        prefetch_diff_files(
+            files,
+            enable_syntax_highlighting=enable_syntax_highlighting)
+    except Exception as e:
+        logger.exception('Unable to prefetch original files for DiffSet %s: '
+                         '%s',
+                         diffset_id, e)
+
+    for diff_file in files:
+        filediff = diff_file['filediff']
+
+        try:
+            generator = get_diff_chunk_generator(
+                None,
+                filediff,
+                diff_file['interfilediff'],
+                diff_file['force_interdiff'],
+                enable_syntax_highlighting,
+                base_filediff=diff_file.get('base_filediff'))
+
+            # Consume the chunks, so they're generated and cached.
+            for chunk in generator.get_chunks():
+                pass
+
+            num_rendered += 1
+        except Exception as e:
+            logger.exception('Unable to pre-render diff chunks for '
+                             'FileDiff %s: %s',
+                             filediff.pk, e)
+
+    return num_rendered
+
+
+class BasePrerenderBackend(object):
+    """Base class for a diff chunk pre-rendering backend.
+
+    Subclasses must set :py:attr:`backend_id` and :py:attr:`name`, and
+    implement :py:meth:`queue_diffset`.
+    """
+
+    #: The unique ID of the backend.
+    backend_id = None
+
+    #: The displayed name of the backend.
+    name = None
+
+    def queue_diffset(self, diffset_id):
+        """Queue a DiffSet for pre-rendering.
+
+        This must return quickly, without waiting for the rendering to
+        finish. The work should end up calling :py:func:`prerender_diffset`.
+
+        Args:
+            diffset_id (int):
+                The ID of the DiffSet to pre-render.
+        """
+        raise NotImplementedError
+
+    def shutdown(self):
+        """Shut down any workers used by the backend.
+
+        This is called when the backend is unregistered.
+        """
+        pass
+
+
+# Database connections and cache backends inherited from the parent process
+# by forked workers. These are kept referenced so that they're never closed
+# (and the parent's sessions aren't terminated) when garbage-collected in the
+# worker.
+_inherited_db_connections = []
+_inherited_caches = []
+
+
+def _init_pool_worker():
+    """Initialize a worker process for ProcessPoolPrerenderBackend.
+
+    Worker processes are spawned fresh where supported, and need Review
+    Board set up first.
+
+    Worker processes forked from a Review Board process (on Python 2) must
+    not share its database or cache connections, so they're set aside and
+    new ones will be opened on demand.
+    """
+    from django.apps import apps
+
+    if apps.ready:
+        from django.core.cache import caches
+
+        for conn in connections.all():
+            if conn.connection is not None:
+                _inherited_db_connections.append(conn.connection)
+                conn.connection = None
+
+        # Cache backends are stored per-thread. The ones belonging to the
+        # thread that forked this process were copied along with it, so
+        # start over with new ones.
+        _inherited_caches.extend(caches.all())
+        caches._caches = threading.local()
+    else:
+        import django
+
+        django.setup()
+
+
+class ProcessPoolPrerenderBackend(BasePrerenderBackend):
+    """A pre-rendering backend using a local pool of worker processes.
+
+    Each Review Board process that queues work starts its own pool the
+    first time it's needed. The number of worker processes is controlled by
+    the ``diffviewer_prerender_workers`` setting.
+    """
+
+    backend_id = 'process-pool'
+    name = _('Local process pool')
+
+    #: The number of DiffSets a worker will pre-render before it's replaced.
+    #:
+    #: This keeps memory from building up in long-running workers.
+    MAX_TASKS_PER_CHILD = 50
+
+    def __init__(self):
+        """Initialize the backend."""
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def queue_diffset(self, diffset_id):
+        """Queue a DiffSet for pre-rendering in the process pool.
+
+        Args:
+            diffset_id (int):
+                The ID of the DiffSet to pre-render.
+        """
+        self._get_pool().apply_async(prerender_diffset, (diffset_id,))
+
+    def shutdown(self):
+        """Shut down the worker processes."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+
+    def _get_pool(self):
+        """Return the process pool, creating it if needed.
+
+        Returns:
+            multiprocessing.pool.Pool:
+            The process pool.
+        """
+        with self._lock:
+            if self._pool is None:
+                from djblets.siteconfig.models import SiteConfiguration
+
+                siteconfig = SiteConfiguration.objects.get_current()
+
+                if hasattr(multiprocessing, 'get_context'):
+                    # Forking a (usually multi-threaded) web server process
+                    # would copy its open connections and any locks held by
+                    # other threads into the workers, so start them fresh.
+                    context = multiprocessing.get_context('spawn')
+                else:
+                    context = multiprocessing
+
+                self._pool = context.Pool(
+                    processes=siteconfig.get('diffviewer_prerender_workers'),
+                    initializer=_init_pool_worker,
+                    maxtasksperchild=self.MAX_TASKS_PER_CHILD)
+
+            return self._pool
+
+
+class PrerenderBackendRegistry(Registry):
+    """A registry for diff chunk pre-rendering backends.
+
+    Extensions can add additional backends, such as ones handing the work
+    off to a task queue.
+
+    See :py:ref:`the registry documentation <registry-guides>` for information
+    on how registries work.
+    """
+
+    lookup_attrs = ['backend_id']
+
+    def get_defaults(self):
+        """Return the default pre-rendering backends.
+
+        Returns:
+            list of BasePrerenderBackend:
+            The default backends.
+        """
+        return [
+            ProcessPoolPrerenderBackend(),
+        ]
+
+    def unregister(self, backend):
+        """Unregister a backend, shutting it down.
+
+        Args:
+            backend (BasePrerenderBackend):
+                The backend to unregister.
+        """
+        super(PrerenderBackendRegistry, self).unregister(backend)
+        backend.shutdown()
+
+    @property
+    def current_backend(self):
+        """The configured backend, or ``None`` if pre-rendering is disabled.
+        """
+        from djblets.siteconfig.models import SiteConfiguration
+
+        siteconfig = SiteConfiguration.objects.get_current()
+        backend_id = siteconfig.get('diffviewer_prerender_backend_id')
+
+        if not backend_id:
+            return None
+
+        backend = self.get('backend_id', backend_id)
+
+        if backend is None:
+            logger.error('The diff pre-rendering backend "%s" is not '
+                         'registered.',
+                         backend_id)
+
+        return backend
+
+
+#: The registry of diff chunk pre-rendering backends.
+prerender_backend_registry = PrerenderBackendRegistry()
+
+
+def queue_prerender_diffset(diffset):
+    """Queue a DiffSet for pre-rendering, if enabled.
+
+    The DiffSet is queued once the current database transaction (if any)
+    has been committed, so that the workers can see it.
+
+    Args:
+        diffset (reviewboard.diffviewer.models.diffset.DiffSet):
+            The DiffSet to pre-render.
+    """
+    backend = prerender_backend_registry.current_backend
+
+    if backend is None:
+        return
+
+    diffset_id = diffset.pk
+
+    def _queue():
+        try:
+            backend.queue_diffset(diffset_id)
+        except Exception as e:
+            logger.exception('Unable to queue DiffSet %s for diff '
+                             'pre-rendering: %s',
+                             diffset_id, e)
+
+    transaction.on_commit(_queue)
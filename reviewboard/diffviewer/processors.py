@@ -3,64 +3,107 @@ from __future__ import unicode_literals
 from reviewboard.diffviewer.diffutils import get_diff_data_chunks_info
 
 
-def filter_interdiff_opcodes(opcodes, filediff_data, interfilediff_data):
-    """Filters the opcodes for an interdiff to remove unnecessary lines.
+def get_interdiff_ranges(filediff_data, interfilediff_data):
+    """Return the ranges of changed lines used to filter interdiff opcodes.
 
-    An interdiff may contain lines of code that have changed as the result of
-    updates to the tree between the time that the first and second diff were
-    created. This leads to some annoyances when reviewing.
+    The ranges cover the lines changed in each of the uploaded diffs, along
+    with any lines of context shared by both sides of each chunk. They only
+    depend on the diffs themselves, so they can be computed once and cached
+    for an interdiff.
 
-    This function will filter the opcodes to remove as much of this as
-    possible. It will only output non-"equal" opcodes if it falls into the
-    ranges of lines dictated in the uploaded diff files.
+    Args:
+        filediff_data (bytes):
+            The diff data for the left-hand side of the interdiff.
+
+        interfilediff_data (bytes):
+            The diff data for the right-hand side of the interdiff.
+
+    Returns:
+        tuple:
+        A 2-tuple containing the list of ``(start, end)`` line ranges for
+        ``filediff_data`` and the list for ``interfilediff_data``.
     """
-    def _find_range_info(diff):
-        ranges = []
-
-        for range_info in get_diff_data_chunks_info(diff):
-            orig_info = range_info['orig']
-            modified_info = range_info['modified']
-
-            orig_pre_lines_of_context = orig_info['pre_lines_of_context']
-            orig_post_lines_of_context = orig_info['post_lines_of_context']
-            modified_pre_lines_of_context = \
-                modified_info['pre_lines_of_context']
-            modified_post_lines_of_context = \
-                modified_info['post_lines_of_context']
-
-            if modified_pre_lines_of_context and orig_pre_lines_of_context:
-                pre_lines_of_context = min(orig_pre_lines_of_context,
-                                           modified_pre_lines_of_context)
-            else:
-                pre_lines_of_context = (modified_pre_lines_of_context or
-                                        orig_pre_lines_of_context)
+    return (_get_diff_ranges(filediff_data),
+            _get_diff_ranges(interfilediff_data))
 
-            if modified_post_lines_of_context and orig_post_lines_of_context:
-                post_lines_of_context = min(orig_post_lines_of_context,
-                                            modified_post_lines_of_context)
-            else:
-                post_lines_of_context = (modified_post_lines_of_context or
-                                         orig_post_lines_of_context)
 
-            start = modified_info['chunk_start'] + pre_lines_of_context
+def _get_diff_ranges(diff):
+    """Return the ranges of changed lines in a diff.
+
+    Args:
+        diff (bytes):
+            The diff data.
 
-            if pre_lines_of_context > 0:
-                start -= 1
+    Returns:
+        list of tuple:
+        The list of ``(start, end)`` line ranges in the modified file.
+    """
+    ranges = []
+
+    for range_info in get_diff_data_chunks_info(diff):
+        orig_info = range_info['orig']
+        modified_info = range_info['modified']
+
+        orig_pre_lines_of_context = orig_info['pre_lines_of_context']
+        orig_post_lines_of_context = orig_info['post_lines_of_context']
+        modified_pre_lines_of_context = \
+            modified_info['pre_lines_of_context']
+        modified_post_lines_of_context = \
+            modified_info['post_lines_of_context']
+
+        if modified_pre_lines_of_context and orig_pre_lines_of_context:
+            pre_lines_of_context = min(orig_pre_lines_of_context,
+                                       modified_pre_lines_of_context)
+        else:
+            pre_lines_of_context = (modified_pre_lines_of_context or
+                                    orig_pre_lines_of_context)
+
+        if modified_post_lines_of_context and orig_post_lines_of_context:
+            post_lines_of_context = min(orig_post_lines_of_context,
+                                        modified_post_lines_of_context)
+        else:
+            post_lines_of_context = (modified_post_lines_of_context or
+                                     orig_post_lines_of_context)
 
-            length = (modified_info['chunk_len'] - pre_lines_of_context -
-                      post_lines_of_context)
+        start = modified_info['chunk_start'] + pre_lines_of_context
 
-            ranges.append((start, start + length))
+        if pre_lines_of_context > 0:
+            start -= 1
 
-        return ranges
+        length = (modified_info['chunk_len'] - pre_lines_of_context -
+                  post_lines_of_context)
 
+        ranges.append((start, start + length))
+
+    return ranges
+
+
+def filter_interdiff_opcodes(opcodes, filediff_data, interfilediff_data,
+                             interdiff_ranges=None):
+    """Filters the opcodes for an interdiff to remove unnecessary lines.
+
+    An interdiff may contain lines of code that have changed as the result of
+    updates to the tree between the time that the first and second diff were
+    created. This leads to some annoyances when reviewing.
+
+    This function will filter the opcodes to remove as much of this as
+    possible. It will only output non-"equal" opcodes if it falls into the
+    ranges of lines dictated in the uploaded diff files.
+
+    If ``interdiff_ranges`` is provided (as returned by
+    :py:func:`get_interdiff_ranges`), it will be used instead of parsing
+    ``filediff_data`` and ``interfilediff_data``.
+    """
     def _is_range_valid(line_range, tag, i1, i2):
         return (line_range is not None and
                 i1 >= line_range[0] and
                 (tag == 'delete' or i1 != i2))
 
-    orig_ranges = _find_range_info(filediff_data)
-    new_ranges = _find_range_info(interfilediff_data)
+    if interdiff_ranges is None:
+        interdiff_ranges = get_interdiff_ranges(filediff_data,
+                                                interfilediff_data)
+
+    orig_ranges, new_ranges = interdiff_ranges
 
     orig_range_i = 0
     new_range_i = 0
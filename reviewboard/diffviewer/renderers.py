@@ -1,13 +1,20 @@
 from __future__ import unicode_literals
 
+import itertools
+import uuid
+
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template import Context
+from django.template.loader import get_template
 from django.utils import six
 from django.utils.translation import ugettext as _, get_language
 from djblets.cache.backend import cache_memoize
+from djblets.siteconfig.models import SiteConfiguration
 from djblets.util.compat.django.template.loader import render_to_string
 
-from reviewboard.diffviewer.chunk_generator import compute_chunk_last_header
+from reviewboard.diffviewer.chunk_generator import (compute_chunk_last_header,
+                                                    get_diff_chunk_generator)
 from reviewboard.diffviewer.diffutils import populate_diff_chunks
 from reviewboard.diffviewer.errors import UserVisibleError
 
@@ -29,9 +36,15 @@ class DiffRenderer(object):
     Note that any of the render functions are meant to be called only once per
     DiffRenderer. It will alter the state of the renderer, possibly
     disrupting future render calls.
+
+    Large files may be streamed to the client a chunk at a time, rather than
+    rendered in full up-front. See :py:meth:`should_stream`.
     """
     default_template_name = 'diffviewer/diff_file_fragment.html'
 
+    #: The template used to render each chunk when streaming.
+    chunk_template_name = 'diffviewer/diff_file_chunk.html'
+
     def __init__(self, diff_file, chunk_index=None, highlighting=False,
                  collapse_all=True, lines_of_context=None, extra_context=None,
                  allow_caching=True, template_name=default_template_name,
@@ -46,6 +59,7 @@ class DiffRenderer(object):
         self.template_name = template_name
         self.num_chunks = 0
         self.show_deleted = show_deleted
+        self._chunks_info = None
 
         if self.lines_of_context and len(self.lines_of_context) == 1:
             # If we only have one value, then assume it represents before
@@ -53,8 +67,143 @@ class DiffRenderer(object):
             self.lines_of_context.append(self.lines_of_context[0])
 
     def render_to_response(self, request):
-        """Renders the diff to an HttpResponse."""
-        return HttpResponse(self.render_to_string(request))
+        """Renders the diff to an HttpResponse.
+
+        If the diff should be streamed (see :py:meth:`should_stream`), this
+        will return a :py:class:`~django.http.StreamingHttpResponse`.
+        """
+        if self.should_stream():
+            return StreamingHttpResponse(self.render_to_stream(request))
+        else:
+            return HttpResponse(self.render_to_string(request))
+
+    def should_stream(self):
+        """Return whether the diff should be streamed to the client.
+
+        Whole files rendered with the default template will be streamed if
+        the number of changed lines in the diff is at or above the
+        ``diffviewer_streaming_threshold`` setting.
+
+        Returns:
+            bool:
+            ``True`` if the diff should be streamed.
+        """
+        if (self.chunk_index is not None or
+            self.lines_of_context or
+            self.template_name != self.default_template_name):
+            return False
+
+        siteconfig = SiteConfiguration.objects.get_current()
+        threshold = siteconfig.get('diffviewer_streaming_threshold')
+
+        filediff = self.diff_file.get('filediff')
+
+        if not threshold or filediff is None:
+            return False
+
+        counts = filediff.get_line_counts()
+
+        return ((counts['raw_insert_count'] or 0) +
+                (counts['raw_delete_count'] or 0)) >= threshold
+
+    def render_to_stream(self, request):
+        """Render the diff, yielding the HTML a chunk at a time.
+
+        If the chunks are already in the cache, they'll be read from the
+        cache a segment at a time as they're rendered. Otherwise, they'll be
+        rendered as they're generated (and stored in the cache a segment at
+        a time).
+
+        Generation is started before this returns, so that any errors
+        fetching or diffing the files can be handled before a response is
+        started.
+
+        The rendered HTML isn't cached.
+
+        Args:
+            request (django.http.HttpRequest):
+                The HTTP request from the client.
+
+        Returns:
+            iterator of unicode:
+            An iterator yielding the HTML for the diff.
+        """
+        diff_file = self.diff_file
+
+        if diff_file.get('chunks_loaded', False):
+            chunks = diff_file['chunks']
+        else:
+            generator = get_diff_chunk_generator(
+                request,
+                diff_file['filediff'],
+                diff_file['interfilediff'],
+                diff_file['force_interdiff'],
+                self.highlighting,
+                base_filediff=diff_file.get('base_filediff'))
+            chunks_info = generator.get_cached_chunks_info()
+            chunks = generator.get_chunks()
+
+            if chunks_info is None:
+                # Start generating the chunks. Information on them will be
+                # available once the first one is generated.
+                chunks = itertools.chain(list(itertools.islice(chunks, 1)),
+                                         chunks)
+                chunks_info = generator.chunks_info
+
+            changed_chunk_indexes = chunks_info['changed_chunk_indexes']
+            num_chunks = chunks_info['num_chunks']
+
+            diff_file.update({
+                'num_chunks': num_chunks,
+                'changed_chunk_indexes': changed_chunk_indexes,
+                'whitespace_only': (
+                    num_chunks > 0 and
+                    (len(chunks_info['whitespace_chunk_indexes']) ==
+                     len(changed_chunk_indexes))),
+                'num_changes': len(changed_chunk_indexes),
+            })
+
+            self._chunks_info = chunks_info
+
+        context = Context(self.make_context())
+        context['stream_chunks_marker'] = \
+            'rb-diff-chunks-%s' % uuid.uuid4().hex
+
+        return self._iter_stream(context, chunks)
+
+    def _iter_stream(self, context, chunks):
+        """Yield the HTML for a streamed diff.
+
+        The file's template is rendered with a marker in place of the
+        chunks. Everything before the marker is yielded, followed by the HTML
+        for each chunk and then the rest of the file's template.
+
+        Args:
+            context (django.template.Context):
+                The context for rendering. The chunks are rendered using the
+                same context as the file, so that any variables defined by
+                the file's template are available to them.
+
+            chunks (iterable of dict):
+                The chunks to render.
+
+        Yields:
+            unicode:
+            Each piece of HTML for the diff.
+        """
+        html = get_template(self.template_name).template.render(context)
+        head, tail = html.split(context['stream_chunks_marker'], 1)
+        del html
+
+        yield head
+
+        chunk_template = get_template(self.chunk_template_name).template
+
+        for chunk in chunks:
+            with context.push(chunk=chunk):
+                yield chunk_template.render(context)
+
+        yield tail
 
     def render_to_string(self, request):
         """Returns the diff as a string.
@@ -233,11 +382,15 @@ class DiffRenderer(object):
                     else:
                         self.diff_file['chunks'].remove(chunk)
 
-        equal_lines = 0
+        if self._chunks_info is not None:
+            # We're streaming chunks, which haven't been loaded yet.
+            equal_lines = self._chunks_info['line_counts']['equal']
+        else:
+            equal_lines = 0
 
-        for chunk in self.diff_file['chunks']:
-            if chunk['change'] == 'equal':
-                equal_lines += chunk['numlines']
+            for chunk in self.diff_file['chunks']:
+                if chunk['change'] == 'equal':
+                    equal_lines += chunk['numlines']
 
         context.update({
             'collapseall': self.collapse_all,
@@ -0,0 +1,32 @@
+"""Signal handlers for the diff viewer."""
+
+from __future__ import unicode_literals
+
+from reviewboard.diffviewer.prerender import queue_prerender_diffset
+
+
+def on_review_request_published(review_request, changedesc=None, **kwargs):
+    """Queue the latest diff of a published review request for pre-rendering.
+
+    This handles review requests being published for the first time with a
+    diff, and review requests being published with a new diff.
+
+    Args:
+        review_request (reviewboard.reviews.models.review_request.
+                        ReviewRequest):
+            The review request that was published.
+
+        changedesc (reviewboard.changedescs.models.ChangeDescription,
+                    optional):
+            The change description for the publish, if any.
+
+        **kwargs (dict):
+            Ignored arguments from the signal.
+    """
+    if changedesc is not None and 'diff' not in changedesc.fields_changed:
+        return
+
+    diffset = review_request.get_latest_diffset()
+
+    if diffset is not None:
+        queue_prerender_diffset(diffset)
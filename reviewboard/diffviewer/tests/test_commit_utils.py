@@ -6,14 +6,18 @@ from django.utils import six
 from kgb import SpyAgency
 
 from reviewboard.diffviewer.commit_utils import (CommitHistoryDiffEntry,
+                                                 FileDiffAncestorIndex,
+                                                 ValidationHistory,
+                                                 deserialize_validation_info,
                                                  diff_histories,
                                                  exclude_ancestor_filediffs,
                                                  get_base_and_tip_commits,
-                                                 get_file_exists_in_history)
-from reviewboard.diffviewer.models import DiffCommit
+                                                 get_file_exists_in_history,
+                                                 serialize_validation_info)
+from reviewboard.diffviewer.models import DiffCommit, FileDiff
 from reviewboard.diffviewer.tests.test_diffutils import \
     BaseFileDiffAncestorTests
-from reviewboard.scmtools.core import UNKNOWN
+from reviewboard.scmtools.core import PRE_CREATION, UNKNOWN
 from reviewboard.testing.testcase import TestCase
 
 
@@ -392,6 +396,153 @@ class GetFileExistsInHistoryTests(SpyAgency, TestCase):
         return get_file_exists_in_history
 
 
+class ValidationHistoryTests(SpyAgency, TestCase):
+    """Unit tests for reviewboard.diffviewer.commit_utils.ValidationHistory.
+    """
+
+    def _make_history(self, num_commits):
+        """Return a history where each commit modifies and adds a file.
+
+        Args:
+            num_commits (int):
+                The number of commits in the history.
+
+        Returns:
+            reviewboard.diffviewer.commit_utils.ValidationHistory:
+            The history.
+        """
+        return ValidationHistory(
+            ('r%d' % i, {
+                'parent_id': 'r%d' % (i - 1),
+                'tree': {
+                    'added': [{
+                        'filename': 'file%d' % i,
+                        'revision': 'a%d' % i,
+                    }],
+                    'modified': [{
+                        'filename': 'common',
+                        'revision': 'c%d' % i,
+                    }],
+                    'removed': [{
+                        'filename': 'removed%d' % i,
+                        'revision': 'b%d' % i,
+                    }],
+                },
+            })
+            for i in range(1, num_commits + 1)
+        )
+
+    def test_get_file_exists(self):
+        """Testing ValidationHistory.get_file_exists"""
+        history = self._make_history(10)
+
+        self.assertTrue(history.get_file_exists('r10', 'file3', 'a3'))
+        self.assertTrue(history.get_file_exists('r10', 'file3', UNKNOWN))
+        self.assertTrue(history.get_file_exists('r10', 'common', 'c2'))
+        self.assertFalse(history.get_file_exists('r10', 'removed4', UNKNOWN))
+        self.assertIsNone(history.get_file_exists('r10', 'removed4', 'b4'))
+        self.assertIsNone(history.get_file_exists('r10', 'file3', 'a4'))
+        self.assertIsNone(history.get_file_exists('r2', 'file3', 'a3'))
+        self.assertIsNone(history.get_file_exists('r0', 'file1', 'a1'))
+
+    def test_get_file_exists_memoized(self):
+        """Testing ValidationHistory.get_file_exists re-uses results from
+        previous lookups
+        """
+        history = self._make_history(100)
+        self.spy_on(history._get_commit_index)
+
+        self.assertTrue(history.get_file_exists('r50', 'file1', 'a1'))
+        self.assertEqual(len(history._get_commit_index.calls), 50)
+
+        # Looking up the same file from a later commit only has to walk
+        # back to the commits that were already walked.
+        self.assertTrue(history.get_file_exists('r100', 'file1', 'a1'))
+        self.assertEqual(len(history._get_commit_index.calls), 100)
+
+        self.assertTrue(history.get_file_exists('r75', 'file1', 'a1'))
+        self.assertEqual(len(history._get_commit_index.calls), 100)
+
+    def test_get_file_exists_with_cycle(self):
+        """Testing ValidationHistory.get_file_exists with a cycle in the
+        parent IDs
+        """
+        history = self._make_history(3)
+        history['r1']['parent_id'] = 'r3'
+
+        self.assertIsNone(history.get_file_exists('r3', 'foo', UNKNOWN))
+
+    def test_get_file_exists_after_adding_commit(self):
+        """Testing ValidationHistory.get_file_exists after adding a commit
+        """
+        history = self._make_history(2)
+
+        self.assertIsNone(history.get_file_exists('r2', 'file0', 'a0'))
+
+        history['r0'] = {
+            'parent_id': 'base',
+            'tree': {
+                'added': [{
+                    'filename': 'file0',
+                    'revision': 'a0',
+                }],
+                'modified': [],
+                'removed': [],
+            },
+        }
+
+        self.assertTrue(history.get_file_exists('r2', 'file0', 'a0'))
+
+    def test_serialize_after_deserialize(self):
+        """Testing serialize_validation_info after
+        deserialize_validation_info and adding a commit
+        """
+        history = deserialize_validation_info(
+            serialize_validation_info(self._make_history(3)))
+
+        self.assertIsInstance(history, ValidationHistory)
+        self.assertEqual(history, self._make_history(3))
+
+        self.spy_on(ValidationHistory.serialize)
+        history['r4'] = self._make_history(4)['r4']
+
+        result = deserialize_validation_info(
+            serialize_validation_info(history))
+
+        self.assertEqual(result, self._make_history(4))
+        self.assertTrue(ValidationHistory.serialize.called)
+
+    def test_serialize_after_deserialize_empty(self):
+        """Testing serialize_validation_info after
+        deserialize_validation_info with empty validation info
+        """
+        history = deserialize_validation_info(serialize_validation_info({}))
+        history['r1'] = self._make_history(1)['r1']
+
+        self.assertEqual(
+            deserialize_validation_info(serialize_validation_info(history)),
+            self._make_history(1))
+
+    def test_serialize_after_replacing_commit(self):
+        """Testing serialize_validation_info after
+        deserialize_validation_info and replacing a commit
+        """
+        history = deserialize_validation_info(
+            serialize_validation_info(self._make_history(2)))
+        history['r2'] = {
+            'parent_id': 'r1',
+            'tree': {
+                'added': [],
+                'modified': [],
+                'removed': [],
+            },
+        }
+
+        self.assertEqual(
+            deserialize_validation_info(serialize_validation_info(history)),
+            history)
+
+
 class ExcludeAncestorFileDiffsTests(BaseFileDiffAncestorTests):
     """Unit tests for commit_utils.exclude_ancestor_filediffs."""
 
@@ -406,9 +557,10 @@ class ExcludeAncestorFileDiffsTests(BaseFileDiffAncestorTests):
 
     def test_exclude_query_count(self):
         """Testing exclude_ancestor_filediffs query count"""
-        num_queries = len(self.filediffs)
-
-        with self.assertNumQueries(num_queries):
+        # The commit series is finalized, so only the DiffSet needs to be
+        # loaded for its ancestor index. The index is shared by the other
+        # FileDiffs.
+        with self.assertNumQueries(1):
             result = exclude_ancestor_filediffs(self.filediffs)
 
         self._test_excluded(result)
@@ -461,6 +613,90 @@ class ExcludeAncestorFileDiffsTests(BaseFileDiffAncestorTests):
         self.assertEqual(expected, set(result))
 
 
+class FileDiffAncestorIndexTests(TestCase):
+    """Unit tests for FileDiffAncestorIndex."""
+
+    def setUp(self):
+        super(FileDiffAncestorIndexTests, self).setUp()
+
+        def _make_filediff(pk, commit_id, source_file, source_revision,
+                           dest_file, dest_detail, status=FileDiff.MODIFIED):
+            return FileDiff(pk=pk,
+                            commit_id=commit_id,
+                            source_file=source_file,
+                            source_revision=source_revision,
+                            dest_file=dest_file,
+                            dest_detail=dest_detail,
+                            status=status)
+
+        # foo is added, modified, deleted, re-added, and then modified and
+        # copied to bar in the same commit.
+        self.filediffs = [
+            _make_filediff(10, 1, 'foo', PRE_CREATION, 'foo', 'a'),
+            _make_filediff(11, 2, 'foo', 'a', 'foo', 'b'),
+            _make_filediff(12, 3, 'foo', 'b', 'foo', '0',
+                           status=FileDiff.DELETED),
+            _make_filediff(13, 4, 'foo', PRE_CREATION, 'foo', 'c'),
+            _make_filediff(15, 5, 'foo', 'c', 'bar', 'd',
+                           status=FileDiff.COPIED),
+            _make_filediff(14, 5, 'foo', 'c', 'foo', 'e'),
+            _make_filediff(16, 5, 'baz', 'x', 'baz', 'y'),
+        ]
+
+    def test_get_ancestor_ids(self):
+        """Testing FileDiffAncestorIndex.get_ancestor_ids"""
+        index = FileDiffAncestorIndex.build(self.filediffs)
+
+        self.assertEqual(index.get_ancestor_ids(10), ([], []))
+        self.assertEqual(index.get_ancestor_ids(11), ([], [10]))
+        self.assertEqual(index.get_ancestor_ids(12), ([], [10, 11]))
+        self.assertEqual(index.get_ancestor_ids(13), ([10, 11, 12], []))
+        self.assertEqual(index.get_ancestor_ids(14), ([10, 11, 12], [13]))
+        self.assertEqual(index.get_ancestor_ids(15), ([10, 11, 12], [13]))
+        self.assertEqual(index.get_ancestor_ids(16), ([], []))
+
+    def test_get_ancestor_ids_matches_get_ancestors(self):
+        """Testing FileDiffAncestorIndex.get_ancestor_ids matches
+        FileDiff.get_ancestors
+        """
+        index = FileDiffAncestorIndex.build(self.filediffs)
+
+        for filediff in self.filediffs:
+            filediff.extra_data = {}
+            compliment_ids, minimal_ids = filediff._compute_ancestors(
+                self.filediffs, update=False)
+
+            self.assertEqual(index.get_ancestor_ids(filediff.pk),
+                             (compliment_ids, minimal_ids))
+
+    def test_get_base_filediff_id(self):
+        """Testing FileDiffAncestorIndex.get_base_filediff_id"""
+        index = FileDiffAncestorIndex.build(self.filediffs)
+
+        self.assertIsNone(index.get_base_filediff_id(14, 0))
+        self.assertEqual(index.get_base_filediff_id(14, 1), 10)
+        self.assertEqual(index.get_base_filediff_id(14, 2), 11)
+        self.assertEqual(index.get_base_filediff_id(14, 3), 12)
+        self.assertEqual(index.get_base_filediff_id(14, 5), 13)
+        self.assertIsNone(index.get_base_filediff_id(16, 5))
+
+    def test_serialize(self):
+        """Testing FileDiffAncestorIndex.serialize and deserialize"""
+        index = FileDiffAncestorIndex.build(self.filediffs)
+        data = index.serialize()
+
+        self.assertIsInstance(data, six.text_type)
+
+        new_index = FileDiffAncestorIndex.deserialize(data)
+
+        for filediff in self.filediffs:
+            self.assertIn(filediff.pk, new_index)
+            self.assertEqual(new_index.get_ancestor_ids(filediff.pk),
+                             index.get_ancestor_ids(filediff.pk))
+
+        self.assertNotIn(100, new_index)
+
+
 class DiffHistoriesTests(TestCase):
     """Unit tests for reviewboard.diffviewer.commit_utils.diff_histories."""
 
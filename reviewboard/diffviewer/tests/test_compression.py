@@ -0,0 +1,212 @@
+"""Unit tests for reviewboard.diffviewer.compression."""
+
+from __future__ import unicode_literals
+
+import nose
+
+from reviewboard.diffviewer.compression import (
+    Bzip2DiffCompressionCodec,
+    ZlibDiffCompressionCodec,
+    ZstdDiffCompressionCodec,
+    ZstdDictionaryDiffCompressionCodec,
+    diff_compression_codec_registry,
+    train_zstd_dictionary)
+from reviewboard.diffviewer.models import (DiffCompressionDictionary,
+                                           RawFileDiffData)
+from reviewboard.testing import TestCase
+
+
+class DiffCompressionCodecTests(TestCase):
+    """Unit tests for the diff compression codecs."""
+
+    diff = (
+        b'diff --git a/README b/README\n'
+        b'index d6613f5..5b50866 100644\n'
+        b'--- README\n'
+        b'+++ README\n'
+        b'@ -1,1 +1,3 @@\n'
+        b'-blah blah\n'
+        b'+blah!\n'
+        b'+blah!\n'
+        b'+blah!\n'
+    )
+
+    def test_bzip2(self):
+        """Testing Bzip2DiffCompressionCodec"""
+        self._test_codec(Bzip2DiffCompressionCodec())
+
+    def test_zlib(self):
+        """Testing ZlibDiffCompressionCodec"""
+        self._test_codec(ZlibDiffCompressionCodec())
+
+    def test_zstd(self):
+        """Testing ZstdDiffCompressionCodec"""
+        codec = ZstdDiffCompressionCodec()
+
+        if not codec.available:
+            raise nose.SkipTest('zstandard is not installed')
+
+        self._test_codec(codec)
+
+    def test_zstd_dictionary(self):
+        """Testing ZstdDictionaryDiffCompressionCodec with a trained
+        dictionary
+        """
+        codec = ZstdDictionaryDiffCompressionCodec()
+
+        if not codec.available:
+            raise nose.SkipTest('zstandard is not installed')
+
+        import zstandard
+
+        dictionary = self._create_dictionary()
+        compressed = self._test_codec(codec)
+
+        self.assertEqual(zstandard.get_frame_parameters(compressed).dict_id,
+                         dictionary.dict_id())
+
+        # A new codec instance must load the dictionary to decompress.
+        self.assertEqual(
+            ZstdDictionaryDiffCompressionCodec().decompress(compressed),
+            self.diff)
+
+    def test_zstd_dictionary_caches_current_dictionary(self):
+        """Testing ZstdDictionaryDiffCompressionCodec only looks up the
+        current dictionary once
+        """
+        codec = ZstdDictionaryDiffCompressionCodec()
+
+        if not codec.available:
+            raise nose.SkipTest('zstandard is not installed')
+
+        dictionary = self._create_dictionary()
+
+        with self.assertNumQueries(2):
+            codec.compress(self.diff)
+
+        with self.assertNumQueries(0):
+            compressed = codec.compress(self.diff)
+
+        import zstandard
+
+        self.assertEqual(zstandard.get_frame_parameters(compressed).dict_id,
+                         dictionary.dict_id())
+
+    def test_train_zstd_dictionary_invalidates_current_dictionary(self):
+        """Testing train_zstd_dictionary makes the registered codec use the
+        new dictionary
+        """
+        codec = diff_compression_codec_registry.get(
+            'codec_id', ZstdDictionaryDiffCompressionCodec.codec_id)
+
+        if not codec.available:
+            raise nose.SkipTest('zstandard is not installed')
+
+        import zstandard
+
+        self.addCleanup(codec.invalidate_current_dictionary)
+        codec.invalidate_current_dictionary()
+
+        compressed = codec.compress(self.diff)
+        self.assertEqual(zstandard.get_frame_parameters(compressed).dict_id,
+                         0)
+
+        zlib_codec = ZlibDiffCompressionCodec()
+        RawFileDiffData.objects.bulk_create([
+            RawFileDiffData(
+                binary_hash='hash%d' % i,
+                binary=zlib_codec.compress(sample),
+                compression=RawFileDiffData.COMPRESSION_ZLIB)
+            for i, sample in enumerate(self._get_samples())
+        ])
+
+        stored_dictionary = train_zstd_dictionary(dict_size=4096)
+
+        compressed = codec.compress(self.diff)
+        self.assertEqual(zstandard.get_frame_parameters(compressed).dict_id,
+                         stored_dictionary.dict_id)
+
+    def test_zstd_dictionary_without_dictionary(self):
+        """Testing ZstdDictionaryDiffCompressionCodec without a trained
+        dictionary
+        """
+        codec = ZstdDictionaryDiffCompressionCodec()
+
+        if not codec.available:
+            raise nose.SkipTest('zstandard is not installed')
+
+        self._test_codec(codec)
+
+    def test_registry_codec_ids(self):
+        """Testing diff_compression_codec_registry codec IDs are single
+        characters
+        """
+        for codec in diff_compression_codec_registry:
+            self.assertEqual(len(codec.codec_id), 1)
+
+    def test_raw_file_diff_data_content(self):
+        """Testing RawFileDiffData.content with zlib-compressed data"""
+        codec = ZlibDiffCompressionCodec()
+        raw_diff_data = RawFileDiffData.objects.create(
+            binary_hash='abc123',
+            binary=codec.compress(self.diff),
+            compression=RawFileDiffData.COMPRESSION_ZLIB)
+
+        raw_diff_data = RawFileDiffData.objects.get(pk=raw_diff_data.pk)
+        self.assertEqual(raw_diff_data.content, self.diff)
+
+    def test_raw_file_diff_data_content_with_unknown_codec(self):
+        """Testing RawFileDiffData.content with an unknown codec"""
+        raw_diff_data = RawFileDiffData(binary=self.diff,
+                                        compression='?')
+
+        with self.assertRaises(NotImplementedError):
+            raw_diff_data.content
+
+    def _test_codec(self, codec):
+        """Test compressing and decompressing data with a codec.
+
+        Args:
+            codec (reviewboard.diffviewer.compression.
+                   BaseDiffCompressionCodec):
+                The codec to test.
+
+        Returns:
+            bytes:
+            The compressed data.
+        """
+        compressed = codec.compress(self.diff)
+
+        self.assertIsInstance(compressed, bytes)
+        self.assertNotEqual(compressed, self.diff)
+        self.assertEqual(codec.decompress(compressed), self.diff)
+
+        return compressed
+
+    def _get_samples(self):
+        """Return sample diffs for training a dictionary.
+
+        Returns:
+            list of bytes:
+            The sample diffs.
+        """
+        return [
+            self.diff.replace(b'README', ('README%d' % i).encode('utf-8'))
+            for i in range(1000)
+        ]
+
+    def _create_dictionary(self):
+        """Train and store a dictionary from sample diffs.
+
+        Returns:
+            zstandard.ZstdCompressionDict:
+            The trained dictionary.
+        """
+        import zstandard
+
+        dictionary = zstandard.train_dictionary(4096, self._get_samples())
+        DiffCompressionDictionary.objects.create(
+            dict_id=dictionary.dict_id(),
+            data=dictionary.as_bytes())
+
+        return dictionary
@@ -2,7 +2,10 @@ from __future__ import unicode_literals
 
 from kgb import SpyAgency
 
-from reviewboard.diffviewer.chunk_generator import DiffChunkGenerator
+from reviewboard.admin.cache_stats import get_cache_counter_stats
+from reviewboard.diffviewer.chunk_generator import (DiffChunkGenerator,
+                                                    RawDiffChunkGenerator)
+from reviewboard.diffviewer.models import FileDiff
 from reviewboard.scmtools.core import PRE_CREATION
 from reviewboard.testing import TestCase
 
@@ -333,6 +336,190 @@ class DiffChunkGeneratorTests(SpyAgency, TestCase):
                 False,
             ]])
 
+    def test_get_chunks_with_content_cache(self):
+        """Testing DiffChunkGenerator.get_chunks shares cached chunks between
+        FileDiffs with the same content
+        """
+        filediff2 = self.create_filediff(
+            diffset=self.create_diffset(repository=self.repository))
+
+        self.assertIsNone(filediff2.orig_sha256)
+
+        chunks = list(self.generator.get_chunks())
+        self.assertEqual(len(chunks), 1)
+
+        generator2 = DiffChunkGenerator(None, filediff2)
+        self.spy_on(generator2.get_chunks_uncached)
+
+        self.assertEqual(list(generator2.get_chunks()), chunks)
+        self.assertFalse(generator2.get_chunks_uncached.called)
+
+        self.assertEqual(filediff2.orig_sha256, self.filediff.orig_sha256)
+        self.assertEqual(filediff2.patched_sha256,
+                         self.filediff.patched_sha256)
+        self.assertEqual(filediff2.get_line_counts(),
+                         self.filediff.get_line_counts())
+
+        label, stats = get_cache_counter_stats()[0]
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_get_chunks_with_id_cache_and_no_checksums(self):
+        """Testing DiffChunkGenerator.get_chunks uses chunks cached by ID
+        before computing missing checksums
+        """
+        # Cache the chunks by ID, as older versions did.
+        chunks = list(RawDiffChunkGenerator.get_chunks(
+            self.generator, self.generator.make_cache_key()))
+        self.assertEqual(len(chunks), 1)
+
+        self.filediff.extra_data.pop('orig_sha256', None)
+        self.filediff.extra_data.pop('patched_sha256', None)
+
+        generator = DiffChunkGenerator(None, self.filediff)
+        self.spy_on(generator._get_filediff_files)
+        self.spy_on(generator.get_chunks_uncached)
+
+        self.assertIsNotNone(generator.get_cached_chunks_info())
+        self.assertEqual(list(generator.get_chunks()), chunks)
+        self.assertFalse(generator._get_filediff_files.called)
+        self.assertFalse(generator.get_chunks_uncached.called)
+        self.assertIsNone(self.filediff.orig_sha256)
+
+    def test_get_chunks_without_checksums(self):
+        """Testing DiffChunkGenerator.get_chunks computes missing checksums
+        when the chunks aren't cached by ID
+        """
+        self.assertIsNone(self.filediff.orig_sha256)
+        self.assertIsNone(self.generator.get_cached_chunks_info())
+
+        chunks = list(self.generator.get_chunks())
+        self.assertEqual(len(chunks), 1)
+
+        self.assertIsNotNone(self.filediff.orig_sha256)
+        self.assertIsNotNone(self.filediff.patched_sha256)
+        self.assertIsNotNone(
+            self.generator._get_cached_chunks_info(
+                self.generator.make_content_cache_key()))
+
+    def test_get_chunks_in_ranges_with_cache(self):
+        """Testing DiffChunkGenerator.get_chunks_in_ranges reuses cached
+        chunks for the same ranges
+        """
+        self.filediff.source_file = '/data:old line'
+        self.filediff.dest_file = '/data:new line'
+        self.filediff.diff = (
+            b'--- a/data\n'
+            b'+++ b/data\n'
+            b'@@ -1,1 +1,1 @@\n'
+            b'-old line\n'
+            b'+new line\n'
+        )
+        self.filediff.save()
+
+        self.spy_on(DiffChunkGenerator.get_chunks_uncached,
+                    owner=DiffChunkGenerator)
+
+        chunks = DiffChunkGenerator(None, self.filediff).get_chunks_in_ranges(
+            [(1, 1)])
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(len(DiffChunkGenerator.get_chunks_uncached.calls), 1)
+
+        generator = DiffChunkGenerator(None, self.filediff)
+        self.assertEqual(generator.get_chunks_in_ranges([(1, 1)]), chunks)
+        self.assertEqual(generator.chunks_info['num_chunks'], 1)
+        self.assertEqual(len(DiffChunkGenerator.get_chunks_uncached.calls), 1)
+
+        # Different ranges are rendered separately.
+        DiffChunkGenerator(None, self.filediff).get_chunks_in_ranges([(1, 2)])
+        self.assertEqual(len(DiffChunkGenerator.get_chunks_uncached.calls), 2)
+
+    def test_make_content_cache_key(self):
+        """Testing DiffChunkGenerator.make_content_cache_key"""
+        self.filediff.extra_data.update({
+            'orig_sha256': 'a' * 64,
+            'patched_sha256': 'b' * 64,
+        })
+
+        cache_key = self.generator.make_content_cache_key()
+        self.assertTrue(cache_key.startswith(
+            'diff-sidebyside-content-hl-%s-%s-%s-'
+            % (self.diffset.diffcompat, 'a' * 64, 'b' * 64)))
+
+        filediff2 = self.create_filediff(
+            diffset=self.create_diffset(repository=self.repository))
+        filediff2.extra_data.update({
+            'orig_sha256': 'a' * 64,
+            'patched_sha256': 'b' * 64,
+        })
+
+        self.assertEqual(
+            DiffChunkGenerator(None, filediff2).make_content_cache_key(),
+            cache_key)
+
+        # Anything affecting the rendered chunks should change the key.
+        self.assertNotEqual(
+            DiffChunkGenerator(
+                None, self.filediff,
+                enable_syntax_highlighting=False).make_content_cache_key(),
+            cache_key)
+
+        with self.siteconfig_settings(
+                {'diffviewer_intraline_diff_algorithm': 'tokens'},
+                reload_settings=False):
+            self.assertNotEqual(
+                DiffChunkGenerator(None, filediff2).make_content_cache_key(),
+                cache_key)
+
+        filediff2.source_file = '/other-file'
+        self.assertNotEqual(
+            DiffChunkGenerator(None, filediff2).make_content_cache_key(),
+            cache_key)
+
+    def test_make_content_cache_key_without_checksums(self):
+        """Testing DiffChunkGenerator.make_content_cache_key without
+        checksums
+        """
+        self.assertIsNone(self.generator.make_content_cache_key())
+
+    def test_make_content_cache_key_with_interdiff(self):
+        """Testing DiffChunkGenerator.make_content_cache_key with interdiff"""
+        self.filediff.extra_data.update({
+            'orig_sha256': 'a' * 64,
+            'patched_sha256': 'b' * 64,
+        })
+
+        generator = DiffChunkGenerator(None, self.filediff,
+                                       interfilediff=self.filediff)
+        self.assertIsNone(generator.make_content_cache_key())
+
+    def test_get_interdiff_ranges_with_cache(self):
+        """Testing DiffChunkGenerator._get_interdiff_ranges with cached
+        ranges doesn't load the diffs
+        """
+        self.filediff.diff = self.COMMIT_1_DIFF
+        self.filediff.save()
+
+        interdiffset = self.create_diffset(repository=self.repository,
+                                           revision=2)
+        interfilediff = self.create_filediff(
+            diffset=interdiffset,
+            diff=self.COMMIT_1_2_SQUASHED_DIFF)
+
+        generator = DiffChunkGenerator(None, self.filediff,
+                                       interfilediff=interfilediff)
+        ranges = generator._get_interdiff_ranges()
+        self.assertEqual(ranges, ([(0, 1)], [(0, 1)]))
+
+        # Fresh FileDiffs would need to query for their diff data.
+        generator = DiffChunkGenerator(
+            None,
+            FileDiff.objects.get(pk=self.filediff.pk),
+            interfilediff=FileDiff.objects.get(pk=interfilediff.pk))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(generator._get_interdiff_ranges(), ranges)
+
     def test_line_counts_unmodified_by_interdiff(self):
         """Testing that line counts are not modified by interdiffs where the
         changes are reverted
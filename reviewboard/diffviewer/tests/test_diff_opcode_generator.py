@@ -3,7 +3,8 @@ from __future__ import print_function, unicode_literals
 import os
 
 from reviewboard.diffviewer.myersdiff import MyersDiffer
-from reviewboard.diffviewer.opcode_generator import get_diff_opcode_generator
+from reviewboard.diffviewer.opcode_generator import (DiffOpcodeGenerator,
+                                                     get_diff_opcode_generator)
 from reviewboard.testing import TestCase
 
 
@@ -698,9 +699,90 @@ class MoveDetectionTests(TestCase):
             ]
         )
 
-    def _test_move_detection(self, a, b, expected_i_moves, expected_r_moves):
-        differ = MyersDiffer(a, b)
-        opcode_generator = get_diff_opcode_generator(differ)
+    def test_move_detection_with_repeated_lines(self):
+        """Testing DiffOpcodeGenerator move detection with lines repeated
+        across moved blocks
+        """
+        class SwappedBlocksDiffer(object):
+            a = [
+                'def test_one(self):',
+                '    self.assertEqual(value, expected)',
+                '    self.assertEqual(value, expected)',
+                'def test_two(self):',
+                '    self.assertEqual(value, expected)',
+                '    self.assertEqual(value, expected)',
+            ]
+            b = a[3:] + a[:3]
+
+            def get_opcodes(self):
+                return [
+                    ('delete', 0, 6, 0, 0),
+                    ('insert', 6, 6, 0, 6),
+                ]
+
+        # Each moved block must be matched with its own removed lines, and
+        # not with lines already claimed by another move.
+        self._test_move_detection(
+            None,
+            None,
+            [
+                {
+                    1: 4,
+                    2: 5,
+                    3: 6,
+                    4: 1,
+                    5: 2,
+                    6: 3,
+                },
+            ],
+            [
+                {
+                    1: 4,
+                    2: 5,
+                    3: 6,
+                    4: 1,
+                    5: 2,
+                    6: 3,
+                },
+            ],
+            differ=SwappedBlocksDiffer())
+
+    def test_move_detection_with_max_work(self):
+        """Testing DiffOpcodeGenerator move detection stops after
+        MOVE_DETECTION_MAX_WORK
+        """
+        class LimitedDiffOpcodeGenerator(DiffOpcodeGenerator):
+            MOVE_DETECTION_MAX_WORK = 1
+
+        # Line 4 would normally be seen as a move.
+        self._test_move_detection(
+            [
+                'this is line 1, and it is sufficiently long',
+                'this is line 2, and it is sufficiently long',
+                'this is line 3, and it is sufficiently long',
+                '',
+                'this is line 4, and it is sufficiently long',
+            ],
+            [
+                '',
+                'this is line 4, and it is sufficiently long',
+                'this is line 1, and it is sufficiently long',
+                'this is line 2, and it is sufficiently long',
+                'this is line 3, and it is sufficiently long',
+            ],
+            [],
+            [],
+            generator_cls=LimitedDiffOpcodeGenerator)
+
+    def _test_move_detection(self, a, b, expected_i_moves, expected_r_moves,
+                             differ=None, generator_cls=None):
+        if differ is None:
+            differ = MyersDiffer(a, b)
+
+        if generator_cls is None:
+            opcode_generator = get_diff_opcode_generator(differ)
+        else:
+            opcode_generator = generator_cls(differ)
 
         r_moves = []
         i_moves = []
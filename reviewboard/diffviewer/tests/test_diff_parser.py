@@ -1,8 +1,11 @@
 from __future__ import unicode_literals
 
 from djblets.testing.decorators import add_fixtures
+from kgb import SpyAgency
 
-from reviewboard.diffviewer.parser import DiffParser
+from reviewboard.diffviewer.diffutils import split_line_endings
+from reviewboard.diffviewer.parser import DiffLineStream, DiffParser
+from reviewboard.scmtools.git import GitDiffParser
 from reviewboard.testing import TestCase
 
 
@@ -28,6 +31,35 @@ class DiffParserTest(TestCase):
         self.assertEqual(files[0].delete_count, 0)
         self.assertEqual(files[0].data, data)
 
+    def test_iter_files_with_stream(self):
+        """Testing DiffParser.iter_files with a DiffLineStream"""
+        data = (
+            b'--- README  123\n'
+            b'+++ README  (new)\n'
+            b'@@ -1,1 +1,2 @@\n'
+            b' Line 1\n'
+            b'+Line 2\n'
+            b'--- NEWS  456\n'
+            b'+++ NEWS  (new)\n'
+            b'@@ -1,2 +1,1 @@\n'
+            b'-Line 1\n'
+            b' Line 2\n')
+        chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+
+        expected = [
+            (f.orig_filename, f.data, f.insert_count, f.delete_count)
+            for f in DiffParser(data).parse()
+        ]
+
+        parser = DiffParser(DiffLineStream(chunks))
+        files = [
+            (f.orig_filename, f.data, f.insert_count, f.delete_count)
+            for f in parser.iter_files()
+        ]
+
+        self.assertEqual(len(files), 2)
+        self.assertEqual(files, expected)
+
     def test_line_counts(self):
         """Testing DiffParser with insert/delete line counts"""
         diff = (
@@ -206,3 +238,96 @@ class DiffParserTest(TestCase):
 
         parser = DiffParser(b'')
         self.assertEqual(parser.raw_diff(commit1), commit1_diff)
+
+
+class DiffLineStreamTests(SpyAgency, TestCase):
+    """Unit tests for reviewboard.diffviewer.parser.DiffLineStream."""
+
+    def test_lines(self):
+        """Testing DiffLineStream splits lines like split_line_endings"""
+        data = b'Line 1\r\nLine 2\rLine 3\r\r\nLine 4\nLine 5'
+
+        for chunk_size in range(1, len(data) + 1):
+            chunks = [
+                data[i:i + chunk_size]
+                for i in range(0, len(data), chunk_size)
+            ]
+
+            self.assertEqual(list(DiffLineStream(chunks)),
+                             split_line_endings(data))
+
+    def test_getitem(self):
+        """Testing DiffLineStream.__getitem__"""
+        stream = DiffLineStream([b'a\nb', b'\nc\n', b'd\n'])
+
+        self.assertEqual(stream[1], b'b')
+        self.assertEqual(stream[1:3], [b'b', b'c'])
+        self.assertEqual(stream[3], b'd')
+        self.assertEqual(len(stream), 4)
+        self.assertEqual(stream.size, 8)
+
+        with self.assertRaises(IndexError):
+            stream[4]
+
+    def test_discard_before(self):
+        """Testing DiffLineStream.discard_before"""
+        stream = DiffLineStream(
+            b'Line %d\n' % i
+            for i in range(5000)
+        )
+
+        self.assertEqual(stream[2500], b'Line 2500')
+
+        stream.discard_before(2000)
+        self.assertEqual(stream[2000], b'Line 2000')
+        self.assertEqual(stream[4999], b'Line 4999')
+        self.assertEqual(len(stream), 5000)
+
+        with self.assertRaises(ValueError):
+            stream[1999]
+
+    def test_parse_git_diff(self):
+        """Testing GitDiffParser.iter_files with a DiffLineStream matches
+        parsing the full diff
+        """
+        data = (
+            b'diff --git a/ABC b/ABC\n'
+            b'index 94bdd3e..197009f 100644\n'
+            b'--- a/ABC\n'
+            b'+++ b/ABC\n'
+            b'@@ -1,1 +1,1 @@\n'
+            b'-line!\n'
+            b'+line..\n'
+            b'diff --git a/FOO b/FOO\n'
+            b'deleted file mode 100644\n'
+            b'index 84bda3e..0000000\n'
+            b'--- a/FOO\n'
+            b'+++ /dev/null\n'
+            b'@@ -1,1 +0,0 @@\n'
+            b'-Some line\n'
+            b'diff --git a/README b/README\n'
+            b'index 94bdd3e..87abad9 100644\n'
+            b'--- a/README\n'
+            b'+++ b/README\n'
+            b'@@ -1,1 +1,1 @@\n'
+            b'-Hello, world!\n'
+            b'+Yo, world.\n'
+        )
+        chunks = [data[i:i + 7] for i in range(0, len(data), 7)]
+
+        self.spy_on(DiffLineStream.discard_before)
+
+        expected = [
+            (f.orig_filename, f.data, f.deleted, f.insert_count,
+             f.delete_count)
+            for f in GitDiffParser(data).parse()
+        ]
+        files = [
+            (f.orig_filename, f.data, f.deleted, f.insert_count,
+             f.delete_count)
+            for f in GitDiffParser(DiffLineStream(chunks)).iter_files()
+        ]
+
+        self.assertEqual(len(files), 3)
+        self.assertEqual(files, expected)
+        self.assertTrue(DiffLineStream.discard_before.called)
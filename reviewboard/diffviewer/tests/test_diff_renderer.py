@@ -1,10 +1,16 @@
 from __future__ import unicode_literals
 
-from django.http import HttpResponse
+import re
+
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
 from django.test import RequestFactory
 from djblets.cache.backend import cache_memoize
 from kgb import SpyAgency
 
+from reviewboard.diffviewer.chunk_generator import DiffChunkGenerator
+from reviewboard.diffviewer import renderers
+from reviewboard.diffviewer.diffutils import get_diff_files
 from reviewboard.diffviewer.errors import UserVisibleError
 from reviewboard.diffviewer.models import FileDiff
 from reviewboard.diffviewer.renderers import DiffRenderer
@@ -14,6 +20,8 @@ from reviewboard.testing import TestCase
 class DiffRendererTests(SpyAgency, TestCase):
     """Unit tests for DiffRenderer."""
 
+    fixtures = ['test_scmtools']
+
     def test_construction_with_invalid_chunks(self):
         """Testing DiffRenderer construction with invalid chunks"""
         diff_file = {
@@ -110,6 +118,78 @@ class DiffRendererTests(SpyAgency, TestCase):
         self.assertFalse(renderer.make_cache_key.called)
         self.assertFalse(cache_memoize.spy.called)
 
+    def test_render_to_response_with_streaming(self):
+        """Testing DiffRenderer.render_to_response with streaming"""
+        diffset = self._create_diffset()
+        request = RequestFactory().get('/')
+
+        with self.siteconfig_settings({'diffviewer_streaming_threshold': 0}):
+            renderer = DiffRenderer(get_diff_files(diffset)[0])
+            self.assertFalse(renderer.should_stream())
+
+            expected_html = renderer.render_to_string(request)
+
+        with self.siteconfig_settings({'diffviewer_streaming_threshold': 2}):
+            renderer = DiffRenderer(get_diff_files(diffset)[0])
+            self.assertTrue(renderer.should_stream())
+
+            response = renderer.render_to_response(request)
+
+        self.assertIsInstance(response, StreamingHttpResponse)
+
+        html = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn('id="chunk0.0"', html)
+        self.assertEqual(self._normalize_html(html),
+                         self._normalize_html(expected_html))
+
+    def test_render_to_stream_with_uncached_chunks(self):
+        """Testing DiffRenderer.render_to_stream with chunks not in the
+        cache renders chunks as they're generated
+        """
+        diffset = self._create_diffset()
+        request = RequestFactory().get('/')
+
+        expected_html = DiffRenderer(get_diff_files(diffset)[0],
+                                     allow_caching=False).render_to_string(
+            request)
+        cache.clear()
+
+        self.spy_on(renderers.populate_diff_chunks)
+
+        diff_file = get_diff_files(diffset)[0]
+        renderer = DiffRenderer(diff_file)
+        html = ''.join(renderer.render_to_stream(request))
+
+        self.assertFalse(renderers.populate_diff_chunks.called)
+        self.assertNotIn('chunks', diff_file)
+        self.assertEqual(diff_file['num_chunks'], 1)
+        self.assertEqual(diff_file['num_changes'], 1)
+        self.assertFalse(diff_file['whitespace_only'])
+        self.assertEqual(self._normalize_html(html),
+                         self._normalize_html(expected_html))
+
+    def test_render_to_stream_with_cached_chunks(self):
+        """Testing DiffRenderer.render_to_stream with chunks in the cache"""
+        diffset = self._create_diffset()
+        request = RequestFactory().get('/')
+
+        renderer = DiffRenderer(get_diff_files(diffset)[0])
+        expected_html = ''.join(renderer.render_to_stream(request))
+
+        self.spy_on(DiffChunkGenerator.get_chunks_uncached,
+                    owner=DiffChunkGenerator)
+
+        diff_file = get_diff_files(diffset)[0]
+        renderer = DiffRenderer(diff_file)
+        html = ''.join(renderer.render_to_stream(request))
+
+        self.assertFalse(DiffChunkGenerator.get_chunks_uncached.called)
+        self.assertNotIn('chunks', diff_file)
+        self.assertEqual(diff_file['num_chunks'], 1)
+        self.assertEqual(diff_file['num_changes'], 1)
+        self.assertFalse(diff_file['whitespace_only'])
+        self.assertEqual(html, expected_html)
+
     def test_make_context_with_chunk_index(self):
         """Testing DiffRenderer.make_context with chunk_index"""
         diff_file = {
@@ -146,3 +226,31 @@ class DiffRendererTests(SpyAgency, TestCase):
 
         chunk = diff_file['chunks'][0]
         self.assertEqual(chunk['change'], 'replace')
+
+    def _create_diffset(self):
+        """Return a new DiffSet containing a FileDiff to render.
+
+        Returns:
+            reviewboard.diffviewer.models.diffset.DiffSet:
+            The new DiffSet.
+        """
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        filediff = self.create_filediff(diffset=diffset)
+        filediff.set_line_counts(raw_insert_count=1, raw_delete_count=1)
+        filediff.save(update_fields=('extra_data',))
+
+        return diffset
+
+    def _normalize_html(self, html):
+        """Return HTML with whitespace between tags removed.
+
+        Args:
+            html (unicode):
+                The HTML to normalize.
+
+        Returns:
+            unicode:
+            The normalized HTML.
+        """
+        return re.sub(r'>\s+<', '><', html.strip())
@@ -2,6 +2,8 @@
 
 from __future__ import unicode_literals
 
+from django.core.management import call_command
+from django.utils.six.moves import cStringIO as StringIO
 from django.utils.timezone import now
 
 from reviewboard.diffviewer.models import DiffCommit, DiffSet
@@ -120,6 +122,75 @@ class DiffCommitTests(TestCase):
             'total_line_count': 2,
         })
 
+    def test_get_total_raw_line_counts(self):
+        """Testing DiffCommit.get_total_raw_line_counts and
+        DiffSet.get_total_raw_line_counts
+        """
+        diffset = DiffSet.objects.get(pk=self.diffset.pk)
+
+        # The line counts on the DiffSet were stored as FileDiffs were
+        # added to it.
+        with self.assertNumQueries(0):
+            self.assertEqual(diffset.get_total_raw_line_counts(), {
+                'raw_insert_count': 2,
+                'raw_delete_count': 2,
+            })
+
+        # The commits were created without line counts, so they'll be
+        # computed, but not saved.
+        commit = DiffCommit.objects.get(pk=self.commits[0].pk)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(commit.get_total_raw_line_counts(), {
+                'raw_insert_count': 1,
+                'raw_delete_count': 1,
+            })
+
+        commit = DiffCommit.objects.get(pk=self.commits[0].pk)
+        self.assertNotIn(DiffCommit._RAW_LINE_COUNTS_KEY, commit.extra_data)
+
+    def test_get_total_raw_line_counts_legacy(self):
+        """Testing DiffSet.get_total_raw_line_counts with a DiffSet without
+        stored line counts
+        """
+        del self.diffset.extra_data[DiffSet._RAW_LINE_COUNTS_KEY]
+        self.diffset.save(update_fields=('extra_data',))
+
+        diffset = DiffSet.objects.get(pk=self.diffset.pk)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(diffset.get_total_raw_line_counts(), {
+                'raw_insert_count': 2,
+                'raw_delete_count': 2,
+            })
+
+        diffset = DiffSet.objects.get(pk=self.diffset.pk)
+        self.assertNotIn(DiffSet._RAW_LINE_COUNTS_KEY, diffset.extra_data)
+
+    def test_aggregatelinecounts(self):
+        """Testing aggregatelinecounts management command stores line counts
+        on DiffSets and DiffCommits
+        """
+        del self.diffset.extra_data[DiffSet._RAW_LINE_COUNTS_KEY]
+        self.diffset.save(update_fields=('extra_data',))
+
+        call_command('aggregatelinecounts', stdout=StringIO())
+
+        diffset = DiffSet.objects.get(pk=self.diffset.pk)
+        commits = list(DiffCommit.objects.filter(diffset=diffset))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(diffset.get_total_raw_line_counts(), {
+                'raw_insert_count': 2,
+                'raw_delete_count': 2,
+            })
+
+            for commit in commits:
+                self.assertEqual(commit.get_total_raw_line_counts(), {
+                    'raw_insert_count': 1,
+                    'raw_delete_count': 1,
+                })
+
     def test_ordering(self):
         """Testing DiffCommits are returned in the correct order"""
         commits = list(DiffCommit.objects.all())
@@ -73,3 +73,111 @@ class DiffCommitManagerTests(SpyAgency, TestCase):
         self.assertEqual(
             raw_date,
             commit.committer_date.strftime(DiffCommit.ISO_DATE_FORMAT))
+
+    def test_create_from_data_stores_line_counts(self):
+        """Testing DiffCommitManager.create_from_data stores line counts on
+        the DiffCommit and DiffSet
+        """
+        repository = self.create_repository(tool_name='Test')
+        self.spy_on(repository.get_file_exists,
+                    call_fake=lambda *args, **kwargs: True)
+
+        diffset = DiffSet.objects.create_empty(
+            repository=repository,
+            basedir='',
+            revision=1)
+
+        parsed_date = parse_date('2000-01-01 00:00:00-0600')
+
+        for commit_id, parent_id in (('r1', 'r0'), ('r2', 'r1')):
+            DiffCommit.objects.create_from_data(
+                repository=repository,
+                diff_file_name='diff',
+                diff_file_contents=self.DEFAULT_GIT_FILEDIFF_DATA_DIFF,
+                parent_diff_file_name=None,
+                parent_diff_file_contents=b'',
+                request=None,
+                commit_id=commit_id,
+                parent_id=parent_id,
+                author_name='Author',
+                author_email='author@example.com',
+                author_date=parsed_date,
+                committer_name='Committer',
+                committer_email='committer@example.com',
+                committer_date=parsed_date,
+                commit_message='Description',
+                diffset=diffset,
+                validation_info={})
+
+        diffset = DiffSet.objects.get(pk=diffset.pk)
+        commits = list(diffset.commits.all())
+
+        with self.assertNumQueries(0):
+            self.assertEqual(diffset.get_total_raw_line_counts(), {
+                'raw_insert_count': 2,
+                'raw_delete_count': 2,
+            })
+
+            for commit in commits:
+                self.assertEqual(commit.get_total_raw_line_counts(), {
+                    'raw_insert_count': 1,
+                    'raw_delete_count': 1,
+                })
+
+    def test_create_from_data_stores_line_counts_concurrently(self):
+        """Testing DiffCommitManager.create_from_data stores line counts on
+        the DiffSet when commits are uploaded concurrently
+        """
+        repository = self.create_repository(tool_name='Test')
+        self.spy_on(repository.get_file_exists,
+                    call_fake=lambda *args, **kwargs: True)
+
+        diffset = DiffSet.objects.create_empty(
+            repository=repository,
+            basedir='',
+            revision=1)
+
+        # Each upload has its own copy of the DiffSet, loaded before either
+        # commit was added.
+        diffsets = [
+            DiffSet.objects.get(pk=diffset.pk),
+            DiffSet.objects.get(pk=diffset.pk),
+        ]
+
+        parsed_date = parse_date('2000-01-01 00:00:00-0600')
+
+        uploads = [
+            (diffsets[0], 'r1', 'r0'),
+            (diffsets[1], 'r2', 'r1'),
+        ]
+
+        for upload_diffset, commit_id, parent_id in uploads:
+            DiffCommit.objects.create_from_data(
+                repository=repository,
+                diff_file_name='diff',
+                diff_file_contents=self.DEFAULT_GIT_FILEDIFF_DATA_DIFF,
+                parent_diff_file_name=None,
+                parent_diff_file_contents=b'',
+                request=None,
+                commit_id=commit_id,
+                parent_id=parent_id,
+                author_name='Author',
+                author_email='author@example.com',
+                author_date=parsed_date,
+                committer_name='Committer',
+                committer_email='committer@example.com',
+                committer_date=parsed_date,
+                commit_message='Description',
+                diffset=upload_diffset,
+                validation_info={})
+
+        expected_counts = {
+            'raw_insert_count': 2,
+            'raw_delete_count': 2,
+        }
+
+        self.assertEqual(diffsets[1].get_total_raw_line_counts(),
+                         expected_counts)
+        self.assertEqual(
+            DiffSet.objects.get(pk=diffset.pk).get_total_raw_line_counts(),
+            expected_counts)
@@ -0,0 +1,87 @@
+"""Unit tests for reviewboard.diffviewer.differ."""
+
+from __future__ import unicode_literals
+
+from reviewboard.diffviewer.differ import (DiffCompatVersion,
+                                           get_diff_compat_version,
+                                           get_differ)
+from reviewboard.diffviewer.errors import DiffCompatError
+from reviewboard.diffviewer.histogramdiff import HistogramDiffer
+from reviewboard.diffviewer.myersdiff import MyersDiffer
+from reviewboard.diffviewer.patiencediff import PatienceDiffer
+from reviewboard.diffviewer.smdiff import SMDiffer
+from reviewboard.scmtools.models import Repository
+from reviewboard.testing import TestCase
+
+
+class GetDiffCompatVersionTests(TestCase):
+    """Unit tests for reviewboard.diffviewer.differ.get_diff_compat_version.
+    """
+
+    def test_default(self):
+        """Testing get_diff_compat_version with default settings"""
+        self.assertEqual(get_diff_compat_version(),
+                         DiffCompatVersion.DEFAULT)
+
+    def test_with_siteconfig(self):
+        """Testing get_diff_compat_version with diffviewer_diff_algorithm
+        setting
+        """
+        with self.siteconfig_settings({'diffviewer_diff_algorithm':
+                                       'patience'}):
+            self.assertEqual(get_diff_compat_version(),
+                             DiffCompatVersion.PATIENCE)
+
+    def test_with_repository(self):
+        """Testing get_diff_compat_version with Repository.extra_data
+        override
+        """
+        repository = Repository(extra_data={
+            'diff_algorithm': 'histogram',
+        })
+
+        with self.siteconfig_settings({'diffviewer_diff_algorithm':
+                                       'patience'}):
+            self.assertEqual(get_diff_compat_version(repository),
+                             DiffCompatVersion.HISTOGRAM)
+
+    def test_with_repository_without_override(self):
+        """Testing get_diff_compat_version with Repository without
+        override
+        """
+        with self.siteconfig_settings({'diffviewer_diff_algorithm':
+                                       'myers-bounded'}):
+            self.assertEqual(get_diff_compat_version(Repository()),
+                             DiffCompatVersion.MYERS_BOUNDED_COST)
+
+    def test_with_unknown(self):
+        """Testing get_diff_compat_version with unknown algorithm"""
+        with self.siteconfig_settings({'diffviewer_diff_algorithm':
+                                       'bogus'}):
+            self.assertEqual(get_diff_compat_version(),
+                             DiffCompatVersion.DEFAULT)
+
+
+class GetDifferTests(TestCase):
+    """Unit tests for reviewboard.diffviewer.differ.get_differ."""
+
+    def test_with_versions(self):
+        """Testing get_differ with each compatibility version"""
+        expected = {
+            DiffCompatVersion.SMDIFFER: SMDiffer,
+            DiffCompatVersion.MYERS: MyersDiffer,
+            DiffCompatVersion.MYERS_SMS_COST_BAIL: MyersDiffer,
+            DiffCompatVersion.MYERS_BOUNDED_COST: MyersDiffer,
+            DiffCompatVersion.PATIENCE: PatienceDiffer,
+            DiffCompatVersion.HISTOGRAM: HistogramDiffer,
+        }
+
+        for compat_version, differ_cls in expected.items():
+            differ = get_differ(['a'], ['b'], compat_version=compat_version)
+            self.assertIs(type(differ), differ_cls)
+            self.assertEqual(differ.compat_version, compat_version)
+
+    def test_with_invalid_version(self):
+        """Testing get_differ with invalid compatibility version"""
+        with self.assertRaises(DiffCompatError):
+            get_differ(['a'], ['b'], compat_version=100)
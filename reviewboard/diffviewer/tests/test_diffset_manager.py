@@ -2,6 +2,7 @@ from __future__ import unicode_literals
 
 from kgb import SpyAgency
 
+from reviewboard.diffviewer.differ import DiffCompatVersion
 from reviewboard.diffviewer.models import DiffSet, DiffSetHistory, FileDiff
 from reviewboard.testing import TestCase
 
@@ -26,6 +27,28 @@ class DiffSetManagerTests(SpyAgency, TestCase):
 
         self.assertEqual(diffset.files.count(), 1)
 
+    def test_create_from_data_stores_line_counts(self):
+        """Testing DiffSetManager.create_from_data stores line counts"""
+        repository = self.create_repository(tool_name='Test')
+
+        self.spy_on(repository.get_file_exists,
+                    call_fake=lambda *args, **kwargs: True)
+
+        diffset = DiffSet.objects.create_from_data(
+            repository=repository,
+            diff_file_name='diff',
+            diff_file_contents=self.DEFAULT_GIT_FILEDIFF_DATA_DIFF,
+            basedir='/')
+        diffset = DiffSet.objects.get(pk=diffset.pk)
+
+        with self.assertNumQueries(0):
+            counts = diffset.get_total_raw_line_counts()
+
+        self.assertEqual(counts, {
+            'raw_insert_count': 1,
+            'raw_delete_count': 1,
+        })
+
     def test_create_from_data_with_basedir_no_slash(self):
         """Testing DiffSetManager.create_from_data with basedir without leading
         slash
@@ -68,6 +91,27 @@ class DiffSetManagerTests(SpyAgency, TestCase):
         self.assertEqual(filediff.source_file, 'trunk/README')
         self.assertEqual(filediff.dest_file, 'trunk/README')
 
+    def test_create_from_data_with_diff_algorithm(self):
+        """Testing DiffSetManager.create_from_data with repository
+        diff_algorithm
+        """
+        repository = self.create_repository(
+            tool_name='Test',
+            extra_data={
+                'diff_algorithm': 'patience',
+            })
+
+        self.spy_on(repository.get_file_exists,
+                    call_fake=lambda *args, **kwargs: True)
+
+        diffset = DiffSet.objects.create_from_data(
+            repository=repository,
+            diff_file_name='diff',
+            diff_file_contents=self.DEFAULT_GIT_FILEDIFF_DATA_DIFF,
+            basedir='/')
+
+        self.assertEqual(diffset.diffcompat, DiffCompatVersion.PATIENCE)
+
     def test_create_from_data_with_validate_only_true(self):
         """Testing DiffSetManager.create_from_data with validate_only=True"""
         repository = self.create_repository(tool_name='Test')
@@ -99,6 +143,12 @@ class DiffSetManagerTests(SpyAgency, TestCase):
         self.assertEqual(diffset.files.count(), 0)
         self.assertEqual(diffset.revision, 1)
 
+        with self.assertNumQueries(0):
+            self.assertEqual(diffset.get_total_raw_line_counts(), {
+                'raw_insert_count': 0,
+                'raw_delete_count': 0,
+            })
+
     def test_create_empty_with_revision(self):
         """Testing DiffSetManager.create_empty with revision"""
         repository = self.create_repository(tool_name='Test')
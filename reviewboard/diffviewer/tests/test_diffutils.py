@@ -1,5 +1,9 @@
 from __future__ import print_function, unicode_literals
 
+import threading
+import time
+from difflib import SequenceMatcher
+
 from django.contrib.auth.models import AnonymousUser
 from django.test.client import RequestFactory
 from django.utils import six
@@ -9,12 +13,20 @@ from djblets.testing.decorators import add_fixtures
 from kgb import SpyAgency
 
 from reviewboard.deprecation import RemovedInReviewBoard50Warning
+from reviewboard.diffviewer import diffutils
 from reviewboard.diffviewer.diffutils import (
+    INTRALINE_DIFF_CHARACTERS,
+    INTRALINE_DIFF_TOKENS,
+    PATCH_ENGINE_BUILTIN,
+    PATCH_ENGINE_SUBPROCESS,
+    DiffFileList,
     convert_line_endings,
+    clear_line_changed_regions_cache,
     convert_to_unicode,
     get_diff_data_chunks_info,
     get_diff_files,
     get_displayed_diff_line_ranges,
+    get_cached_matched_interdiff_files,
     get_file_chunks_in_range,
     get_filediffs_match,
     get_filediff_encodings,
@@ -27,13 +39,17 @@ from reviewboard.diffviewer.diffutils import (
     get_revision_str,
     get_sorted_filediffs,
     patch,
+    prefetch_original_files,
     split_line_endings,
     _PATCH_GARBAGE_INPUT,
-    _get_last_header_in_chunks_before_line)
+    _get_line_changed_regions_by_characters,
+    _get_last_header_in_chunks_before_line,
+    _patch_with_subprocess)
 from reviewboard.diffviewer.errors import PatchError
+from reviewboard.diffviewer.patcher import apply_patch
 from reviewboard.diffviewer.models import DiffCommit, FileDiff
 from reviewboard.scmtools.core import PRE_CREATION
-from reviewboard.scmtools.errors import FileNotFoundError
+from reviewboard.scmtools.errors import FileNotFoundError, SCMError
 from reviewboard.scmtools.models import Repository
 from reviewboard.testing import TestCase
 
@@ -802,6 +818,51 @@ class GetDiffFilesTests(BaseFileDiffAncestorTests):
         self.assertEqual(two_to_three['depot_filename'], 'foo2.txt')
         self.assertEqual(two_to_three['dest_filename'], 'foo3.txt')
 
+    def test_get_diff_files_with_lazy(self):
+        """Testing get_diff_files with lazy=True"""
+        repository = self.create_repository(tool_name='Git')
+        review_request = self.create_review_request(repository=repository)
+        diffset = self.create_diffset(review_request=review_request)
+
+        filediff1 = self.create_filediff(diffset=diffset,
+                                         source_file='foo/b.txt',
+                                         dest_file='foo/b.txt',
+                                         diff=b'diff1')
+        filediff2 = self.create_filediff(diffset=diffset,
+                                         source_file='foo/a.txt',
+                                         dest_file='foo/a.txt',
+                                         diff=b'diff2')
+        filediff3 = self.create_filediff(diffset=diffset,
+                                         source_file='bar.txt',
+                                         dest_file='bar.txt',
+                                         diff=b'diff3')
+
+        self.spy_on(diffutils.get_revision_str)
+
+        diff_files = get_diff_files(diffset=diffset, lazy=True)
+
+        self.assertIsInstance(diff_files, DiffFileList)
+        self.assertEqual(len(diff_files), 3)
+        self.assertFalse(diffutils.get_revision_str.called)
+
+        self.assertEqual(diff_files.get_filediff_index(filediff1.pk), 2)
+        self.assertEqual(diff_files.get_filediff_index(filediff2.pk), 1)
+        self.assertEqual(diff_files.get_filediff_index(filediff3.pk), 0)
+        self.assertIsNone(diff_files.get_filediff_index(filediff3.pk + 100))
+
+        # Only the requested files should be built.
+        page = diff_files[1:]
+
+        self.assertEqual(len(page), 2)
+        self.assertEqual(len(diffutils.get_revision_str.calls), 2)
+        self.assertEqual(page[0]['filediff'], filediff2)
+        self.assertEqual(page[0]['index'], 1)
+        self.assertEqual(page[1]['filediff'], filediff1)
+        self.assertEqual(page[1]['index'], 0)
+
+        self.assertEqual(list(diff_files),
+                         get_diff_files(diffset=diffset))
+
     def test_get_diff_files_with_interdiff_and_files_same_source(self):
         """Testing get_diff_files with interdiff and multiple files using the
         same source_file
@@ -1150,7 +1211,11 @@ class GetDiffFilesTests(BaseFileDiffAncestorTests):
             3, 'foo', '257cc56', 'qux', '03b37a0',
         )]
 
-        with self.assertNumQueries(4):
+        # Expecting 2 queries:
+        #
+        # 1. Select the DiffSet, for its ancestor index.
+        # 2. Select the ancestor FileDiffs.
+        with self.assertNumQueries(2):
             files = get_diff_files(diffset=self.diffset,
                                    filediff=filediff)
 
@@ -1205,18 +1270,11 @@ class GetDiffFilesTests(BaseFileDiffAncestorTests):
         # assertion.
         self.assertEqual(len(self.filediffs), 9)
 
-        # Expecting 9 queries:
+        # Expecting 1 query, since ancestors are looked up in the
+        # DiffSet's ancestor index:
         #
         # 1. Select all FileDiffs for a DiffSet.
-        # 2. Update extra_data on FileDiff id=1.
-        # 3. Update extra_data on FileDiff id=3.
-        # 4. Update extra_data on FileDiff id=6.
-        # 5. Update extra_data on FileDiff id=7.
-        # 6. Update extra_data on FileDiff id=2.
-        # 7. Update extra_data on FileDiff id=5.
-        # 8. Update extra_data on FileDiff id=8.
-        # 9. Update extra_data on FileDiff id=9.
-        with self.assertNumQueries(9):
+        with self.assertNumQueries(1):
             files = get_diff_files(diffset=self.diffset,
                                    base_commit=diff_commit)
 
@@ -1275,18 +1333,11 @@ class GetDiffFilesTests(BaseFileDiffAncestorTests):
         # assertion.
         self.assertEqual(len(self.filediffs), 9)
 
-        # Expecting 9 queries:
+        # Expecting 1 query, since ancestors are looked up in the
+        # DiffSet's ancestor index:
         #
         # 1. Select all FileDiffs for a DiffSet.
-        # 2. Update extra_data on FileDiff id=1.
-        # 3. Update extra_data on FileDiff id=3.
-        # 4. Update extra_data on FileDiff id=6.
-        # 5. Update extra_data on FileDiff id=7.
-        # 6. Update extra_data on FileDiff id=2.
-        # 7. Update extra_data on FileDiff id=5.
-        # 8. Update extra_data on FileDiff id=8.
-        # 9. Update extra_data on FileDiff id=9.
-        with self.assertNumQueries(9):
+        with self.assertNumQueries(1):
             files = get_diff_files(diffset=self.diffset,
                                    tip_commit=tip_commit)
 
@@ -1386,17 +1437,11 @@ class GetDiffFilesTests(BaseFileDiffAncestorTests):
         # assertion.
         self.assertEqual(len(self.filediffs), 9)
 
-        # Expecting 8 queries:
+        # Expecting 1 query, since ancestors are looked up in the
+        # DiffSet's ancestor index:
         #
         # 1. Select all FileDiffs for a DiffSet.
-        # 2. Update extra_data on FileDiff id=1.
-        # 3. Update extra_data on FileDiff id=3.
-        # 4. Update extra_data on FileDiff id=6.
-        # 5. Update extra_data on FileDiff id=7.
-        # 6. Update extra_data on FileDiff id=2.
-        # 7. Update extra_data on FileDiff id=5.
-        # 8. Update extra_data on FileDiff id=8.
-        with self.assertNumQueries(8):
+        with self.assertNumQueries(1):
             files = get_diff_files(diffset=self.diffset,
                                    base_commit=base_commit,
                                    tip_commit=tip_commit)
@@ -1547,6 +1592,23 @@ class GetFileDiffsMatchTests(TestCase):
 
         self.assertTrue(get_filediffs_match(filediff1, filediff2))
 
+    def test_with_diffs_not_equal(self):
+        """Testing get_filediffs_match with diffs not equal does not load the
+        diff data
+        """
+        filediff1 = self.create_filediff(self.diffset,
+                                         source_file='foo.txt',
+                                         diff=b'abc')
+        filediff2 = self.create_filediff(self.diffset,
+                                         source_file='bar.txt',
+                                         diff=b'def')
+
+        filediff1 = FileDiff.objects.get(pk=filediff1.pk)
+        filediff2 = FileDiff.objects.get(pk=filediff2.pk)
+
+        with self.assertNumQueries(0):
+            self.assertFalse(get_filediffs_match(filediff1, filediff2))
+
     def test_with_deleted_true(self):
         """Testing get_filediffs_match with deleted flags both set"""
         self.assertTrue(get_filediffs_match(
@@ -2533,9 +2595,116 @@ class GetMatchedInterdiffFilesTests(TestCase):
             ])
 
 
-class GetLineChangedRegionsTests(TestCase):
+class GetCachedMatchedInterdiffFilesTests(SpyAgency, TestCase):
+    """Unit tests for get_cached_matched_interdiff_files."""
+
+    fixtures = ['test_users', 'test_scmtools']
+
+    def setUp(self):
+        super(GetCachedMatchedInterdiffFilesTests, self).setUp()
+
+        self.repository = self.create_repository(tool_name='Git')
+        review_request = self.create_review_request(
+            repository=self.repository)
+
+        self.diffset = self.create_diffset(review_request=review_request,
+                                           revision=1)
+        self.interdiffset = self.create_diffset(review_request=review_request,
+                                                revision=2)
+
+        self.filediff1 = self.create_filediff(
+            diffset=self.diffset,
+            source_file='foo.txt',
+            source_revision=123,
+            dest_file='foo.txt',
+            diff=b'diff1')
+        self.filediff2 = self.create_filediff(
+            diffset=self.diffset,
+            source_file='foo2.txt',
+            source_revision=123,
+            dest_file='foo2.txt',
+            diff=b'diff2')
+
+        self.interfilediff1 = self.create_filediff(
+            diffset=self.interdiffset,
+            source_file='foo.txt',
+            source_revision=123,
+            dest_file='foo.txt',
+            diff=b'interdiff1')
+        self.interfilediff2 = self.create_filediff(
+            diffset=self.interdiffset,
+            source_file='foo3.txt',
+            source_revision=PRE_CREATION,
+            dest_file='foo3.txt',
+            diff=b'interdiff2')
+
+    def test_caches_matches(self):
+        """Testing get_cached_matched_interdiff_files caches matches"""
+        self.spy_on(diffutils.get_matched_interdiff_files)
+
+        filediffs = [self.filediff1, self.filediff2]
+        interfilediffs = [self.interfilediff1, self.interfilediff2]
+        expected_matches = [
+            (self.filediff1, self.interfilediff1),
+            (self.filediff2, None),
+            (None, self.interfilediff2),
+        ]
+
+        for i in range(2):
+            matched_files = get_cached_matched_interdiff_files(
+                tool=self.repository.get_scmtool(),
+                diffset=self.diffset,
+                interdiffset=self.interdiffset,
+                filediffs=filediffs,
+                interfilediffs=interfilediffs)
+
+            self.assertEqual(matched_files, expected_matches)
+
+        self.assertEqual(
+            len(diffutils.get_matched_interdiff_files.calls), 1)
+
+    def test_with_different_files(self):
+        """Testing get_cached_matched_interdiff_files caches subsets of files
+        separately
+        """
+        self.spy_on(diffutils.get_matched_interdiff_files)
+
+        tool = self.repository.get_scmtool()
+
+        matched_files = get_cached_matched_interdiff_files(
+            tool=tool,
+            diffset=self.diffset,
+            interdiffset=self.interdiffset,
+            filediffs=[self.filediff1, self.filediff2],
+            interfilediffs=[self.interfilediff1, self.interfilediff2])
+        self.assertEqual(len(matched_files), 3)
+
+        matched_files = get_cached_matched_interdiff_files(
+            tool=tool,
+            diffset=self.diffset,
+            interdiffset=self.interdiffset,
+            filediffs=[self.filediff1],
+            interfilediffs=[self.interfilediff1])
+        self.assertEqual(matched_files,
+                         [(self.filediff1, self.interfilediff1)])
+
+        self.assertEqual(
+            len(diffutils.get_matched_interdiff_files.calls), 2)
+
+
+class GetLineChangedRegionsTests(SpyAgency, TestCase):
     """Unit tests for get_line_changed_regions."""
 
+    def setUp(self):
+        super(GetLineChangedRegionsTests, self).setUp()
+
+        clear_line_changed_regions_cache()
+
+    def tearDown(self):
+        super(GetLineChangedRegionsTests, self).tearDown()
+
+        clear_line_changed_regions_cache()
+
     def test_get_line_changed_regions(self):
         """Testing get_line_changed_regions"""
         def deep_equal(A, B):
@@ -2567,6 +2736,175 @@ class GetLineChangedRegionsTests(TestCase):
         regions = get_line_changed_regions(old, new)
         deep_equal(regions, (None, None))
 
+    def test_with_tokens(self):
+        """Testing get_line_changed_regions with algorithm=tokens"""
+        self.assertEqual(
+            get_line_changed_regions(
+                'submitter = models.ForeignKey(Person, '
+                'verbose_name="Submitter")',
+                'submitter = models.ForeignKey(User, '
+                'verbose_name="Submitter")',
+                algorithm=INTRALINE_DIFF_TOKENS),
+            ([(30, 36)], [(30, 34)]))
+
+        # Whole words are highlighted, rather than scattered characters.
+        self.assertEqual(
+            get_line_changed_regions(
+                '-from reviews.models import ReviewRequest, Person, Group',
+                '+from .reviews.models import ReviewRequest, Group',
+                algorithm=INTRALINE_DIFF_TOKENS),
+            ([(0, 1), (6, 6), (41, 49)], [(0, 1), (6, 7), (42, 42)]))
+
+        self.assertEqual(
+            get_line_changed_regions('abcdefghijklm', 'nopqrstuvwxyz',
+                                     algorithm=INTRALINE_DIFF_TOKENS),
+            (None, None))
+
+    def test_with_tokens_and_insert(self):
+        """Testing get_line_changed_regions with algorithm=tokens and text
+        inserted into a line
+        """
+        self.assertEqual(
+            get_line_changed_regions('foo(a)', 'foo(a, b)',
+                                     algorithm=INTRALINE_DIFF_TOKENS),
+            ([(5, 5)], [(5, 8)]))
+
+    def test_with_tokens_and_delete(self):
+        """Testing get_line_changed_regions with algorithm=tokens and text
+        deleted from a line
+        """
+        self.assertEqual(
+            get_line_changed_regions('foo(a, b)', 'foo(a)',
+                                     algorithm=INTRALINE_DIFF_TOKENS),
+            ([(5, 8)], [(5, 5)]))
+
+    def test_with_tokens_and_max_tokens(self):
+        """Testing get_line_changed_regions with algorithm=tokens and more
+        than INTRALINE_DIFF_MAX_TOKENS tokens changed
+        """
+        old = '%s%s%s' % ('a' * 2000, '+-' * 150, 'b' * 2000)
+        new = '%s%s%s' % ('a' * 2000, '-+' * 150, 'b' * 2000)
+
+        self.spy_on(SequenceMatcher.get_opcodes,
+                    owner=SequenceMatcher)
+
+        self.assertEqual(
+            get_line_changed_regions(old, new,
+                                     algorithm=INTRALINE_DIFF_TOKENS),
+            ([(2000, 2300)], [(2000, 2300)]))
+        self.assertFalse(SequenceMatcher.get_opcodes.called)
+
+    def test_with_invalid_algorithm(self):
+        """Testing get_line_changed_regions with invalid algorithm"""
+        with self.assertRaises(ValueError):
+            get_line_changed_regions('a', 'b', algorithm='invalid')
+
+    def test_caches_results(self):
+        """Testing get_line_changed_regions caches results"""
+        self.spy_on(_get_line_changed_regions_by_characters)
+
+        old = 'submitter = models.ForeignKey(Person)'
+        new = 'submitter = models.ForeignKey(User)'
+        regions = get_line_changed_regions(old, new)
+
+        # Modifying the results must not affect the cached copy.
+        regions[0].append((0, 1))
+
+        self.assertEqual(get_line_changed_regions(old, new),
+                         ([(30, 36)], [(30, 34)]))
+        self.assertEqual(
+            len(_get_line_changed_regions_by_characters.calls), 1)
+
+        # Different algorithms are cached separately.
+        get_line_changed_regions(old, new, algorithm=INTRALINE_DIFF_TOKENS)
+        self.assertEqual(
+            len(_get_line_changed_regions_by_characters.calls), 1)
+
+    def test_caches_results_up_to_cache_size(self):
+        """Testing get_line_changed_regions evicts the least recently used
+        results
+        """
+        self.spy_on(_get_line_changed_regions_by_characters)
+
+        old_size = diffutils.LINE_CHANGED_REGIONS_CACHE_SIZE
+        diffutils.LINE_CHANGED_REGIONS_CACHE_SIZE = 2
+
+        try:
+            get_line_changed_regions('line 1', 'line A')
+            get_line_changed_regions('line 2', 'line B')
+            get_line_changed_regions('line 1', 'line A')
+            get_line_changed_regions('line 3', 'line C')
+
+            self.assertEqual(
+                len(_get_line_changed_regions_by_characters.calls), 3)
+
+            get_line_changed_regions('line 1', 'line A')
+            self.assertEqual(
+                len(_get_line_changed_regions_by_characters.calls), 3)
+
+            get_line_changed_regions('line 2', 'line B')
+            self.assertEqual(
+                len(_get_line_changed_regions_by_characters.calls), 4)
+        finally:
+            diffutils.LINE_CHANGED_REGIONS_CACHE_SIZE = old_size
+
+    def test_caches_results_up_to_max_chars(self):
+        """Testing get_line_changed_regions evicts results when the cached
+        lines exceed the maximum total length
+        """
+        self.spy_on(_get_line_changed_regions_by_characters)
+
+        old_max_chars = diffutils.LINE_CHANGED_REGIONS_CACHE_MAX_CHARS
+        diffutils.LINE_CHANGED_REGIONS_CACHE_MAX_CHARS = 30
+
+        try:
+            get_line_changed_regions('line 1', 'line A')
+            get_line_changed_regions('line 2', 'line B')
+            get_line_changed_regions('line 3', 'line C')
+
+            self.assertEqual(
+                len(_get_line_changed_regions_by_characters.calls), 3)
+
+            get_line_changed_regions('line 3', 'line C')
+            get_line_changed_regions('line 2', 'line B')
+            self.assertEqual(
+                len(_get_line_changed_regions_by_characters.calls), 3)
+
+            get_line_changed_regions('line 1', 'line A')
+            self.assertEqual(
+                len(_get_line_changed_regions_by_characters.calls), 4)
+        finally:
+            diffutils.LINE_CHANGED_REGIONS_CACHE_MAX_CHARS = old_max_chars
+
+    def test_with_long_lines(self):
+        """Testing get_line_changed_regions doesn't cache results for long
+        lines
+        """
+        self.spy_on(_get_line_changed_regions_by_characters)
+
+        oldline = 'x' * 1000 + ' old'
+        newline = 'x' * 1000 + ' new'
+
+        get_line_changed_regions(oldline, newline)
+        get_line_changed_regions(oldline, newline)
+
+        self.assertEqual(
+            len(_get_line_changed_regions_by_characters.calls), 2)
+
+    def test_with_use_cache_false(self):
+        """Testing get_line_changed_regions with use_cache=False"""
+        self.spy_on(_get_line_changed_regions_by_characters)
+
+        get_line_changed_regions('line 1', 'line A', use_cache=False)
+        get_line_changed_regions('line 1', 'line A', use_cache=False)
+
+        self.assertEqual(
+            len(_get_line_changed_regions_by_characters.calls), 2)
+        self.assertEqual(
+            get_line_changed_regions('line 1', 'line A', use_cache=False),
+            get_line_changed_regions('line 1', 'line A',
+                                     algorithm=INTRALINE_DIFF_CHARACTERS))
+
 
 class GetDisplayedDiffLineRangesTests(TestCase):
     """Unit tests for get_displayed_diff_line_ranges."""
@@ -3136,9 +3474,18 @@ class DiffExpansionHeaderTests(TestCase):
                          lines[header['left']['line'] - 1][2])
 
 
-class PatchTests(TestCase):
+class PatchTests(SpyAgency, TestCase):
     """Unit tests for patch."""
 
+    _ENGINE_DIFF = (
+        b'--- README\n'
+        b'+++ README\n'
+        b'@@ -1,2 +1,2 @@\n'
+        b' foo\n'
+        b'-bar\n'
+        b'+baz\n'
+    )
+
     def test_patch(self):
         """Testing patch"""
         old = (b'int\n'
@@ -3377,6 +3724,59 @@ class PatchTests(TestCase):
                         filename='README')
         self.assertEqual(patched, new)
 
+    def test_patch_builtin_engine(self):
+        """Testing patch with the built-in engine does not use patch(1)"""
+        self.spy_on(_patch_with_subprocess)
+
+        with self.siteconfig_settings({'diffviewer_patch_engine':
+                                       PATCH_ENGINE_BUILTIN}):
+            patched = patch(diff=self._ENGINE_DIFF,
+                            orig_file=b'foo\nbar\n',
+                            filename='README')
+
+        self.assertEqual(patched, b'foo\nbaz\n')
+        self.assertFalse(_patch_with_subprocess.called)
+
+    def test_patch_builtin_engine_fallback(self):
+        """Testing patch with the built-in engine falls back on patch(1)
+        when hunks are rejected
+        """
+        def _apply_patch(diff, orig_file, filename, max_fuzz=2):
+            raise PatchError(filename=filename,
+                             error_output='Hunk #1 FAILED at 1.',
+                             orig_file=orig_file,
+                             new_file=None,
+                             diff=diff,
+                             rejects=None)
+
+        self.spy_on(apply_patch, call_fake=_apply_patch)
+        self.spy_on(_patch_with_subprocess)
+
+        with self.siteconfig_settings({'diffviewer_patch_engine':
+                                       PATCH_ENGINE_BUILTIN}):
+            patched = patch(diff=self._ENGINE_DIFF,
+                            orig_file=b'foo\nbar\n',
+                            filename='README')
+
+        self.assertEqual(patched, b'foo\nbaz\n')
+        self.assertTrue(apply_patch.called)
+        self.assertTrue(_patch_with_subprocess.called)
+
+    def test_patch_subprocess_engine(self):
+        """Testing patch with the patch(1) engine"""
+        self.spy_on(apply_patch)
+        self.spy_on(_patch_with_subprocess)
+
+        with self.siteconfig_settings({'diffviewer_patch_engine':
+                                       PATCH_ENGINE_SUBPROCESS}):
+            patched = patch(diff=self._ENGINE_DIFF,
+                            orig_file=b'foo\nbar\n',
+                            filename='README')
+
+        self.assertEqual(patched, b'foo\nbaz\n')
+        self.assertFalse(apply_patch.called)
+        self.assertTrue(_patch_with_subprocess.called)
+
 
 class GetFileDiffEncodingsTests(TestCase):
     """Unit tests for get_filediff_encodings."""
@@ -3506,10 +3906,10 @@ class GetOriginalFileTests(BaseFileDiffAncestorTests):
 
         self.spy_on(patch, call_fake=_patch)
 
-        # One query for each of the following:
-        # - saving the RawFileDiffData in RawFileDiffData.recompute_line_counts
-        # - saving the FileDiff in FileDiff.is_parent_diff_empty
-        with self.assertNumQueries(2):
+        # The RawFileDiffData's line counts were stored when it was created,
+        # so the only query is for saving the FileDiff in
+        # FileDiff.is_parent_diff_empty.
+        with self.assertNumQueries(1):
             orig = get_original_file(filediff=filediff)
 
         self.assertEqual(orig, b'')
@@ -3726,6 +4126,326 @@ class GetOriginalFileTests(BaseFileDiffAncestorTests):
         self.assertTrue(convert_line_endings.called_with('hello world'))
 
 
+class PrefetchOriginalFilesTests(SpyAgency, TestCase):
+    """Unit tests for prefetch_original_files."""
+
+    fixtures = ['test_scmtools']
+
+    def setUp(self):
+        super(PrefetchOriginalFilesTests, self).setUp()
+
+        self.fetched = []
+        self.lock = threading.Lock()
+
+    def test_fetches_files(self):
+        """Testing prefetch_original_files fetches each file from the
+        repository
+        """
+        self.spy_on(Repository.get_file,
+                    owner=Repository,
+                    call_fake=self._fake_get_file)
+
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        filediffs = [
+            self.create_filediff(diffset,
+                                 source_file='/file%d' % i,
+                                 dest_file='/file%d' % i)
+            for i in range(3)
+        ]
+
+        prefetch_original_files(filediffs)
+
+        self.assertEqual(sorted(self.fetched),
+                         [('/file0', '123'), ('/file1', '123'),
+                          ('/file2', '123')])
+
+    def test_with_duplicate_files(self):
+        """Testing prefetch_original_files fetches duplicate files once"""
+        self.spy_on(Repository.get_file,
+                    owner=Repository,
+                    call_fake=self._fake_get_file)
+
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        filediffs = [
+            self.create_filediff(diffset,
+                                 source_file=source_file,
+                                 dest_file=source_file)
+            for source_file in ('/file1', '/file1', '/file2')
+        ]
+
+        prefetch_original_files(filediffs)
+
+        self.assertEqual(sorted(self.fetched),
+                         [('/file1', '123'), ('/file2', '123')])
+
+    def test_with_new_files(self):
+        """Testing prefetch_original_files skips new files"""
+        self.spy_on(Repository.get_file,
+                    owner=Repository,
+                    call_fake=self._fake_get_file)
+
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        filediffs = [
+            self.create_filediff(diffset,
+                                 source_file='/file%d' % i,
+                                 dest_file='/file%d' % i,
+                                 source_revision=source_revision)
+            for i, source_revision in enumerate(('123', PRE_CREATION, '456'))
+        ]
+
+        prefetch_original_files(filediffs)
+
+        self.assertEqual(sorted(self.fetched),
+                         [('/file0', '123'), ('/file2', '456')])
+
+    def test_with_errors(self):
+        """Testing prefetch_original_files ignores errors fetching files"""
+        def _get_file(repository, path, revision, *args, **kwargs):
+            if path == '/file0':
+                raise FileNotFoundError(path, revision)
+
+            return self._fake_get_file(repository, path, revision)
+
+        self.spy_on(Repository.get_file,
+                    owner=Repository,
+                    call_fake=_get_file)
+
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        filediffs = [
+            self.create_filediff(diffset,
+                                 source_file='/file%d' % i,
+                                 dest_file='/file%d' % i)
+            for i in range(3)
+        ]
+
+        prefetch_original_files(filediffs)
+
+        self.assertEqual(sorted(self.fetched),
+                         [('/file1', '123'), ('/file2', '123')])
+
+    def test_with_errors_remembers_failures(self):
+        """Testing prefetch_original_files remembers files that failed to
+        be fetched
+        """
+        def _get_file(repository, path, revision, *args, **kwargs):
+            if path == '/file0':
+                raise FileNotFoundError(path, revision, detail='Missing')
+            elif path == '/file1':
+                raise SCMError('Connection refused')
+
+            return self._fake_get_file(repository, path, revision)
+
+        self.spy_on(Repository.get_file,
+                    owner=Repository,
+                    call_fake=_get_file)
+
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        filediffs = [
+            self.create_filediff(diffset,
+                                 source_file='/file%d' % i,
+                                 dest_file='/file%d' % i)
+            for i in range(3)
+        ]
+
+        prefetch_original_files(filediffs)
+        self.assertEqual(len(Repository.get_file.calls), 3)
+
+        with self.assertRaisesMessage(FileNotFoundError, 'Missing'):
+            get_original_file(filediff=filediffs[0])
+
+        self.assertEqual(len(Repository.get_file.calls), 3)
+
+        # Other errors may be temporary, so the file is fetched again.
+        with self.assertRaisesMessage(SCMError, 'Connection refused'):
+            get_original_file(filediff=filediffs[1])
+
+        self.assertEqual(len(Repository.get_file.calls), 4)
+
+    def test_with_wait_false(self):
+        """Testing prefetch_original_files with wait=False returns before
+        the files are fetched
+        """
+        release = threading.Event()
+
+        def _get_file(repository, path, revision, *args, **kwargs):
+            release.wait(5)
+
+            return self._fake_get_file(repository, path, revision)
+
+        self.spy_on(Repository.get_file,
+                    owner=Repository,
+                    call_fake=_get_file)
+
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        filediffs = [
+            self.create_filediff(diffset,
+                                 source_file='/file%d' % i,
+                                 dest_file='/file%d' % i)
+            for i in range(3)
+        ]
+
+        prefetch_original_files(filediffs, wait=False)
+        self.assertEqual(self.fetched, [])
+
+        release.set()
+
+        for i in range(100):
+            with self.lock:
+                if len(self.fetched) == 3:
+                    break
+
+            time.sleep(0.05)
+
+        self.assertEqual(sorted(self.fetched),
+                         [('/file0', '123'), ('/file1', '123'),
+                          ('/file2', '123')])
+
+    def test_with_max_workers_per_repository(self):
+        """Testing prefetch_original_files limits concurrent fetches using
+        the repository's prefetch_max_workers
+        """
+        state = {
+            'active': 0,
+            'max_active': 0,
+        }
+
+        def _get_file(repository, path, revision, *args, **kwargs):
+            with self.lock:
+                state['active'] += 1
+                state['max_active'] = max(state['max_active'],
+                                          state['active'])
+
+            time.sleep(0.02)
+
+            with self.lock:
+                state['active'] -= 1
+
+            return self._fake_get_file(repository, path, revision)
+
+        self.spy_on(Repository.get_file,
+                    owner=Repository,
+                    call_fake=_get_file)
+
+        repository = self.create_repository(
+            tool_name='Test',
+            extra_data={
+                'prefetch_max_workers': 2,
+            })
+        diffset = self.create_diffset(repository=repository)
+        filediffs = [
+            self.create_filediff(diffset,
+                                 source_file='/file%d' % i,
+                                 dest_file='/file%d' % i)
+            for i in range(6)
+        ]
+
+        prefetch_original_files(filediffs)
+
+        self.assertEqual(len(self.fetched), 6)
+        self.assertLessEqual(state['max_active'], 2)
+
+    def test_with_batched_file_fetches(self):
+        """Testing prefetch_original_files fetches files in batches for
+        repositories supporting batched file fetches
+        """
+        batches = []
+
+        def _get_files(repository, files, *args, **kwargs):
+            with self.lock:
+                batches.append(sorted(path for path, revision, commit_id
+                                      in files))
+
+            return [b'data\n'] * len(files)
+
+        repository = self.create_repository(
+            tool_name='Test',
+            extra_data={
+                'prefetch_max_workers': 2,
+            })
+        tool = repository.get_scmtool()
+        tool.supports_batched_file_fetches = True
+
+        self.spy_on(Repository.get_scmtool,
+                    owner=Repository,
+                    call_fake=lambda *args, **kwargs: tool)
+        self.spy_on(Repository.get_file, owner=Repository)
+        self.spy_on(Repository.get_files,
+                    owner=Repository,
+                    call_fake=_get_files)
+
+        diffset = self.create_diffset(repository=repository)
+        filediffs = [
+            self.create_filediff(diffset,
+                                 source_file='/file%d' % i,
+                                 dest_file='/file%d' % i)
+            for i in range(5)
+        ]
+
+        prefetch_original_files(filediffs)
+
+        self.assertFalse(Repository.get_file.called)
+        self.assertEqual(sorted(batches),
+                         [['/file0', '/file2', '/file4'],
+                          ['/file1', '/file3']])
+
+    def test_with_disabled(self):
+        """Testing prefetch_original_files with
+        diffviewer_prefetch_max_workers=0
+        """
+        self.spy_on(Repository.get_file,
+                    owner=Repository,
+                    call_fake=self._fake_get_file)
+
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        filediffs = [
+            self.create_filediff(diffset,
+                                 source_file='/file%d' % i,
+                                 dest_file='/file%d' % i)
+            for i in range(3)
+        ]
+
+        with self.siteconfig_settings({'diffviewer_prefetch_max_workers': 0},
+                                      reload_settings=False):
+            prefetch_original_files(filediffs)
+
+        self.assertFalse(Repository.get_file.called)
+
+    def _fake_get_file(self, repository, path, revision, *args, **kwargs):
+        """Record a file fetch.
+
+        Args:
+            repository (reviewboard.scmtools.models.Repository):
+                The repository the file is fetched from.
+
+            path (unicode):
+                The path of the file.
+
+            revision (unicode):
+                The revision of the file.
+
+            *args (tuple):
+                Unused positional arguments.
+
+            **kwargs (dict):
+                Unused keyword arguments.
+
+        Returns:
+            bytes:
+            The file contents.
+        """
+        with self.lock:
+            self.fetched.append((path, revision))
+
+        return b'data\n'
+
+
 class SplitLineEndingsTests(TestCase):
     """Unit tests for reviewboard.diffviewer.diffutils.split_line_endings."""
 
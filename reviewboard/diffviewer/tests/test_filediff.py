@@ -241,6 +241,16 @@ class FileDiffAncestorTests(BaseFileDiffAncestorTests):
 
         self.set_up_filediffs()
 
+        # Most of these tests cover computing ancestors for a commit series
+        # that hasn't been finalized, and so has no ancestor index.
+        self.finalized_extra_data = self.diffset.extra_data
+        self.diffset.extra_data = {}
+        self.diffset.save(update_fields=('extra_data',))
+        self.diffset._filediff_ancestor_index = None
+
+        for filediff in self.filediffs:
+            filediff.diffset = self.diffset
+
     def test_get_ancestors_minimal(self):
         """Testing FileDiff.get_ancestors with minimal=True"""
         ancestors = {}
@@ -319,6 +329,116 @@ class FileDiffAncestorTests(BaseFileDiffAncestorTests):
 
         self._check_ancestors(ancestors, minimal=True)
 
+    def test_get_ancestors_with_index_minimal(self):
+        """Testing FileDiff.get_ancestors with minimal=True for a finalized
+        commit series
+        """
+        self._restore_finalized_diffset()
+
+        ancestors = {}
+
+        with self.assertNumQueries(0):
+            for filediff in self.filediffs:
+                ancestors[filediff] = filediff.get_ancestors(
+                    minimal=True,
+                    filediffs=self.filediffs)
+
+        self._check_ancestors(ancestors, minimal=True)
+
+        for filediff in self.filediffs:
+            self.assertNotIn(FileDiff._ANCESTORS_KEY, filediff.extra_data)
+
+    def test_get_ancestors_with_index_full(self):
+        """Testing FileDiff.get_ancestors with minimal=False for a finalized
+        commit series
+        """
+        self._restore_finalized_diffset()
+
+        ancestors = {}
+
+        with self.assertNumQueries(0):
+            for filediff in self.filediffs:
+                ancestors[filediff] = filediff.get_ancestors(
+                    minimal=False,
+                    filediffs=self.filediffs)
+
+        self._check_ancestors(ancestors, minimal=False)
+
+    def test_get_ancestors_with_index_no_filediffs(self):
+        """Testing FileDiff.get_ancestors for a finalized commit series when
+        no FileDiffs are provided
+        """
+        self._restore_finalized_diffset()
+
+        ancestors = {}
+
+        # Only FileDiffs with ancestors need to query for them.
+        with self.assertNumQueries(5):
+            for filediff in self.filediffs:
+                ancestors[filediff] = filediff.get_ancestors(minimal=True)
+
+        self._check_ancestors(ancestors, minimal=True)
+
+    def test_get_ancestors_with_index_built_on_demand(self):
+        """Testing FileDiff.get_ancestors builds the ancestor index for a
+        commit series finalized without one
+        """
+        self.finalized_extra_data.pop(DiffSet._FILEDIFF_ANCESTOR_INDEX_KEY)
+        self._restore_finalized_diffset()
+
+        # Simulate a change made to the DiffSet elsewhere after it was
+        # loaded.
+        stored_diffset = DiffSet.objects.get(pk=self.diffset.pk)
+        stored_diffset.extra_data['foo'] = 'bar'
+        stored_diffset.save(update_fields=('extra_data',))
+
+        ancestors = {}
+
+        # Expecting 6 queries:
+        #
+        # 1. Select the per-commit FileDiffs.
+        # 2. Create a savepoint.
+        # 3. Select and lock the DiffSet's extra_data.
+        # 4. Select the DiffSet's history ID when saving.
+        # 5. Update extra_data on the DiffSet.
+        # 6. Release the savepoint.
+        with self.assertNumQueries(6):
+            for filediff in self.filediffs:
+                ancestors[filediff] = filediff.get_ancestors(
+                    minimal=False,
+                    filediffs=self.filediffs)
+
+        self._check_ancestors(ancestors, minimal=False)
+
+        diffset = DiffSet.objects.get(pk=self.diffset.pk)
+        self.assertIn(DiffSet._FILEDIFF_ANCESTOR_INDEX_KEY, diffset.extra_data)
+        self.assertEqual(diffset.extra_data['foo'], 'bar')
+
+    def test_get_ancestors_with_index_shared(self):
+        """Testing FileDiff.get_ancestors for a finalized commit series
+        shares the ancestor index between FileDiffs loaded separately
+        """
+        self._restore_finalized_diffset()
+
+        filediffs = list(FileDiff.objects.filter(diffset=self.diffset,
+                                                 commit__isnull=False))
+        ancestors = {}
+
+        # Only the first FileDiff needs to load the DiffSet.
+        with self.assertNumQueries(1):
+            for filediff in filediffs:
+                ancestors[filediff] = filediff.get_ancestors(
+                    minimal=False,
+                    filediffs=filediffs)
+
+        self._check_ancestors(ancestors, minimal=False)
+
+    def _restore_finalized_diffset(self):
+        """Restore the finalized state of the DiffSet."""
+        self.diffset.extra_data = self.finalized_extra_data
+        self.diffset.save(update_fields=('extra_data',))
+        self.diffset._filediff_ancestor_index = None
+
     def _check_ancestors(self, all_ancestors, minimal):
         paths = {
             (1, 'foo', 'PRE-CREATION', 'foo', 'e69de29'): ([], []),
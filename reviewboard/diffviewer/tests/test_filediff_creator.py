@@ -5,7 +5,8 @@ from __future__ import unicode_literals
 from django.utils.timezone import now
 
 from reviewboard.diffviewer.filediff_creator import create_filediffs
-from reviewboard.diffviewer.models import DiffCommit, DiffSet
+from reviewboard.diffviewer.models import DiffCommit, DiffSet, RawFileDiffData
+from reviewboard.diffviewer.parser import DiffLineStream
 from reviewboard.testing import TestCase
 
 
@@ -93,3 +94,79 @@ class FileDiffCreatorTests(TestCase):
 
         self.assertEqual(diffset.files.count(), 2)
         self.assertEqual(commits[1].files.count(), 1)
+
+    def test_create_filediffs_with_stream(self):
+        """Testing create_filediffs() with a DiffLineStream"""
+        repository = self.create_repository()
+        diffset = self.create_diffset(repository=repository)
+        diff = self.DEFAULT_GIT_FILEDIFF_DATA_DIFF
+        parent_diff = (
+            b'diff --git a/README b/README\n'
+            b'index 94bdd3e..d6a3f8e 100644\n'
+            b'--- a/README\n'
+            b'+++ b/README\n'
+            b'@@ -1 +1 @@\n'
+            b'-Hi, world!\n'
+            b'+Hello, world!\n'
+        )
+
+        filediffs = create_filediffs(
+            DiffLineStream([diff[:20], diff[20:]]),
+            DiffLineStream([parent_diff]),
+            repository=repository,
+            basedir='/',
+            base_commit_id='0' * 40,
+            diffset=diffset,
+            check_existence=False)
+
+        self.assertEqual(len(filediffs), 1)
+
+        filediff = diffset.files.get()
+        self.assertEqual(filediff.diff, diff)
+        self.assertEqual(filediff.parent_diff, parent_diff)
+
+    def test_create_filediffs_many_files(self):
+        """Testing create_filediffs() with many files stores diffs in bulk"""
+        repository = self.create_repository()
+        diffset = self.create_diffset(repository=repository)
+        diff = b''.join(
+            b'diff --git a/file%d b/file%d\n'
+            b'index 94bdd3e..197009f 100644\n'
+            b'--- a/file%d\n'
+            b'+++ b/file%d\n'
+            b'@@ -1 +1,2 @@\n'
+            b'-old line\n'
+            b'+new line %d\n'
+            b'+another line\n'
+            % (i, i, i, i, i)
+            for i in range(50)
+        )
+
+        with self.assertNumQueries(6):
+            filediffs = create_filediffs(
+                diff,
+                None,
+                repository=repository,
+                basedir='/',
+                base_commit_id='0' * 40,
+                diffset=diffset,
+                check_existence=False)
+
+        self.assertEqual(len(filediffs), 50)
+        self.assertEqual(RawFileDiffData.objects.count(), 50)
+
+        filediff = diffset.files.get(source_file='file7')
+        self.assertEqual(filediff.diff, (
+            b'diff --git a/file7 b/file7\n'
+            b'index 94bdd3e..197009f 100644\n'
+            b'--- a/file7\n'
+            b'+++ b/file7\n'
+            b'@@ -1 +1,2 @@\n'
+            b'-old line\n'
+            b'+new line 7\n'
+            b'+another line\n'
+        ))
+        self.assertEqual(filediff.extra_data['raw_insert_count'], 2)
+        self.assertEqual(filediff.extra_data['raw_delete_count'], 1)
+        self.assertEqual(filediff.diff_hash.insert_count, 2)
+        self.assertEqual(filediff.diff_hash.delete_count, 1)
@@ -0,0 +1,56 @@
+from __future__ import unicode_literals
+
+from reviewboard.diffviewer.differ import DiffCompatVersion
+from reviewboard.diffviewer.histogramdiff import HistogramDiffer
+from reviewboard.testing import TestCase
+
+
+class HistogramDifferTests(TestCase):
+    """Unit tests for HistogramDiffer."""
+
+    def test_equals(self):
+        """Testing HistogramDiffer with equal chunk"""
+        self._test_diff(['1', '2', '3'],
+                        ['1', '2', '3'],
+                        [('equal', 0, 3, 0, 3)])
+
+    def test_replace(self):
+        """Testing HistogramDiffer with replace chunk"""
+        self._test_diff(['1', '2', '3'],
+                        ['1', '4', '3'],
+                        [('equal', 0, 1, 0, 1),
+                         ('replace', 1, 2, 1, 2),
+                         ('equal', 2, 3, 2, 3)])
+
+    def test_repeated_lines(self):
+        """Testing HistogramDiffer splits on the rarest common lines"""
+        self._test_diff(['a', 'x', 'b', 'x', 'c'],
+                        ['a', 'b', 'x', 'x', 'c'],
+                        [('equal', 0, 1, 0, 1),
+                         ('delete', 1, 2, 1, 1),
+                         ('equal', 2, 4, 1, 3),
+                         ('insert', 4, 4, 3, 4),
+                         ('equal', 4, 5, 4, 5)])
+
+    def test_with_max_chain_length(self):
+        """Testing HistogramDiffer with lines exceeding MAX_CHAIN_LENGTH"""
+        class ShortChainHistogramDiffer(HistogramDiffer):
+            MAX_CHAIN_LENGTH = 1
+
+        differ = ShortChainHistogramDiffer(
+            ['x', 'y', 'x', 'y'],
+            ['y', 'x', 'y', 'x'],
+            compat_version=DiffCompatVersion.HISTOGRAM)
+        differ._gen_diff_data()
+
+        self.assertEqual(differ._find_matches(0, 4, 0, 4), [])
+        self.assertEqual(
+            list(differ.get_opcodes()),
+            [('delete', 0, 1, 0, 0),
+             ('equal', 1, 4, 0, 3),
+             ('insert', 4, 4, 3, 4)])
+
+    def _test_diff(self, a, b, expected):
+        differ = HistogramDiffer(a, b,
+                                 compat_version=DiffCompatVersion.HISTOGRAM)
+        self.assertEqual(list(differ.get_opcodes()), expected)
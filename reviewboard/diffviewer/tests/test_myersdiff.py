@@ -1,5 +1,10 @@
 from __future__ import unicode_literals
 
+import random
+
+from django.utils.six.moves import range
+
+from reviewboard.diffviewer.differ import DiffCompatVersion
 from reviewboard.diffviewer.myersdiff import MyersDiffer
 from reviewboard.testing import TestCase
 
@@ -36,6 +41,235 @@ class MyersDifferTest(TestCase):
                          ('insert', 5, 5, 5, 9),
                          ('equal', 5, 8, 9, 12)])
 
-    def _test_diff(self, a, b, expected):
-        opcodes = list(MyersDiffer(a, b).get_opcodes())
+    def test_bounded_cost(self):
+        """Testing MyersDiffer with DiffCompatVersion.MYERS_BOUNDED_COST"""
+        self._test_diff(['b', 'c', 'd', 'a'],
+                        ['a', 'd', 'c', 'b', 'b', 'd', 'd'],
+                        [('replace', 0, 1, 0, 1),
+                         ('insert', 1, 1, 1, 2),
+                         ('equal', 1, 2, 2, 3),
+                         ('insert', 2, 2, 3, 6),
+                         ('equal', 2, 3, 6, 7),
+                         ('delete', 3, 4, 7, 7)],
+                        compat_version=DiffCompatVersion.MYERS_BOUNDED_COST)
+
+    def test_bounded_cost_with_max_total_cost(self):
+        """Testing MyersDiffer with DiffCompatVersion.MYERS_BOUNDED_COST
+        and the maximum total cost reached
+        """
+        class BoundedMyersDiffer(MyersDiffer):
+            MAX_TOTAL_COST = 1
+
+        differ = BoundedMyersDiffer(
+            ['b', 'c', 'd', 'a'],
+            ['a', 'd', 'c', 'b', 'b', 'd', 'd'],
+            compat_version=DiffCompatVersion.MYERS_BOUNDED_COST)
+
+        # Once the total cost has been reached, the remaining regions are
+        # treated as changed.
+        self.assertEqual(
+            list(differ.get_opcodes()),
+            [('replace', 0, 2, 0, 2),
+             ('insert', 2, 2, 2, 6),
+             ('equal', 2, 3, 6, 7),
+             ('delete', 3, 4, 7, 7)])
+        self.assertGreaterEqual(differ.total_cost, 1)
+
+    def test_bounded_cost_with_older_compat_version(self):
+        """Testing MyersDiffer with DiffCompatVersion.MYERS_SMS_COST_BAIL
+        ignores the maximum total cost
+        """
+        differ = MyersDiffer(
+            ['a'], ['b'],
+            compat_version=DiffCompatVersion.MYERS_SMS_COST_BAIL)
+        self.assertFalse(differ.bounded_cost)
+
+    def test_very_approx_sqrt(self):
+        """Testing MyersDiffer._very_approx_sqrt with
+        DiffCompatVersion.MYERS_BOUNDED_COST
+        """
+        differ = MyersDiffer(
+            [], [],
+            compat_version=DiffCompatVersion.MYERS_BOUNDED_COST)
+
+        self.assertEqual(differ._very_approx_sqrt(4), 2)
+        self.assertEqual(differ._very_approx_sqrt(4096), 64)
+        self.assertEqual(differ._very_approx_sqrt(40000), 128)
+
+    def _test_diff(self, a, b, expected, compat_version=None):
+        opcodes = list(MyersDiffer(a, b, compat_version=compat_version)
+                       .get_opcodes())
         self.assertEqual(opcodes, expected)
+
+
+class _LegacyMyersDiffer(MyersDiffer):
+    """MyersDiffer using the original line-at-a-time line interning.
+
+    This is used to check that the compact line interning produces the same
+    results.
+    """
+
+    USE_ARRAYS = False
+
+    def _gen_diff_codes(self, lines, is_modified_file):
+        codes = []
+        linenum = 0
+
+        if is_modified_file:
+            interesting_lines = self.interesting_lines[1]
+        else:
+            interesting_lines = self.interesting_lines[0]
+
+        for line in lines:
+            raw_line = line
+            stripped_line = line.lstrip()
+
+            if self.ignore_space:
+                if len(stripped_line) > 0:
+                    line = stripped_line
+
+            interesting_line_name = None
+
+            try:
+                code = self.code_table[line]
+                interesting_line_name = \
+                    self.interesting_line_table.get(code, None)
+            except KeyError:
+                self.last_code += 1
+                code = self.last_code
+                self.code_table[line] = code
+
+                if stripped_line:
+                    for name, regex in self.interesting_line_regexes:
+                        if regex.match(raw_line):
+                            interesting_line_name = name
+                            self.interesting_line_table[code] = name
+                            break
+
+            if interesting_line_name:
+                interesting_lines[interesting_line_name].append((linenum,
+                                                                 raw_line))
+
+            codes.append(code)
+            linenum += 1
+
+        return codes
+
+
+class MyersDifferEquivalenceTests(TestCase):
+    """Unit tests for MyersDiffer line interning and compact arrays.
+
+    These check that opcodes and interesting lines are identical to those
+    of the original line interning, with and without compact arrays.
+    """
+
+    def test_equivalence(self):
+        """Testing MyersDiffer line interning produces identical results"""
+        self._test_equivalence(ignore_space=False)
+
+    def test_equivalence_with_ignore_space(self):
+        """Testing MyersDiffer line interning produces identical results with
+        ignore_space=True
+        """
+        self._test_equivalence(ignore_space=True)
+
+    def test_equivalence_with_large_files(self):
+        """Testing MyersDiffer line interning produces identical results with
+        large files
+        """
+        self._test_equivalence(ignore_space=False,
+                               num_files=5,
+                               num_lines=3000,
+                               num_edits=300)
+
+    def _test_equivalence(self, ignore_space, num_files=150, num_lines=60,
+                          num_edits=10):
+        """Check opcodes and interesting lines for randomized files.
+
+        Args:
+            ignore_space (bool):
+                Whether to ignore leading whitespace.
+
+            num_files (int, optional):
+                The number of pairs of files to diff.
+
+            num_lines (int, optional):
+                The maximum number of lines in each original file.
+
+            num_edits (int, optional):
+                The maximum number of edits made to each modified file.
+        """
+        rand = random.Random(num_files * num_lines)
+        words = ['def foo():', 'class Foo(object):', 'return 1', 'pass',
+                 '', '#', 'x = 1', 'y = x + 1', '}', '{']
+
+        def make_line():
+            return '%s%s' % (' ' * rand.choice((0, 0, 2, 4)),
+                             rand.choice(words))
+
+        for i in range(num_files):
+            a = [
+                make_line()
+                for j in range(rand.randint(0, num_lines))
+            ]
+            b = list(a)
+
+            for j in range(rand.randint(0, num_edits)):
+                pos = rand.randint(0, len(b))
+                action = rand.random()
+
+                if action < 0.4:
+                    b.insert(pos, make_line())
+                elif b and action < 0.7:
+                    del b[min(pos, len(b) - 1)]
+                elif b:
+                    b[min(pos, len(b) - 1)] = make_line()
+
+            for compat_version in DiffCompatVersion.MYERS_VERSIONS:
+                expected = self._diff(_LegacyMyersDiffer, a, b, ignore_space,
+                                      compat_version, use_arrays=False)
+
+                for use_arrays in (False, True):
+                    self.assertEqual(
+                        self._diff(MyersDiffer, a, b, ignore_space,
+                                   compat_version, use_arrays),
+                        expected)
+
+    def _diff(self, differ_cls, a, b, ignore_space, compat_version,
+              use_arrays):
+        """Return the results of a diff.
+
+        Args:
+            differ_cls (type):
+                The differ class to use.
+
+            a (list of unicode):
+                The original lines.
+
+            b (list of unicode):
+                The modified lines.
+
+            ignore_space (bool):
+                Whether to ignore leading whitespace.
+
+            compat_version (int):
+                The diff compatibility version.
+
+            use_arrays (bool):
+                Whether to use compact arrays.
+
+        Returns:
+            tuple:
+            A tuple of the opcodes and the interesting lines for each file.
+        """
+        differ = differ_cls(a, b,
+                            ignore_space=ignore_space,
+                            compat_version=compat_version)
+        differ.USE_ARRAYS = use_arrays
+        differ.add_interesting_lines_for_headers('foo.py')
+
+        return (
+            list(differ.get_opcodes()),
+            differ.get_interesting_lines('header', False),
+            differ.get_interesting_lines('header', True),
+        )
@@ -0,0 +1,256 @@
+"""Unit tests for reviewboard.diffviewer.patcher."""
+
+from __future__ import unicode_literals
+
+from reviewboard.diffviewer.errors import PatchError
+from reviewboard.diffviewer.patcher import apply_patch, parse_hunks
+from reviewboard.testing import TestCase
+
+
+class ParseHunksTests(TestCase):
+    """Unit tests for reviewboard.diffviewer.patcher.parse_hunks."""
+
+    def test_with_headers(self):
+        """Testing parse_hunks skips file headers"""
+        hunks = parse_hunks(
+            b'diff --git a/README b/README\n'
+            b'index 94bdd3e..197009f 100644\n'
+            b'--- README\n'
+            b'+++ README\n'
+            b'@@ -2 +2,2 @@ header\n'
+            b'-foo\n'
+            b'+bar\n'
+            b'+baz\n')
+
+        self.assertEqual(len(hunks), 1)
+
+        hunk = hunks[0]
+        self.assertEqual(hunk.orig_start, 2)
+        self.assertEqual(hunk.orig_len, 1)
+        self.assertEqual(hunk.new_start, 2)
+        self.assertEqual(hunk.new_len, 2)
+        self.assertEqual(hunk.lines,
+                         [(b'-', b'foo\n'),
+                          (b'+', b'bar\n'),
+                          (b'+', b'baz\n')])
+
+    def test_with_no_newline_marker(self):
+        """Testing parse_hunks with "No newline at end of file" markers"""
+        hunks = parse_hunks(
+            b'--- README\n'
+            b'+++ README\n'
+            b'@@ -1 +1 @@\n'
+            b'-foo\n'
+            b'\\ No newline at end of file\n'
+            b'+foo\n')
+
+        self.assertEqual(len(hunks), 1)
+        self.assertEqual(hunks[0].lines,
+                         [(b'-', b'foo'),
+                          (b'+', b'foo\n')])
+
+    def test_with_stripped_context(self):
+        """Testing parse_hunks with empty context lines lacking a space"""
+        hunks = parse_hunks(
+            b'@@ -1,3 +1,3 @@\n'
+            b' foo\n'
+            b'\n'
+            b'-bar\n'
+            b'+baz\n')
+
+        self.assertEqual(len(hunks), 1)
+        self.assertEqual(hunks[0].lines,
+                         [(b' ', b'foo\n'),
+                          (b' ', b'\n'),
+                          (b'-', b'bar\n'),
+                          (b'+', b'baz\n')])
+
+
+class ApplyPatchTests(TestCase):
+    """Unit tests for reviewboard.diffviewer.patcher.apply_patch."""
+
+    orig_file = b''.join(
+        b'line %d\n' % i
+        for i in range(1, 21)
+    )
+
+    def test_apply(self):
+        """Testing apply_patch"""
+        diff = (
+            b'--- file\n'
+            b'+++ file\n'
+            b'@@ -2,5 +2,5 @@\n'
+            b' line 2\n'
+            b' line 3\n'
+            b'-line 4\n'
+            b'+line four\n'
+            b' line 5\n'
+            b' line 6\n'
+            b'@@ -17,4 +17,5 @@\n'
+            b' line 17\n'
+            b' line 18\n'
+            b' line 19\n'
+            b'+line 19.5\n'
+            b' line 20\n'
+        )
+
+        self.assertEqual(
+            apply_patch(diff=diff,
+                        orig_file=self.orig_file,
+                        filename='file'),
+            self.orig_file
+            .replace(b'line 4\n', b'line four\n')
+            .replace(b'line 20\n', b'line 19.5\nline 20\n'))
+
+    def test_apply_with_offset(self):
+        """Testing apply_patch with a hunk applying at an offset"""
+        diff = (
+            b'--- file\n'
+            b'+++ file\n'
+            b'@@ -5,3 +5,3 @@\n'
+            b' line 10\n'
+            b'-line 11\n'
+            b'+line eleven\n'
+            b' line 12\n'
+        )
+
+        self.assertEqual(
+            apply_patch(diff=diff,
+                        orig_file=self.orig_file,
+                        filename='file'),
+            self.orig_file.replace(b'line 11\n', b'line eleven\n'))
+
+    def test_apply_with_negative_offset(self):
+        """Testing apply_patch with a hunk applying before its expected
+        position
+        """
+        diff = (
+            b'--- file\n'
+            b'+++ file\n'
+            b'@@ -15,3 +15,3 @@\n'
+            b' line 3\n'
+            b'-line 4\n'
+            b'+line four\n'
+            b' line 5\n'
+        )
+
+        self.assertEqual(
+            apply_patch(diff=diff,
+                        orig_file=self.orig_file,
+                        filename='file'),
+            self.orig_file.replace(b'line 4\n', b'line four\n'))
+
+    def test_apply_with_fuzz(self):
+        """Testing apply_patch with a hunk requiring fuzz"""
+        diff = (
+            b'--- file\n'
+            b'+++ file\n'
+            b'@@ -9,5 +9,5 @@\n'
+            b' line nine\n'
+            b' line 10\n'
+            b'-line 11\n'
+            b'+line eleven\n'
+            b' line 12\n'
+            b' line 13\n'
+        )
+
+        self.assertEqual(
+            apply_patch(diff=diff,
+                        orig_file=self.orig_file,
+                        filename='file'),
+            self.orig_file.replace(b'line 11\n', b'line eleven\n'))
+
+    def test_apply_new_file(self):
+        """Testing apply_patch with a diff creating a new file"""
+        diff = (
+            b'--- /dev/null\n'
+            b'+++ file\n'
+            b'@@ -0,0 +1,2 @@\n'
+            b'+foo\n'
+            b'+bar\n'
+        )
+
+        self.assertEqual(
+            apply_patch(diff=diff,
+                        orig_file=b'',
+                        filename='file'),
+            b'foo\nbar\n')
+
+    def test_apply_with_no_newline(self):
+        """Testing apply_patch with a file lacking a trailing newline"""
+        diff = (
+            b'--- file\n'
+            b'+++ file\n'
+            b'@@ -1,2 +1,2 @@\n'
+            b' foo\n'
+            b'-bar\n'
+            b'\\ No newline at end of file\n'
+            b'+baz\n'
+            b'\\ No newline at end of file\n'
+        )
+
+        self.assertEqual(
+            apply_patch(diff=diff,
+                        orig_file=b'foo\nbar',
+                        filename='file'),
+            b'foo\nbaz')
+
+    def test_apply_with_rejects(self):
+        """Testing apply_patch with a hunk that doesn't apply"""
+        diff = (
+            b'--- file\n'
+            b'+++ file\n'
+            b'@@ -2,3 +2,3 @@\n'
+            b' line 2\n'
+            b'-line 3\n'
+            b'+line three\n'
+            b' line 4\n'
+            b'@@ -10,3 +10,3 @@\n'
+            b' line 10\n'
+            b'-line 999\n'
+            b'+line eleven\n'
+            b' line 12\n'
+        )
+
+        with self.assertRaises(PatchError) as cm:
+            apply_patch(diff=diff,
+                        orig_file=self.orig_file,
+                        filename='/path/to/file')
+
+        e = cm.exception
+        self.assertEqual(
+            e.error_output,
+            'patching file file\n'
+            'Hunk #2 FAILED at 10.\n'
+            '1 out of 2 hunks FAILED -- saving rejects to file file.rej')
+        self.assertEqual(
+            e.rejects,
+            b'--- file\n'
+            b'+++ file\n'
+            b'@@ -10,3 +10,3 @@\n'
+            b' line 10\n'
+            b'-line 999\n'
+            b'+line eleven\n'
+            b' line 12\n')
+        self.assertEqual(
+            e.new_file,
+            self.orig_file.replace(b'line 3\n', b'line three\n'))
+
+    def test_apply_with_truncated_hunk(self):
+        """Testing apply_patch with a truncated hunk"""
+        diff = (
+            b'--- file\n'
+            b'+++ file\n'
+            b'@@ -2,3 +2,3 @@\n'
+            b' line 2\n'
+            b'-line 3\n'
+        )
+
+        with self.assertRaises(PatchError) as cm:
+            apply_patch(diff=diff,
+                        orig_file=self.orig_file,
+                        filename='file')
+
+        self.assertTrue(
+            cm.exception.error_output.startswith(
+                'patch: **** malformed patch'))
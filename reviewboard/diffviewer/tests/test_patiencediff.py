@@ -0,0 +1,61 @@
+from __future__ import unicode_literals
+
+from reviewboard.diffviewer.differ import DiffCompatVersion
+from reviewboard.diffviewer.patiencediff import PatienceDiffer
+from reviewboard.testing import TestCase
+
+
+class PatienceDifferTests(TestCase):
+    """Unit tests for PatienceDiffer."""
+
+    def test_equals(self):
+        """Testing PatienceDiffer with equal chunk"""
+        self._test_diff(['1', '2', '3'],
+                        ['1', '2', '3'],
+                        [('equal', 0, 3, 0, 3)])
+
+    def test_delete(self):
+        """Testing PatienceDiffer with delete chunk"""
+        self._test_diff(['1', '2', '3'],
+                        [],
+                        [('delete', 0, 3, 0, 0)])
+
+    def test_insert(self):
+        """Testing PatienceDiffer with insert chunk"""
+        self._test_diff([],
+                        ['1', '2', '3'],
+                        [('insert', 0, 0, 0, 3)])
+
+    def test_unique_anchors(self):
+        """Testing PatienceDiffer matches lines unique to both files"""
+        self._test_diff(['a', 'x', 'b', 'x', 'c'],
+                        ['a', 'b', 'x', 'x', 'c'],
+                        [('equal', 0, 1, 0, 1),
+                         ('insert', 1, 1, 1, 2),
+                         ('equal', 1, 2, 2, 3),
+                         ('delete', 2, 3, 3, 3),
+                         ('equal', 3, 5, 3, 5)])
+
+    def test_moved_function(self):
+        """Testing PatienceDiffer with reordered functions"""
+        self._test_diff(['def foo():', '    return 1', '',
+                         'def bar():', '    return 2', ''],
+                        ['def bar():', '    return 2', '',
+                         'def foo():', '    return 1', ''],
+                        [('insert', 0, 0, 0, 3),
+                         ('equal', 0, 2, 3, 5),
+                         ('delete', 2, 5, 5, 5),
+                         ('equal', 5, 6, 5, 6)])
+
+    def test_without_unique_lines(self):
+        """Testing PatienceDiffer falls back on Myers without unique lines"""
+        self._test_diff(['x', 'y', 'x', 'y'],
+                        ['y', 'x', 'y', 'x'],
+                        [('delete', 0, 1, 0, 0),
+                         ('equal', 1, 4, 0, 3),
+                         ('insert', 4, 4, 3, 4)])
+
+    def _test_diff(self, a, b, expected):
+        differ = PatienceDiffer(a, b,
+                                compat_version=DiffCompatVersion.PATIENCE)
+        self.assertEqual(list(differ.get_opcodes()), expected)
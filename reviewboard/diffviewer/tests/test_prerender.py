@@ -0,0 +1,244 @@
+from __future__ import unicode_literals
+
+import multiprocessing
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.db import transaction
+from djblets.siteconfig.models import SiteConfiguration
+from kgb import SpyAgency
+
+from reviewboard.changedescs.models import ChangeDescription
+from reviewboard.diffviewer.chunk_generator import (DiffChunkGenerator,
+                                                    get_diff_chunk_generator)
+from reviewboard.diffviewer.models import DiffSet
+from reviewboard.diffviewer.prerender import (BasePrerenderBackend,
+                                              _init_pool_worker,
+                                              prerender_backend_registry,
+                                              prerender_diffset,
+                                              queue_prerender_diffset)
+from reviewboard.diffviewer.signal_handlers import \
+    on_review_request_published
+from reviewboard.testing import TestCase
+
+
+def _get_worker_cache_ids():
+    """Return the IDs of the cache backends used in a pool worker.
+
+    Returns:
+        tuple:
+        A 2-tuple of the ID of the default cache backend, and the IDs of the
+        backends inherited from the parent process.
+    """
+    from reviewboard.diffviewer import prerender
+
+    return (id(caches[DEFAULT_CACHE_ALIAS]),
+            [id(cache_backend)
+             for cache_backend in prerender._inherited_caches])
+
+
+class DummyPrerenderBackend(BasePrerenderBackend):
+    """A pre-rendering backend that records the queued DiffSets."""
+
+    backend_id = 'dummy'
+    name = 'Dummy'
+
+    def __init__(self):
+        self.queued_diffset_ids = []
+
+    def queue_diffset(self, diffset_id):
+        self.queued_diffset_ids.append(diffset_id)
+
+
+class PrerenderDiffSetTests(SpyAgency, TestCase):
+    """Unit tests for prerender_diffset."""
+
+    fixtures = ['test_scmtools']
+
+    def test_prerender_diffset(self):
+        """Testing prerender_diffset caches chunks for each file"""
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        filediff = self.create_filediff(diffset=diffset)
+
+        self.assertEqual(prerender_diffset(diffset.pk), 1)
+
+        siteconfig = SiteConfiguration.objects.get_current()
+        generator = get_diff_chunk_generator(
+            None, filediff,
+            enable_syntax_highlighting=siteconfig.get(
+                'diffviewer_syntax_highlighting'))
+        self.spy_on(generator.get_chunks_uncached)
+
+        self.assertEqual(len(list(generator.get_chunks())), 1)
+        self.assertFalse(generator.get_chunks_uncached.called)
+
+    def test_prerender_diffset_with_error(self):
+        """Testing prerender_diffset skips files that fail to render"""
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        self.create_filediff(diffset=diffset)
+
+        def _get_chunks_uncached(*args, **kwargs):
+            raise Exception('Oh no')
+
+        self.spy_on(DiffChunkGenerator.get_chunks_uncached,
+                    owner=DiffChunkGenerator,
+                    call_fake=_get_chunks_uncached)
+
+        self.assertEqual(prerender_diffset(diffset.pk), 0)
+
+    def test_prerender_diffset_with_missing_diffset(self):
+        """Testing prerender_diffset with a missing DiffSet"""
+        self.assertEqual(prerender_diffset(12345), 0)
+
+
+class QueuePrerenderDiffSetTests(SpyAgency, TestCase):
+    """Unit tests for queueing DiffSets for pre-rendering."""
+
+    fixtures = ['test_users', 'test_scmtools']
+
+    def setUp(self):
+        super(QueuePrerenderDiffSetTests, self).setUp()
+
+        self.backend = DummyPrerenderBackend()
+        prerender_backend_registry.register(self.backend)
+
+        # Test cases run inside a transaction that's never committed, so
+        # run on-commit callbacks immediately.
+        self.spy_on(transaction.on_commit,
+                    call_fake=lambda func, using=None: func())
+
+    def tearDown(self):
+        prerender_backend_registry.unregister(self.backend)
+
+        super(QueuePrerenderDiffSetTests, self).tearDown()
+
+    def test_queue_prerender_diffset(self):
+        """Testing queue_prerender_diffset with a backend configured"""
+        diffset = self.create_diffset(
+            repository=self.create_repository(tool_name='Test'))
+
+        with self.siteconfig_settings({
+                'diffviewer_prerender_backend_id': 'dummy',
+            }):
+            queue_prerender_diffset(diffset)
+
+        self.assertEqual(self.backend.queued_diffset_ids, [diffset.pk])
+
+    def test_queue_prerender_diffset_disabled(self):
+        """Testing queue_prerender_diffset is disabled by default"""
+        diffset = self.create_diffset(
+            repository=self.create_repository(tool_name='Test'))
+
+        queue_prerender_diffset(diffset)
+
+        self.assertEqual(self.backend.queued_diffset_ids, [])
+
+    def test_queue_prerender_diffset_with_unregistered_backend(self):
+        """Testing queue_prerender_diffset with an unregistered backend"""
+        diffset = self.create_diffset(
+            repository=self.create_repository(tool_name='Test'))
+
+        with self.siteconfig_settings({
+                'diffviewer_prerender_backend_id': 'missing',
+            }):
+            queue_prerender_diffset(diffset)
+
+        self.assertEqual(self.backend.queued_diffset_ids, [])
+
+    def test_create_from_data(self):
+        """Testing DiffSetManager.create_from_data queues pre-rendering"""
+        repository = self.create_repository(tool_name='Test')
+
+        self.spy_on(repository.get_file_exists,
+                    call_fake=lambda *args, **kwargs: True)
+
+        with self.siteconfig_settings({
+                'diffviewer_prerender_backend_id': 'dummy',
+            }):
+            diffset = DiffSet.objects.create_from_data(
+                repository=repository,
+                diff_file_name='diff',
+                diff_file_contents=self.DEFAULT_GIT_FILEDIFF_DATA_DIFF,
+                basedir='/')
+
+        self.assertEqual(self.backend.queued_diffset_ids, [diffset.pk])
+
+    def test_create_from_data_with_validate_only(self):
+        """Testing DiffSetManager.create_from_data with validate_only=True
+        does not queue pre-rendering
+        """
+        repository = self.create_repository(tool_name='Test')
+
+        self.spy_on(repository.get_file_exists,
+                    call_fake=lambda *args, **kwargs: True)
+
+        with self.siteconfig_settings({
+                'diffviewer_prerender_backend_id': 'dummy',
+            }):
+            DiffSet.objects.create_from_data(
+                repository=repository,
+                diff_file_name='diff',
+                diff_file_contents=self.DEFAULT_GIT_FILEDIFF_DATA_DIFF,
+                basedir='/',
+                validate_only=True)
+
+        self.assertEqual(self.backend.queued_diffset_ids, [])
+
+    def test_review_request_published_with_new_diff(self):
+        """Testing review_request_published handler queues pre-rendering
+        for a new diff
+        """
+        review_request = self.create_review_request(create_repository=True)
+        diffset = self.create_diffset(review_request)
+        changedesc = ChangeDescription()
+        changedesc.record_field_change('diff', None, None, [])
+
+        with self.siteconfig_settings({
+                'diffviewer_prerender_backend_id': 'dummy',
+            }):
+            on_review_request_published(review_request=review_request,
+                                        changedesc=changedesc)
+
+        self.assertEqual(self.backend.queued_diffset_ids, [diffset.pk])
+
+    def test_review_request_published_without_new_diff(self):
+        """Testing review_request_published handler does not queue
+        pre-rendering when the diff didn't change
+        """
+        review_request = self.create_review_request(create_repository=True)
+        self.create_diffset(review_request)
+        changedesc = ChangeDescription()
+        changedesc.record_field_change('summary', 'Old', 'New')
+
+        with self.siteconfig_settings({
+                'diffviewer_prerender_backend_id': 'dummy',
+            }):
+            on_review_request_published(review_request=review_request,
+                                        changedesc=changedesc)
+
+        self.assertEqual(self.backend.queued_diffset_ids, [])
+
+
+class ProcessPoolPrerenderBackendTests(TestCase):
+    """Unit tests for ProcessPoolPrerenderBackend workers."""
+
+    def test_forked_worker_caches(self):
+        """Testing ProcessPoolPrerenderBackend forked workers don't reuse the
+        parent's cache backends
+        """
+        if hasattr(multiprocessing, 'get_context'):
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing
+
+        parent_cache_id = id(caches[DEFAULT_CACHE_ALIAS])
+
+        pool = context.Pool(processes=1, initializer=_init_pool_worker)
+        self.addCleanup(pool.terminate)
+
+        cache_id, inherited_cache_ids = \
+            pool.apply(_get_worker_cache_ids)
+
+        self.assertNotEqual(cache_id, parent_cache_id)
+        self.assertIn(parent_cache_id, inherited_cache_ids)
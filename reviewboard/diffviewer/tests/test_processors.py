@@ -1,6 +1,7 @@
 from __future__ import unicode_literals
 
 from reviewboard.diffviewer.processors import (filter_interdiff_opcodes,
+                                               get_interdiff_ranges,
                                                post_process_filtered_equals)
 from reviewboard.testing import TestCase
 
@@ -250,6 +251,40 @@ class FilterInterdiffOpcodesTests(TestCase):
         ])
         self._sanity_check_opcodes(new_opcodes)
 
+    def test_filter_interdiff_opcodes_with_interdiff_ranges(self):
+        """Testing filter_interdiff_opcodes with pre-computed interdiff_ranges
+        """
+        opcodes = [
+            ('insert', 0, 0, 0, 1),
+            ('equal', 0, 5, 1, 6),
+            ('delete', 5, 10, 6, 6),
+            ('equal', 10, 25, 6, 21),
+            ('replace', 25, 26, 21, 22),
+            ('equal', 26, 40, 22, 36),
+            ('insert', 40, 40, 36, 46),
+        ]
+        self._sanity_check_opcodes(opcodes)
+
+        orig_diff = self._build_dummy_diff_data(22, 10, 22, 10)
+        new_diff = b''.join([
+            self._build_dummy_diff_data(2, 14, 2, 9),
+            self._build_dummy_diff_data(22, 10, 22, 10),
+        ])
+
+        interdiff_ranges = get_interdiff_ranges(orig_diff, new_diff)
+        self.assertEqual(interdiff_ranges,
+                         ([(23, 27)], [(3, 6), (23, 27)]))
+
+        # The diff data should not be needed when ranges are provided.
+        new_opcodes = list(filter_interdiff_opcodes(
+            opcodes, None, None,
+            interdiff_ranges=interdiff_ranges))
+
+        self.assertEqual(
+            new_opcodes,
+            list(filter_interdiff_opcodes(opcodes, orig_diff, new_diff)))
+        self._sanity_check_opcodes(new_opcodes)
+
     def _sanity_check_opcodes(self, opcodes):
         prev_i2 = None
         prev_j2 = None
@@ -1,10 +1,17 @@
 from __future__ import unicode_literals
 
+import pygments
+from django.core.cache import cache
+from djblets.cache.backend import make_cache_key
+from djblets.siteconfig.models import SiteConfiguration
+from kgb import SpyAgency
+
+from reviewboard.admin.cache_stats import get_cache_counter_stats
 from reviewboard.diffviewer.chunk_generator import RawDiffChunkGenerator
 from reviewboard.testing import TestCase
 
 
-class RawDiffChunkGeneratorTests(TestCase):
+class RawDiffChunkGeneratorTests(SpyAgency, TestCase):
     """Unit tests for RawDiffChunkGenerator."""
 
     @property
@@ -143,6 +150,82 @@ class RawDiffChunkGeneratorTests(TestCase):
                 'numlines': 1,
             })
 
+    def test_get_chunks_with_cache_key(self):
+        """Testing RawDiffChunkGenerator.get_chunks with cache_key stores
+        chunks in segments
+        """
+        generator = self._create_segmented_generator()
+        chunks = list(generator.get_chunks(cache_key='test-chunks'))
+
+        self.assertEqual(
+            chunks,
+            list(self._create_segmented_generator().get_chunks_uncached()))
+
+        chunks_info = generator.get_cached_chunks_info('test-chunks')
+        self.assertEqual(chunks_info['num_chunks'], len(chunks))
+        self.assertEqual(chunks_info['num_segments'], 5)
+        self.assertEqual(chunks_info['line_counts'], {
+            'equal': 59,
+            'replace': 4,
+            'insert': 0,
+            'delete': 0,
+        })
+        self.assertEqual(
+            chunks_info['changed_chunk_indexes'],
+            [
+                i
+                for i, chunk in enumerate(chunks)
+                if chunk['change'] != 'equal'
+            ])
+        self.assertEqual(chunks_info['whitespace_chunk_indexes'], [])
+
+        # Now read them back from the cache.
+        generator = self._create_segmented_generator()
+        self.spy_on(generator.get_chunks_uncached)
+
+        self.assertEqual(list(generator.get_chunks(cache_key='test-chunks')),
+                         chunks)
+        self.assertFalse(generator.get_chunks_uncached.called)
+
+    def test_chunks_info(self):
+        """Testing RawDiffChunkGenerator.chunks_info describes the chunks
+        before they're generated
+        """
+        generator = self._create_segmented_generator()
+        chunks_iter = generator.get_chunks_uncached()
+        next(chunks_iter)
+
+        chunks_info = generator.chunks_info
+        chunks = list(self._create_segmented_generator().get_chunks(
+            cache_key='test-chunks'))
+
+        self.assertEqual(chunks_info['num_chunks'], len(chunks))
+        self.assertEqual(
+            dict(chunks_info, num_segments=5),
+            generator.get_cached_chunks_info('test-chunks'))
+
+    def test_get_chunks_with_cache_key_and_missing_segment(self):
+        """Testing RawDiffChunkGenerator.get_chunks with cache_key and a
+        segment missing from the cache
+        """
+        generator = self._create_segmented_generator()
+        chunks = list(generator.get_chunks(cache_key='test-chunks'))
+
+        cache.delete(make_cache_key('test-chunks-segment-2'))
+
+        generator = self._create_segmented_generator()
+        self.spy_on(generator.get_chunks_uncached)
+
+        self.assertEqual(list(generator.get_chunks(cache_key='test-chunks')),
+                         chunks)
+        self.assertTrue(generator.get_chunks_uncached.called)
+
+    def test_get_cached_chunks_info_with_uncached(self):
+        """Testing RawDiffChunkGenerator.get_cached_chunks_info with chunks
+        not in the cache
+        """
+        self.assertIsNone(self.generator.get_cached_chunks_info('test-chunks'))
+
     def test_get_chunks_with_enable_syntax_highlighting_true(self):
         """Testing RawDiffChunkGenerator.get_chunks with
         enable_syntax_highlighting=True and syntax highlighting
@@ -276,6 +359,40 @@ class RawDiffChunkGeneratorTests(TestCase):
             }
         )
 
+    def test_get_line_changed_regions(self):
+        """Testing RawDiffChunkGenerator.get_line_changed_regions uses the
+        diffviewer_intraline_diff_algorithm setting by default
+        """
+        with self.siteconfig_settings(
+                {'diffviewer_intraline_diff_algorithm': 'tokens'},
+                reload_settings=False):
+            generator = RawDiffChunkGenerator(old=[],
+                                              new=[],
+                                              orig_filename='file1',
+                                              modified_filename='file2')
+
+        self.assertEqual(generator.intraline_diff_algorithm, 'tokens')
+        self.assertEqual(
+            generator.get_line_changed_regions(1, 'This is **bold**',
+                                               1, 'This is *italic*'),
+            ([(9, 15)], [(9, 15)]))
+
+    def test_get_line_changed_regions_with_intraline_diff_algorithm(self):
+        """Testing RawDiffChunkGenerator.get_line_changed_regions with
+        intraline_diff_algorithm=
+        """
+        generator = RawDiffChunkGenerator(
+            old=[],
+            new=[],
+            orig_filename='file1',
+            modified_filename='file2',
+            intraline_diff_algorithm='characters')
+
+        self.assertEqual(
+            generator.get_line_changed_regions(1, 'This is **bold**',
+                                               1, 'This is *italic*'),
+            ([(9, 16)], [(9, 16)]))
+
     def test_generate_chunks_with_encodings(self):
         """Testing RawDiffChunkGenerator.generate_chunks with explicit
         encodings for old and new
@@ -448,6 +565,173 @@ class RawDiffChunkGeneratorTests(TestCase):
             chunk_generator._apply_pygments(data='This is **bold**',
                                             filename='test.md'))
 
+    def test_apply_pygments_caches_lines(self):
+        """Testing RawDiffChunkGenerator._apply_pygments caches highlighted
+        lines across generators
+        """
+        self.spy_on(pygments.highlight)
+
+        for i in range(2):
+            chunk_generator = RawDiffChunkGenerator(old=[],
+                                                    new=[],
+                                                    orig_filename='file1',
+                                                    modified_filename='file2')
+            self.assertEqual(
+                chunk_generator._apply_pygments(data='This is **bold**\n',
+                                                filename='test.md'),
+                ['This is <span class="gs">**bold**</span>'])
+
+        self.assertEqual(len(pygments.highlight.calls), 1)
+
+        label, stats = get_cache_counter_stats()[1]
+        self.assertEqual(label, 'Syntax-highlighted files')
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_apply_pygments_caches_by_content_and_lexer(self):
+        """Testing RawDiffChunkGenerator._apply_pygments caches highlighted
+        lines separately for different content and lexers
+        """
+        self.spy_on(pygments.highlight)
+
+        self.assertEqual(
+            self.generator._apply_pygments(data='This is **bold**\n',
+                                           filename='test.md'),
+            ['This is <span class="gs">**bold**</span>'])
+        self.assertEqual(
+            self.generator._apply_pygments(data='This is *italic*\n',
+                                           filename='test.md'),
+            ['This is <span class="ge">*italic*</span>'])
+        self.assertEqual(
+            self.generator._apply_pygments(data='This is **bold**\n',
+                                           filename='test.py'),
+            ['<span class="n">This</span> <span class="ow">is</span> '
+             '<span class="o">**</span><span class="n">bold</span>'
+             '<span class="o">**</span>'])
+
+        self.assertEqual(len(pygments.highlight.calls), 3)
+
+    def test_apply_pygments_with_use_cache_false(self):
+        """Testing RawDiffChunkGenerator._apply_pygments with
+        use_cache=False
+        """
+        self.spy_on(pygments.highlight)
+
+        for i in range(2):
+            self.assertEqual(
+                self.generator._apply_pygments(data='This is **bold**\n',
+                                               filename='test.md',
+                                               use_cache=False),
+                ['This is <span class="gs">**bold**</span>'])
+
+        self.assertEqual(len(pygments.highlight.calls), 2)
+
+        label, stats = get_cache_counter_stats()[1]
+        self.assertEqual(label, 'Syntax-highlighted files')
+        self.assertEqual(stats['hits'], 0)
+        self.assertEqual(stats['misses'], 0)
+
+    def test_get_chunks_with_syntax_highlighting_max_bytes(self):
+        """Testing RawDiffChunkGenerator.get_chunks with files larger than
+        diffviewer_syntax_highlighting_max_bytes
+        """
+        old = b'This is **bold**'
+        new = b'This is *italic*'
+
+        generator = RawDiffChunkGenerator(old=old,
+                                          new=new,
+                                          orig_filename='file1.md',
+                                          modified_filename='file2.md')
+
+        with self.siteconfig_settings(
+                {'diffviewer_syntax_highlighting_max_bytes': 10},
+                reload_settings=False):
+            chunks = list(generator.get_chunks())
+
+        self.assertEqual(len(chunks), 1)
+
+        lines = chunks[0]['lines']
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0][2], 'This is **bold**')
+        self.assertEqual(lines[0][5], 'This is *italic*')
+
+    def test_get_chunks_with_styled_max_limit_bytes(self):
+        """Testing RawDiffChunkGenerator.get_chunks with files larger than
+        STYLED_MAX_LIMIT_BYTES and diffviewer_syntax_highlighting_max_bytes
+        unset
+        """
+        class MyRawDiffChunkGenerator(RawDiffChunkGenerator):
+            STYLED_MAX_LIMIT_BYTES = 10
+
+        siteconfig = SiteConfiguration.objects.get_current()
+        self.assertNotIn('diffviewer_syntax_highlighting_max_bytes',
+                         siteconfig.settings)
+
+        generator = MyRawDiffChunkGenerator(old=b'This is **bold**',
+                                            new=b'This is *italic*',
+                                            orig_filename='file1.md',
+                                            modified_filename='file2.md')
+        chunks = list(generator.get_chunks())
+
+        self.assertEqual(len(chunks), 1)
+
+        lines = chunks[0]['lines']
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0][2], 'This is **bold**')
+        self.assertEqual(lines[0][5], 'This is *italic*')
+
+    def test_get_chunks_in_ranges(self):
+        """Testing RawDiffChunkGenerator.get_chunks_in_ranges"""
+        old_lines = ['value_%d = %d' % (i, i) for i in range(1, 41)]
+        new_lines = list(old_lines)
+        new_lines[4] = 'value_5 = 500'
+        new_lines[29:31] = ['def func():', '    return 30']
+
+        old = ''.join('%s\n' % line for line in old_lines).encode('utf-8')
+        new = ''.join('%s\n' % line for line in new_lines).encode('utf-8')
+
+        expected_chunks = list(RawDiffChunkGenerator(
+            old=old,
+            new=new,
+            orig_filename='file.py',
+            modified_filename='file.py').get_chunks_uncached())
+
+        generator = RawDiffChunkGenerator(old=old,
+                                          new=new,
+                                          orig_filename='file.py',
+                                          modified_filename='file.py')
+
+        self.spy_on(generator._apply_pygments)
+
+        chunks = generator.get_chunks_in_ranges([(4, 3), (29, 4)])
+
+        # Only the two ranges in each file should have been highlighted,
+        # without storing them in the highlighted file cache.
+        self.assertEqual(len(generator._apply_pygments.calls), 4)
+
+        for call in generator._apply_pygments.calls:
+            self.assertFalse(call.kwargs['use_cache'])
+
+        self.assertEqual(len(chunks), len(expected_chunks))
+
+        rendered_line_nums = set(range(4, 7)) | set(range(29, 33))
+
+        for chunk, expected_chunk in zip(chunks, expected_chunks):
+            lines = chunk.pop('lines')
+            expected_lines = expected_chunk.pop('lines')
+
+            self.assertEqual(chunk, expected_chunk)
+            self.assertEqual(len(lines), len(expected_lines))
+
+            for line, expected_line in zip(lines, expected_lines):
+                if line[0] in rendered_line_nums:
+                    self.assertEqual(line, expected_line)
+                else:
+                    self.assertEqual(
+                        line,
+                        [expected_line[0], expected_line[1], '', [],
+                         expected_line[4], '', [], False])
+
     def test_get_move_info_with_new_range_no_preceding(self):
         """Testing RawDiffChunkGenerator._get_move_info with new move range and
         no adjacent preceding move range
@@ -705,3 +989,26 @@ class RawDiffChunkGeneratorTests(TestCase):
              '|&lt;&mdash;&mdash;&mdash;&mdash;&mdash;&mdash;'
              '</span>        </span> foo', ''))
 
+    def _create_segmented_generator(self):
+        """Return a generator for a file spanning several cache segments.
+
+        Returns:
+            reviewboard.diffviewer.chunk_generator.RawDiffChunkGenerator:
+            The new generator.
+        """
+        old = b''.join(
+            b'Line %d\n' % i
+            for i in range(1, 64)
+        )
+        new = old.replace(b'Line 10\n', b'Line ten\n')
+        new = new.replace(b'Line 30\n', b'Line thirty\n')
+        new = new.replace(b'Line 40\n', b'Line forty\n')
+        new = new.replace(b'Line 60\n', b'Line sixty\n')
+
+        generator = RawDiffChunkGenerator(old=old,
+                                          new=new,
+                                          orig_filename='foo.txt',
+                                          modified_filename='foo.txt')
+        generator.CACHE_SEGMENT_MAX_LINES = 10
+
+        return generator
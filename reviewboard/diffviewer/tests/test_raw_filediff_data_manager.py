@@ -1,7 +1,9 @@
 from __future__ import unicode_literals
 
 import bz2
+import zlib
 
+from reviewboard.diffviewer.compression import ZlibDiffCompressionCodec
 from reviewboard.diffviewer.models import RawFileDiffData
 from reviewboard.testing import TestCase
 
@@ -55,3 +57,164 @@ class RawFileDiffDataManagerTests(TestCase):
 
         self.assertEqual(data, bz2.compress(self.large_diff, 9))
         self.assertEqual(compression, RawFileDiffData.COMPRESSION_BZIP2)
+
+    def test_process_diff_data_with_codec(self):
+        """Testing RawFileDiffDataManager.process_diff_data with codec"""
+        data, compression = RawFileDiffData.objects.process_diff_data(
+            self.large_diff,
+            codec=ZlibDiffCompressionCodec())
+
+        self.assertEqual(data, zlib.compress(self.large_diff, 9))
+        self.assertEqual(compression, RawFileDiffData.COMPRESSION_ZLIB)
+
+    def test_process_diff_data_with_codec_setting(self):
+        """Testing RawFileDiffDataManager.process_diff_data with
+        diffviewer_compression_codec_id setting
+        """
+        with self.siteconfig_settings(
+                {'diffviewer_compression_codec_id': 'Z'},
+                reload_settings=False):
+            data, compression = \
+                RawFileDiffData.objects.process_diff_data(self.large_diff)
+
+        self.assertEqual(data, zlib.compress(self.large_diff, 9))
+        self.assertEqual(compression, RawFileDiffData.COMPRESSION_ZLIB)
+
+    def test_process_diff_data_with_unavailable_codec_setting(self):
+        """Testing RawFileDiffDataManager.process_diff_data with
+        diffviewer_compression_codec_id setting for an unregistered codec
+        falls back on bzip2
+        """
+        with self.siteconfig_settings(
+                {'diffviewer_compression_codec_id': '?'},
+                reload_settings=False):
+            data, compression = \
+                RawFileDiffData.objects.process_diff_data(self.large_diff)
+
+        self.assertEqual(data, bz2.compress(self.large_diff, 9))
+        self.assertEqual(compression, RawFileDiffData.COMPRESSION_BZIP2)
+
+    def test_recompress_all(self):
+        """Testing RawFileDiffDataManager.recompress_all"""
+        raw_diff_data1 = \
+            RawFileDiffData.objects.get_or_create_from_data(self.large_diff)[0]
+        raw_diff_data2 = \
+            RawFileDiffData.objects.get_or_create_from_data(self.small_diff)[0]
+
+        self.assertEqual(raw_diff_data1.compression,
+                         RawFileDiffData.COMPRESSION_BZIP2)
+        self.assertIsNone(raw_diff_data2.compression)
+
+        batches = []
+
+        def _on_batch_done(**kwargs):
+            batches.append(kwargs)
+
+        info = RawFileDiffData.objects.recompress_all(
+            codec=ZlibDiffCompressionCodec(),
+            batch_done_cb=_on_batch_done,
+            batch_size=1)
+
+        self.assertEqual(info['diffs_processed'], 2)
+        self.assertEqual(
+            info['old_diff_size'],
+            len(bz2.compress(self.large_diff, 9)) + len(self.small_diff))
+        self.assertEqual(
+            info['new_diff_size'],
+            (len(zlib.compress(self.large_diff, 9)) +
+             len(zlib.compress(self.small_diff, 9))))
+        self.assertEqual(
+            batches,
+            [
+                {
+                    'total_diffs_processed': 1,
+                    'total_count': 2,
+                },
+                {
+                    'total_diffs_processed': 2,
+                    'total_count': 2,
+                },
+            ])
+
+        raw_diff_data1 = RawFileDiffData.objects.get(pk=raw_diff_data1.pk)
+        self.assertEqual(raw_diff_data1.compression,
+                         RawFileDiffData.COMPRESSION_ZLIB)
+        self.assertEqual(raw_diff_data1.content, self.large_diff)
+
+        # zlib has less overhead than bzip2, so the small diff is now worth
+        # compressing.
+        raw_diff_data2 = RawFileDiffData.objects.get(pk=raw_diff_data2.pk)
+        self.assertEqual(raw_diff_data2.compression,
+                         RawFileDiffData.COMPRESSION_ZLIB)
+        self.assertEqual(raw_diff_data2.content, self.small_diff)
+
+    def test_recompress_all_with_max_diffs(self):
+        """Testing RawFileDiffDataManager.recompress_all with max_diffs"""
+        raw_diff_data1 = \
+            RawFileDiffData.objects.get_or_create_from_data(self.large_diff)[0]
+        raw_diff_data2 = RawFileDiffData.objects.get_or_create_from_data(
+            self.large_diff + b'+blah!\n')[0]
+
+        info = RawFileDiffData.objects.recompress_all(
+            codec=ZlibDiffCompressionCodec(),
+            max_diffs=1)
+
+        self.assertEqual(info['diffs_processed'], 1)
+
+        raw_diff_data1 = RawFileDiffData.objects.get(pk=raw_diff_data1.pk)
+        self.assertEqual(raw_diff_data1.compression,
+                         RawFileDiffData.COMPRESSION_ZLIB)
+
+        raw_diff_data2 = RawFileDiffData.objects.get(pk=raw_diff_data2.pk)
+        self.assertEqual(raw_diff_data2.compression,
+                         RawFileDiffData.COMPRESSION_BZIP2)
+
+    def test_bulk_get_or_create_from_data(self):
+        """Testing RawFileDiffDataManager.bulk_get_or_create_from_data"""
+        existing = RawFileDiffData.objects.get_or_create_from_data(
+            self.small_diff)[0]
+
+        with self.assertNumQueries(6):
+            results = RawFileDiffData.objects.bulk_get_or_create_from_data(
+                [self.large_diff, self.small_diff, self.large_diff],
+                line_counts=[(10, 1), (1, 1), (10, 1)])
+
+        self.assertEqual(RawFileDiffData.objects.count(), 2)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0], results[2])
+        self.assertEqual(results[1], existing)
+
+        new = RawFileDiffData.objects.get(pk=results[0].pk)
+        self.assertEqual(new.content, self.large_diff)
+        self.assertEqual(new.compression, RawFileDiffData.COMPRESSION_BZIP2)
+        self.assertEqual(new.insert_count, 10)
+        self.assertEqual(new.delete_count, 1)
+
+        existing = RawFileDiffData.objects.get(pk=existing.pk)
+        self.assertEqual(existing.insert_count, 1)
+        self.assertEqual(existing.delete_count, 1)
+
+    def test_bulk_get_or_create_from_data_all_existing(self):
+        """Testing RawFileDiffDataManager.bulk_get_or_create_from_data with
+        only existing entries
+        """
+        existing = RawFileDiffData.objects.get_or_create_from_data(
+            self.small_diff)[0]
+        existing.insert_count = 1
+        existing.delete_count = 1
+        existing.save()
+
+        with self.assertNumQueries(1):
+            results = RawFileDiffData.objects.bulk_get_or_create_from_data(
+                [self.small_diff],
+                line_counts=[(1, 1)])
+
+        self.assertEqual(results, [existing])
+
+    def test_bulk_get_or_create_from_data_with_non_bytes(self):
+        """Testing RawFileDiffDataManager.bulk_get_or_create_from_data with
+        non-bytes data
+        """
+        with self.assertRaises(TypeError):
+            RawFileDiffData.objects.bulk_get_or_create_from_data(
+                [self.small_diff, self.small_diff.decode('utf-8')])
@@ -30,7 +30,8 @@ from pygments.lexers import get_lexer_by_name
 from reviewboard.diffviewer.commit_utils import (diff_histories,
                                                  get_base_and_tip_commits)
 from reviewboard.diffviewer.diffutils import (get_diff_files,
-                                              get_enable_highlighting)
+                                              get_enable_highlighting,
+                                              prefetch_diff_files)
 from reviewboard.diffviewer.errors import PatchError, UserVisibleError
 from reviewboard.diffviewer.models import DiffCommit, DiffSet, FileDiff
 from reviewboard.diffviewer.renderers import (get_diff_renderer,
@@ -230,9 +231,11 @@ class DiffViewerView(TemplateView):
                                request=self.request,
                                filename_patterns=filename_patterns,
                                base_commit=base_commit,
-                               tip_commit=tip_commit)
+                               tip_commit=tip_commit,
+                               lazy=True)
 
-        # Break the list of files into pages
+        # Break the list of files into pages. Only the files on the page
+        # being shown will have their information built.
         siteconfig = SiteConfiguration.objects.get_current()
 
         paginator = Paginator(files,
@@ -242,22 +245,35 @@ class DiffViewerView(TemplateView):
         page_num = int(self.request.GET.get('page', 1))
 
         if self.request.GET.get('file', False):
-            file_id = int(self.request.GET['file'])
+            i = files.get_filediff_index(int(self.request.GET['file']))
 
-            for i, f in enumerate(files):
-                if f['filediff'].pk == file_id:
-                    page_num = i // paginator.per_page + 1
-
-                    if page_num > paginator.num_pages:
-                        page_num = paginator.num_pages
-
-                    break
+            if i is not None:
+                page_num = min(i // paginator.per_page + 1,
+                               paginator.num_pages)
 
         try:
             page = paginator.page(page_num)
         except InvalidPage:
             page = paginator.page(paginator.num_pages)
 
+        # The files on this page will be rendered by separate requests.
+        # Start fetching the original files they need in the background, in
+        # parallel, so those requests don't each have to wait on the
+        # repository in turn. This page doesn't wait on the fetches. Any
+        # errors will be shown when those files are rendered.
+        try:
+            prefetch_diff_files(
+                page.object_list,
+                enable_syntax_highlighting=get_enable_highlighting(
+                    self.request.user),
+                request=self.request,
+                wait=False)
+        except Exception as e:
+            logging.exception('Unable to prefetch original files for '
+                              'diffset ID=%s: %s',
+                              diffset.pk, e,
+                              request=self.request)
+
         diff_context = {
             'commits': None,
             'commit_history_diff': None,
@@ -1429,6 +1429,13 @@ class HostingService(object):
     supports_list_remote_repositories = False
     has_repository_hook_instructions = False
 
+    #: Whether many files can be fetched at once more efficiently.
+    #:
+    #: If ``True``, the service implements :py:meth:`get_files` in a way that
+    #: fetches many files at once, and callers fetching many files should
+    #: prefer it over fetching files one at a time.
+    supports_batched_file_fetches = False
+
     #: Whether this service should be shown as an available option.
     #:
     #: This should be set to ``False`` when a service is no longer available
@@ -1698,6 +1705,38 @@ class HostingService(object):
 
         return repository.get_scmtool().get_file(path, revision, **kwargs)
 
+    def get_files(self, repository, files):
+        """Return the contents of several files.
+
+        By default, this fetches each file using :py:meth:`get_file`.
+        Subclasses that can fetch many files at once should override this
+        and set :py:attr:`supports_batched_file_fetches`.
+
+        Args:
+            repository (reviewboard.scmtools.models.Repository):
+                The repository to retrieve the files from.
+
+            files (list of tuple):
+                A list of ``(path, revision, base_commit_id)`` tuples for the
+                files to fetch.
+
+        Returns:
+            list:
+            A list with an entry for each file. Each entry is either the
+            contents of the file (as bytes), or the exception raised when
+            fetching it.
+        """
+        results = []
+
+        for path, revision, base_commit_id in files:
+            try:
+                results.append(self.get_file(repository, path, revision,
+                                             base_commit_id=base_commit_id))
+            except Exception as e:
+                results.append(e)
+
+        return results
+
     def get_file_exists(self, repository, path, revision, *args, **kwargs):
         """Return whether or not the given path exists in the repository.
 
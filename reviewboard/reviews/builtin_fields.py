@@ -893,7 +893,7 @@ class DiffField(ReviewRequestPageDataMixin, BuiltinFieldMixin,
 
         # Fetch the total number of inserts/deletes. These will be shown
         # alongside the diff revision.
-        counts = diffset.get_total_line_counts()
+        counts = diffset.get_total_raw_line_counts()
         raw_insert_count = counts.get('raw_insert_count', 0)
         raw_delete_count = counts.get('raw_delete_count', 0)
 
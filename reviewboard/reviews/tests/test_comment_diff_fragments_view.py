@@ -8,12 +8,14 @@ import struct
 from django.contrib.auth.models import User
 from django.utils import six
 from djblets.testing.decorators import add_fixtures
+from kgb import SpyAgency
 
+from reviewboard.diffviewer.chunk_generator import DiffChunkGenerator
 from reviewboard.site.urlresolvers import local_site_reverse
 from reviewboard.testing import TestCase
 
 
-class CommentDiffFragmentsViewTests(TestCase):
+class CommentDiffFragmentsViewTests(SpyAgency, TestCase):
     """Unit tests for reviewboard.reviews.views.CommentDiffFragmentsView."""
 
     fixtures = ['test_users', 'test_scmtools']
@@ -172,6 +174,56 @@ class CommentDiffFragmentsViewTests(TestCase):
         self.assertTrue(html.endswith('</table>'))
         self.assertIn('ÄËÏÖÜŸ', html)
 
+    def test_get_renders_comment_ranges_once(self):
+        """Testing CommentDiffFragmentsView renders only the lines for all
+        comments on a file in one pass
+        """
+        user = User.objects.create(username='reviewer')
+
+        repository = self.create_repository(tool_name='Test')
+        review_request = self.create_review_request(repository=repository,
+                                                    publish=True)
+        diffset = self.create_diffset(review_request)
+        filediff = self.create_filediff(
+            diffset,
+            source_file='/data:old line',
+            dest_file='/data:new line',
+            diff=(
+                b'diff --git a/data b/data\n'
+                b'index abcd123..abcd124 100644\n'
+                b'--- a/data\n'
+                b'+++ b/data\n'
+                b'@@ -1,1 +1,1 @@\n'
+                b'-old line\n'
+                b'+new line\n'
+            ))
+
+        review = self.create_review(review_request, user=user)
+        comment1 = self.create_diff_comment(review, filediff,
+                                            first_line=1, num_lines=1)
+        comment2 = self.create_diff_comment(review, filediff,
+                                            first_line=1, num_lines=2)
+        review.publish()
+
+        self.spy_on(DiffChunkGenerator.get_chunks_in_ranges,
+                    owner=DiffChunkGenerator)
+        self.spy_on(DiffChunkGenerator.get_chunks,
+                    owner=DiffChunkGenerator)
+
+        fragments = self._get_fragments(review_request,
+                                        [comment1.pk, comment2.pk])
+        self.assertEqual(len(fragments), 2)
+
+        for comment_id, html in fragments:
+            self.assertIn('<span class="hl">old</span> line', html)
+            self.assertIn('<span class="hl">new</span> line', html)
+
+        self.assertFalse(DiffChunkGenerator.get_chunks.called)
+        self.assertEqual(len(DiffChunkGenerator.get_chunks_in_ranges.calls),
+                         1)
+        self.assertTrue(DiffChunkGenerator.get_chunks_in_ranges.called_with(
+            [(1, 1), (1, 2)]))
+
     def test_get_with_valid_comment_ids(self):
         """Testing CommentDiffFragmentsView with valid comment ID"""
         user = User.objects.create_user(username='reviewer',
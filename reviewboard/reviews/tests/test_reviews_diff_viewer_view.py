@@ -2,11 +2,15 @@
 
 from __future__ import unicode_literals
 
+from kgb import SpyAgency
+
+from reviewboard.diffviewer import views as diffviewer_views
+from reviewboard.scmtools.errors import SCMError
 from reviewboard.site.urlresolvers import local_site_reverse
 from reviewboard.testing import TestCase
 
 
-class ReviewsDiffViewerViewTests(TestCase):
+class ReviewsDiffViewerViewTests(SpyAgency, TestCase):
     """Unit tests for reviewboard.reviews.views.ReviewsDiffViewerView."""
 
     fixtures = ['test_users', 'test_scmtools']
@@ -250,6 +254,37 @@ class ReviewsDiffViewerViewTests(TestCase):
         self.assertEqual({file_info['filediff'] for file_info in files},
                          {filediff1, filediff2, filediff3, filediff4})
 
+    def test_with_prefetch_error(self):
+        """Testing ReviewsDiffViewerView with an error prefetching original
+        files
+        """
+        def _prefetch_diff_files(*args, **kwargs):
+            raise SCMError('Connection refused')
+
+        self.spy_on(diffviewer_views.prefetch_diff_files,
+                    call_fake=_prefetch_diff_files)
+
+        review_request = self.create_review_request(create_repository=True,
+                                                    publish=True)
+        diffset = self.create_diffset(review_request)
+        filediff = self.create_filediff(diffset)
+
+        response = self.client.get(
+            local_site_reverse(
+                'view-diff-revision',
+                kwargs={
+                    'review_request_id': review_request.display_id,
+                    'revision': diffset.revision,
+                }))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(diffviewer_views.prefetch_diff_files.called)
+        self.assertFalse(
+            diffviewer_views.prefetch_diff_files.last_call.kwargs['wait'])
+
+        files = response.context['files']
+        self.assertEqual([file_info['filediff'] for file_info in files],
+                         [filediff])
+
     def test_with_filenames_option_normalized(self):
         """Testing ReviewsDiffViewerView with ?filenames=... values normalized
         """
@@ -5,6 +5,7 @@ import json
 import logging
 import re
 import struct
+from collections import defaultdict
 
 import dateutil.parser
 from django.conf import settings
@@ -44,6 +45,7 @@ from reviewboard.attachments.models import (FileAttachment,
                                             get_latest_file_attachments)
 from reviewboard.diffviewer.diffutils import (convert_to_unicode,
                                               get_file_chunks_in_range,
+                                              get_file_from_filediff,
                                               get_filediff_encodings,
                                               get_last_header_before_line,
                                               get_last_line_number_in_diff,
@@ -358,8 +360,25 @@ def build_diff_comment_fragments(
     if lines_of_context is None:
         lines_of_context = [0, 0]
 
+    # Collect the lines needed for all the comments on each file, so that
+    # they can be rendered together, rather than rendering the entire file.
+    file_line_ranges = defaultdict(list)
+
+    for comment in comments:
+        first_line = max(1, comment.first_line - lines_of_context[0])
+        last_line = comment.last_line + lines_of_context[1]
+
+        file_line_ranges[(comment.filediff_id,
+                          comment.interfilediff_id)].append(
+            (first_line, last_line - first_line + 1))
+
     for comment in comments:
         try:
+            get_file_from_filediff(
+                context, comment.filediff, comment.interfilediff,
+                line_ranges=file_line_ranges[(comment.filediff_id,
+                                              comment.interfilediff_id)])
+
             max_line = get_last_line_number_in_diff(context, comment.filediff,
                                                     comment.interfilediff)
 
@@ -38,6 +38,7 @@ class BZRTool(SCMTool):
 
     scmtool_id = 'bazaar'
     name = 'Bazaar'
+    supports_streaming_diffs = True
     dependencies = {
         'executables': ['bzr'],
     }
@@ -32,6 +32,7 @@ _popen_shell = (sys.version_info[:2] == (2, 7) and
 class ClearCaseTool(SCMTool):
     scmtool_id = 'clearcase'
     name = 'ClearCase'
+    supports_streaming_diffs = True
     field_help_text = {
         'path': 'The absolute path to the VOB.',
     }
@@ -508,6 +508,26 @@ class SCMTool(object):
     #: diff formats list absolute paths.
     diffs_use_absolute_paths = False
 
+    #: Whether diffs can be parsed as they're read.
+    #:
+    #: If ``True``, :py:meth:`get_parser` may be passed a
+    #: :py:class:`~reviewboard.diffviewer.parser.DiffLineStream` instead of
+    #: the diff's content when uploading a diff, and the parser it returns
+    #: must support it. This allows very large diffs to be processed without
+    #: loading them into memory all at once.
+    #:
+    #: This should only be set if :py:meth:`get_parser` does not need to
+    #: look through the diff's content itself.
+    supports_streaming_diffs = False
+
+    #: Whether many files can be fetched at once more efficiently.
+    #:
+    #: If ``True``, the SCMTool implements :py:meth:`get_files` in a way that
+    #: fetches many files at once (for instance, in a single command), and
+    #: callers fetching many files should prefer it over fetching files one
+    #: at a time.
+    supports_batched_file_fetches = False
+
     #: Whether this prefers the Mirror Path value for communication.
     #:
     #: This will affect which field the repository configuration form will
@@ -622,6 +642,39 @@ class SCMTool(object):
         """
         raise NotImplementedError
 
+    def get_files(self, files, **kwargs):
+        """Return the contents of several files from a repository.
+
+        By default, this fetches each file using :py:meth:`get_file`.
+        Subclasses that can fetch many files at once should override this
+        and set :py:attr:`supports_batched_file_fetches`.
+
+        Args:
+            files (list of tuple):
+                A list of ``(path, revision, base_commit_id)`` tuples for the
+                files to fetch. See :py:meth:`get_file` for details on each.
+
+            **kwargs (dict):
+                Additional keyword arguments. This is not currently used, but
+                is available for future expansion.
+
+        Returns:
+            list:
+            A list with an entry for each file. Each entry is either the
+            contents of the file (as bytes), or the exception raised when
+            fetching it.
+        """
+        results = []
+
+        for path, revision, base_commit_id in files:
+            try:
+                results.append(self.get_file(path, revision,
+                                             base_commit_id=base_commit_id))
+            except Exception as e:
+                results.append(e)
+
+        return results
+
     def file_exists(self, path, revision=HEAD, base_commit_id=None, **kwargs):
         """Return whether a particular file exists in a repository.
 
@@ -918,7 +971,8 @@ class SCMTool(object):
         return patch
 
     @classmethod
-    def popen(cls, command, local_site_name=None, env={}):
+    def popen(cls, command, local_site_name=None, env={}, stdin=None,
+              stderr=subprocess.PIPE):
         """Launch an application and return its output.
 
         This wraps :py:func:`subprocess.Popen` to provide some common
@@ -936,6 +990,15 @@ class SCMTool(object):
                 Extra environment variables to provide. Each key and value
                 must be byte strings.
 
+            stdin (int or file, optional):
+                The standard input for the process, as accepted by
+                :py:class:`subprocess.Popen`. Pass
+                :py:data:`subprocess.PIPE` to write to the process.
+
+            stderr (int or file, optional):
+                The standard error for the process, as accepted by
+                :py:class:`subprocess.Popen`. This defaults to a pipe.
+
         Returns:
             bytes:
             The combined output (stdout and stderr) from the command.
@@ -955,7 +1018,8 @@ class SCMTool(object):
 
         return subprocess.Popen(command,
                                 env=dict(os.environ, **new_env),
-                                stderr=subprocess.PIPE,
+                                stdin=stdin,
+                                stderr=stderr,
                                 stdout=subprocess.PIPE,
                                 close_fds=(os.name != 'nt'))
 
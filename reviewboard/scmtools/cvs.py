@@ -30,6 +30,7 @@ class CVSTool(SCMTool):
     scmtool_id = 'cvs'
     name = "CVS"
     diffs_use_absolute_paths = True
+    supports_streaming_diffs = True
     field_help_text = {
         'path': 'The CVSROOT used to access the repository.',
     }
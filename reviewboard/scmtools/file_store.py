@@ -0,0 +1,400 @@
+"""A size-bounded, on-disk store for files fetched from repositories.
+
+Files fetched from repositories are cached in the main cache (usually
+memcached), but large files are often evicted from there long before they
+stop being useful, and some repositories take seconds to fetch a file. A
+:py:class:`FileStore` keeps fetched files on a local (or shared) disk as a
+second tier behind the main cache.
+
+Files are stored by the SHA-256 of their contents, so identical files
+fetched through different paths or revisions are only stored once. A
+separate index maps the cache key for each path and revision to the
+contents. When the store grows beyond its maximum size, the least recently
+used files are removed in a background thread.
+
+The store is configured through the ``diffviewer_file_store_path`` and
+``diffviewer_file_store_max_size`` site configuration settings, and is
+fetched through :py:func:`get_file_store`.
+"""
+
+from __future__ import unicode_literals
+
+import errno
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.utils.encoding import force_bytes
+from djblets.siteconfig.models import SiteConfiguration
+
+
+logger = logging.getLogger(__name__)
+
+
+class FileStore(object):
+    """A content-addressed store for files, with least-recently-used eviction.
+
+    Each file's contents are stored in :file:`objects/` under the SHA-256 of
+    the contents, and an entry in :file:`index/` (named by the SHA-256 of
+    the key) contains the SHA-256 of the contents for that key. Reading a
+    file updates the modification times of both, which are used to find the
+    least recently used files when the store needs to shrink.
+
+    All writes are made to temporary files that are then renamed, so any
+    number of threads and processes (including ones on other servers, for
+    a shared filesystem) can use the same store at once.
+
+    Each process keeps track of the size of the files it adds, and
+    periodically re-reads the total size of the store from disk to account
+    for files added or removed by other processes. Reading the size and
+    evicting files both happen in a background thread, so they don't hold
+    up the request that added a file.
+    """
+
+    #: The fraction of the maximum size that eviction shrinks the store to.
+    #:
+    #: This leaves room for new files, so that eviction isn't needed on
+    #: every write once the store is full.
+    EVICTION_TARGET_RATIO = 0.9
+
+    #: How often the total size of the store is read from disk, in seconds.
+    SIZE_CHECK_INTERVAL = 5 * 60
+
+    #: The minimum time between evictions started by a process, in seconds.
+    MIN_EVICTION_INTERVAL = 60
+
+    def __init__(self, path, max_size):
+        """Initialize the store.
+
+        Args:
+            path (unicode):
+                The directory containing the store. This will be created if
+                it doesn't exist.
+
+            max_size (int):
+                The maximum total size of the stored files, in bytes.
+        """
+        self.path = path
+        self.max_size = max_size
+
+        self._objects_path = os.path.join(path, 'objects')
+        self._index_path = os.path.join(path, 'index')
+        self._size = None
+        self._size_checked = None
+        self._last_eviction = None
+        self._maintenance_thread = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return a file from the store.
+
+        Args:
+            key (unicode):
+                The key identifying the file, such as the path and revision.
+
+        Returns:
+            bytes:
+            The contents of the file, or ``None`` if the file isn't in the
+            store.
+        """
+        index_path = self._get_index_path(key)
+
+        try:
+            with open(index_path, 'rb') as fp:
+                content_id = fp.read().decode('ascii')
+        except (IOError, OSError):
+            return None
+
+        object_path = self._get_object_path(content_id)
+
+        try:
+            with open(object_path, 'rb') as fp:
+                data = fp.read()
+        except (IOError, OSError):
+            # The contents were evicted.
+            self._remove(index_path)
+            return None
+
+        if hashlib.sha256(data).hexdigest() != content_id:
+            logger.warning('File store entry %s is corrupt. Removing it.',
+                           object_path)
+            self._remove(object_path)
+            self._remove(index_path)
+            return None
+
+        self._touch(index_path)
+        self._touch(object_path)
+
+        return data
+
+    def set(self, key, data):
+        """Add a file to the store.
+
+        If this makes the store larger than its maximum size, the least
+        recently used files will be evicted in the background.
+
+        Errors writing to the store are logged, rather than raised.
+
+        Args:
+            key (unicode):
+                The key identifying the file, such as the path and revision.
+
+            data (bytes):
+                The contents of the file.
+        """
+        if len(data) > self.max_size:
+            return
+
+        content_id = hashlib.sha256(data).hexdigest()
+        object_path = self._get_object_path(content_id)
+
+        try:
+            if os.path.exists(object_path):
+                self._touch(object_path)
+                added_size = 0
+            else:
+                self._write(object_path, data)
+                added_size = len(data)
+
+            self._write(self._get_index_path(key),
+                        content_id.encode('ascii'))
+        except (IOError, OSError) as e:
+            logger.error('Unable to write to file store %s: %s',
+                         self.path, e)
+            return
+
+        now = time.time()
+
+        with self._lock:
+            if self._size is not None:
+                self._size += added_size
+
+            if (self._maintenance_thread is not None and
+                self._maintenance_thread.is_alive()):
+                return
+
+            check_size = (
+                self._size is None or
+                now - self._size_checked >= self.SIZE_CHECK_INTERVAL)
+            evict = (
+                not check_size and
+                self._size > self.max_size and
+                (self._last_eviction is None or
+                 now - self._last_eviction >= self.MIN_EVICTION_INTERVAL))
+
+            if check_size or evict:
+                self._maintenance_thread = threading.Thread(
+                    target=self._evict)
+                self._maintenance_thread.daemon = True
+                self._maintenance_thread.start()
+
+    def evict(self):
+        """Evict the least recently used files until the store is small enough.
+
+        This happens automatically in the background when adding files to
+        the store, but can be called to shrink a store after lowering its
+        maximum size.
+        """
+        self._evict()
+
+    def _evict(self):
+        """Read the size of the store, and evict files if it's too large.
+
+        If the store is larger than its maximum size, the least recently used
+        files are evicted, shrinking it to :py:attr:`EVICTION_TARGET_RATIO`
+        of its maximum size. Index entries not used since the newest evicted
+        file are removed as well.
+
+        The store is read without holding the lock, so files may be added
+        while this runs. Any not counted will be picked up by the next size
+        check.
+        """
+        objects = []
+        total_size = 0
+
+        for path in self._iter_files(self._objects_path):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+
+            objects.append((st.st_mtime, st.st_size, path))
+            total_size += st.st_size
+
+        evicted = total_size > self.max_size
+
+        if evicted:
+            target_size = int(self.max_size * self.EVICTION_TARGET_RATIO)
+            cutoff = None
+
+            objects.sort()
+
+            for mtime, size, path in objects:
+                if total_size <= target_size:
+                    break
+
+                self._remove(path)
+                total_size -= size
+                cutoff = mtime
+
+            if cutoff is not None:
+                for path in self._iter_files(self._index_path):
+                    try:
+                        if os.path.getmtime(path) <= cutoff:
+                            self._remove(path)
+                    except OSError:
+                        continue
+
+        now = time.time()
+
+        with self._lock:
+            self._size = total_size
+            self._size_checked = now
+
+            if evicted:
+                self._last_eviction = now
+
+    def _get_object_path(self, content_id):
+        """Return the path to the stored contents with the given ID.
+
+        Args:
+            content_id (unicode):
+                The SHA-256 of the contents.
+
+        Returns:
+            unicode:
+            The path to the stored contents.
+        """
+        return os.path.join(self._objects_path, content_id[:2], content_id)
+
+    def _get_index_path(self, key):
+        """Return the path to the index entry for a key.
+
+        Args:
+            key (unicode):
+                The key identifying the file.
+
+        Returns:
+            unicode:
+            The path to the index entry.
+        """
+        key_id = hashlib.sha256(force_bytes(key)).hexdigest()
+
+        return os.path.join(self._index_path, key_id[:2], key_id)
+
+    def _iter_files(self, path):
+        """Iterate through the files in a directory of the store.
+
+        Args:
+            path (unicode):
+                The directory of the store to iterate through.
+
+        Yields:
+            unicode:
+            The path to each file.
+        """
+        for dirpath, dirnames, filenames in os.walk(path):
+            for filename in filenames:
+                if not filename.startswith('.'):
+                    yield os.path.join(dirpath, filename)
+
+    def _write(self, path, data):
+        """Atomically write a file in the store.
+
+        Args:
+            path (unicode):
+                The path to write to.
+
+            data (bytes):
+                The data to write.
+
+        Raises:
+            IOError:
+                The file could not be written.
+
+            OSError:
+                The file or its directory could not be created.
+        """
+        dirname = os.path.dirname(path)
+
+        try:
+            os.makedirs(dirname)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        fd, temp_path = tempfile.mkstemp(dir=dirname, prefix='.tmp')
+
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(data)
+
+            os.rename(temp_path, path)
+        except Exception:
+            self._remove(temp_path)
+            raise
+
+    def _touch(self, path):
+        """Mark a file in the store as recently used.
+
+        Args:
+            path (unicode):
+                The path to the file.
+        """
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def _remove(self, path):
+        """Remove a file from the store, ignoring errors.
+
+        Args:
+            path (unicode):
+                The path to the file.
+        """
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+_file_store = None
+_file_store_lock = threading.Lock()
+
+
+def get_file_store():
+    """Return the file store, if enabled.
+
+    The store is enabled by setting ``diffviewer_file_store_max_size`` (in
+    megabytes) in the site configuration. It's located at
+    ``diffviewer_file_store_path``, or at :file:`file-store` in the site's
+    data directory if not set.
+
+    Returns:
+        FileStore:
+        The file store, or ``None`` if it's disabled.
+    """
+    global _file_store
+
+    siteconfig = SiteConfiguration.objects.get_current()
+    max_size = siteconfig.get('diffviewer_file_store_max_size') or 0
+
+    if max_size <= 0:
+        return None
+
+    path = (siteconfig.get('diffviewer_file_store_path') or
+            os.path.join(settings.SITE_DATA_DIR, 'file-store'))
+    max_size *= 1024 * 1024
+
+    with _file_store_lock:
+        if (_file_store is None or
+            _file_store.path != path or
+            _file_store.max_size != max_size):
+            _file_store = FileStore(path, max_size)
+
+        return _file_store
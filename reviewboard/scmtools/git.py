@@ -6,6 +6,7 @@ import os
 import platform
 import re
 import stat
+import subprocess
 
 from django.utils import six
 from django.utils.encoding import force_bytes
@@ -23,12 +24,16 @@ from reviewboard.scmtools.errors import (FileNotFoundError,
                                          InvalidRevisionFormatError,
                                          RepositoryNotFoundError,
                                          SCMError)
+from reviewboard.scmtools.worker_pool import BaseWorker, get_worker_pool
 from reviewboard.ssh import utils as sshutils
 
 
 GIT_DIFF_EMPTY_CHANGESET_SIZE = 3
 
 
+logger = logging.getLogger(__name__)
+
+
 try:
     import urlparse
     uses_netloc = urlparse.uses_netloc
@@ -71,6 +76,7 @@ class GitTool(SCMTool):
     supports_history = True
     commits_have_committer = True
     supports_raw_file_urls = True
+    supports_streaming_diffs = True
     field_help_text = {
         'path': _('For local Git repositories, this should be the path to a '
                   '.git directory that Review Board can read from. For remote '
@@ -101,6 +107,48 @@ class GitTool(SCMTool):
 
         return self.client.get_file(path, revision)
 
+    @property
+    def supports_batched_file_fetches(self):
+        """Whether many files can be fetched at once.
+
+        This is the case for local repositories, which are read using
+        :command:`git cat-file --batch`.
+        """
+        return not self.client.raw_file_url
+
+    def get_files(self, files, **kwargs):
+        """Return the contents of several files from the repository.
+
+        Args:
+            files (list of tuple):
+                A list of ``(path, revision, base_commit_id)`` tuples for the
+                files to fetch.
+
+            **kwargs (dict, unused):
+                Unused keyword arguments.
+
+        Returns:
+            list:
+            A list with an entry for each file. Each entry is either the
+            contents of the file (as bytes), or the exception raised when
+            fetching it.
+        """
+        results = [b''] * len(files)
+        indexes = [
+            i
+            for i, (path, revision, base_commit_id) in enumerate(files)
+            if revision != PRE_CREATION
+        ]
+        fetched = self.client.get_files([
+            files[i][:2]
+            for i in indexes
+        ])
+
+        for i, result in zip(indexes, fetched):
+            results[i] = result
+
+        return results
+
     def file_exists(self, path, revision=HEAD, **kwargs):
         if revision == PRE_CREATION:
             return False
@@ -296,24 +344,32 @@ class GitDiffParser(DiffParser):
 
         return headers, linenum
 
-    def parse(self):
-        """
-        Parses the diff, returning a list of File objects representing each
-        file in the diff.
+    def iter_files(self):
+        """Parse the diff, yielding each file as it's parsed.
+
+        Yields:
+            reviewboard.diffviewer.parser.ParsedDiffFile:
+            Each file in the diff, after it has been finalized.
+
+        Raises:
+            reviewboard.diffviewer.errors.DiffParserError:
+                There was an error parsing part of the diff.
         """
-        self.files = []
         i = 0
         preamble = io.BytesIO()
+        prev_file = None
 
         while i < len(self.lines):
             next_i, file_info, new_diff = self._parse_diff(i)
 
             if file_info:
-                if self.files:
-                    self.files[-1].append_data(preamble.getvalue())
+                if prev_file is not None:
+                    prev_file.append_data(preamble.getvalue())
                     preamble.close()
                     preamble = io.BytesIO()
-                    self.files[-1].finalize()
+                    prev_file.finalize()
+
+                    yield prev_file
 
                 self._ensure_file_has_required_fields(file_info)
 
@@ -321,7 +377,7 @@ class GitDiffParser(DiffParser):
                 preamble.close()
                 preamble = io.BytesIO()
 
-                self.files.append(file_info)
+                prev_file = file_info
             elif new_diff:
                 # We found a diff, but it was empty and has no file entry.
                 # Reset the preamble.
@@ -332,11 +388,12 @@ class GitDiffParser(DiffParser):
                 preamble.write(b'\n')
 
             i = next_i
+            self._discard_lines_before(i)
 
         try:
-            if self.files:
-                self.files[-1].append_data(preamble.getvalue())
-                self.files[-1].finalize()
+            if prev_file is not None:
+                prev_file.append_data(preamble.getvalue())
+                prev_file.finalize()
             elif preamble.getvalue().strip() != b'':
                 # This is probably not an actual git diff file.
                 raise DiffParserError('This does not appear to be a git diff',
@@ -344,7 +401,8 @@ class GitDiffParser(DiffParser):
         finally:
             preamble.close()
 
-        return self.files
+        if prev_file is not None:
+            yield prev_file
 
     def _parse_diff(self, linenum):
         """Parses out one file from a Git diff
@@ -598,9 +656,192 @@ class GitDiffParser(DiffParser):
                 setattr(file_info, attr, b'')
 
 
+class GitCatFileProcess(BaseWorker):
+    """A long-lived :command:`git cat-file` process.
+
+    This runs :command:`git cat-file --batch` (or ``--batch-check``, if only
+    object types are needed), which reads object names on standard input and
+    writes each object's information (and contents) to standard output. Many
+    objects can be looked up without launching a process for each one.
+    """
+
+    #: The maximum size of object names to write before reading responses.
+    #:
+    #: Writing everything at once could fill the pipe to the process while
+    #: it's blocked writing responses that haven't been read yet.
+    MAX_PENDING_REQUEST_BYTES = 8192
+
+    def __init__(self, git_dir, local_site_name=None, check_only=False):
+        """Initialize the process.
+
+        Args:
+            git_dir (unicode):
+                The path to the Git repository.
+
+            local_site_name (unicode, optional):
+                The name of the Local Site being used, if any.
+
+            check_only (bool, optional):
+                Whether to only look up the types of objects, rather than
+                their contents.
+        """
+        if check_only:
+            batch_arg = '--batch-check'
+        else:
+            batch_arg = '--batch'
+
+        self.check_only = check_only
+        self._broken = False
+
+        with open(os.devnull, 'wb') as devnull:
+            self._process = SCMTool.popen(
+                ['git', '--git-dir=%s' % git_dir, 'cat-file', batch_arg],
+                local_site_name=local_site_name,
+                stdin=subprocess.PIPE,
+                stderr=devnull)
+
+    def is_alive(self):
+        """Return whether the process can still be used.
+
+        Returns:
+            bool:
+            ``True`` if the process is running and in a known state.
+        """
+        return not self._broken and self._process.poll() is None
+
+    def close(self):
+        """Stop the process."""
+        self._broken = True
+
+        try:
+            self._process.stdin.close()
+        except (IOError, OSError):
+            pass
+
+        if self._process.poll() is None:
+            try:
+                self._process.wait()
+            except OSError:
+                pass
+
+        self._process.stdout.close()
+
+    def get_objects(self, object_names):
+        """Look up objects in the repository.
+
+        Args:
+            object_names (list of bytes):
+                The names of the objects, in any form understood by
+                :command:`git cat-file` (such as ``<sha1>`` or
+                ``<commit>:<path>``). These cannot contain newlines.
+
+        Returns:
+            list of tuple:
+            A list with an entry for each object name. Each entry is a tuple
+            of the object type (as bytes) and the contents (as bytes, or
+            ``None`` when only checking objects), or ``None`` if the object
+            doesn't exist or the name is ambiguous.
+
+        Raises:
+            reviewboard.scmtools.errors.SCMError:
+                The process failed while handling the requests. It can't be
+                used any further.
+        """
+        results = []
+        i = 0
+
+        try:
+            while i < len(object_names):
+                # Write as many requests as we safely can, then read their
+                # responses.
+                pending = []
+                pending_size = 0
+
+                while (i < len(object_names) and
+                       (not pending or
+                        pending_size < self.MAX_PENDING_REQUEST_BYTES)):
+                    object_name = object_names[i]
+                    pending.append(object_name)
+                    pending_size += len(object_name) + 1
+                    i += 1
+
+                self._process.stdin.write(b''.join(
+                    object_name + b'\n'
+                    for object_name in pending
+                ))
+                self._process.stdin.flush()
+
+                for object_name in pending:
+                    results.append(self._read_object())
+        except (IOError, OSError) as e:
+            self._broken = True
+
+            raise SCMError('Unable to communicate with git cat-file: %s'
+                           % e)
+        except SCMError:
+            self._broken = True
+            raise
+
+        return results
+
+    def _read_object(self):
+        """Read the response for an object from the process.
+
+        Returns:
+            tuple:
+            The object type and contents, or ``None`` if the object doesn't
+            exist. See :py:meth:`get_objects` for details.
+
+        Raises:
+            reviewboard.scmtools.errors.SCMError:
+                The response could not be read.
+        """
+        stdout = self._process.stdout
+        header = stdout.readline()
+
+        if not header.endswith(b'\n'):
+            raise SCMError('git cat-file exited unexpectedly')
+
+        # The header is either "<sha1> <type> <size>", or "<name> missing"
+        # (or "<name> ambiguous"). The name may contain spaces, so look at
+        # the end of the line.
+        parts = header[:-1].rsplit(b' ', 2)
+
+        if parts[-1] in (b'missing', b'ambiguous'):
+            return None
+
+        if len(parts) != 3 or not parts[2].isdigit():
+            raise SCMError('Unexpected response from git cat-file: %r'
+                           % header)
+
+        obj_type = parts[1]
+
+        if self.check_only:
+            contents = None
+        else:
+            size = int(parts[2])
+            contents = stdout.read(size + 1)
+
+            if len(contents) != size + 1:
+                raise SCMError('git cat-file exited unexpectedly')
+
+            contents = contents[:-1]
+
+        return obj_type, contents
+
+
 class GitClient(SCMClient):
     FULL_SHA1_LENGTH = 40
 
+    #: The maximum number of cat-file processes to keep per repository.
+    #:
+    #: There are separate pools of processes for fetching files and for
+    #: checking whether files exist.
+    CAT_FILE_MAX_PROCESSES = 4
+
+    #: The number of seconds before an idle cat-file process is stopped.
+    CAT_FILE_IDLE_TIMEOUT = 300
+
     schemeless_url_re = re.compile(
         r'^(?P<username>[A-Za-z0-9_\.-]+@)?(?P<hostname>[A-Za-z0-9_\.-]+):'
         r'(?P<path>.*)')
@@ -683,7 +924,43 @@ class GitClient(SCMClient):
             return self.get_file_http(self._build_raw_url(path, revision),
                                       path, revision)
         else:
-            return self._cat_file(path, revision, "blob")
+            result = self._cat_files([(path, revision)])[0]
+
+            if isinstance(result, Exception):
+                raise result
+
+            return result
+
+    def get_files(self, files):
+        """Return the contents of several files.
+
+        For local repositories, the files are all fetched through one
+        :command:`git cat-file --batch` process. Otherwise, they're fetched
+        one at a time.
+
+        Args:
+            files (list of tuple):
+                A list of ``(path, revision)`` tuples for the files to fetch.
+
+        Returns:
+            list:
+            A list with an entry for each file. Each entry is either the
+            contents of the file (as bytes), or the
+            :py:class:`~reviewboard.scmtools.errors.SCMError` raised when
+            fetching it.
+        """
+        if not self.raw_file_url:
+            return self._cat_files(files)
+
+        results = []
+
+        for path, revision in files:
+            try:
+                results.append(self.get_file(path, revision))
+            except SCMError as e:
+                results.append(e)
+
+        return results
 
     def get_file_exists(self, path, revision):
         if self.raw_file_url:
@@ -698,8 +975,12 @@ class GitClient(SCMClient):
             except Exception:
                 return False
         else:
-            contents = self._cat_file(path, revision, '-t')
-            return contents and contents.strip() == b'blob'
+            result = self._cat_files([(path, revision)], check_only=True)[0]
+
+            if isinstance(result, Exception):
+                raise result
+
+            return result
 
     def validate_sha1_format(self, path, sha1):
         """Validates that a SHA1 is of the right length for this repository."""
@@ -717,6 +998,139 @@ class GitClient(SCMClient):
         url = url.replace("<filename>", urlquote(path))
         return url
 
+    def _cat_files(self, files, check_only=False):
+        """Look up several files in a local repository.
+
+        The files are looked up through a long-lived
+        :command:`git cat-file` process shared by all clients for the
+        repository. If that fails, they'll be looked up using
+        :py:meth:`_cat_file` instead.
+
+        Args:
+            files (list of tuple):
+                A list of ``(path, revision)`` tuples for the files.
+
+            check_only (bool, optional):
+                Whether to only check if the files exist, rather than
+                fetching them.
+
+        Returns:
+            list:
+            A list with an entry for each file. Each entry is the result of
+            the lookup (the contents of the file as bytes, or whether it
+            exists if ``check_only`` is ``True``), or the
+            :py:class:`~reviewboard.scmtools.errors.SCMError` raised when
+            looking it up.
+        """
+        results = [None] * len(files)
+        batch_indexes = []
+        batch_object_names = []
+
+        for i, (path, revision) in enumerate(files):
+            try:
+                object_name = force_bytes(self._resolve_head(revision, path))
+            except SCMError as e:
+                results[i] = e
+                continue
+
+            if b'\n' in object_name:
+                # This can't be written to cat-file on a line of its own.
+                results[i] = self._cat_file_result(path, revision,
+                                                   check_only)
+            else:
+                batch_indexes.append(i)
+                batch_object_names.append(object_name)
+
+        if not batch_object_names:
+            return results
+
+        try:
+            with self._get_cat_file_pool(check_only).get_worker() as process:
+                objects = process.get_objects(batch_object_names)
+        except (OSError, SCMError) as e:
+            logger.warning('Unable to look up files using git cat-file '
+                           '--batch in %s. Falling back to running git '
+                           'cat-file for each file: %s',
+                           self.git_dir, e)
+
+            for i in batch_indexes:
+                path, revision = files[i]
+                results[i] = self._cat_file_result(path, revision,
+                                                   check_only)
+
+            return results
+
+        for i, object_name, obj in zip(batch_indexes, batch_object_names,
+                                       objects):
+            path, revision = files[i]
+
+            if obj is None:
+                results[i] = FileNotFoundError(
+                    path, revision=object_name.decode('utf-8', 'replace'))
+            elif check_only:
+                results[i] = (obj[0] == b'blob')
+            elif obj[0] != b'blob':
+                results[i] = SCMError(
+                    'The object "%s" is a %s, not a file.'
+                    % (object_name.decode('utf-8', 'replace'),
+                       obj[0].decode('utf-8')))
+            else:
+                results[i] = obj[1]
+
+        return results
+
+    def _cat_file_result(self, path, revision, check_only):
+        """Look up a file using a new git cat-file process.
+
+        Args:
+            path (unicode):
+                The path to the file.
+
+            revision (unicode):
+                The revision of the file.
+
+            check_only (bool):
+                Whether to only check if the file exists.
+
+        Returns:
+            object:
+            The result of the lookup, or the
+            :py:class:`~reviewboard.scmtools.errors.SCMError` raised. See
+            :py:meth:`_cat_files` for details.
+        """
+        try:
+            if check_only:
+                contents = self._cat_file(path, revision, '-t')
+
+                return contents.strip() == b'blob'
+            else:
+                return self._cat_file(path, revision, 'blob')
+        except SCMError as e:
+            return e
+
+    def _get_cat_file_pool(self, check_only):
+        """Return the pool of cat-file processes for the repository.
+
+        Args:
+            check_only (bool):
+                Whether the processes will only be used to check if files
+                exist.
+
+        Returns:
+            reviewboard.scmtools.worker_pool.WorkerPool:
+            The pool of processes.
+        """
+        git_dir = self.git_dir
+        local_site_name = self.local_site_name
+
+        return get_worker_pool(
+            ('git-cat-file', git_dir, local_site_name, check_only),
+            lambda: GitCatFileProcess(git_dir,
+                                      local_site_name=local_site_name,
+                                      check_only=check_only),
+            max_workers=self.CAT_FILE_MAX_PROCESSES,
+            idle_timeout=self.CAT_FILE_IDLE_TIMEOUT)
+
     def _cat_file(self, path, revision, option):
         """
         Call git-cat-file(1) to get content or type information for a
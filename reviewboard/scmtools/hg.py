@@ -2,19 +2,24 @@ from __future__ import unicode_literals
 
 import json
 import logging
+import os
+import struct
+import subprocess
 from datetime import datetime
 
 from django.utils import six
-from django.utils.encoding import force_text
+from django.utils.encoding import force_bytes, force_text
 from django.utils.six.moves.urllib.parse import quote as urllib_quote, urlparse
 from djblets.util.filesystem import is_exe_in_path
 
-from reviewboard.diffviewer.parser import DiffParser, DiffParserError
+from reviewboard.diffviewer.parser import (DiffLineStream, DiffParser,
+                                           DiffParserError)
 from reviewboard.scmtools.core import (Branch, Commit, FileNotFoundError, HEAD,
                                        PRE_CREATION, SCMClient, SCMTool,
                                        UNKNOWN)
 from reviewboard.scmtools.errors import SCMError
 from reviewboard.scmtools.git import GitDiffParser
+from reviewboard.scmtools.worker_pool import BaseWorker, get_worker_pool
 
 
 class HgTool(SCMTool):
@@ -23,6 +28,7 @@ class HgTool(SCMTool):
     diffs_use_absolute_paths = True
     supports_history = True
     supports_post_commit = True
+    supports_streaming_diffs = True
     dependencies = {
         'executables': ['hg'],
     }
@@ -53,6 +59,42 @@ class HgTool(SCMTool):
             six.text_type(revision),
             base_commit_id=base_commit_id)
 
+    @property
+    def supports_batched_file_fetches(self):
+        """Whether many files can be fetched at once.
+
+        This is the case for local repositories, where the files are all
+        fetched through one Mercurial command server.
+        """
+        return isinstance(self.client, HgClient)
+
+    def get_files(self, files, **kwargs):
+        """Return the contents of several files from the repository.
+
+        Args:
+            files (list of tuple):
+                A list of ``(path, revision, base_commit_id)`` tuples for the
+                files to fetch.
+
+            **kwargs (dict):
+                Additional keyword arguments.
+
+        Returns:
+            list:
+            A list with an entry for each file. Each entry is either the
+            contents of the file (as bytes), or the exception raised when
+            fetching it.
+        """
+        if not self.supports_batched_file_fetches:
+            return super(HgTool, self).get_files(files, **kwargs)
+
+        return self.client.get_files([
+            (path,
+             six.text_type(revision),
+             base_commit_id and six.text_type(base_commit_id))
+            for path, revision, base_commit_id in files
+        ])
+
     def parse_diff_revision(self, filename, revision, *args, **kwargs):
         """Parse and return a filename and revision from a diff.
 
@@ -128,11 +170,24 @@ class HgTool(SCMTool):
         return self.client.get_change(revision)
 
     def get_parser(self, data):
-        hg_position = data.find(b'diff -r')
-        git_position = data.find(b'diff --git')
+        if isinstance(data, DiffLineStream):
+            # Look for the first diff header, without discarding any lines.
+            is_git_diff = False
+
+            for line in data:
+                if line.startswith(b'diff -r'):
+                    break
+                elif line.startswith(b'diff --git'):
+                    is_git_diff = True
+                    break
+        else:
+            hg_position = data.find(b'diff -r')
+            git_position = data.find(b'diff --git')
+
+            is_git_diff = (git_position > -1 and
+                           (git_position < hg_position or hg_position == -1))
 
-        if git_position > -1 and (git_position < hg_position or
-                                  hg_position == -1):
+        if is_git_diff:
             return HgGitDiffParser(data)
         else:
             return HgDiffParser(data)
@@ -322,19 +377,17 @@ class HgGitDiffParser(GitDiffParser):
     be parsed in order to properly locate changes to files in a repository.
     """
 
-    def parse(self):
-        """Parse the diff.
-
-        This will parse the diff, looking for changes to the file.
+    def iter_files(self):
+        """Parse the diff, yielding each file as it's parsed.
 
         It special-cases the default Git diff parsing to check for any
         ``# Node ID`` or ``# Parent`` lines found at the beginning of the
         file, which specify the new commit ID and the base commit ID,
         respectively.
 
-        Returns:
-            list of ParsedDiffFile:
-            The resulting list of files.
+        Yields:
+            reviewboard.diffviewer.parser.ParsedDiffFile:
+            Each file in the diff, after it has been finalized.
 
         Raises:
             reviewboard.diffviewer.errors.DiffParserError:
@@ -355,7 +408,8 @@ class HgGitDiffParser(GitDiffParser):
             elif line.startswith(b'# Parent') and len(split_line) == 3:
                 self.base_commit_id = split_line[2]
 
-        return super(HgGitDiffParser, self).parse()
+        for parsed_file in super(HgGitDiffParser, self).iter_files():
+            yield parsed_file
 
     def get_orig_commit_id(self):
         """Return the commit ID of the original revision for the diff.
@@ -582,39 +636,260 @@ class HgWebClient(SCMClient):
         return json.loads(contents.decode('utf-8'))
 
 
+class HgCommandServer(BaseWorker):
+    """A long-lived Mercurial command server process.
+
+    This runs :command:`hg serve --cmdserver pipe`, which runs commands sent
+    to it over standard input without starting a new :command:`hg` process
+    (and loading Mercurial and its extensions) for each one.
+
+    Messages from the server are sent on channels. Each message starts with
+    a byte identifying the channel and a big-endian 32-bit length, followed
+    by the data (except for input requests, where the length is the amount
+    of input wanted).
+    """
+
+    def __init__(self, args, local_site_name=None):
+        """Start the command server.
+
+        Args:
+            args (list of unicode):
+                Global arguments for :command:`hg`, such as the repository.
+
+            local_site_name (unicode, optional):
+                The name of the Local Site being used, if any.
+
+        Raises:
+            OSError:
+                The process could not be started.
+
+            reviewboard.scmtools.errors.SCMError:
+                The command server isn't supported by this version of
+                Mercurial.
+        """
+        self._broken = False
+
+        with open(os.devnull, 'wb') as devnull:
+            self._process = SCMTool.popen(
+                ['hg'] + args + ['serve', '--cmdserver', 'pipe'],
+                local_site_name=local_site_name,
+                stdin=subprocess.PIPE,
+                stderr=devnull)
+
+        # The server starts by announcing its capabilities.
+        channel, data = self._read_message()
+        capabilities = []
+
+        if channel == b'o':
+            for line in data.splitlines():
+                if line.startswith(b'capabilities:'):
+                    capabilities = line.split(b':', 1)[1].split()
+
+        if b'runcommand' not in capabilities:
+            self.close()
+
+            raise SCMError('The Mercurial command server is not available.')
+
+    def run_command(self, args):
+        """Run a Mercurial command.
+
+        Args:
+            args (list of unicode):
+                The arguments for the command, starting with its name.
+
+        Returns:
+            tuple:
+            A 3-tuple of the command's exit code, standard output (as bytes),
+            and standard error (as bytes).
+
+        Raises:
+            OSError:
+                There was an error communicating with the process.
+
+            reviewboard.scmtools.errors.SCMError:
+                The process sent an unexpected message.
+        """
+        data = b'\0'.join(force_bytes(arg) for arg in args)
+
+        try:
+            self._write(b'runcommand\n' + struct.pack(b'>I', len(data)) +
+                        data)
+
+            output = []
+            errors = []
+
+            while True:
+                channel, data = self._read_message()
+
+                if channel == b'o':
+                    output.append(data)
+                elif channel == b'e':
+                    errors.append(data)
+                elif channel == b'r':
+                    return (struct.unpack(b'>i', data)[0],
+                            b''.join(output),
+                            b''.join(errors))
+                elif channel in (b'I', b'L'):
+                    # Commands shouldn't ask for input, since they're run
+                    # non-interactively. Send an empty response.
+                    self._write(struct.pack(b'>I', 0))
+                elif channel.isupper():
+                    raise SCMError(
+                        'Unexpected message on required Mercurial command '
+                        'server channel "%s"' % force_text(channel))
+        except Exception:
+            # The process may be in the middle of a response, and can't be
+            # used for anything else.
+            self._broken = True
+            raise
+
+    def is_alive(self):
+        """Return whether the process can still be used.
+
+        Returns:
+            bool:
+            ``True`` if the process is running and in a known state.
+        """
+        return not self._broken and self._process.poll() is None
+
+    def close(self):
+        """Stop the process."""
+        self._broken = True
+
+        try:
+            self._process.stdin.close()
+        except (IOError, OSError):
+            pass
+
+        try:
+            self._process.stdout.close()
+        except (IOError, OSError):
+            pass
+
+        self._process.wait()
+
+    def _write(self, data):
+        """Write data to the process.
+
+        Args:
+            data (bytes):
+                The data to write.
+        """
+        stdin = self._process.stdin
+        stdin.write(data)
+        stdin.flush()
+
+    def _read_message(self):
+        """Read a message from the process.
+
+        Returns:
+            tuple:
+            A 2-tuple of the channel (as bytes) and the data (as bytes). For
+            input requests, the data is the amount of input wanted.
+
+        Raises:
+            reviewboard.scmtools.errors.SCMError:
+                The process exited or sent a truncated message.
+        """
+        stdout = self._process.stdout
+        header = stdout.read(5)
+
+        if len(header) != 5:
+            raise SCMError('The Mercurial command server exited '
+                           'unexpectedly.')
+
+        channel = header[:1]
+        length = struct.unpack(b'>I', header[1:])[0]
+
+        if channel in (b'I', b'L'):
+            return channel, length
+
+        data = stdout.read(length)
+
+        if len(data) != length:
+            raise SCMError('The Mercurial command server exited '
+                           'unexpectedly.')
+
+        return channel, data
+
+
 class HgClient(SCMClient):
     COMMITS_PAGE_LIMIT = '31'
 
+    #: The maximum number of command servers to keep per repository.
+    COMMAND_SERVER_MAX_PROCESSES = 4
+
+    #: The number of seconds before an idle command server is stopped.
+    COMMAND_SERVER_IDLE_TIMEOUT = 300
+
     def __init__(self, path, local_site):
         super(HgClient, self).__init__(path)
         self.default_args = None
 
+        #: Whether to run commands through the Mercurial command server.
+        #:
+        #: This is turned off if the command server fails, in which case
+        #: commands will be run in new :command:`hg` processes.
+        self.use_command_server = True
+
         if local_site:
             self.local_site_name = local_site.name
         else:
             self.local_site_name = None
 
     def cat_file(self, path, rev='tip', base_commit_id=None):
-        # If the base commit id is provided it should override anything
-        # that was parsed from the diffs.
-        if rev != PRE_CREATION and base_commit_id is not None:
-            rev = base_commit_id
-
-        if rev == HEAD:
-            rev = "tip"
-        elif rev == PRE_CREATION:
-            rev = ""
+        rev = self._get_cat_rev(rev, base_commit_id)
 
         if path:
-            p = self._run_hg(['cat', '--rev', rev, path])
-            contents = p.stdout.read()
-            failure = p.wait()
+            failure, contents, errors = self._run_hg_command(
+                ['cat', '--rev', rev, path])
 
             if not failure:
                 return contents
 
         raise FileNotFoundError(path, rev)
 
+    def get_files(self, files):
+        """Return the contents of several files.
+
+        The files are all fetched through one command server, rather than
+        checking out a command server (or starting :command:`hg`) for each
+        file.
+
+        Args:
+            files (list of tuple):
+                A list of ``(path, rev, base_commit_id)`` tuples for the files
+                to fetch. See :py:meth:`cat_file` for details on each.
+
+        Returns:
+            list:
+            A list with an entry for each file. Each entry is either the
+            contents of the file (as bytes), or the
+            :py:class:`~reviewboard.scmtools.errors.FileNotFoundError` raised
+            when fetching it.
+        """
+        results = [None] * len(files)
+        commands = []
+        indexes = []
+
+        for i, (path, rev, base_commit_id) in enumerate(files):
+            rev = self._get_cat_rev(rev, base_commit_id)
+
+            if path:
+                commands.append(['cat', '--rev', rev, path])
+                indexes.append(i)
+            else:
+                results[i] = FileNotFoundError(path, rev)
+
+        for i, args, (failure, contents, errors) in \
+                zip(indexes, commands, self._run_hg_commands(commands)):
+            if failure:
+                results[i] = FileNotFoundError(args[-1], args[-2])
+            else:
+                results[i] = contents
+
+        return results
+
     def get_branches(self):
         """Return open/inactive branches from repository in JSON.
 
@@ -622,17 +897,18 @@ class HgClient(SCMClient):
             list of reviewboard.scmtools.core.Branch:
             The list of the branches.
         """
-        p = self._run_hg(['branches', '--template', 'json'])
+        failure, output, errors = self._run_hg_command(
+            ['branches', '--template', 'json'])
 
-        if p.wait() != 0:
-            raise SCMError('Cannot load branches: %s' % p.stderr.read())
+        if failure:
+            raise SCMError('Cannot load branches: %s' % errors)
 
         results = [
             Branch(
                 id=data['branch'],
                 commit=data['node'],
                 default=(data['branch'] == 'default'))
-            for data in json.loads(force_text(p.stdout.read()))
+            for data in json.loads(force_text(output))
             if not data['closed']
         ]
 
@@ -654,14 +930,14 @@ class HgClient(SCMClient):
             The list of commit objects.
         """
         cmd = ['log'] + revset + ['--template', 'json']
-        p = self._run_hg(cmd)
+        failure, output, errors = self._run_hg_command(cmd)
 
-        if p.wait() != 0:
-            raise SCMError('Cannot load commits: %s' % p.stderr.read())
+        if failure:
+            raise SCMError('Cannot load commits: %s' % errors)
 
         results = []
 
-        for data in json.loads(force_text(p.stdout.read())):
+        for data in json.loads(force_text(output)):
             try:
                 parent = data['parents'][0]
             except IndexError:
@@ -724,13 +1000,13 @@ class HgClient(SCMClient):
         if changesets:
             commit = changesets[0]
             cmd = ['diff', '-c', revision]
-            p = self._run_hg(cmd)
+            failure, output, errors = self._run_hg_command(cmd)
 
-            if p.wait() != 0:
-                e = p.stderr.read()
-                raise SCMError('Cannot load patch %s: %s' % (revision, e))
+            if failure:
+                raise SCMError('Cannot load patch %s: %s'
+                               % (revision, errors))
 
-            commit.diff = p.stdout.read()
+            commit.diff = output
             return commit
 
         raise SCMError('Cannot load changeset %s' % revision)
@@ -782,3 +1058,108 @@ class HgClient(SCMClient):
         return SCMTool.popen(
             ['hg'] + self.default_args + args,
             local_site_name=self.local_site_name)
+
+    def _get_cat_rev(self, rev, base_commit_id):
+        """Return the revision to pass to :command:`hg cat` for a file.
+
+        Args:
+            rev (unicode):
+                The revision of the file.
+
+            base_commit_id (unicode):
+                The ID of the commit the file is relative to, if any.
+
+        Returns:
+            unicode:
+            The revision to pass to :command:`hg cat`.
+        """
+        # If the base commit id is provided it should override anything
+        # that was parsed from the diffs.
+        if rev != PRE_CREATION and base_commit_id is not None:
+            rev = base_commit_id
+
+        if rev == HEAD:
+            rev = "tip"
+        elif rev == PRE_CREATION:
+            rev = ""
+
+        return rev
+
+    def _run_hg_command(self, args):
+        """Run a Mercurial command and return its results.
+
+        The command is run through a pooled Mercurial command server for the
+        repository, avoiding the cost of starting :command:`hg`. If the
+        command server isn't available, or fails, the command will be run in
+        a new :command:`hg` process instead.
+
+        Args:
+            args (list of unicode):
+                The arguments for the command, starting with its name.
+
+        Returns:
+            tuple:
+            A 3-tuple of the command's exit code, standard output (as bytes),
+            and standard error (as bytes).
+        """
+        return self._run_hg_commands([args])[0]
+
+    def _run_hg_commands(self, commands):
+        """Run several Mercurial commands and return their results.
+
+        The commands are all run through one pooled Mercurial command server
+        for the repository. If the command server isn't available, or fails,
+        any remaining commands will be run in new :command:`hg` processes
+        instead.
+
+        Args:
+            commands (list of list of unicode):
+                The arguments for each command, starting with its name.
+
+        Returns:
+            list of tuple:
+            A 3-tuple for each command, containing its exit code, standard
+            output (as bytes), and standard error (as bytes).
+        """
+        results = []
+
+        if self.use_command_server and commands:
+            try:
+                with self._get_command_server_pool().get_worker() as server:
+                    for args in commands:
+                        results.append(server.run_command(args))
+            except (IOError, OSError, SCMError) as e:
+                logging.warning('Unable to use the Mercurial command server '
+                                'for %s. Falling back to running hg: %s',
+                                self.path, e)
+                self.use_command_server = False
+
+        for args in commands[len(results):]:
+            p = self._run_hg(args)
+            output, errors = p.communicate()
+
+            results.append((p.returncode, output, errors))
+
+        return results
+
+    def _get_command_server_pool(self):
+        """Return the pool of command servers for the repository.
+
+        Returns:
+            reviewboard.scmtools.worker_pool.WorkerPool:
+            The pool of command servers.
+        """
+        local_site_name = self.local_site_name
+
+        def _create_command_server():
+            if not self.default_args:
+                self._calculate_default_args()
+
+            return HgCommandServer(self.default_args,
+                                   local_site_name=local_site_name)
+
+        return get_worker_pool(
+            ('hg-cmdserver', self.path, local_site_name),
+            _create_command_server,
+            max_workers=self.COMMAND_SERVER_MAX_PROCESSES,
+            idle_timeout=self.COMMAND_SERVER_IDLE_TIMEOUT)
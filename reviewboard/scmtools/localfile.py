@@ -8,6 +8,7 @@ from reviewboard.scmtools.core import FileNotFoundError, SCMTool, HEAD
 class LocalFileTool(SCMTool):
     scmtool_id = 'local-file'
     name = "Local File"
+    supports_streaming_diffs = True
 
     def __init__(self, repository):
         self.repopath = repository.path
@@ -21,10 +21,13 @@ from djblets.db.fields import JSONField
 from djblets.log import log_timed
 from djblets.util.decorators import cached_property
 
+from reviewboard.cache_utils import get_many_cached_large_data
 from reviewboard.hostingsvcs.models import HostingServiceAccount
 from reviewboard.hostingsvcs.service import get_hosting_service
+from reviewboard.scmtools.core import HEAD
 from reviewboard.scmtools.crypto_utils import (decrypt_password,
                                                encrypt_password)
+from reviewboard.scmtools.file_store import get_file_store
 from reviewboard.scmtools.managers import RepositoryManager, ToolManager
 from reviewboard.scmtools.signals import (checked_file_exists,
                                           checking_file_exists,
@@ -557,6 +560,7 @@ class Repository(models.Model):
         :py:data:`~reviewboard.scmtools.signals.fetching_file` signal before
         beginning a file fetch from the repository (if not cached), and the
         :py:data:`~reviewboard.scmtools.signals.fetched_file` signal after.
+        Both are also sent for files read from the file store.
 
         Args:
             path (unicode):
@@ -591,26 +595,130 @@ class Repository(models.Model):
         #
         # Basically, this fixes the massive regressions introduced by the
         # Django unicode changes.
-        if not isinstance(path, six.text_type):
-            raise TypeError('"path" must be a Unicode string, not %s'
-                            % type(path))
-
-        if not isinstance(revision, six.text_type):
-            raise TypeError('"revision" must be a Unicode string, not %s'
-                            % type(revision))
+        self._check_file_args(path, revision, base_commit_id)
 
-        if (base_commit_id is not None and
-            not isinstance(base_commit_id, six.text_type)):
-            raise TypeError('"base_commit_id" must be a Unicode string, '
-                            'not %s'
-                            % type(base_commit_id))
+        key = self._make_file_cache_key(path, revision, base_commit_id)
 
         return cache_memoize(
-            self._make_file_cache_key(path, revision, base_commit_id),
-            lambda: [self._get_file_uncached(path, revision, base_commit_id,
-                                             request)],
+            key,
+            lambda: [self._get_file_from_store_or_repository(
+                key, path, revision, base_commit_id, request)],
             large_data=True)[0]
 
+    def get_files(self, files, request=None):
+        """Return several files from the repository.
+
+        Any files already in the cache are looked up at once, followed by
+        the file store (see :py:mod:`reviewboard.scmtools.file_store`), if
+        enabled. The rest are fetched from the repository, all at once if
+        the hosting service or SCMTool supports it (see
+        :py:attr:`supports_batched_file_fetches`), or one at a time
+        otherwise, and then stored in the cache and file store.
+
+        This will send the
+        :py:data:`~reviewboard.scmtools.signals.fetching_file` and
+        :py:data:`~reviewboard.scmtools.signals.fetched_file` signals for
+        each file fetched from the repository or read from the file store,
+        as :py:meth:`get_file` does.
+
+        Args:
+            files (list of tuple):
+                A list of ``(path, revision, base_commit_id)`` tuples for the
+                files to fetch. See :py:meth:`get_file` for details on each.
+
+            request (django.http.HttpRequest, optional):
+                The current HTTP request from the client. This is used for
+                logging purposes.
+
+        Returns:
+            list:
+            A list with an entry for each file. Each entry is either the
+            contents of the file (as bytes), or the exception raised when
+            fetching it.
+
+        Raises:
+            TypeError:
+                One or more of the provided arguments is an invalid type.
+                Details are contained in the error message.
+        """
+        for path, revision, base_commit_id in files:
+            self._check_file_args(path, revision, base_commit_id)
+
+        keys = [
+            self._make_file_cache_key(path, revision, base_commit_id)
+            for path, revision, base_commit_id in files
+        ]
+        cached_files = get_many_cached_large_data(keys)
+        results = [
+            cached_files[key][0] if key in cached_files else None
+            for key in keys
+        ]
+        missing_indexes = [
+            i
+            for i, result in enumerate(results)
+            if result is None
+        ]
+
+        if not missing_indexes:
+            return results
+
+        file_store = get_file_store()
+
+        if file_store is not None:
+            for i in missing_indexes:
+                path, revision, base_commit_id = files[i]
+
+                if revision != HEAD:
+                    results[i] = self._get_file_from_store(
+                        file_store, keys[i], path, revision, base_commit_id,
+                        request)
+
+        fetch_indexes = []
+
+        for i in missing_indexes:
+            result = results[i]
+
+            if result is None:
+                fetch_indexes.append(i)
+            else:
+                cache_memoize(keys[i],
+                              lambda: [result],
+                              large_data=True,
+                              force_overwrite=True)
+
+        if fetch_indexes:
+            fetched = self._get_files_uncached(
+                [files[i] for i in fetch_indexes],
+                request)
+
+            for i, result in zip(fetch_indexes, fetched):
+                results[i] = result
+
+                if not isinstance(result, Exception):
+                    cache_memoize(keys[i],
+                                  lambda: [result],
+                                  large_data=True,
+                                  force_overwrite=True)
+
+                    if file_store is not None and files[i][1] != HEAD:
+                        file_store.set(make_cache_key(keys[i]), result)
+
+        return results
+
+    @property
+    def supports_batched_file_fetches(self):
+        """Whether many files can be fetched at once more efficiently.
+
+        If ``True``, :py:meth:`get_files` will fetch any files not in the
+        cache all at once, rather than one at a time.
+        """
+        hosting_service = self.hosting_service
+
+        if hosting_service:
+            return hosting_service.supports_batched_file_fetches
+        else:
+            return self.get_scmtool().supports_batched_file_fetches
+
     def get_file_exists(self, path, revision, base_commit_id=None,
                         request=None):
         """Return whether or not a file exists in the repository.
@@ -654,19 +762,7 @@ class Repository(models.Model):
                 One or more of the provided arguments is an invalid type.
                 Details are contained in the error message.
         """
-        if not isinstance(path, six.text_type):
-            raise TypeError('"path" must be a Unicode string, not %s'
-                            % type(path))
-
-        if not isinstance(revision, six.text_type):
-            raise TypeError('"revision" must be a Unicode string, not %s'
-                            % type(revision))
-
-        if (base_commit_id is not None and
-            not isinstance(base_commit_id, six.text_type)):
-            raise TypeError('"base_commit_id" must be a Unicode string, '
-                            'not %s'
-                            % type(base_commit_id))
+        self._check_file_args(path, revision, base_commit_id)
 
         key = self._make_file_exists_cache_key(path, revision, base_commit_id)
 
@@ -1006,6 +1102,38 @@ class Repository(models.Model):
             if errors:
                 raise ValidationError(errors)
 
+    def _check_file_args(self, path, revision, base_commit_id):
+        """Check the types of arguments identifying a file.
+
+        Args:
+            path (unicode):
+                The path to the file in the repository.
+
+            revision (unicode):
+                The revision of the file.
+
+            base_commit_id (unicode):
+                The ID of the commit containing the revision of the file.
+
+        Raises:
+            TypeError:
+                One or more of the provided arguments is an invalid type.
+                Details are contained in the error message.
+        """
+        if not isinstance(path, six.text_type):
+            raise TypeError('"path" must be a Unicode string, not %s'
+                            % type(path))
+
+        if not isinstance(revision, six.text_type):
+            raise TypeError('"revision" must be a Unicode string, not %s'
+                            % type(revision))
+
+        if (base_commit_id is not None and
+            not isinstance(base_commit_id, six.text_type)):
+            raise TypeError('"base_commit_id" must be a Unicode string, '
+                            'not %s'
+                            % type(base_commit_id))
+
     def _make_file_cache_key(self, path, revision, base_commit_id):
         """Return a cache key for fetched files.
 
@@ -1137,6 +1265,173 @@ class Repository(models.Model):
 
         return data
 
+    def _get_file_from_store_or_repository(self, key, path, revision,
+                                           base_commit_id, request):
+        """Return a file from the file store or the repository.
+
+        This is called internally by :py:meth:`get_file` when the file isn't
+        in the cache. If the file store is enabled (see
+        :py:mod:`reviewboard.scmtools.file_store`), the file will be looked
+        up there before fetching it from the repository, and will be added
+        to it after.
+
+        Files at :py:data:`~reviewboard.scmtools.core.HEAD` are never
+        stored, since their contents will change.
+
+        Args:
+            key (unicode):
+                The cache key for the file.
+
+            path (unicode):
+                The path to the file in the repository.
+
+            revision (unicode):
+                The revision of the file to retrieve.
+
+            base_commit_id (unicode):
+                The ID of the commit containing the revision of the file.
+
+            request (django.http.HttpRequest):
+                The current HTTP request from the client.
+
+        Returns:
+            bytes:
+            The resulting file contents.
+        """
+        if revision == HEAD:
+            file_store = None
+        else:
+            file_store = get_file_store()
+
+        if file_store is not None:
+            data = self._get_file_from_store(file_store, key, path, revision,
+                                             base_commit_id, request)
+
+            if data is not None:
+                return data
+
+        data = self._get_file_uncached(path, revision, base_commit_id,
+                                       request)
+
+        if file_store is not None:
+            file_store.set(make_cache_key(key), data)
+
+        return data
+
+    def _get_file_from_store(self, file_store, key, path, revision,
+                             base_commit_id, request):
+        """Return a file from the file store.
+
+        If the file is in the store, this will send the
+        :py:data:`~reviewboard.scmtools.signals.fetching_file` and
+        :py:data:`~reviewboard.scmtools.signals.fetched_file` signals, as
+        fetching it from the repository would.
+
+        Args:
+            file_store (reviewboard.scmtools.file_store.FileStore):
+                The file store.
+
+            key (unicode):
+                The cache key for the file.
+
+            path (unicode):
+                The path to the file in the repository.
+
+            revision (unicode):
+                The revision of the file to retrieve.
+
+            base_commit_id (unicode):
+                The ID of the commit containing the revision of the file.
+
+            request (django.http.HttpRequest):
+                The current HTTP request from the client.
+
+        Returns:
+            bytes:
+            The file contents, or ``None`` if the file isn't in the store.
+        """
+        data = file_store.get(make_cache_key(key))
+
+        if data is not None:
+            fetching_file.send(sender=self,
+                               path=path,
+                               revision=revision,
+                               base_commit_id=base_commit_id,
+                               request=request)
+            fetched_file.send(sender=self,
+                              path=path,
+                              revision=revision,
+                              base_commit_id=base_commit_id,
+                              request=request,
+                              data=data)
+
+        return data
+
+    def _get_files_uncached(self, files, request):
+        """Return several files from the repository, bypassing cache.
+
+        This is called internally by :py:meth:`get_files` for any files not
+        already in the cache.
+
+        Args:
+            files (list of tuple):
+                A list of ``(path, revision, base_commit_id)`` tuples for the
+                files to fetch.
+
+            request (django.http.HttpRequest):
+                The current HTTP request from the client.
+
+        Returns:
+            list:
+            A list with an entry for each file. Each entry is either the
+            contents of the file (as bytes), or the exception raised when
+            fetching it.
+        """
+        if len(files) < 2 or not self.supports_batched_file_fetches:
+            results = []
+
+            for path, revision, base_commit_id in files:
+                try:
+                    results.append(self._get_file_uncached(
+                        path, revision, base_commit_id, request))
+                except Exception as e:
+                    results.append(e)
+
+            return results
+
+        for path, revision, base_commit_id in files:
+            fetching_file.send(sender=self,
+                               path=path,
+                               revision=revision,
+                               base_commit_id=base_commit_id,
+                               request=request)
+
+        log_timer = log_timed('Fetching %d files from %s'
+                              % (len(files), self),
+                              request=request)
+
+        hosting_service = self.hosting_service
+
+        if hosting_service:
+            results = hosting_service.get_files(self, files)
+        else:
+            results = self.get_scmtool().get_files(files)
+
+        log_timer.done()
+
+        assert len(results) == len(files)
+
+        for (path, revision, base_commit_id), data in zip(files, results):
+            if not isinstance(data, Exception):
+                fetched_file.send(sender=self,
+                                  path=path,
+                                  revision=revision,
+                                  base_commit_id=base_commit_id,
+                                  request=request,
+                                  data=data)
+
+        return results
+
     def _get_file_exists_uncached(self, path, revision, base_commit_id,
                                   request):
         """Check for file existence, bypassing cache.
@@ -15,6 +15,7 @@ class MonotoneTool(SCMTool):
     scmtool_id = 'monotone'
     name = "Monotone"
     diffs_use_absolute_paths = True
+    supports_streaming_diffs = True
     dependencies = {
         'executables': ['mtn'],
     }
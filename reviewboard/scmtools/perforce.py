@@ -17,7 +17,7 @@ from contextlib import contextmanager
 
 from django.conf import settings
 from django.utils import six
-from django.utils.encoding import force_str, force_text
+from django.utils.encoding import force_bytes, force_str, force_text
 from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 from djblets.util.filesystem import is_exe_in_path
@@ -31,6 +31,7 @@ from reviewboard.scmtools.errors import (SCMError, EmptyChangeSetError,
                                          InvalidRevisionFormatError,
                                          RepositoryNotFoundError,
                                          UnverifiedCertificateError)
+from reviewboard.scmtools.worker_pool import BaseWorker, get_worker_pool
 
 
 class STunnelProxy(object):
@@ -216,6 +217,93 @@ class STunnelProxy(object):
                     pass
 
 
+class PerforceConnection(BaseWorker):
+    """A persistent connection to a Perforce server.
+
+    Connecting to a Perforce server (and starting an stunnel proxy, if
+    needed) often takes longer than the commands run over the connection.
+    These connections are kept open in a pool by :py:class:`PerforceClient`
+    and reused for many operations.
+
+    Each connection has its own :py:class:`PerforceClient` (with its own
+    P4 object), so connections can be used by different threads at once.
+    """
+
+    #: The number of seconds between checks that the login ticket is valid.
+    #:
+    #: Tickets are renewed when they're close to expiring (see
+    #: :py:attr:`PerforceClient.TICKET_RENEWAL_SECS`), so they don't need
+    #: to be checked before every operation.
+    TICKET_CHECK_INTERVAL_SECS = 5 * 60
+
+    def __init__(self, client):
+        """Initialize the connection.
+
+        This will connect to the server, logging in if needed.
+
+        Args:
+            client (PerforceClient):
+                The client owning the connection. This must not be used
+                for anything else.
+
+        Raises:
+            P4.P4Exception:
+                There was an error connecting to the server.
+        """
+        self.client = client
+        self._connect_context = client.connect()
+        self._connect_context.__enter__()
+        self._last_ticket_check = time.time()
+        self._broken = False
+
+    @property
+    def p4(self):
+        """The P4 object for running commands over the connection."""
+        return self.client.p4
+
+    def check_refresh_ticket(self):
+        """Refresh the login ticket for the connection, if needed.
+
+        The ticket is checked at most every
+        :py:attr:`TICKET_CHECK_INTERVAL_SECS` seconds.
+        """
+        client = self.client
+
+        if (client.use_ticket_auth and
+            (time.time() - self._last_ticket_check >=
+             self.TICKET_CHECK_INTERVAL_SECS)):
+            client.check_refresh_ticket()
+            self._last_ticket_check = time.time()
+
+    def mark_broken(self):
+        """Mark the connection as no longer usable.
+
+        The connection will be closed when it's returned to the pool, rather
+        than being used again.
+        """
+        self._broken = True
+
+    def is_alive(self):
+        """Return whether the connection can still be used.
+
+        Returns:
+            bool:
+            ``True`` if the connection is open and hasn't been marked as
+            broken.
+        """
+        return (not self._broken and
+                self._connect_context is not None and
+                self.p4.connected())
+
+    def close(self):
+        """Close the connection."""
+        connect_context = self._connect_context
+
+        if connect_context is not None:
+            self._connect_context = None
+            connect_context.__exit__(None, None, None)
+
+
 class PerforceClient(object):
     """Client for talking to a Perforce server.
 
@@ -231,9 +319,26 @@ class PerforceClient(object):
     #: We default this to 1 hour.
     TICKET_RENEWAL_SECS = 1 * 60 * 60
 
+    #: The maximum number of connections to keep open per repository.
+    CONNECTION_POOL_MAX_CONNECTIONS = 4
+
+    #: The number of seconds before an idle connection is closed.
+    CONNECTION_POOL_IDLE_TIMEOUT = 300
+
+    #: Parts of Perforce error messages indicating a login problem.
+    #:
+    #: These cover invalid or missing passwords, as well as expired or
+    #: revoked login tickets and sessions.
+    LOGIN_ERROR_MESSAGES = (
+        'Perforce password',
+        'Password must be set',
+        'Password invalid',
+        'please login again',
+    )
+
     def __init__(self, path, username, password, encoding='', host=None,
                  client_name=None, local_site_name=None,
-                 use_ticket_auth=False):
+                 use_ticket_auth=False, use_connection_pool=False):
         """Initialize the client.
 
         Args:
@@ -263,6 +368,12 @@ class PerforceClient(object):
             use_ticket_auth (bool, optional):
                 Whether to use ticket-based authentication. By default, this
                 is not used.
+
+            use_connection_pool (bool, optional):
+                Whether :py:meth:`run_worker` should use connections from a
+                pool shared by all clients for the same server and
+                credentials, rather than connecting for each operation. By
+                default, this is not used.
         """
         if path.startswith('stunnel:'):
             path = path[8:]
@@ -278,6 +389,7 @@ class PerforceClient(object):
         self.client_name = client_name
         self.local_site_name = local_site_name
         self.use_ticket_auth = use_ticket_auth
+        self.use_connection_pool = use_connection_pool
 
         import P4
         self.p4 = P4.P4()
@@ -445,11 +557,14 @@ class PerforceClient(object):
         when the context is finished, and raising a suitable exception if
         anything goes wrong.
 
-        Context:
-            The context for the connection. Once the context ends, the
-            connection will close.
+        If :py:attr:`use_connection_pool` is set, an open connection from
+        the pool will be used instead, and returned to the pool when the
+        context is finished.
 
-            No variables are passed to the context.
+        Context:
+            P4.P4:
+            The P4 object to run commands with. Once the context ends, the
+            connection will close or be returned to the pool.
 
         Raises:
             reviewboard.scmtools.errors.AuthenticationError:
@@ -472,18 +587,35 @@ class PerforceClient(object):
         Example:
             .. code-block:: python
 
-                with client.run_worker():
+                with client.run_worker() as p4:
                     ...
         """
         from P4 import P4Exception
 
         try:
-            with self.connect():
-                yield
+            if self.use_connection_pool:
+                with self._get_connection_pool().get_worker() as connection:
+                    try:
+                        connection.check_refresh_ticket()
+
+                        yield connection.p4
+                    except P4Exception as e:
+                        if self._is_login_error(six.text_type(e)):
+                            # The connection's login is no longer valid.
+                            # Close it instead of returning it to the pool,
+                            # so the next operation connects and logs in
+                            # again, rather than failing until the next
+                            # ticket check.
+                            connection.mark_broken()
+
+                        raise
+            else:
+                with self.connect():
+                    yield self.p4
         except P4Exception as e:
             error = six.text_type(e)
 
-            if 'Perforce password' in error or 'Password must be set' in error:
+            if self._is_login_error(error):
                 raise AuthenticationError(msg=error)
             elif 'SSL library must be at least version' in error:
                 raise SCMError(_(
@@ -512,6 +644,23 @@ class PerforceClient(object):
             else:
                 raise SCMError(error)
 
+    def _is_login_error(self, error):
+        """Return whether a Perforce error indicates a login problem.
+
+        Args:
+            error (unicode):
+                The error message.
+
+        Returns:
+            bool:
+            ``True`` if the error is due to invalid credentials or an expired
+            login.
+        """
+        return any(
+            message in error
+            for message in self.LOGIN_ERROR_MESSAGES
+        )
+
     def get_changeset(self, changeset_id):
         """Return information about a server-side changeset.
 
@@ -525,16 +674,16 @@ class PerforceClient(object):
         """
         changeset_id = six.text_type(changeset_id)
 
-        with self.run_worker():
+        with self.run_worker() as p4:
             try:
-                change = self.p4.run_change('-o', '-O', changeset_id)
+                change = p4.run_change('-o', '-O', changeset_id)
                 changeset_id = change[0]['Change']
             except Exception as e:
                 logging.warning('Failed to get updated changeset information '
                                 'for CLN %s (%s): %s',
                                 changeset_id, self.p4port, e, exc_info=True)
 
-            return self.p4.run_describe('-s', changeset_id)
+            return p4.run_describe('-s', changeset_id)
 
     def get_info(self):
         """Return information on a Perforce server connection.
@@ -543,8 +692,8 @@ class PerforceClient(object):
             list of dict:
             A list of connection detail dictionaries.
         """
-        with self.run_worker():
-            return self.p4.run_info()
+        with self.run_worker() as p4:
+            return p4.run_info()
 
     def get_file(self, path, revision):
         """Return the contents of a file at a specified revision.
@@ -563,17 +712,14 @@ class PerforceClient(object):
         if revision == PRE_CREATION:
             return b''
 
-        if revision == HEAD:
-            depot_path = path
-        else:
-            depot_path = '%s#%s' % (path, revision)
+        depot_path = self._get_depot_path(path, revision)
 
-        with self.run_worker():
+        with self.run_worker() as p4:
             fd, filename = tempfile.mkstemp(prefix='reviewboard.')
 
             try:
                 os.close(fd)
-                self.p4.run_print('-q', '-o', filename, depot_path)
+                p4.run_print('-q', '-o', filename, depot_path)
 
                 if os.path.islink(filename):
                     return b''
@@ -589,6 +735,119 @@ class PerforceClient(object):
 
         return b''
 
+    def get_files(self, files):
+        """Return the contents of several files.
+
+        The files are fetched using a single :command:`p4 print`. Any files
+        that couldn't be matched up with its results (for instance, files
+        that don't exist) are then fetched one at a time, in order to
+        report the right errors. Files at
+        :py:data:`~reviewboard.scmtools.core.HEAD` are also fetched one at a
+        time, since they can't be told apart from other revisions in the
+        results.
+
+        Args:
+            files (list of tuple):
+                A list of ``(path, revision)`` tuples for the files to fetch.
+
+        Returns:
+            list:
+            A list with an entry for each file. Each entry is either the
+            contents of the file (as bytes), or the exception raised when
+            fetching it.
+        """
+        results = [None] * len(files)
+        depot_paths = []
+
+        for i, (path, revision) in enumerate(files):
+            if revision == PRE_CREATION:
+                results[i] = b''
+            elif revision != HEAD:
+                depot_paths.append(self._get_depot_path(path, revision))
+
+        if len(depot_paths) > 1:
+            try:
+                printed = self._print_files(depot_paths)
+            except SCMError as e:
+                logging.warning('Unable to fetch %d files from Perforce '
+                                'host "%s" at once. Falling back to '
+                                'fetching each file: %s',
+                                len(depot_paths), self.p4port, e)
+                printed = {}
+        else:
+            printed = {}
+
+        for i, (path, revision) in enumerate(files):
+            if results[i] is not None:
+                continue
+
+            data = printed.get((path, six.text_type(revision)))
+
+            if data is None:
+                try:
+                    data = self.get_file(path, revision)
+                except Exception as e:
+                    data = e
+
+            results[i] = data
+
+        return results
+
+    def _print_files(self, depot_paths):
+        """Return the contents of several files using one p4 print.
+
+        Args:
+            depot_paths (list of unicode):
+                The depot paths (with revisions, if needed) to print.
+
+        Returns:
+            dict:
+            A dictionary mapping ``(depot_file, rev)`` tuples to each
+            printed file's contents.
+
+        Raises:
+            reviewboard.scmtools.errors.SCMError:
+                There was an error printing the files.
+        """
+        with self.run_worker() as p4:
+            # Use raw output, so that file contents are returned as bytes
+            # without being decoded.
+            old_encoding = p4.encoding
+            p4.encoding = 'raw'
+
+            try:
+                output = p4.run_print(depot_paths)
+            finally:
+                p4.encoding = old_encoding
+
+        printed = {}
+        chunks = None
+
+        # The results contain a dictionary of information on each file,
+        # followed by its contents, which may be split across several items.
+        for item in output:
+            if isinstance(item, dict):
+                info = {
+                    force_text(key): force_text(value)
+                    for key, value in six.iteritems(item)
+                }
+
+                if 'symlink' in info.get('type', ''):
+                    # Symlinks are returned as empty files, as in get_file().
+                    contents = []
+                    chunks = None
+                else:
+                    contents = chunks = []
+
+                printed[(info.get('depotFile'), info.get('rev'))] = contents
+            elif chunks is not None:
+                chunks.append(force_bytes(item))
+
+        return {
+            key: b''.join(contents)
+            for key, contents in six.iteritems(printed)
+        }
+
     def get_file_stat(self, path, revision):
         """Return status information about a file in the repository.
 
@@ -608,19 +867,66 @@ class PerforceClient(object):
         """
         if revision == PRE_CREATION:
             return None
-        elif revision == HEAD:
-            depot_path = path
-        else:
-            depot_path = '%s#%s' % (path, revision)
 
-        with self.run_worker():
-            res = self.p4.run_fstat(depot_path)
+        depot_path = self._get_depot_path(path, revision)
+
+        with self.run_worker() as p4:
+            res = p4.run_fstat(depot_path)
 
         if res:
             return res[-1]
 
         return None
 
+    def _get_depot_path(self, path, revision):
+        """Return a depot path for a revision of a file.
+
+        Args:
+            path (unicode):
+                The depot path for the file, without a revision.
+
+            revision (reviewboard.scmtools.core.Revision):
+                The revision of the file.
+
+        Returns:
+            unicode:
+            The depot path, including the revision if not
+            :py:data:`~reviewboard.scmtools.core.HEAD`.
+        """
+        if revision == HEAD:
+            return path
+        else:
+            return '%s#%s' % (path, revision)
+
+    def _get_connection_pool(self):
+        """Return the pool of connections for the server and credentials.
+
+        Returns:
+            reviewboard.scmtools.worker_pool.WorkerPool:
+            The pool of connections.
+        """
+        if self.use_stunnel:
+            path = 'stunnel:%s' % self.p4port
+        else:
+            path = self.p4port
+
+        kwargs = {
+            'path': path,
+            'username': self.username,
+            'password': self.password,
+            'encoding': self.encoding,
+            'host': self.p4host,
+            'client_name': self.client_name,
+            'local_site_name': self.local_site_name,
+            'use_ticket_auth': self.use_ticket_auth,
+        }
+
+        return get_worker_pool(
+            ('perforce',) + tuple(sorted(six.iteritems(kwargs))),
+            lambda: PerforceConnection(PerforceClient(**kwargs)),
+            max_workers=self.CONNECTION_POOL_MAX_CONNECTIONS,
+            idle_timeout=self.CONNECTION_POOL_IDLE_TIMEOUT)
+
 
 class PerforceTool(SCMTool):
     """Repository support for Perforce.
@@ -642,6 +948,8 @@ class PerforceTool(SCMTool):
     supports_ticket_auth = True
     supports_pending_changesets = True
     prefers_mirror_path = True
+    supports_streaming_diffs = True
+    supports_batched_file_fetches = True
 
     field_help_text = {
         'path': _(
@@ -685,7 +993,8 @@ class PerforceTool(SCMTool):
             client_name=repository.extra_data.get('p4_client'),
             local_site_name=local_site_name,
             use_ticket_auth=repository.extra_data.get('use_ticket_auth',
-                                                      False))
+                                                      False),
+            use_connection_pool=True)
 
     @classmethod
     def check_repository(cls, path, username=None, password=None,
@@ -806,6 +1115,30 @@ class PerforceTool(SCMTool):
         """
         return self.client.get_file(path, revision)
 
+    def get_files(self, files, **kwargs):
+        """Return the contents of several files in the repository.
+
+        The files are fetched using a single :command:`p4 print`.
+
+        Args:
+            files (list of tuple):
+                A list of ``(path, revision, base_commit_id)`` tuples for the
+                files to fetch.
+
+            **kwargs (dict):
+                Unused keyword arguments.
+
+        Returns:
+            list:
+            A list with an entry for each file. Each entry is either the
+            contents of the file (as bytes), or the exception raised when
+            fetching it.
+        """
+        return self.client.get_files([
+            (path, revision)
+            for path, revision, base_commit_id in files
+        ])
+
     def file_exists(self, path, revision=HEAD, **kwargs):
         """Return whether a particular file exists in a repository.
 
@@ -22,6 +22,7 @@ class PlasticTool(SCMTool):
     name = "Plastic SCM"
     diffs_use_absolute_paths = True
     supports_pending_changesets = True
+    supports_streaming_diffs = True
     field_help_text = {
         'path': _('The Plastic repository spec in the form of '
                   '[repo]@[hostname]:[port].'),
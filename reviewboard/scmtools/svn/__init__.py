@@ -53,6 +53,7 @@ class SVNTool(SCMTool):
     scmtool_id = 'subversion'
     name = "Subversion"
     supports_post_commit = True
+    supports_streaming_diffs = True
     dependencies = {
         'modules': [],  # This will get filled in later in
                         # recompute_svn_backend()
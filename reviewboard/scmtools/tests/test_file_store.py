@@ -0,0 +1,363 @@
+"""Unit tests for reviewboard.scmtools.file_store."""
+
+from __future__ import unicode_literals
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.cache import cache
+from kgb import SpyAgency
+
+from reviewboard.scmtools.file_store import FileStore, get_file_store
+from reviewboard.scmtools.models import Repository, Tool
+from reviewboard.scmtools.signals import fetched_file, fetching_file
+from reviewboard.testing import TestCase
+
+
+class FileStoreTests(TestCase):
+    """Unit tests for reviewboard.scmtools.file_store.FileStore."""
+
+    def setUp(self):
+        super(FileStoreTests, self).setUp()
+
+        self.tempdir = tempfile.mkdtemp(prefix='rb-tests-file-store-')
+        self.addCleanup(shutil.rmtree, self.tempdir)
+
+        self.file_store = FileStore(self.tempdir, max_size=100)
+
+    def test_get_and_set(self):
+        """Testing FileStore.get and set"""
+        self.assertIsNone(self.file_store.get('key1'))
+
+        self.file_store.set('key1', b'data 1')
+
+        self.assertEqual(self.file_store.get('key1'), b'data 1')
+        self.assertIsNone(self.file_store.get('key2'))
+
+    def test_set_with_duplicate_contents(self):
+        """Testing FileStore.set stores identical contents once"""
+        self.file_store.set('key1', b'data')
+        self.file_store.set('key2', b'data')
+
+        self.assertEqual(self.file_store.get('key1'), b'data')
+        self.assertEqual(self.file_store.get('key2'), b'data')
+        self.assertEqual(len(self._get_object_paths()), 1)
+
+    def test_set_with_too_large(self):
+        """Testing FileStore.set with a file larger than the store"""
+        self.file_store.set('key1', b'x' * 101)
+
+        self.assertIsNone(self.file_store.get('key1'))
+        self.assertEqual(self._get_object_paths(), [])
+
+    def test_get_with_corrupt_contents(self):
+        """Testing FileStore.get with corrupt stored contents"""
+        self.file_store.set('key1', b'data')
+
+        object_path = self._get_object_paths()[0]
+
+        with open(object_path, 'wb') as fp:
+            fp.write(b'bad data')
+
+        self.assertIsNone(self.file_store.get('key1'))
+        self.assertFalse(os.path.exists(object_path))
+
+    def test_set_evicts_least_recently_used(self):
+        """Testing FileStore.set evicts the least recently used files"""
+        for i in range(3):
+            key = 'key%d' % i
+            self._set_and_wait(self.file_store, key, (b'%d' % i) * 30)
+            self._set_mtime(key, 1000 + i)
+
+        # Using the first file should keep it around, leaving the second
+        # as the least recently used.
+        self.file_store.get('key0')
+
+        self._set_and_wait(self.file_store, 'key3', b'3' * 30)
+
+        self.assertEqual(self.file_store.get('key0'), b'0' * 30)
+        self.assertIsNone(self.file_store.get('key1'))
+        self.assertEqual(self.file_store.get('key2'), b'2' * 30)
+        self.assertEqual(self.file_store.get('key3'), b'3' * 30)
+        self.assertEqual(len(self._get_object_paths()), 3)
+
+    def test_set_checks_size_on_disk(self):
+        """Testing FileStore.set periodically reads the size of the store
+        from disk
+        """
+        self._set_and_wait(self.file_store, 'key0', b'0' * 30)
+
+        # Another process sharing the store adds files.
+        other_file_store = FileStore(self.tempdir, max_size=100)
+        other_file_store._size = 0
+        other_file_store._size_checked = time.time()
+
+        for i in range(1, 4):
+            self._set_and_wait(other_file_store, 'key%d' % i,
+                               (b'%d' % i) * 30)
+
+        self.assertEqual(len(self._get_object_paths()), 4)
+
+        # This process only knows about its own file until the size is
+        # checked again.
+        self._set_and_wait(self.file_store, 'key0', b'0' * 30)
+        self.assertEqual(len(self._get_object_paths()), 4)
+
+        self.file_store._size_checked -= FileStore.SIZE_CHECK_INTERVAL
+        self._set_and_wait(self.file_store, 'key0', b'0' * 30)
+        self.assertEqual(len(self._get_object_paths()), 3)
+        self.assertEqual(self.file_store._size, 90)
+
+    def test_set_limits_evictions(self):
+        """Testing FileStore.set waits between evictions"""
+        for i in range(4):
+            self._set_and_wait(self.file_store, 'key%d' % i,
+                               (b'%d' % i) * 30)
+
+        self.assertEqual(len(self._get_object_paths()), 3)
+
+        self._set_and_wait(self.file_store, 'key4', b'4' * 30)
+        self.assertEqual(len(self._get_object_paths()), 4)
+
+        self.file_store._last_eviction -= FileStore.MIN_EVICTION_INTERVAL
+        self._set_and_wait(self.file_store, 'key5', b'5' * 30)
+        self.assertEqual(len(self._get_object_paths()), 3)
+
+    def _set_and_wait(self, file_store, key, data):
+        """Add a file to a store, and wait for any eviction to finish.
+
+        Args:
+            file_store (reviewboard.scmtools.file_store.FileStore):
+                The file store.
+
+            key (unicode):
+                The key identifying the file.
+
+            data (bytes):
+                The contents of the file.
+        """
+        file_store.set(key, data)
+
+        thread = file_store._maintenance_thread
+
+        if thread is not None:
+            thread.join()
+
+    def _get_object_paths(self):
+        """Return the paths to all stored contents.
+
+        Returns:
+            list of unicode:
+            The paths to all stored contents.
+        """
+        return [
+            os.path.join(dirpath, filename)
+            for dirpath, dirnames, filenames in os.walk(
+                os.path.join(self.tempdir, 'objects'))
+            for filename in filenames
+        ]
+
+    def _set_mtime(self, key, mtime):
+        """Set the modification time of a stored file.
+
+        Args:
+            key (unicode):
+                The key of the file.
+
+            mtime (int):
+                The modification time to set.
+        """
+        with open(self.file_store._get_index_path(key), 'rb') as fp:
+            content_id = fp.read().decode('ascii')
+
+        os.utime(self.file_store._get_object_path(content_id),
+                 (mtime, mtime))
+
+
+class RepositoryFileStoreTests(SpyAgency, TestCase):
+    """Unit tests for using the file store in Repository."""
+
+    fixtures = ['test_scmtools']
+
+    def setUp(self):
+        super(RepositoryFileStoreTests, self).setUp()
+
+        self.tempdir = tempfile.mkdtemp(prefix='rb-tests-file-store-')
+        self.addCleanup(shutil.rmtree, self.tempdir)
+
+        self.repository = Repository.objects.create(
+            name='Git test repo',
+            path=os.path.join(os.path.dirname(__file__), '..', 'testdata',
+                              'git_repo'),
+            tool=Tool.objects.get(name='Git'))
+
+        self.scmtool_cls = self.repository.scmtool_class
+        self.spy_on(self.scmtool_cls.get_file,
+                    call_fake=lambda *args, **kwargs: b'file data',
+                    owner=self.scmtool_cls)
+
+    def test_get_file(self):
+        """Testing Repository.get_file uses the file store when not cached"""
+        with self._file_store_enabled():
+            self.assertEqual(self.repository.get_file('readme', 'e965047'),
+                             b'file data')
+
+            cache.clear()
+
+            self.assertEqual(self.repository.get_file('readme', 'e965047'),
+                             b'file data')
+
+        self.assertEqual(len(self.scmtool_cls.get_file.calls), 1)
+        self.assertIsNotNone(self._get_stored_object(b'file data'))
+
+    def test_get_file_signals(self):
+        """Testing Repository.get_file emits signals for files in the file
+        store
+        """
+        with self._file_store_enabled():
+            self.repository.get_file('readme', 'e965047')
+            cache.clear()
+
+            found_signals = self._connect_signals()
+            self.repository.get_file('readme', 'e965047')
+
+        self.assertEqual(len(self.scmtool_cls.get_file.calls), 1)
+        self.assertEqual(
+            found_signals,
+            [
+                ('fetching_file', 'readme', 'e965047'),
+                ('fetched_file', 'readme', 'e965047'),
+            ])
+
+    def test_get_file_with_head(self):
+        """Testing Repository.get_file doesn't store files at HEAD"""
+        with self._file_store_enabled():
+            self.repository.get_file('readme', 'HEAD')
+            cache.clear()
+            self.repository.get_file('readme', 'HEAD')
+
+        self.assertEqual(len(self.scmtool_cls.get_file.calls), 2)
+        self.assertIsNone(self._get_stored_object(b'file data'))
+
+    def test_get_files(self):
+        """Testing Repository.get_files uses the file store when not cached
+        """
+        self.spy_on(self.scmtool_cls.get_files,
+                    call_fake=lambda *args, **kwargs: [b'data 1', b'data 2'],
+                    owner=self.scmtool_cls)
+
+        files = [
+            ('file1', 'e965047', None),
+            ('file2', 'e965047', None),
+        ]
+
+        with self._file_store_enabled():
+            self.repository.get_files(files)
+            cache.clear()
+
+            self.assertEqual(self.repository.get_files(files),
+                             [b'data 1', b'data 2'])
+
+        self.assertEqual(len(self.scmtool_cls.get_files.calls), 1)
+
+    def test_get_files_signals(self):
+        """Testing Repository.get_files emits signals for files in the file
+        store
+        """
+        self.spy_on(self.scmtool_cls.get_files,
+                    call_fake=lambda *args, **kwargs: [b'data 1', b'data 2'],
+                    owner=self.scmtool_cls)
+
+        files = [
+            ('file1', 'e965047', None),
+            ('file2', 'e965047', None),
+        ]
+
+        with self._file_store_enabled():
+            self.repository.get_files(files)
+            cache.clear()
+
+            found_signals = self._connect_signals()
+            self.repository.get_files(files)
+
+        self.assertEqual(len(self.scmtool_cls.get_files.calls), 1)
+        self.assertEqual(
+            found_signals,
+            [
+                ('fetching_file', 'file1', 'e965047'),
+                ('fetched_file', 'file1', 'e965047'),
+                ('fetching_file', 'file2', 'e965047'),
+                ('fetched_file', 'file2', 'e965047'),
+            ])
+
+    def test_get_file_with_disabled(self):
+        """Testing Repository.get_file with the file store disabled"""
+        self.assertIsNone(get_file_store())
+
+        self.repository.get_file('readme', 'e965047')
+
+        self.assertFalse(os.path.exists(os.path.join(self.tempdir,
+                                                     'objects')))
+
+    def _connect_signals(self):
+        """Record the file fetching signals sent for the repository.
+
+        Returns:
+            list of tuple:
+            The list that each signal will be recorded in.
+        """
+        def on_fetching_file(sender, path, revision, **kwargs):
+            found_signals.append(('fetching_file', path, revision))
+
+        def on_fetched_file(sender, path, revision, **kwargs):
+            found_signals.append(('fetched_file', path, revision))
+
+        found_signals = []
+
+        fetching_file.connect(on_fetching_file, sender=self.repository,
+                              weak=False)
+        fetched_file.connect(on_fetched_file, sender=self.repository,
+                             weak=False)
+        self.addCleanup(fetching_file.disconnect, on_fetching_file,
+                        sender=self.repository)
+        self.addCleanup(fetched_file.disconnect, on_fetched_file,
+                        sender=self.repository)
+
+        return found_signals
+
+    def _file_store_enabled(self):
+        """Enable the file store for the duration of a block.
+
+        Returns:
+            contextlib.GeneratorContextManager:
+            The context manager enabling the file store.
+        """
+        return self.siteconfig_settings(
+            {
+                'diffviewer_file_store_max_size': 1,
+                'diffviewer_file_store_path': self.tempdir,
+            },
+            reload_settings=False)
+
+    def _get_stored_object(self, data):
+        """Return the path to stored contents, if stored.
+
+        Args:
+            data (bytes):
+                The contents to look up.
+
+        Returns:
+            unicode:
+            The path to the stored contents, or ``None`` if not stored.
+        """
+        content_id = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.tempdir, 'objects', content_id[:2],
+                            content_id)
+
+        if os.path.exists(path):
+            return path
+
+        return None
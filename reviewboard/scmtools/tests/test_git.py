@@ -9,11 +9,13 @@ from djblets.testing.decorators import add_fixtures
 from kgb import SpyAgency
 
 from reviewboard.diffviewer.parser import DiffParserError
-from reviewboard.scmtools.core import PRE_CREATION
+from reviewboard.scmtools.core import HEAD, PRE_CREATION
 from reviewboard.scmtools.errors import SCMError, FileNotFoundError
-from reviewboard.scmtools.git import ShortSHA1Error, GitClient, GitTool
+from reviewboard.scmtools.git import (ShortSHA1Error, GitCatFileProcess,
+                                      GitClient, GitTool)
 from reviewboard.scmtools.models import Repository, Tool
 from reviewboard.scmtools.tests.testcases import SCMTestCase
+from reviewboard.scmtools.worker_pool import close_worker_pools
 from reviewboard.testing.testcase import TestCase
 
 
@@ -49,6 +51,8 @@ class GitTests(SpyAgency, SCMTestCase):
         except ImportError:
             raise nose.SkipTest('git binary not found')
 
+        self.addCleanup(close_worker_pools)
+
     def _read_fixture(self, filename):
         filename = os.path.join(os.path.dirname(__file__),
                                 '..', 'testdata', filename)
@@ -1109,6 +1113,100 @@ class GitTests(SpyAgency, SCMTestCase):
         with self.assertRaises(FileNotFoundError):
             tool.get_file('readme', '0000000')
 
+    def test_get_files(self):
+        """Testing GitClient.get_files"""
+        results = self.tool.client.get_files([
+            ('readme', 'e965047'),
+            ('readme', '0000000'),
+            ('readme', 'd6613f5'),
+            ('readme', 'a62df6c'),
+            ('readme', HEAD),
+            ('', HEAD),
+        ])
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(results[0], b'Hello\n')
+        self.assertIsInstance(results[1], FileNotFoundError)
+        self.assertEqual(results[2], b'Hello there\n')
+        self.assertIsInstance(results[3], SCMError)
+        self.assertNotIsInstance(results[3], FileNotFoundError)
+        self.assertEqual(results[4], b'Hello there\n')
+        self.assertIsInstance(results[5], SCMError)
+
+    def test_tool_get_files(self):
+        """Testing GitTool.get_files"""
+        results = self.tool.get_files([
+            ('readme', 'e965047', None),
+            ('newfile', PRE_CREATION, None),
+            ('readme', '0000000', None),
+        ])
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0], b'Hello\n')
+        self.assertEqual(results[1], b'')
+        self.assertIsInstance(results[2], FileNotFoundError)
+
+    def test_get_file_reuses_cat_file_process(self):
+        """Testing GitClient.get_file and get_file_exists reuse git cat-file
+        processes
+        """
+        self.spy_on(GitCatFileProcess.__init__)
+        self.spy_on(GitClient._cat_file)
+
+        client = self.tool.client
+
+        for i in range(3):
+            self.assertEqual(client.get_file('readme', 'e965047'),
+                             b'Hello\n')
+            self.assertTrue(client.get_file_exists('readme', 'e965047'))
+
+        # Another client for the same repository shares the processes.
+        client = self.repository.get_scmtool().client
+        self.assertEqual(client.get_file('readme', 'd6613f5'),
+                         b'Hello there\n')
+
+        self.assertFalse(GitClient._cat_file.called)
+        self.assertEqual(len(GitCatFileProcess.__init__.calls), 2)
+        self.assertFalse(GitCatFileProcess.__init__.calls[0].kwargs[
+            'check_only'])
+        self.assertTrue(GitCatFileProcess.__init__.calls[1].kwargs[
+            'check_only'])
+
+    def test_get_file_with_exited_cat_file_process(self):
+        """Testing GitClient.get_file after the git cat-file process exits"""
+        client = self.tool.client
+        self.assertEqual(client.get_file('readme', 'e965047'), b'Hello\n')
+
+        pool = client._get_cat_file_pool(check_only=False)
+
+        with pool.get_worker() as process:
+            process._process.kill()
+            process._process.wait()
+
+        self.spy_on(GitCatFileProcess.__init__)
+
+        self.assertEqual(client.get_file('readme', 'e965047'), b'Hello\n')
+        self.assertTrue(GitCatFileProcess.__init__.called)
+
+    def test_get_file_with_cat_file_process_error(self):
+        """Testing GitClient.get_file falls back to running git cat-file per
+        file when the git cat-file process fails
+        """
+        def _get_objects(process, object_names):
+            process._broken = True
+            raise SCMError('Oh no')
+
+        self.spy_on(GitCatFileProcess.get_objects, call_fake=_get_objects)
+        self.spy_on(GitClient._cat_file)
+
+        client = self.tool.client
+        self.assertEqual(client.get_file('readme', 'e965047'), b'Hello\n')
+
+        with self.assertRaises(FileNotFoundError):
+            client.get_file('readme', '0000000')
+
+        self.assertEqual(len(GitClient._cat_file.calls), 2)
+
     def test_parse_diff_revision_with_remote_and_short_SHA1_error(self):
         """Testing GitTool.parse_diff_revision with remote files and short
         SHA1 error
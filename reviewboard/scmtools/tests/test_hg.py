@@ -10,17 +10,20 @@ from kgb import SpyAgency
 
 from reviewboard.scmtools.core import HEAD, PRE_CREATION, Revision
 from reviewboard.scmtools.errors import SCMError, FileNotFoundError
-from reviewboard.scmtools.hg import (HgDiffParser,
+from reviewboard.scmtools.hg import (HgClient,
+                                     HgCommandServer,
+                                     HgDiffParser,
                                      HgGitDiffParser,
                                      HgTool,
                                      HgWebClient)
 from reviewboard.scmtools.models import Repository, Tool
 from reviewboard.scmtools.tests.testcases import SCMTestCase
+from reviewboard.scmtools.worker_pool import close_worker_pools
 from reviewboard.testing import online_only
 from reviewboard.testing.testcase import TestCase
 
 
-class MercurialTests(SCMTestCase):
+class MercurialTests(SpyAgency, SCMTestCase):
     """Unit tests for mercurial."""
 
     fixtures = ['test_scmtools']
@@ -39,6 +42,11 @@ class MercurialTests(SCMTestCase):
         except ImportError:
             raise nose.SkipTest('Hg is not installed')
 
+    def tearDown(self):
+        super(MercurialTests, self).tearDown()
+
+        close_worker_pools()
+
     def _first_file_in_diff(self, diff):
         return self.tool.get_parser(diff).parse()[0]
 
@@ -374,6 +382,142 @@ class MercurialTests(SCMTestCase):
             bogus_rev,
             base_commit_id=base_commit_id))
 
+    def test_get_file_reuses_command_server(self):
+        """Testing HgTool.get_file reuses the Mercurial command server"""
+        self.spy_on(HgCommandServer.__init__, owner=HgCommandServer)
+        self.spy_on(HgClient._run_hg, owner=HgClient)
+
+        for i in range(3):
+            value = self.tool.get_file('doc/readme',
+                                       Revision('661e5dd3c493'))
+            self.assertEqual(value, b'Hello\n\ngoodbye\n')
+
+        with self.assertRaises(FileNotFoundError):
+            self.tool.get_file('doc/readme2', Revision('661e5dd3c493'))
+
+        self.assertEqual(len(self.tool.get_commits()), 2)
+        self.assertEqual(len(HgCommandServer.__init__.calls), 1)
+        self.assertFalse(HgClient._run_hg.called)
+
+    def test_get_file_with_command_server_unavailable(self):
+        """Testing HgTool.get_file falls back to running hg when the
+        Mercurial command server is unavailable
+        """
+        def _init(server, *args, **kwargs):
+            raise SCMError('The Mercurial command server is not available.')
+
+        self.spy_on(HgCommandServer.__init__,
+                    owner=HgCommandServer,
+                    call_fake=_init)
+        self.spy_on(HgClient._run_hg, owner=HgClient)
+
+        value = self.tool.get_file('doc/readme', Revision('661e5dd3c493'))
+        self.assertEqual(value, b'Hello\n\ngoodbye\n')
+
+        value = self.tool.get_file('doc/readme', Revision('661e5dd3c493'))
+        self.assertEqual(value, b'Hello\n\ngoodbye\n')
+
+        self.assertFalse(self.tool.client.use_command_server)
+        self.assertEqual(len(HgCommandServer.__init__.calls), 1)
+
+        cat_calls = [
+            call
+            for call in HgClient._run_hg.calls
+            if call.args[0][0] == 'cat'
+        ]
+        self.assertEqual(len(cat_calls), 2)
+
+    def test_get_file_without_command_server(self):
+        """Testing HgTool.get_file with the Mercurial command server
+        disabled
+        """
+        self.spy_on(HgCommandServer.__init__, owner=HgCommandServer)
+
+        self.tool.client.use_command_server = False
+
+        value = self.tool.get_file('doc/readme', Revision('661e5dd3c493'))
+        self.assertEqual(value, b'Hello\n\ngoodbye\n')
+
+        with self.assertRaises(FileNotFoundError):
+            self.tool.get_file('doc/readme2', Revision('661e5dd3c493'))
+
+        self.assertFalse(HgCommandServer.__init__.called)
+
+    def test_get_files(self):
+        """Testing HgTool.get_files"""
+        self.spy_on(HgClient._get_command_server_pool, owner=HgClient)
+        self.spy_on(HgCommandServer.run_command, owner=HgCommandServer)
+
+        rev = Revision('661e5dd3c493')
+
+        self.assertTrue(self.tool.supports_batched_file_fetches)
+
+        results = self.tool.get_files([
+            ('doc/readme', rev, None),
+            ('doc/readme2', rev, None),
+            ('doc/readme', Revision('bogusrevision'), rev),
+            ('hello', PRE_CREATION, None),
+            ('', rev, None),
+        ])
+
+        self.assertEqual(len(results), 5)
+        self.assertEqual(results[0], b'Hello\n\ngoodbye\n')
+        self.assertIsInstance(results[1], FileNotFoundError)
+        self.assertEqual(results[1].path, 'doc/readme2')
+        self.assertEqual(results[2], b'Hello\n\ngoodbye\n')
+        self.assertIsInstance(results[3], FileNotFoundError)
+        self.assertIsInstance(results[4], FileNotFoundError)
+
+        # The files were all fetched through one command server.
+        self.assertEqual(len(HgClient._get_command_server_pool.calls), 1)
+        self.assertEqual(len(HgCommandServer.run_command.calls), 4)
+
+    def test_supports_batched_file_fetches_with_hgweb(self):
+        """Testing HgTool.supports_batched_file_fetches with hgweb"""
+        repository = Repository(name='Test HG2',
+                                path='http://hg.example.com/',
+                                tool=Tool.objects.get(name='Mercurial'))
+        tool = repository.get_scmtool()
+
+        self.assertFalse(tool.supports_batched_file_fetches)
+
+    def test_get_files_with_command_server_failure(self):
+        """Testing HgTool.get_files falls back to running hg when the
+        Mercurial command server fails
+        """
+        def _run_command(server, args):
+            if len(HgCommandServer.run_command.calls) > 1:
+                raise SCMError('The Mercurial command server exited '
+                               'unexpectedly.')
+
+            return HgCommandServer.run_command.call_original(server, args)
+
+        self.spy_on(HgCommandServer.run_command,
+                    owner=HgCommandServer,
+                    call_fake=_run_command)
+        self.spy_on(HgClient._run_hg, owner=HgClient)
+
+        rev = Revision('661e5dd3c493')
+
+        results = self.tool.get_files([
+            ('doc/readme', rev, None),
+            ('doc/readme2', rev, None),
+            ('doc/readme', rev, None),
+        ])
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0], b'Hello\n\ngoodbye\n')
+        self.assertIsInstance(results[1], FileNotFoundError)
+        self.assertEqual(results[2], b'Hello\n\ngoodbye\n')
+        self.assertFalse(self.tool.client.use_command_server)
+
+        cat_calls = [
+            call
+            for call in HgClient._run_hg.calls
+            if call.args[0][0] == 'cat'
+        ]
+        self.assertEqual(len(cat_calls), 2)
+
     def test_interface(self):
         """Testing basic HgTool API"""
         self.assertTrue(self.tool.diffs_use_absolute_paths)
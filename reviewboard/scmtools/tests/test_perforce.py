@@ -3,6 +3,7 @@ from __future__ import unicode_literals
 
 import os
 import shutil
+from contextlib import contextmanager
 from hashlib import md5
 
 try:
@@ -19,14 +20,19 @@ from djblets.util.filesystem import is_exe_in_path
 from kgb import SpyAgency
 from P4 import P4Exception
 
-from reviewboard.scmtools.core import PRE_CREATION
+from reviewboard.scmtools.core import HEAD, PRE_CREATION
 from reviewboard.scmtools.errors import (AuthenticationError,
+                                         FileNotFoundError,
                                          RepositoryNotFoundError,
                                          SCMError,
                                          UnverifiedCertificateError)
 from reviewboard.scmtools.models import Repository, Tool
-from reviewboard.scmtools.perforce import PerforceTool, STunnelProxy
+from reviewboard.scmtools.perforce import (PerforceClient,
+                                           PerforceConnection,
+                                           PerforceTool,
+                                           STunnelProxy)
 from reviewboard.scmtools.tests.testcases import SCMTestCase
+from reviewboard.scmtools.worker_pool import close_worker_pools
 from reviewboard.site.models import LocalSite
 from reviewboard.testing import online_only
 from reviewboard.testing.testcase import TestCase
@@ -42,8 +48,20 @@ if P4 is not None:
 
         def connect(self):
             return self
+
+    class DummyPrintP4(DummyP4):
+        """A dummy P4 that returns canned results for p4 print."""
+
+        print_output = []
+
+        def run_print(self, *args):
+            self.print_args = args
+            self.print_encoding = self.encoding
+
+            return self.print_output
 else:
     DummyP4 = None
+    DummyPrintP4 = None
 
 
 class BasePerforceTestCase(SpyAgency, SCMTestCase):
@@ -62,6 +80,8 @@ class BasePerforceTestCase(SpyAgency, SCMTestCase):
         if not is_exe_in_path('p4'):
             raise nose.SkipTest('The p4 command line tool is not installed')
 
+        self.addCleanup(close_worker_pools)
+
 
 class PerforceTests(BasePerforceTestCase):
     """Unit tests for Perforce.
@@ -210,6 +230,7 @@ class PerforceTests(BasePerforceTestCase):
         p4 = DummyP4()
         client = tool.client
         client.p4 = p4
+        client.use_connection_pool = False
 
         fingerprint = \
             'A0:B1:C2:D3:E4:F5:6A:7B:8C:9D:E0:F1:2A:3B:4C:5D:6E:7F:A1:B2'
@@ -244,6 +265,7 @@ class PerforceTests(BasePerforceTestCase):
         p4 = DummyP4()
         client = tool.client
         client.p4 = p4
+        client.use_connection_pool = False
 
         fingerprint = \
             'A0:B1:C2:D3:E4:F5:6A:7B:8C:9D:E0:F1:2A:3B:4C:5D:6E:7F:A1:B2'
@@ -280,6 +302,7 @@ class PerforceTests(BasePerforceTestCase):
         p4 = DummyP4()
         client = tool.client
         client.p4 = p4
+        client.use_connection_pool = False
 
         fingerprint = \
             'A0:B1:C2:D3:E4:F5:6A:7B:8C:9D:E0:F1:2A:3B:4C:5D:6E:7F:A1:B2'
@@ -309,6 +332,202 @@ class PerforceTests(BasePerforceTestCase):
             with client.run_worker():
                 raise P4Exception(err_msg)
 
+    def test_run_worker_reuses_connections(self):
+        """Testing PerforceClient.run_worker reuses pooled connections"""
+        self.spy_on(PerforceClient.connect,
+                    owner=PerforceClient,
+                    call_fake=self._fake_connect)
+        self.spy_on(PerforceConnection.is_alive,
+                    owner=PerforceConnection,
+                    call_fake=lambda connection: True)
+
+        client = self.tool.client
+        self.assertTrue(client.use_connection_pool)
+
+        with client.run_worker() as p4_1:
+            pass
+
+        with client.run_worker() as p4_2:
+            pass
+
+        self.assertIs(p4_1, p4_2)
+        self.assertIsNot(p4_1, client.p4)
+        self.assertEqual(len(PerforceClient.connect.calls), 1)
+
+    def test_run_worker_with_connection_pool_refreshes_ticket(self):
+        """Testing PerforceClient.run_worker with pooled connections
+        periodically checks tickets
+        """
+        self.repository.extra_data['use_ticket_auth'] = True
+
+        self.spy_on(PerforceClient.connect,
+                    owner=PerforceClient,
+                    call_fake=self._fake_connect)
+        self.spy_on(PerforceClient.check_refresh_ticket,
+                    owner=PerforceClient,
+                    call_original=False)
+        self.spy_on(PerforceConnection.is_alive,
+                    owner=PerforceConnection,
+                    call_fake=lambda connection: True)
+
+        client = PerforceTool(self.repository).client
+
+        with client.run_worker():
+            pass
+
+        self.assertFalse(PerforceClient.check_refresh_ticket.called)
+
+        # Make the last check look like it was long enough ago to check
+        # again.
+        connection = client._get_connection_pool()._idle_workers[0][0]
+        connection._last_ticket_check -= \
+            PerforceConnection.TICKET_CHECK_INTERVAL_SECS
+
+        with client.run_worker():
+            pass
+
+        self.assertEqual(len(PerforceClient.check_refresh_ticket.calls), 1)
+
+    def test_run_worker_with_connection_pool_and_login_error(self):
+        """Testing PerforceClient.run_worker with pooled connections
+        closes connections after login errors
+        """
+        self.spy_on(PerforceClient.connect,
+                    owner=PerforceClient,
+                    call_fake=self._fake_connect)
+        self.spy_on(PerforceConnection.is_alive,
+                    owner=PerforceConnection,
+                    call_fake=lambda connection: not connection._broken)
+
+        client = self.tool.client
+
+        with self.assertRaises(AuthenticationError):
+            with client.run_worker():
+                raise P4Exception('Your session has expired, please login '
+                                  'again.')
+
+        with client.run_worker():
+            pass
+
+        self.assertEqual(len(PerforceClient.connect.calls), 2)
+
+    def test_run_worker_with_connection_pool_and_other_error(self):
+        """Testing PerforceClient.run_worker with pooled connections
+        reuses connections after errors not related to logins
+        """
+        self.spy_on(PerforceClient.connect,
+                    owner=PerforceClient,
+                    call_fake=self._fake_connect)
+        self.spy_on(PerforceConnection.is_alive,
+                    owner=PerforceConnection,
+                    call_fake=lambda connection: not connection._broken)
+
+        client = self.tool.client
+
+        with self.assertRaises(SCMError):
+            with client.run_worker():
+                raise P4Exception('//depot/foo - no such file(s).')
+
+        with client.run_worker():
+            pass
+
+        self.assertEqual(len(PerforceClient.connect.calls), 1)
+
+    def test_get_files(self):
+        """Testing PerforceClient.get_files"""
+        client = self.tool.client
+
+        self.spy_on(client._print_files, call_fake=lambda *args: {
+            ('//depot/file1', '2'): b'file 1',
+            ('//depot/file2', '3'): b'file 2',
+        })
+        self.spy_on(client.get_file,
+                    call_fake=lambda client, path, revision: (
+                        b'%s at head' % path.encode('utf-8')))
+
+        results = client.get_files([
+            ('//depot/file1', '2'),
+            ('//depot/new-file', PRE_CREATION),
+            ('//depot/file2', '3'),
+            ('//depot/file3', HEAD),
+        ])
+
+        self.assertEqual(results, [
+            b'file 1',
+            b'',
+            b'file 2',
+            b'//depot/file3 at head',
+        ])
+        self.assertSpyCalledWith(client._print_files,
+                                 ['//depot/file1#2', '//depot/file2#3'])
+        self.assertEqual(len(client.get_file.calls), 1)
+
+    def test_get_files_with_missing_files(self):
+        """Testing PerforceClient.get_files with files missing from p4 print
+        results
+        """
+        def _get_file(client, path, revision):
+            raise FileNotFoundError(path, revision)
+
+        client = self.tool.client
+
+        self.spy_on(client._print_files, call_fake=lambda *args: {
+            ('//depot/file1', '2'): b'file 1',
+        })
+        self.spy_on(client.get_file, call_fake=_get_file)
+
+        results = client.get_files([
+            ('//depot/file1', '2'),
+            ('//depot/file2', '3'),
+        ])
+
+        self.assertEqual(results[0], b'file 1')
+        self.assertIsInstance(results[1], FileNotFoundError)
+        self.assertSpyCalledWith(client.get_file, '//depot/file2', '3')
+
+    def test_print_files(self):
+        """Testing PerforceClient._print_files"""
+        p4 = DummyPrintP4()
+        p4.print_output = [
+            {
+                'depotFile': '//depot/file1',
+                'rev': '2',
+                'type': 'text',
+            },
+            b'line 1\n',
+            b'line 2\n',
+            {
+                'depotFile': '//depot/link',
+                'rev': '1',
+                'type': 'symlink',
+            },
+            b'//depot/file1',
+            {
+                'depotFile': '//depot/file2',
+                'rev': '3',
+                'type': 'binary',
+            },
+            b'\x00\x01',
+        ]
+
+        client = self.tool.client
+        client.p4 = p4
+        client.use_connection_pool = False
+
+        printed = client._print_files(['//depot/file1#2', '//depot/link#1',
+                                       '//depot/file2#3'])
+
+        self.assertEqual(printed, {
+            ('//depot/file1', '2'): b'line 1\nline 2\n',
+            ('//depot/link', '1'): b'',
+            ('//depot/file2', '3'): b'\x00\x01',
+        })
+        self.assertEqual(p4.print_args,
+                         (['//depot/file1#2', '//depot/link#1',
+                           '//depot/file2#3'],))
+        self.assertEqual(p4.print_encoding, 'raw')
+        self.assertNotEqual(p4.encoding, 'raw')
+
     @online_only
     def test_changeset(self):
         """Testing PerforceTool.get_changeset"""
@@ -391,6 +610,25 @@ class PerforceTests(BasePerforceTestCase):
         self.assertEqual(md5(content).hexdigest(),
                          '227bdd87b052fcad9369e65c7bf23fd0')
 
+    @online_only
+    def test_get_files_online(self):
+        """Testing PerforceTool.get_files"""
+        results = self.tool.get_files([
+            ('//depot/foo', PRE_CREATION, None),
+            ('//public/perforce/api/python/P4Client/p4.py', '1', None),
+            ('//public/perforce/api/python/P4Client/p4.py', '2', None),
+        ])
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0], b'')
+        self.assertIsInstance(results[1], bytes)
+        self.assertEqual(md5(results[1]).hexdigest(),
+                         '227bdd87b052fcad9369e65c7bf23fd0')
+        self.assertEqual(
+            results[2],
+            self.tool.get_file('//public/perforce/api/python/P4Client/p4.py',
+                               '2'))
+
     @online_only
     def test_file_exists(self):
         """Testing PerforceTool.file_exists"""
@@ -564,6 +802,21 @@ class PerforceTests(BasePerforceTestCase):
                              os.path.join(settings.SITE_DATA_DIR, 'p4',
                                           'local-site-1', 'p4tickets'))
 
+    @contextmanager
+    def _fake_connect(self, client):
+        """Pretend to connect to the server.
+
+        Args:
+            client (reviewboard.scmtools.perforce.PerforceClient):
+                The client connecting.
+
+        Context:
+            No variables are passed to the context.
+        """
+        client.p4 = DummyP4()
+
+        yield
+
     @online_only
     def test_parse_diff_revision_with_revision_eq_0(self):
         """Testing Perforce.parse_diff_revision with revision == 0"""
@@ -9,6 +9,7 @@ from djblets.testing.decorators import add_fixtures
 from kgb import SpyAgency
 
 from reviewboard.scmtools.core import HEAD
+from reviewboard.scmtools.errors import FileNotFoundError
 from reviewboard.scmtools.models import Repository, Tool
 from reviewboard.scmtools.signals import (checked_file_exists,
                                           checking_file_exists,
@@ -182,6 +183,90 @@ class RepositoryTests(SpyAgency, TestCase):
         self.assertEqual(found_signals[1],
                          ('fetched_file', path, revision, request))
 
+    def test_get_files(self):
+        """Testing Repository.get_files"""
+        results = self.repository.get_files([
+            ('readme', 'e965047', None),
+            ('missing', 'abc123', None),
+        ])
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0], b'Hello\n')
+        self.assertIsInstance(results[1], FileNotFoundError)
+
+    def test_get_files_caching(self):
+        """Testing Repository.get_files uses and stores cached results"""
+        repository = self.repository
+        scmtool_cls = repository.scmtool_class
+
+        self.spy_on(scmtool_cls.get_file,
+                    call_fake=lambda *args, **kwargs: b'file data',
+                    owner=scmtool_cls)
+        self.spy_on(scmtool_cls.get_files,
+                    call_fake=lambda *args, **kwargs: [
+                        b'file data 2',
+                        FileNotFoundError('file3', 'e965047'),
+                    ],
+                    owner=scmtool_cls)
+
+        repository.get_file('file1', 'e965047')
+
+        files = [
+            ('file1', 'e965047', None),
+            ('file2', 'e965047', None),
+            ('file3', 'e965047', None),
+        ]
+        results = repository.get_files(files)
+
+        self.assertEqual(results[:2], [b'file data', b'file data 2'])
+        self.assertIsInstance(results[2], FileNotFoundError)
+        self.assertEqual(len(scmtool_cls.get_files.calls), 1)
+        self.assertSpyCalledWith(scmtool_cls.get_files, files[1:])
+
+        # The second file should now be cached, leaving only the third
+        # (which failed) to fetch.
+        results = repository.get_files(files)
+
+        self.assertEqual(results[:2], [b'file data', b'file data 2'])
+        self.assertEqual(len(scmtool_cls.get_file.calls), 2)
+        self.assertSpyLastCalledWith(scmtool_cls.get_file,
+                                     'file3',
+                                     revision='e965047')
+        self.assertEqual(
+            repository.get_file('file2', 'e965047'),
+            b'file data 2')
+        self.assertEqual(len(scmtool_cls.get_files.calls), 1)
+
+    def test_get_files_signals(self):
+        """Testing Repository.get_files emits signals"""
+        def on_fetching_file(sender, path, revision, request, **kwargs):
+            found_signals.append(('fetching_file', path, revision, request))
+
+        def on_fetched_file(sender, path, revision, request, **kwargs):
+            found_signals.append(('fetched_file', path, revision, request))
+
+        found_signals = []
+
+        fetching_file.connect(on_fetching_file, sender=self.repository)
+        fetched_file.connect(on_fetched_file, sender=self.repository)
+
+        request = {}
+
+        self.repository.get_files(
+            [
+                ('readme', 'e965047', None),
+                ('missing', 'abc123', None),
+            ],
+            request=request)
+
+        self.assertEqual(
+            found_signals,
+            [
+                ('fetching_file', 'readme', 'e965047', request),
+                ('fetching_file', 'missing', 'abc123', request),
+                ('fetched_file', 'readme', 'e965047', request),
+            ])
+
     def test_get_file_exists_caching_when_exists(self):
         """Testing Repository.get_file_exists caches result when exists"""
         path = 'readme'
@@ -0,0 +1,214 @@
+"""Unit tests for reviewboard.scmtools.worker_pool."""
+
+from __future__ import unicode_literals
+
+import os
+import threading
+import time
+
+from kgb import SpyAgency
+
+from reviewboard.scmtools import worker_pool
+from reviewboard.scmtools.worker_pool import (BaseWorker, WorkerPool,
+                                              close_worker_pools,
+                                              get_worker_pool)
+from reviewboard.testing import TestCase
+
+
+class DummyWorker(BaseWorker):
+    """A worker used for testing."""
+
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+
+    def is_alive(self):
+        return self.alive
+
+    def close(self):
+        self.closed = True
+
+
+class WorkerPoolTests(SpyAgency, TestCase):
+    """Unit tests for reviewboard.scmtools.worker_pool.WorkerPool."""
+
+    def test_get_worker_reuses_workers(self):
+        """Testing WorkerPool.get_worker reuses idle workers"""
+        pool = WorkerPool(DummyWorker)
+
+        with pool.get_worker() as worker1:
+            pass
+
+        with pool.get_worker() as worker2:
+            self.assertEqual(pool.num_idle_workers, 0)
+
+        self.assertIs(worker1, worker2)
+        self.assertEqual(pool.num_workers, 1)
+        self.assertEqual(pool.num_idle_workers, 1)
+        self.assertFalse(worker1.closed)
+
+    def test_get_worker_creates_workers_when_busy(self):
+        """Testing WorkerPool.get_worker creates workers when all are in use
+        """
+        pool = WorkerPool(DummyWorker)
+
+        with pool.get_worker() as worker1:
+            with pool.get_worker() as worker2:
+                self.assertIsNot(worker1, worker2)
+                self.assertEqual(pool.num_workers, 2)
+
+        self.assertEqual(pool.num_idle_workers, 2)
+
+    def test_get_worker_with_max_workers(self):
+        """Testing WorkerPool.get_worker waits for a worker when at
+        max_workers
+        """
+        pool = WorkerPool(DummyWorker, max_workers=1)
+        acquired = threading.Event()
+        results = []
+
+        def _get_worker():
+            with pool.get_worker() as worker:
+                results.append(worker)
+
+            acquired.set()
+
+        with pool.get_worker() as worker:
+            thread = threading.Thread(target=_get_worker)
+            thread.start()
+
+            self.assertFalse(acquired.wait(0.1))
+            self.assertEqual(results, [])
+
+        thread.join()
+
+        self.assertEqual(results, [worker])
+        self.assertEqual(pool.num_workers, 1)
+
+    def test_get_worker_with_dead_worker(self):
+        """Testing WorkerPool.get_worker closes workers that are no longer
+        alive
+        """
+        pool = WorkerPool(DummyWorker)
+
+        with pool.get_worker() as worker1:
+            pass
+
+        worker1.alive = False
+
+        with pool.get_worker() as worker2:
+            self.assertIsNot(worker1, worker2)
+
+        self.assertTrue(worker1.closed)
+        self.assertEqual(pool.num_workers, 1)
+
+    def test_get_worker_releases_dead_worker(self):
+        """Testing WorkerPool.get_worker closes workers that die while in use
+        """
+        pool = WorkerPool(DummyWorker)
+
+        with self.assertRaises(ValueError):
+            with pool.get_worker() as worker:
+                worker.alive = False
+                raise ValueError
+
+        self.assertTrue(worker.closed)
+        self.assertEqual(pool.num_workers, 0)
+        self.assertEqual(pool.num_idle_workers, 0)
+
+    def test_get_worker_with_create_error(self):
+        """Testing WorkerPool.get_worker with an error creating a worker"""
+        def _create_worker():
+            raise OSError
+
+        pool = WorkerPool(_create_worker, max_workers=1)
+
+        with self.assertRaises(OSError):
+            with pool.get_worker():
+                pass
+
+        self.assertEqual(pool.num_workers, 0)
+
+    def test_reap_idle_workers(self):
+        """Testing WorkerPool.reap_idle_workers"""
+        pool = WorkerPool(DummyWorker, idle_timeout=60)
+
+        with pool.get_worker() as worker1:
+            with pool.get_worker() as worker2:
+                pass
+
+        # Make the first worker look like it's been idle too long.
+        pool._idle_workers[0] = (pool._idle_workers[0][0], time.time() - 61)
+
+        pool.reap_idle_workers()
+
+        self.assertTrue(worker2.closed)
+        self.assertFalse(worker1.closed)
+        self.assertEqual(pool.num_workers, 1)
+        self.assertEqual(pool.num_idle_workers, 1)
+
+    def test_close(self):
+        """Testing WorkerPool.close"""
+        pool = WorkerPool(DummyWorker)
+
+        with pool.get_worker() as worker1:
+            with pool.get_worker() as worker2:
+                pass
+
+            pool.close()
+
+        self.assertTrue(worker2.closed)
+        self.assertFalse(worker1.closed)
+        self.assertEqual(pool.num_workers, 1)
+        self.assertEqual(pool.num_idle_workers, 1)
+
+
+class GetWorkerPoolTests(SpyAgency, TestCase):
+    """Unit tests for reviewboard.scmtools.worker_pool.get_worker_pool."""
+
+    def tearDown(self):
+        super(GetWorkerPoolTests, self).tearDown()
+
+        close_worker_pools()
+
+    def test_get_worker_pool(self):
+        """Testing get_worker_pool returns one pool per key"""
+        pool1 = get_worker_pool(('test', 1), DummyWorker, max_workers=2)
+        pool2 = get_worker_pool(('test', 1), DummyWorker, max_workers=3)
+        pool3 = get_worker_pool(('test', 2), DummyWorker)
+
+        self.assertIs(pool1, pool2)
+        self.assertIsNot(pool1, pool3)
+        self.assertEqual(pool1.max_workers, 2)
+
+    def test_get_worker_pool_after_fork(self):
+        """Testing get_worker_pool in a forked process doesn't share the
+        parent's workers
+        """
+        pool1 = get_worker_pool(('test', 1), DummyWorker)
+
+        with pool1.get_worker() as worker:
+            pass
+
+        # Pretend the pools were created by a parent process.
+        worker_pool._pools_pid = os.getpid() + 1
+
+        pool2 = get_worker_pool(('test', 1), DummyWorker)
+        close_worker_pools()
+
+        self.assertIsNot(pool1, pool2)
+        self.assertFalse(worker.closed)
+
+    def test_get_worker_pool_reaps_idle_workers(self):
+        """Testing get_worker_pool reaps idle workers in all pools"""
+        pool = get_worker_pool(('test', 1), DummyWorker)
+
+        with pool.get_worker() as worker:
+            pass
+
+        pool._idle_workers[0] = (worker, time.time() - pool.idle_timeout - 1)
+        worker_pool._last_reap_time = 0
+
+        get_worker_pool(('test', 2), DummyWorker)
+
+        self.assertTrue(worker.closed)
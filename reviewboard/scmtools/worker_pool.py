@@ -0,0 +1,312 @@
+"""Pools of long-lived workers for talking to repositories.
+
+Many SCM operations are dominated by setup costs, such as launching a
+process or connecting to a server, rather than by the work itself. A
+:py:class:`WorkerPool` keeps a bounded number of workers (such as
+long-running processes) around for a repository, handing them out to one
+caller at a time and closing them after they've been idle for a while.
+
+Pools are shared by everything in the process talking to the same
+repository, through :py:func:`get_worker_pool`.
+"""
+
+from __future__ import unicode_literals
+
+import atexit
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.utils import six
+
+
+logger = logging.getLogger(__name__)
+
+
+class BaseWorker(object):
+    """Base class for a worker managed by a :py:class:`WorkerPool`.
+
+    Subclasses must implement :py:meth:`is_alive` and :py:meth:`close`.
+    """
+
+    def is_alive(self):
+        """Return whether the worker can still be used.
+
+        Workers that are no longer alive (for instance, if their process
+        exited or they lost track of their protocol state) are closed
+        instead of being returned to the pool.
+
+        Returns:
+            bool:
+            Whether the worker can still be used.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Close the worker, releasing any resources it holds."""
+        raise NotImplementedError
+
+
+class WorkerPool(object):
+    """A bounded pool of workers for a repository.
+
+    Workers are created on demand, up to :py:attr:`max_workers`. Callers
+    wanting a worker when all of them are in use will wait for one to be
+    returned. Workers that are idle for longer than :py:attr:`idle_timeout`
+    seconds are closed.
+    """
+
+    def __init__(self, create_worker, max_workers=4, idle_timeout=300):
+        """Initialize the pool.
+
+        Args:
+            create_worker (callable):
+                A function taking no arguments and returning a new
+                :py:class:`BaseWorker`.
+
+            max_workers (int, optional):
+                The maximum number of workers, whether in use or idle.
+
+            idle_timeout (int, optional):
+                The number of seconds a worker can be idle before it's
+                closed.
+        """
+        self.max_workers = max_workers
+        self.idle_timeout = idle_timeout
+
+        self._create_worker = create_worker
+        self._idle_workers = []
+        self._num_workers = 0
+        self._cond = threading.Condition()
+
+    @property
+    def num_workers(self):
+        """The number of workers, whether in use or idle."""
+        return self._num_workers
+
+    @property
+    def num_idle_workers(self):
+        """The number of idle workers."""
+        return len(self._idle_workers)
+
+    @contextmanager
+    def get_worker(self):
+        """Return a worker from the pool for the duration of a block.
+
+        The worker is returned to the pool when the block ends. If the
+        worker is no longer alive at that point, it will be closed instead.
+
+        Context:
+            BaseWorker:
+            The worker to use.
+        """
+        worker = self._acquire()
+
+        try:
+            yield worker
+        finally:
+            self._release(worker)
+
+    def reap_idle_workers(self):
+        """Close any workers that have been idle for too long."""
+        cutoff = time.time() - self.idle_timeout
+
+        with self._cond:
+            expired = [
+                worker
+                for worker, last_used in self._idle_workers
+                if last_used < cutoff
+            ]
+
+            if expired:
+                self._idle_workers = [
+                    (worker, last_used)
+                    for worker, last_used in self._idle_workers
+                    if last_used >= cutoff
+                ]
+                self._num_workers -= len(expired)
+                self._cond.notify_all()
+
+        for worker in expired:
+            self._close_worker(worker)
+
+    def close(self):
+        """Close all idle workers.
+
+        Workers currently in use will be closed when they're released, if
+        they're no longer alive. Otherwise, they'll be returned to the pool
+        as normal.
+        """
+        with self._cond:
+            workers = [worker for worker, last_used in self._idle_workers]
+            self._idle_workers = []
+            self._num_workers -= len(workers)
+            self._cond.notify_all()
+
+        for worker in workers:
+            self._close_worker(worker)
+
+    def _acquire(self):
+        """Take a worker from the pool, creating one if needed.
+
+        Returns:
+            BaseWorker:
+            The worker.
+        """
+        self.reap_idle_workers()
+
+        dead_workers = []
+
+        with self._cond:
+            while True:
+                # Use the most recently-used worker first, so that any
+                # excess workers can become idle and be reaped.
+                while self._idle_workers:
+                    worker = self._idle_workers.pop()[0]
+
+                    if worker.is_alive():
+                        break
+
+                    dead_workers.append(worker)
+                    self._num_workers -= 1
+                else:
+                    worker = None
+
+                if worker is not None:
+                    break
+
+                if self._num_workers < self.max_workers:
+                    self._num_workers += 1
+                    break
+
+                self._cond.wait()
+
+        for dead_worker in dead_workers:
+            self._close_worker(dead_worker)
+
+        if worker is None:
+            try:
+                worker = self._create_worker()
+            except Exception:
+                with self._cond:
+                    self._num_workers -= 1
+                    self._cond.notify()
+
+                raise
+
+        return worker
+
+    def _release(self, worker):
+        """Return a worker to the pool.
+
+        Args:
+            worker (BaseWorker):
+                The worker to return.
+        """
+        alive = worker.is_alive()
+
+        with self._cond:
+            if alive:
+                self._idle_workers.append((worker, time.time()))
+            else:
+                self._num_workers -= 1
+
+            self._cond.notify()
+
+        if not alive:
+            self._close_worker(worker)
+
+    def _close_worker(self, worker):
+        """Close a worker, logging any errors.
+
+        Args:
+            worker (BaseWorker):
+                The worker to close.
+        """
+        try:
+            worker.close()
+        except Exception as e:
+            logger.exception('Unexpected error closing worker %r: %s',
+                             worker, e)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = None
+_last_reap_time = 0
+
+#: How often, in seconds, idle workers are reaped from all pools.
+REAP_INTERVAL = 30
+
+
+def get_worker_pool(key, create_worker, **kwargs):
+    """Return the shared worker pool for a key, creating it if needed.
+
+    Calling this will also close any workers in any pool that have been
+    idle for too long, at most every :py:data:`REAP_INTERVAL` seconds.
+
+    Pools don't survive a fork. The workers belong to the parent process,
+    so a child process starts with new pools of its own.
+
+    Args:
+        key (tuple):
+            A key identifying the repository (and kind of worker) the pool
+            is for.
+
+        create_worker (callable):
+            A function returning a new worker for the pool. This is only
+            used if the pool doesn't yet exist.
+
+        **kwargs (dict):
+            Additional keyword arguments for :py:class:`WorkerPool`, used
+            if the pool doesn't yet exist.
+
+    Returns:
+        WorkerPool:
+        The pool for the key.
+    """
+    global _last_reap_time, _pools, _pools_pid
+
+    now = time.time()
+    pools_to_reap = []
+
+    with _pools_lock:
+        pid = os.getpid()
+
+        if _pools_pid != pid:
+            # Any existing workers belong to the parent process, and must
+            # not be used or closed by this one.
+            _pools = {}
+            _pools_pid = pid
+
+        try:
+            pool = _pools[key]
+        except KeyError:
+            pool = WorkerPool(create_worker, **kwargs)
+            _pools[key] = pool
+
+        if now - _last_reap_time >= REAP_INTERVAL:
+            _last_reap_time = now
+            pools_to_reap = list(six.itervalues(_pools))
+
+    for other_pool in pools_to_reap:
+        other_pool.reap_idle_workers()
+
+    return pool
+
+
+def close_worker_pools():
+    """Close the idle workers in all pools in this process."""
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            return
+
+        pools = list(six.itervalues(_pools))
+
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_worker_pools)
@@ -856,6 +856,10 @@ class TestCase(FixturesCompilerMixin, DjbletsTestCase):
         if save:
             filediff.save()
 
+            # Keep any line counts stored on the DiffSet up-to-date, as
+            # uploading the diff would.
+            diffset._add_raw_line_counts([filediff], save=True)
+
         return filediff
 
     def create_repository(self, with_local_site=False, name='Test Repo',
@@ -5,14 +5,71 @@ from __future__ import unicode_literals
 import os
 
 from django.utils import six
+from djblets.cache.backend import cache_memoize
 from djblets.staticbundles import (
     PIPELINE_JAVASCRIPT as DJBLETS_PIPELINE_JAVASCRIPT,
     PIPELINE_STYLESHEETS as DJBLETS_PIPELINE_STYLESHEETS)
 
+from reviewboard import cache_utils
+from reviewboard.cache_utils import get_many_cached_large_data
 from reviewboard.staticbundles import PIPELINE_JAVASCRIPT, PIPELINE_STYLESHEETS
 from reviewboard.testing import TestCase
 
 
+class CacheUtilsTests(TestCase):
+    """Unit tests for reviewboard.cache_utils."""
+
+    def test_get_many_cached_large_data(self):
+        """Testing get_many_cached_large_data reads data stored by
+        cache_memoize
+        """
+        # This must stay compatible with the way djblets stores large data.
+        # The second item spans several cache chunks.
+        items = {
+            'key1': [b'data'],
+            'key2': [os.urandom(3 * 1024 * 1024)],
+        }
+
+        for key, item in six.iteritems(items):
+            cache_memoize(key, lambda: item, large_data=True)
+
+        self.assertEqual(
+            get_many_cached_large_data(['key1', 'key2', 'key3']),
+            items)
+
+    def test_get_many_cached_large_data_without_compression(self):
+        """Testing get_many_cached_large_data reads data stored by
+        cache_memoize without compression
+        """
+        cache_memoize('key1', lambda: [b'data'],
+                      large_data=True,
+                      compress_large_data=False)
+
+        self.assertEqual(
+            get_many_cached_large_data(['key1', 'key2']),
+            {
+                'key1': [b'data'],
+            })
+
+    def test_get_many_cached_large_data_with_unknown_djblets(self):
+        """Testing get_many_cached_large_data with an unknown version of
+        djblets
+        """
+        cache_memoize('key1', lambda: [b'data'], large_data=True)
+
+        old_versions = cache_utils.LARGE_DATA_DJBLETS_VERSIONS
+        cache_utils.LARGE_DATA_DJBLETS_VERSIONS = set()
+
+        try:
+            self.assertEqual(
+                get_many_cached_large_data(['key1', 'key2']),
+                {
+                    'key1': [b'data'],
+                })
+        finally:
+            cache_utils.LARGE_DATA_DJBLETS_VERSIONS = old_versions
+
+
 class StaticBundlesTests(TestCase):
     """Tests the static bundles in reviewboard.staticbundles."""
 
@@ -16,7 +16,8 @@ from djblets.webapi.errors import (DOES_NOT_EXIST, INVALID_ATTRIBUTE,
                                    PERMISSION_DENIED)
 from djblets.webapi.fields import FileFieldType, StringFieldType
 
-from reviewboard.diffviewer.commit_utils import (serialize_validation_info,
+from reviewboard.diffviewer.commit_utils import (ValidationHistory,
+                                                 serialize_validation_info,
                                                  update_validation_info)
 from reviewboard.diffviewer.errors import (DiffParserError,
                                            DiffTooBigError,
@@ -239,7 +240,7 @@ class ValidateDiffCommitResource(WebAPIResource):
                 'Unexpected error while validating the diff: %s' % e)
 
         validation_info = update_validation_info(
-            form.cleaned_data.get('validation_info', {}),
+            form.cleaned_data.get('validation_info') or ValidationHistory(),
             commit_id,
             parent_id,
             filediffs)
@@ -41,7 +41,8 @@ class ResourceListTests(ExtraDataListMixin, BaseWebAPITestCase):
         self.assertEqual(item_rsp['revision'], diffset.revision)
         self.assertEqual(item_rsp['basedir'], diffset.basedir)
         self.assertEqual(item_rsp['base_commit_id'], diffset.base_commit_id)
-        self.assertEqual(item_rsp['extra_data'], diffset.extra_data)
+        self.assertEqual(item_rsp['extra_data'],
+                         self.resource.serialize_extra_data_field(diffset))
 
     #
     # HTTP GET tests
@@ -290,7 +291,8 @@ class ResourceItemTests(SpyAgency, ExtraDataItemMixin, BaseWebAPITestCase):
         self.assertEqual(item_rsp['revision'], diffset.revision)
         self.assertEqual(item_rsp['basedir'], diffset.basedir)
         self.assertEqual(item_rsp['base_commit_id'], diffset.base_commit_id)
-        self.assertEqual(item_rsp['extra_data'], diffset.extra_data)
+        self.assertEqual(item_rsp['extra_data'],
+                         self.resource.serialize_extra_data_field(diffset))
 
     #
     # HTTP GET tests
@@ -499,6 +499,7 @@ setup(
         's3': ['django-storages>=1.8,<1.9'],
         'subvertpy': ['subvertpy'],
         'swift': ['django-storage-swift'],
+        'zstd': ['zstandard'],
     },
     include_package_data=True,
     zip_safe=False,